@@ -8,16 +8,18 @@
 from typing import List, Optional
 from datetime import datetime
 
-from app.core.database import get_db, AsyncSessionLocal
+from app.core.database import get_db, with_session
 from sqlalchemy.orm.attributes import flag_modified
 from app.core.security import get_user_id, _resolve_user_id
 from app.core.config import settings
 from app.models import AcceptanceAnalysis
 from app.api.v1.quotes import upload_file_to_oss
-from app.services.oss_service import oss_service
+from app.services.oss_service import async_oss_service
+from app.services.ai_governor import AIUpstreamBusy, ai_caller
 from app.core.config import settings
 from app.schemas import ApiResponse
 from app.services.message_service import create_message
+from app.services.construction_reminders import materialize_reminders
 
 router = APIRouter(prefix="/acceptance", tags=["验收分析"])
 import logging
@@ -60,9 +62,9 @@ async def upload_acceptance_photo(
         if ext not in (settings.ALLOWED_FILE_TYPES or ["pdf", "jpg", "jpeg", "png"]):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="仅支持图片格式")
         # 上传到OSS（统一使用OSS服务，验收照片使用照片bucket，生命周期1年）
-        object_key = upload_file_to_oss(file, "acceptance", user_id, is_photo=True)
+        object_key = await upload_file_to_oss(file, "acceptance", user_id, is_photo=True)
         # 返回 file_url（签名 URL）供前端直接展示；object_key 供 analyze 使用
-        file_url = oss_service.sign_url_for_key(object_key, expires=86400)  # 24h 内可展示
+        file_url = await async_oss_service.sign_url(object_key, expires=86400)  # 24h 内可展示
         return ApiResponse(code=0, msg="success", data={"object_key": object_key, "file_url": file_url})
     except HTTPException:
         raise
@@ -85,20 +87,13 @@ async def analyze_acceptance(
         if not file_urls:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="请上传1-9张照片")
 
-        from app.services.oss_service import oss_service
         from app.services.coze_service import coze_service
         
         # 验收分析重构：使用扣子智能体直接分析验收照片
         # 生成签名URL列表供扣子智能体访问
-        signed_urls = []
-        for url_or_key in file_urls:
-            try:
-                # 支持 object_key 或旧版公网 URL：object_key 需先换为临时签名 URL
-                fetch_url = oss_service.sign_url_for_key(url_or_key, expires=3600) if not url_or_key.startswith("http") else url_or_key
-                signed_urls.append(fetch_url)
-            except Exception:
-                # 如果生成签名URL失败，使用原始URL
-                signed_urls.append(url_or_key)
+        # 支持 object_key 或旧版公网 URL：object_key 批量换为临时签名 URL，签名失败时使用原始URL
+        signed_map = await async_oss_service.sign_urls(file_urls, expires=3600)
+        signed_urls = [signed_map.get(u, u) for u in file_urls]
         
         # 将签名URL转换为公共URL（OSS bucket是公共读的）
         # 签名URL格式: http://zhuangxiu-images.oss-cn-hangzhou.aliyuncs.com/acceptance%2F2%2F1772802398_9862.png?OSSAccessKeyId=...
@@ -120,7 +115,8 @@ async def analyze_acceptance(
                 public_urls.append(signed_url)
         
         # 使用公共URL调用扣子智能体分析验收照片
-        analysis_result = await coze_service.analyze_acceptance_photos(request.stage, public_urls)
+        with ai_caller(user_id):
+            analysis_result = await coze_service.analyze_acceptance_photos(request.stage, public_urls, user_id)
         
         if not analysis_result:
             # 如果扣子智能体分析失败，生成模拟数据，避免页面完全无数据
@@ -250,6 +246,12 @@ async def analyze_acceptance(
         )
     except HTTPException:
         raise
+    except AIUpstreamBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI分析排队中，请稍后重试",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         logger.error(f"验收分析失败: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="分析失败")
@@ -359,33 +361,34 @@ async def mark_acceptance_rectify(
 
 async def _run_recheck_analysis(analysis_id: int, rectified_urls: list):
     """后台任务：对整改照片进行 AI 复检分析，更新验收记录；复检3次后仍不合格则自动置阶段为 rectify_exhausted 以允许进入下一阶段"""
-    from app.services.oss_service import oss_service
     from app.services.coze_service import coze_service
     from app.models import Construction
     import copy
     try:
-        async with AsyncSessionLocal() as db:
+        # 数据库阶段只读取记录；签名与AI分析期间不占用连接
+        async with with_session(commit=False) as db:
             result = await db.execute(
-                select(AcceptanceAnalysis).where(AcceptanceAnalysis.id == analysis_id)
+                select(AcceptanceAnalysis.stage, AcceptanceAnalysis.user_id)
+                .where(AcceptanceAnalysis.id == analysis_id)
             )
-            record = result.scalar_one_or_none()
-            if not record or not rectified_urls:
-                return
-            stage = record.stage or "plumbing"
-            
-            # 复检分析重构：使用扣子智能体直接分析整改照片
-            # 生成签名URL列表供扣子智能体访问
-            signed_urls = []
-            for url_or_key in rectified_urls[:5]:
-                try:
-                    fetch_url = oss_service.sign_url_for_key(url_or_key, expires=3600) if not (url_or_key or "").startswith("http") else url_or_key
-                    signed_urls.append(fetch_url)
-                except Exception:
-                    # 如果生成签名URL失败，使用原始URL
-                    signed_urls.append(url_or_key)
-            
+            row = result.first()
+        if not row or not rectified_urls:
+            return
+        stage = row.stage or "plumbing"
+        owner_id = row.user_id
+
+        # 复检分析重构：使用扣子智能体直接分析整改照片
+        # 生成签名URL列表供扣子智能体访问
+        # 签名失败时使用原始URL
+        signed_map = await async_oss_service.sign_urls(rectified_urls[:5], expires=3600)
+        signed_urls = [signed_map.get(u, u) for u in rectified_urls[:5]]
+
         # 调用扣子智能体分析整改照片
-        analysis_result = await coze_service.analyze_acceptance_photos(stage, signed_urls)
+        try:
+            with ai_caller(owner_id, background=True):
+                analysis_result = await coze_service.analyze_acceptance_photos(stage, signed_urls, owner_id)
+        except AIUpstreamBusy:
+            analysis_result = None
         
         if not analysis_result:
             # 如果扣子智能体分析失败，返回错误信息，而不是生成假数据
@@ -441,34 +444,39 @@ async def _run_recheck_analysis(analysis_id: int, rectified_urls: list):
         if not issues and passed_items:
             issues.append(f"通过项目: {', '.join(passed_items[:3])}")
             
-        record.result_json = analysis_result
-        record.issues = issues
-        record.suggestions = suggestions
-        record.severity = severity
-        record.result_status = result_status
-        
-        await db.commit()
-        await db.refresh(record)
-        recheck_count = getattr(record, "recheck_count", 0) or 0
-        if recheck_count >= RECHECK_MAX_COUNT and result_status == "need_rectify":
-            stage_s = _ACCEPTANCE_STAGE_TO_S.get(stage, stage) if stage else "S01"
-            const_res = await db.execute(select(Construction).where(Construction.user_id == record.user_id))
-            construction = const_res.scalar_one_or_none()
-            if construction and construction.stages:
-                stages_raw = construction.stages if isinstance(construction.stages, dict) else {}
-                if isinstance(construction.stages, str):
-                    import json
-                    try:
-                        stages_raw = json.loads(construction.stages)
-                    except Exception:
-                        stages_raw = {}
-                stages = copy.deepcopy(stages_raw)
-                if stage_s in stages and isinstance(stages[stage_s], dict):
-                    stages[stage_s]["status"] = "rectify_exhausted"
-                    construction.stages = stages
-                    flag_modified(construction, "stages")
-                    await db.commit()
-                    logger.info(f"复检次数已用完且未通过: analysis_id={analysis_id}, 阶段{stage_s}置为rectify_exhausted")
+        async with with_session() as db:
+            record = await db.get(AcceptanceAnalysis, analysis_id)
+            if not record:
+                return
+            record.result_json = analysis_result
+            record.issues = issues
+            record.suggestions = suggestions
+            record.severity = severity
+            record.result_status = result_status
+        
+            await db.commit()
+            await db.refresh(record)
+            recheck_count = getattr(record, "recheck_count", 0) or 0
+            if recheck_count >= RECHECK_MAX_COUNT and result_status == "need_rectify":
+                stage_s = _ACCEPTANCE_STAGE_TO_S.get(stage, stage) if stage else "S01"
+                const_res = await db.execute(select(Construction).where(Construction.user_id == record.user_id))
+                construction = const_res.scalar_one_or_none()
+                if construction and construction.stages:
+                    stages_raw = construction.stages if isinstance(construction.stages, dict) else {}
+                    if isinstance(construction.stages, str):
+                        import json
+                        try:
+                            stages_raw = json.loads(construction.stages)
+                        except Exception:
+                            stages_raw = {}
+                    stages = copy.deepcopy(stages_raw)
+                    if stage_s in stages and isinstance(stages[stage_s], dict):
+                        stages[stage_s]["status"] = "rectify_exhausted"
+                        construction.stages = stages
+                        flag_modified(construction, "stages")
+                        await materialize_reminders(db, record.user_id)
+                        await db.commit()
+                        logger.info(f"复检次数已用完且未通过: analysis_id={analysis_id}, 阶段{stage_s}置为rectify_exhausted")
         logger.info(f"复检分析完成: analysis_id={analysis_id}, result_status={result_status}")
     except Exception as e:
         logger.error(f"复检分析失败: analysis_id={analysis_id}, err={e}", exc_info=True)
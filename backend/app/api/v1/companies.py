@@ -7,10 +7,14 @@
 from typing import Optional, List
 import logging
 
-from app.core.database import get_db, AsyncSessionLocal
+from app.core.database import get_db, release_connection, with_session
 from app.core.security import get_user_id
+from app.core.config import settings
 from app.models import CompanyScan, User, Quote, Contract
 from app.services.juhecha_service import juhecha_service
+from app.services.company_intel_cache import company_intel_cache
+from app.services.company_name_index import company_name_index
+from app.services.job_queue import register_job, enqueue_job
 from app.schemas import (
     CompanyScanRequest, CompanyScanResponse, ApiResponse, RiskLevel, ScanStatus
 )
@@ -19,7 +23,50 @@
 logger = logging.getLogger(__name__)
 
 
-async def analyze_company_background(company_scan_id: int, company_name: str, db: AsyncSession):
+COMPANY_ANALYSIS_JOB = "company_analysis"
+
+
+async def _find_recent_company_result(db: AsyncSession, company_name: str):
+    """
+    查找最近30天内相同公司已完成的检测记录（公司情报缓存不可用时的降级）
+
+    Returns:
+        (综合分析结果或None, 是否命中)
+    """
+    from datetime import datetime, timedelta
+    from sqlalchemy import and_
+    
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    
+    cache_result = await db.execute(
+        select(CompanyScan)
+        .where(
+            and_(
+                CompanyScan.company_name == company_name,
+                CompanyScan.status == "completed",
+                CompanyScan.created_at >= thirty_days_ago
+            )
+        )
+        .order_by(CompanyScan.created_at.desc())
+        .limit(1)
+    )
+    cached_scan = cache_result.scalar_one_or_none()
+    if not (cached_scan and cached_scan.company_info and cached_scan.legal_risks):
+        return None, False
+    
+    # 从缓存记录构建分析结果
+    return {
+        "enterprise_info": cached_scan.company_info or {},
+        "legal_analysis": {
+            "legal_case_count": cached_scan.legal_risks.get("legal_case_count", 0),
+            "decoration_related_cases": cached_scan.legal_risks.get("decoration_related_cases", 0),
+            "recent_cases": cached_scan.legal_risks.get("legal_cases", []),
+            "case_types": cached_scan.legal_risks.get("case_types", [])
+        }
+    }, True
+
+
+async def analyze_company_background(company_scan_id: int, company_name: str, db: AsyncSession, reraise: bool = False):
     """
     后台任务：分析公司信息（使用聚合数据API，支持缓存）
     只返回原始数据，不做风险评价
@@ -28,62 +75,33 @@ async def analyze_company_background(company_scan_id: int, company_name: str, db
         company_scan_id: 扫描记录ID
         company_name: 公司名称
         db: 数据库会话
+        reraise: 异常时是否向上抛出（任务队列据此重试，由死信回调标记失败）
     """
     try:
         logger.info(f"开始分析公司信息: {company_name}")
 
-        # 1. 先检查是否已经有其他用户扫描过这个公司（缓存机制）
-        # 查找最近30天内完成的相同公司扫描记录
-        from datetime import datetime, timedelta
-        from sqlalchemy import and_
-        
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        
-        cache_result = await db.execute(
-            select(CompanyScan)
-            .where(
-                and_(
-                    CompanyScan.company_name == company_name,
-                    CompanyScan.status == "completed",
-                    CompanyScan.created_at >= thirty_days_ago
-                )
-            )
-            .order_by(CompanyScan.created_at.desc())
-            .limit(1)
-        )
-        cached_scan = cache_result.scalar_one_or_none()
-        
-        comprehensive_result = None
-        use_cache = False
-        
-        if cached_scan and cached_scan.company_info and cached_scan.legal_risks:
-            # 使用缓存的数据
-            logger.info(f"使用缓存的公司分析数据: {company_name}")
-            use_cache = True
-            
-            # 从缓存记录构建分析结果
-            comprehensive_result = {
-                "enterprise_info": cached_scan.company_info or {},
-                "legal_analysis": {
-                    "legal_case_count": cached_scan.legal_risks.get("legal_case_count", 0),
-                    "decoration_related_cases": cached_scan.legal_risks.get("decoration_related_cases", 0),
-                    "recent_cases": cached_scan.legal_risks.get("legal_cases", []),
-                    "case_types": cached_scan.legal_risks.get("case_types", [])
-                }
-            }
+        # 1. 公司情报缓存：多个用户检测同一公司时共享上游结果，未命中时全集群只有一个上游请求
+        if company_intel_cache.available:
+            comprehensive_result, use_cache = await company_intel_cache.get_comprehensive(company_name)
         else:
-            # 没有缓存，调用聚合数据API
-            logger.info(f"调用聚合数据API分析公司: {company_name}")
-            comprehensive_result = await juhecha_service.analyze_company_comprehensive(company_name)
+            # Redis不可用：沿用最近30天内其他用户已完成的检测记录
+            comprehensive_result, use_cache = await _find_recent_company_result(db, company_name)
+            # 上游查询期间不占用数据库连接
+            await release_connection(db)
+            if not comprehensive_result:
+                logger.info(f"调用聚合数据API分析公司: {company_name}")
+                comprehensive_result = await juhecha_service.analyze_company_comprehensive(company_name)
+        if use_cache:
+            logger.info(f"使用缓存的公司分析数据: {company_name}")
         
         if not comprehensive_result:
             raise Exception("公司分析失败，无法获取分析结果")
         
         # 获取企业信息
-        enterprise_info = comprehensive_result.get("enterprise_info", {})
+        enterprise_info = comprehensive_result.get("enterprise_info") or {}
         
         # 获取法律分析结果
-        legal_analysis = comprehensive_result.get("legal_analysis", {})
+        legal_analysis = comprehensive_result.get("legal_analysis") or {}
         
         # 更新数据库
         result = await db.execute(select(CompanyScan).where(CompanyScan.id == company_scan_id))
@@ -118,6 +136,7 @@ async def analyze_company_background(company_scan_id: int, company_name: str, db
 
             await db.commit()
             logger.info(f"公司信息分析完成: {company_name}")
+            await company_name_index.publish([company_name, enterprise_info.get("name") or ""])
             if enterprise_info:
                 logger.info(f"企业信息: {enterprise_info.get('name', '未知')}, 成立时间: {enterprise_info.get('start_date', '未知')}")
             else:
@@ -128,40 +147,40 @@ async def analyze_company_background(company_scan_id: int, company_name: str, db
 
             # P1 首次免费：若用户无任何已解锁报告（报价/合同/公司），则本条公司检测自动免费解锁
             try:
-                async with AsyncSessionLocal() as new_db:
-                    r = await new_db.execute(select(CompanyScan).where(CompanyScan.id == company_scan_id))
-                    cs = r.scalar_one_or_none()
-                    if cs:
-                        uid = cs.user_id
-                        has_quote = await new_db.execute(
-                            select(Quote.id).where(Quote.user_id == uid, Quote.is_unlocked == True).limit(1)
-                        )
-                        has_contract = await new_db.execute(
-                            select(Contract.id).where(Contract.user_id == uid, Contract.is_unlocked == True).limit(1)
-                        )
-                        has_other_company = await new_db.execute(
-                            select(CompanyScan.id).where(
-                                CompanyScan.user_id == uid,
-                                CompanyScan.is_unlocked == True,
-                                CompanyScan.id != company_scan_id,
-                            ).limit(1)
-                        )
-                        if (
-                            not has_quote.scalar_one_or_none()
-                            and not has_contract.scalar_one_or_none()
-                            and not has_other_company.scalar_one_or_none()
-                        ):
-                            cs.is_unlocked = True
-                            cs.unlock_type = "first_free"
-                            await new_db.commit()
-                            logger.info(f"首次报告免费解锁: 公司检测 {company_scan_id}, 用户 {uid}")
+                # 沿用当前会话（上面的提交已结束事务），不再另开会话
+                uid = company_scan.user_id
+                has_quote = await db.execute(
+                    select(Quote.id).where(Quote.user_id == uid, Quote.is_unlocked == True).limit(1)
+                )
+                has_contract = await db.execute(
+                    select(Contract.id).where(Contract.user_id == uid, Contract.is_unlocked == True).limit(1)
+                )
+                has_other_company = await db.execute(
+                    select(CompanyScan.id).where(
+                        CompanyScan.user_id == uid,
+                        CompanyScan.is_unlocked == True,
+                        CompanyScan.id != company_scan_id,
+                    ).limit(1)
+                )
+                if (
+                    not has_quote.scalar_one_or_none()
+                    and not has_contract.scalar_one_or_none()
+                    and not has_other_company.scalar_one_or_none()
+                ):
+                    company_scan.is_unlocked = True
+                    company_scan.unlock_type = "first_free"
+                    logger.info(f"首次报告免费解锁: 公司检测 {company_scan_id}, 用户 {uid}")
+                await db.commit()
             except Exception as e:
+                await db.rollback()
                 logger.warning(f"公司检测首次免费逻辑执行失败: {e}")
         else:
             logger.error(f"公司扫描记录不存在: {company_scan_id}")
 
     except Exception as e:
         logger.error(f"公司信息分析失败: {e}", exc_info=True)
+        if reraise:
+            raise
 
         # 更新为失败状态
         try:
@@ -175,56 +194,63 @@ async def analyze_company_background(company_scan_id: int, company_name: str, db
             pass
 
 
+async def mark_company_scan_failed(payload: dict, error: str):
+    """任务重试耗尽：标记公司检测失败"""
+    async with with_session() as db:
+        result = await db.execute(select(CompanyScan).where(CompanyScan.id == payload["company_scan_id"]))
+        company_scan = result.scalar_one_or_none()
+        if company_scan and company_scan.status != "completed":
+            company_scan.status = "failed"
+            company_scan.error_message = error
+            await db.commit()
+
+
+@register_job(COMPANY_ANALYSIS_JOB, concurrency=settings.JOB_COMPANY_CONCURRENCY, on_dead=mark_company_scan_failed)
+async def run_company_analysis_job(payload: dict):
+    """任务队列入口：使用独立数据库会话分析公司信息"""
+    async with with_session() as db:
+        await analyze_company_background(payload["company_scan_id"], payload["company_name"], db, reraise=True)
+
+
 @router.get("/search")
 async def search_companies(
-    q: str = Query(..., min_length=3, max_length=100),
+    q: str = Query(..., min_length=2, max_length=100),
     limit: int = Query(5, ge=1, le=10),
     user_id: int = 0,
     db: AsyncSession = Depends(get_db)
 ):
     """
     公司名称模糊搜索（PRD FR-012）
-    输入≥3字符时返回匹配建议，使用聚合数据企业工商信息API
+    优先使用本地公司名称索引联想；本地结果不足且输入≥3字符时，再调用聚合数据企业工商信息API，
+    上游返回的公司名加入索引供后续联想
     """
     keyword = q.strip()
-    if len(keyword) < 3:
+    if len(keyword) < 2:
         return ApiResponse(code=0, msg="success", data={"list": []})
 
-    results = []
+    # 1. 本地联想索引
+    await company_name_index.ensure_loaded()
+    names = company_name_index.search(keyword, limit)
+    if len(names) >= limit or len(keyword) < 3:
+        return ApiResponse(code=0, msg="success", data={"list": [{"name": n} for n in names]})
+
+    # 2. 本地结果不足：使用聚合数据企业工商信息API搜索
     try:
-        # 1. 使用聚合数据企业工商信息API搜索
-        logger.info(f"搜索公司（真实数据）: {keyword}, limit: {limit}")
+        logger.info(f"搜索公司（真实数据）: {keyword}, limit: {limit}, 本地命中: {len(names)}")
         enterprise_result = await juhecha_service.search_enterprise_info(keyword, limit)
         logger.info(f"聚合数据API返回真实结果数量: {len(enterprise_result) if enterprise_result else 0}")
         if enterprise_result:
-            results = [{"name": r["name"]} for r in enterprise_result if r.get("name")]
-            logger.info(f"处理后结果数量: {len(results)}")
+            upstream_names = [r["name"] for r in enterprise_result if r.get("name")]
+            await company_name_index.publish(upstream_names)
+            seen = set(names)
+            for n in upstream_names:
+                if n not in seen:
+                    names.append(n)
+                    seen.add(n)
     except Exception as e:
         logger.error(f"聚合数据企业搜索失败: {e}", exc_info=True)
 
-    # 2. 本地 company_scans 表模糊匹配补充（仅当有用户ID时）
-    if len(results) < limit and user_id:
-        try:
-            from sqlalchemy import or_
-            stmt = (
-                select(CompanyScan.company_name)
-                .where(CompanyScan.company_name.ilike(f"%{keyword}%"))
-                .distinct()
-                .limit(limit - len(results))
-            )
-            if user_id:
-                stmt = stmt.where(CompanyScan.user_id == user_id)
-            r = await db.execute(stmt)
-            local_names = [row[0] for row in r.all()]
-            seen = {x["name"] for x in results}
-            for n in local_names:
-                if n not in seen and len(results) < limit:
-                    results.append({"name": n})
-                    seen.add(n)
-        except Exception as e:
-            logger.debug(f"本地搜索失败: {e}")
-
-    return ApiResponse(code=0, msg="success", data={"list": results[:limit]})
+    return ApiResponse(code=0, msg="success", data={"list": [{"name": n} for n in names[:limit]]})
 
 
 @router.post("/scan", response_model=CompanyScanResponse)
@@ -258,12 +284,11 @@ async def scan_company(
         await db.commit()
         await db.refresh(company_scan)
 
-        # 启动后台分析任务
-        background_tasks.add_task(
-            analyze_company_background,
-            company_scan.id,
-            request.company_name,
-            db
+        # 分析任务入队，由独立worker执行
+        await enqueue_job(
+            COMPANY_ANALYSIS_JOB,
+            {"company_scan_id": company_scan.id, "company_name": request.company_name},
+            background_tasks,
         )
 
         logger.info(f"公司扫描任务已创建: {request.company_name}, ID: {company_scan.id}")
@@ -13,7 +13,7 @@
 from app.models import ConstructionPhoto
 from app.schemas import ApiResponse
 from app.api.v1.quotes import upload_file_to_oss
-from app.services.oss_service import oss_service
+from app.services.oss_service import async_oss_service
 
 router = APIRouter(prefix="/construction-photos", tags=["施工照片"])
 import logging
@@ -107,7 +107,7 @@ async def upload_photo(
             ext = "jpg"
 
         # 上传到OSS（统一使用OSS服务，施工照片使用照片bucket，生命周期1年）
-        file_url = upload_file_to_oss(file, "construction", user_id, is_photo=True)
+        file_url = await upload_file_to_oss(file, "construction", user_id, is_photo=True)
         photo = ConstructionPhoto(
             user_id=user_id,
             stage=stage,
@@ -154,17 +154,13 @@ async def list_photos(
         result = await db.execute(stmt)
         photos = result.scalars().all()
 
+        # 批量生成签名URL供前端预览使用（跨请求缓存，失败时回退到原始URL）
+        signed_map = await async_oss_service.sign_urls([p.file_url for p in photos if p.file_url], expires=3600)
+
         by_stage = {}
         photo_list = []
         for p in photos:
-            # 生成签名URL供前端预览使用
-            signed_url = None
-            if p.file_url:
-                try:
-                    signed_url = oss_service.sign_url_for_key(p.file_url, expires=3600)
-                except Exception as e:
-                    logger.warning(f"生成签名URL失败: {p.file_url}, 错误: {e}")
-                    signed_url = p.file_url  # 回退到原始URL
+            signed_url = signed_map.get(p.file_url) if p.file_url else None
             
             if p.stage not in by_stage:
                 by_stage[p.stage] = []
@@ -13,7 +13,8 @@
 from app.core.database import get_db
 from app.core.security import get_user_id
 from app.core.config import settings
-from app.models import Construction, UserSetting
+from app.models import Construction, ReminderEvent
+from app.services.construction_reminders import materialize_reminders
 from app.schemas import (
     StartDateRequest, UpdateStageStatusRequest, CalibrateStageRequest,
     ConstructionResponse, ApiResponse
@@ -277,6 +278,7 @@ async def set_start_date(
         construction.progress_percentage = 0
         construction.is_delayed = False
         construction.delay_days = 0
+        await materialize_reminders(db, user_id)
         await db.commit()
         await db.refresh(construction)
 
@@ -492,6 +494,7 @@ async def update_stage_status(
         if all_done and not construction.actual_end_date:
             construction.actual_end_date = datetime.now()
 
+        await materialize_reminders(db, user_id)
         await db.commit()
         await db.refresh(construction)
         
@@ -574,6 +577,7 @@ async def calibrate_stage_time(
             stages[stage_key]["acceptance_date"] = request.manual_acceptance_date
 
         construction.stages = stages
+        await materialize_reminders(db, user_id)
         await db.commit()
         await db.refresh(construction)
         return ApiResponse(code=0, msg="时间校准成功，提醒同步更新", data={"stages": _serialize_stages_with_lock(construction.stages or {})})
@@ -591,61 +595,34 @@ async def get_reminder_schedule(
     db: AsyncSession = Depends(get_db)
 ):
     """
-    获取提醒计划（FR-029/FR-030）：供定时 worker 或前端查询「某日应发送的施工/验收提醒」。
-    返回当前用户在该日应收到的阶段开始提醒、验收提醒列表。
+    获取提醒计划（FR-029/FR-030）：返回当前用户在该日应收到的阶段开始提醒、验收提醒列表。
+    提醒在进度计划/设置变化时预先生成（reminder_events），由 worker 定时发送，这里只查询
     """
     try:
         try:
             query_date = date_type.fromisoformat(date)
         except ValueError:
             raise HTTPException(status_code=400, detail="date 格式为 YYYY-MM-DD")
-        result = await db.execute(select(Construction).where(Construction.user_id == user_id))
-        construction = result.scalar_one_or_none()
-        if not construction or not construction.stages:
-            return ApiResponse(code=0, msg="success", data={"list": []})
-        settings_result = await db.execute(select(UserSetting).where(UserSetting.user_id == user_id))
-        user_setting = settings_result.scalar_one_or_none()
-        n_days = (user_setting.reminder_days_before or 3) if user_setting else 3
-        if user_setting and not user_setting.notify_progress:
-            n_days = 0
-        reminders = []
-        stages = construction.stages or {}
-        for stage_key in STAGE_ORDER:
-            s = stages.get(stage_key)
-            if not s:
-                continue
-            start_d = s.get("start_date")
-            end_d = s.get("end_date")
-            if start_d:
-                if hasattr(start_d, "date"):
-                    start_d = start_d.date()
-                elif isinstance(start_d, str):
-                    start_d = date_type.fromisoformat(start_d[:10])
-                else:
-                    continue
-                target = query_date + timedelta(days=n_days)
-                if start_d == target and (not user_setting or user_setting.notify_progress):
-                    reminders.append({
-                        "stage": stage_key,
-                        "event_type": "stage_start",
-                        "planned_date": str(start_d),
-                        "reminder_days_before": n_days,
-                    })
-            if end_d and (not user_setting or user_setting.notify_acceptance):
-                if hasattr(end_d, "date"):
-                    end_d = end_d.date()
-                elif isinstance(end_d, str):
-                    end_d = date_type.fromisoformat(end_d[:10])
-                else:
-                    continue
-                target = query_date + timedelta(days=n_days)
-                if end_d == target:
-                    reminders.append({
-                        "stage": stage_key,
-                        "event_type": "stage_acceptance",
-                        "planned_date": str(end_d),
-                        "reminder_days_before": n_days,
-                    })
+        day_start = datetime.combine(query_date, datetime.min.time())
+        result = await db.execute(
+            select(ReminderEvent)
+            .where(
+                ReminderEvent.user_id == user_id,
+                ReminderEvent.remind_at >= day_start,
+                ReminderEvent.remind_at < day_start + timedelta(days=1),
+            )
+            .order_by(ReminderEvent.remind_at, ReminderEvent.id)
+        )
+        reminders = [
+            {
+                "stage": e.stage,
+                "event_type": e.event_type,
+                "planned_date": str(e.planned_date),
+                "reminder_days_before": e.reminder_days_before,
+                "status": e.status,
+            }
+            for e in result.scalars().all()
+        ]
         return ApiResponse(code=0, msg="success", data={"list": reminders, "date": date})
     except HTTPException:
         raise
@@ -665,6 +642,8 @@ async def reset_schedule(
         construction = result.scalar_one_or_none()
         if construction:
             await db.delete(construction)
+            await db.flush()
+            await materialize_reminders(db, user_id)
             await db.commit()
         return ApiResponse(code=0, msg="重置成功", data=None)
     except Exception as e:
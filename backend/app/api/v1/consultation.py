@@ -12,6 +12,7 @@
 from app.core.database import get_db
 from app.core.security import get_user_id
 from app.services import risk_analyzer_service
+from app.services.ai_governor import AIUpstreamBusy, ai_caller
 from app.models import (
     User,
     AcceptanceAnalysis,
@@ -232,12 +233,19 @@ async def send_message(
 
         try:
             image_urls = request.images or []
-            reply = await risk_analyzer_service.consult_acceptance(
-                user_question=request.content or "",
-                stage=stage,
-                context_summary=context_summary,
-                context_issues=context_issues,
-                image_urls=image_urls,
+            with ai_caller(user_id):
+                reply = await risk_analyzer_service.consult_acceptance(
+                    user_question=request.content or "",
+                    stage=stage,
+                    context_summary=context_summary,
+                    context_issues=context_issues,
+                    image_urls=image_urls,
+                )
+        except AIUpstreamBusy as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="AI分析排队中，请稍后重试",
+                headers={"Retry-After": str(e.retry_after)},
             )
         except Exception as e:
             logger.error(f"AI监理咨询失败: {e}", exc_info=True)
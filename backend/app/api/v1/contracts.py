@@ -3,16 +3,24 @@
 """
 from typing import Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import logging
 
-from app.core.database import get_db
+from app.core.database import get_db, AsyncSessionLocal, with_session
 from app.core.security import get_user_id
 from app.core.config import settings
 from app.models import Contract, User
 from app.services import send_progress_reminder
 from app.services.message_service import create_message
+from app.services.job_queue import register_job, enqueue_job
+from app.services.ai_governor import ai_caller
+from app.services.upload_dedup import MATCH_EXACT, apply_reused_result, find_reusable_result, fingerprint_upload
+from app.services.analysis_progress import (
+    SSE_HEADERS, AnalysisProgressReporter, get_latest_progress, progress_events,
+    publish_progress, report_progress,
+)
 from app.schemas import (
     ContractUploadRequest, ContractUploadResponse, ContractAnalysisResponse, ApiResponse
 )
@@ -22,7 +30,10 @@
 logger = logging.getLogger(__name__)
 
 
-async def analyze_contract_background_with_coze_result(contract_id: int, coze_result: Dict[str, Any], ocr_text: str, db: AsyncSession):
+CONTRACT_ANALYSIS_JOB = "contract_analysis"
+
+
+async def analyze_contract_background_with_coze_result(contract_id: int, coze_result: Dict[str, Any], ocr_text: str, db: AsyncSession, reraise: bool = False):
     """
     后台任务：使用扣子智能体结果更新合同分析
 
@@ -31,6 +42,7 @@ async def analyze_contract_background_with_coze_result(contract_id: int, coze_re
         coze_result: 扣子智能体返回的分析结果
         ocr_text: OCR识别的文本
         db: 数据库会话
+        reraise: 异常时是否向上抛出（任务队列据此重试，由死信回调标记失败）
     """
     try:
         logger.info(f"开始更新合同分析结果: {contract_id}")
@@ -43,9 +55,8 @@ async def analyze_contract_background_with_coze_result(contract_id: int, coze_re
             logger.error(f"合同不存在: {contract_id}")
             return
 
-        # V2.6.2优化：更新分析进度
-        contract.analysis_progress = {"step": "generating", "progress": 90, "message": "生成报告中..."}
-        await db.commit()
+        # V2.6.2优化：更新分析进度（中间进度走Redis推送，不写库）
+        await report_progress(Contract, contract_id, {"step": "generating", "progress": 90, "message": "生成报告中..."})
 
         # 根据用户要求：前端必须原样展示AI智能体返回的数据
         # 直接使用扣子智能体返回的结果，不进行格式转换
@@ -141,6 +152,7 @@ async def analyze_contract_background_with_coze_result(contract_id: int, coze_re
             link_url=f"/pages/report-detail/index?type=contract&scanId={contract_id}&name={url_quote(_name)}",
         )
         await db.commit()
+        await publish_progress(Contract, contract_id, contract.analysis_progress)
         logger.info(f"合同分析完成: {contract_id}, 风险等级: {contract.risk_level}")
         # 发送小程序订阅消息「报告生成通知」
         try:
@@ -160,17 +172,89 @@ async def analyze_contract_background_with_coze_result(contract_id: int, coze_re
 
     except Exception as e:
         logger.error(f"合同分析结果更新失败: {e}", exc_info=True)
+        if reraise:
+            raise
 
         try:
             result = await db.execute(select(Contract).where(Contract.id == contract_id))
             contract = result.scalar_one_or_none()
             if contract:
                 contract.status = "failed"
+                contract.analysis_progress = {"step": "failed", "progress": 0, "message": "分析过程异常"}
                 await db.commit()
+                await publish_progress(Contract, contract_id, contract.analysis_progress)
         except:
             pass
 
 
+def extract_contract_ocr_text(analysis_result: Dict[str, Any]) -> str:
+    """从扣子智能体结果中提取OCR文本（如果存在）"""
+    if "raw_text" in analysis_result:
+        return analysis_result["raw_text"]
+    if "ocr_text" in analysis_result:
+        return analysis_result["ocr_text"]
+    if "summary" in analysis_result:
+        return analysis_result["summary"]
+    return "合同文本内容"
+
+
+async def mark_contract_failed(payload: dict, error: str):
+    """任务重试耗尽：标记合同分析失败"""
+    async with with_session() as db:
+        result = await db.execute(select(Contract).where(Contract.id == payload["contract_id"]))
+        contract = result.scalar_one_or_none()
+        if contract and contract.status != "completed":
+            contract.status = "failed"
+            contract.analysis_progress = {"step": "failed", "progress": 0, "message": "分析过程异常"}
+            await db.commit()
+            await publish_progress(Contract, contract.id, contract.analysis_progress)
+
+
+@register_job(CONTRACT_ANALYSIS_JOB, concurrency=settings.JOB_CONTRACT_CONCURRENCY, on_dead=mark_contract_failed)
+async def run_contract_analysis_job(payload: dict):
+    """
+    任务队列入口：调用扣子智能体分析合同并写入结果
+
+    扣子调用（最长约120秒）在worker中执行，不再占用上传请求
+    """
+    contract_id = payload["contract_id"]
+    from app.services.coze_service import coze_service
+    from app.services.oss_service import oss_service
+
+    # 直接使用OSS签名URL调用扣子智能体分析合同
+    # 扣子智能体支持直接访问URL，无需Base64编码
+    signed_url = oss_service.sign_url_for_key(payload["object_key"], expires=3600)
+    logger.info(f"使用签名URL调用扣子智能体分析合同: {signed_url[:100]}...")
+    reporter = AnalysisProgressReporter(Contract, contract_id, start=20)
+    with ai_caller(payload.get("user_id"), background=True):
+        analysis_result = await coze_service.analyze_contract(signed_url, payload.get("user_id"), on_progress=reporter)
+
+    async with with_session() as db:
+        if not analysis_result:
+            # 扣子智能体分析失败，根据用户要求：不要返回假数据
+            # 设置合同状态为失败，让前端显示错误信息
+            logger.error(f"扣子智能体合同分析失败，返回空结果: {contract_id}")
+            result = await db.execute(select(Contract).where(Contract.id == contract_id))
+            contract = result.scalar_one_or_none()
+            if contract:
+                contract.status = "failed"
+                contract.analysis_progress = {"step": "failed", "progress": 0, "message": "AI分析服务暂时不可用，请稍后重试"}
+                await db.commit()
+                await publish_progress(Contract, contract_id, contract.analysis_progress)
+            return
+
+        # 根据用户要求：前端必须原样展示AI智能体返回的数据
+        # 不再进行二次分析，直接使用扣子智能体返回的结果
+        logger.info(f"✅ 合同分析成功，直接使用扣子智能体返回的结果: {contract_id}")
+        await analyze_contract_background_with_coze_result(
+            contract_id,
+            analysis_result,
+            extract_contract_ocr_text(analysis_result),
+            db,
+            reraise=True,
+        )
+
+
 @router.post("/upload", response_model=ContractUploadResponse)
 async def upload_contract(
     background_tasks: BackgroundTasks,
@@ -205,28 +289,16 @@ async def upload_contract(
                 detail=f"仅支持{', '.join(settings.ALLOWED_FILE_TYPES)}格式"
             )
 
-        # 上传到OSS（统一使用OSS服务，合同也使用照片bucket，确保扣子智能体能够访问）
-        # 使用is_photo=True，确保使用照片bucket（zhuangxiu-images-photo），该bucket应该有正确的权限配置
-        object_key = upload_file_to_oss(file, "contract", user_id, is_photo=True)
-        
-        # 如果OSS配置不存在，使用Base64编码的文件内容进行OCR识别
-        ocr_input = object_key
-        if object_key.startswith("https://mock-oss.example.com"):
-            # 开发环境：将文件内容转换为Base64
-            import base64
-            file.file.seek(0)  # 重置文件指针
-            file_content = await file.read()
-            base64_str = base64.b64encode(file_content).decode("utf-8")
-            # PDF文件使用data:application/pdf;base64,前缀
-            if file_ext == "pdf":
-                ocr_input = f"data:application/pdf;base64,{base64_str}"
-            else:
-                ocr_input = f"data:image/{file_ext};base64,{base64_str}"
-            logger.info(f"使用Base64编码进行OCR识别，文件大小: {len(file_content)} bytes")
+        # 内容完全相同的已完成分析直接复用；同一用户上传时连OSS上传也省去
+        fingerprint = await fingerprint_upload(file, file_ext)
+        reused, reuse_match = await find_reusable_result(db, Contract, user_id, fingerprint)
+        if reused is not None and reuse_match == MATCH_EXACT:
+            object_key = reused.file_url
         else:
-            from app.services.oss_service import oss_service
-            ocr_input = oss_service.sign_url_for_key(object_key, expires=3600)
-
+            # 上传到OSS（统一使用OSS服务，合同也使用照片bucket，确保扣子智能体能够访问）
+            # 使用is_photo=True，确保使用照片bucket（zhuangxiu-images-photo），该bucket应该有正确的权限配置
+            object_key = await upload_file_to_oss(file, "contract", user_id, is_photo=True)
+        
         # 创建合同记录
         contract = Contract(
             user_id=user_id,
@@ -235,83 +307,25 @@ async def upload_contract(
             file_size=file.size,
             file_type=file_ext,
             status="analyzing",
-            analysis_progress={"step": "ocr", "progress": 0, "message": "正在识别文字..."}
+            content_hash=fingerprint.sha256,
+            perceptual_hash=fingerprint.phash,
+            # 文件已上传完成，直接以“分析风险”作为初始进度，省去一次更新
+            analysis_progress={"step": "analyzing", "progress": 20, "message": "正在分析风险..."}
         )
+        if reused is not None:
+            apply_reused_result(contract, reused, reuse_match)
 
         db.add(contract)
         await db.commit()
         await db.refresh(contract)
 
-        # V2.6.2优化：更新分析进度
-        contract.analysis_progress = {"step": "ocr", "progress": 20, "message": "正在识别文字..."}
-        await db.commit()
-
-        # 合同审核重构：使用扣子智能体直接分析合同文件
-        from app.services.coze_service import coze_service
-        
-        analysis_result = None
-        try:
-            # 直接使用OSS签名URL调用扣子智能体分析合同
-            # 扣子智能体支持直接访问URL，无需Base64编码
-            from app.services.oss_service import oss_service
-            signed_url = oss_service.sign_url_for_key(object_key, expires=3600)
-            
-            logger.info(f"使用签名URL调用扣子智能体分析合同: {signed_url[:100]}...")
-            
-            # 使用签名URL调用扣子智能体
-            analysis_result = await coze_service.analyze_contract(signed_url, user_id)
-            
-            if analysis_result:
-                logger.info("✅ 合同分析成功")
-            else:
-                logger.error("❌ 合同分析返回空结果")
-                    
-        except Exception as error:
-            logger.error(f"合同分析失败: {error}", exc_info=True)
-            analysis_result = None
-        
-        if not analysis_result:
-            # 扣子智能体分析失败，根据用户要求：不要返回假数据
-            # 设置合同状态为失败，让前端显示错误信息
-            logger.error("扣子智能体合同分析失败，返回空结果")
-            contract.status = "failed"
-            contract.analysis_progress = {"step": "failed", "progress": 0, "message": "AI分析服务暂时不可用，请稍后重试"}
-            await db.commit()
-            
-            return ContractUploadResponse(
-                task_id=contract.id,
-                file_name=contract.file_name,
-                file_type=contract.file_type,
-                status=contract.status
+        # 合同审核重构：扣子智能体分析由任务队列执行，上传接口立即返回
+        if reused is None:
+            await enqueue_job(
+                CONTRACT_ANALYSIS_JOB,
+                {"contract_id": contract.id, "object_key": object_key, "user_id": user_id},
+                background_tasks,
             )
-        
-        # 根据用户要求：前端必须原样展示AI智能体返回的数据
-        # 不再进行二次分析，直接使用扣子智能体返回的结果
-        logger.info("直接使用扣子智能体返回的合同分析结果，不进行二次分析")
-        
-        # 提取OCR文本（如果存在）
-        ocr_text = ""
-        if "raw_text" in analysis_result:
-            ocr_text = analysis_result["raw_text"]
-        elif "ocr_text" in analysis_result:
-            ocr_text = analysis_result["ocr_text"]
-        elif "summary" in analysis_result:
-            ocr_text = analysis_result["summary"]
-        else:
-            ocr_text = "合同文本内容"
-        
-        # V2.6.2优化：更新分析进度
-        contract.analysis_progress = {"step": "analyzing", "progress": 50, "message": "正在分析风险..."}
-        await db.commit()
-
-        # 启动后台分析任务，直接使用扣子智能体的结果
-        background_tasks.add_task(
-            analyze_contract_background_with_coze_result,
-            contract.id,
-            analysis_result,
-            ocr_text,
-            db
-        )
 
         logger.info(f"合同上传成功: {file.filename}, ID: {contract.id}")
 
@@ -419,6 +433,7 @@ async def get_contract_analysis(
         
         # 构建预览数据（用于解锁页面展示）
         preview_data = None
+        analysis_progress = contract.analysis_progress
         if contract.status == "completed" and contract.result_json:
             # 从分析结果中提取预览数据
             preview_data = {
@@ -436,11 +451,12 @@ async def get_contract_analysis(
                 }
             }
         elif contract.status == "analyzing":
-            # 分析中的预览数据
+            # 分析中的预览数据（中间进度只在Redis中，优先读取最新进度）
+            analysis_progress = await get_latest_progress(Contract, contract_id) or analysis_progress
             preview_data = {
                 "analysis_status": "analyzing",
-                "progress_message": contract.analysis_progress.get("message", "正在分析中...") if contract.analysis_progress else "正在分析中...",
-                "progress_percentage": contract.analysis_progress.get("progress", 0) if contract.analysis_progress else 0
+                "progress_message": analysis_progress.get("message", "正在分析中...") if analysis_progress else "正在分析中...",
+                "progress_percentage": analysis_progress.get("progress", 0) if analysis_progress else 0
             }
         
         # 映射风险等级到正确的枚举值
@@ -461,7 +477,7 @@ async def get_contract_analysis(
             is_unlocked=contract.is_unlocked,
             created_at=contract.created_at,
             # V2.6.2优化：返回分析进度
-            analysis_progress=contract.analysis_progress or {"step": "pending", "progress": 0, "message": "等待分析"},
+            analysis_progress=analysis_progress or {"step": "pending", "progress": 0, "message": "等待分析"},
             # 返回AI分析完整结果（失败或兜底时不返回假数据）
             result_json=result_json,
             # 返回OCR识别结果
@@ -480,6 +496,40 @@ async def get_contract_analysis(
         )
 
 
+@router.get("/contract/{contract_id}/progress")
+async def stream_contract_progress(
+    contract_id: int,
+    user_id: int = Depends(get_user_id)
+):
+    """
+    合同分析进度推送（SSE），替代轮询 /contract/{contract_id}
+
+    连接建立后先推送当前进度，之后每次进度更新推送一条 progress 事件，分析完成或失败后关闭连接
+
+    Args:
+        contract_id: 合同ID
+        user_id: 用户ID
+
+    Returns:
+        text/event-stream 响应
+    """
+    # 不使用 get_db 依赖：依赖的会话要到响应结束才释放，推送期间会一直占用连接
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Contract.status, Contract.analysis_progress)
+            .where(Contract.id == contract_id, Contract.user_id == user_id)
+        )
+        row = result.first()
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="合同不存在")
+
+    return StreamingResponse(
+        progress_events(Contract, contract_id, row.status, row.analysis_progress),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
 @router.get("/list")
 async def list_contracts(
     user_id: int = Depends(get_user_id),
@@ -14,7 +14,8 @@
 
 from app.core.database import get_db
 from app.services.risk_analyzer import risk_analyzer_service
-from app.services.oss_service import oss_service
+from app.services.ai_governor import AIUpstreamBusy, ai_caller
+from app.services.oss_service import async_oss_service
 from app.core.security import get_current_user
 from app.core.config import settings
 
@@ -135,10 +136,11 @@ async def create_chat_session(
             ))
             
             # 获取AI回答
-            answer = await risk_analyzer_service.consult_designer(
-                user_question=request.initial_question,
-                context=""
-            )
+            with ai_caller(user_id):
+                answer = await risk_analyzer_service.consult_designer(
+                    user_question=request.initial_question,
+                    context=""
+                )
             
             if answer:
                 messages.append(Message(
@@ -182,6 +184,12 @@ async def create_chat_session(
         
     except HTTPException:
         raise
+    except AIUpstreamBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI设计师排队中，请稍后重试",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         logger.error(f"创建聊天session失败: {e}", exc_info=True)
         raise HTTPException(
@@ -259,11 +267,12 @@ async def send_chat_message(
             user_question += f"\n\n用户上传了{len(request.image_urls)}张图片，请基于图片内容进行分析。"
         
         # 调用AI设计师智能体（传入对话历史作为上下文）
-        answer = await risk_analyzer_service.consult_designer(
-            user_question=user_question,
-            context=conversation_history,
-            image_urls=request.image_urls
-        )
+        with ai_caller(user_id):
+            answer = await risk_analyzer_service.consult_designer(
+                user_question=user_question,
+                context=conversation_history,
+                image_urls=request.image_urls
+            )
         
         if not answer:
             raise HTTPException(
@@ -297,6 +306,12 @@ async def send_chat_message(
         
     except HTTPException:
         raise
+    except AIUpstreamBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI设计师排队中，请稍后重试",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         logger.error(f"发送聊天消息失败: {e}", exc_info=True)
         raise HTTPException(
@@ -537,10 +552,11 @@ async def consult_designer_legacy(
         logger.info(f"AI设计师单次咨询请求: user_id={current_user.get('user_id')}, question={request.question[:100]}...")
         
         # 调用AI设计师智能体
-        answer = await risk_analyzer_service.consult_designer(
-            user_question=request.question,
-            context=request.context or ""
-        )
+        with ai_caller(current_user.get("user_id")):
+            answer = await risk_analyzer_service.consult_designer(
+                user_question=request.question,
+                context=request.context or ""
+            )
         
         if not answer:
             raise HTTPException(
@@ -552,6 +568,12 @@ async def consult_designer_legacy(
         
     except HTTPException:
         raise
+    except AIUpstreamBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI设计师排队中，请稍后重试",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         logger.error(f"AI设计师单次咨询失败: {e}", exc_info=True)
         raise HTTPException(
@@ -598,7 +620,7 @@ async def upload_designer_image(
             )
         
         # 使用OSS服务的upload_upload_file方法上传文件
-        object_key = oss_service.upload_upload_file(
+        object_key = await async_oss_service.upload_upload_file(
             file=file,
             file_type="designer",
             user_id=user_id,
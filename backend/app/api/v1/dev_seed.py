@@ -19,11 +19,13 @@ class AnalyzeQuoteTextRequest(BaseModel):
     """开发环境：用文本直接调报价分析（不经过上传/OCR）"""
     text: str
     total_price: Optional[float] = None
+    use_cache: bool = True  # False 时跳过分析结果缓存
 
 
 class AnalyzeContractTextRequest(BaseModel):
     """开发环境：用文本直接调合同分析（不经过上传/OCR）"""
     text: str
+    use_cache: bool = True  # False 时跳过分析结果缓存
 
 
 @router.post("/analyze-quote-text")
@@ -35,7 +37,7 @@ async def analyze_quote_text(
     if not settings.DEBUG:
         raise HTTPException(status_code=404, detail="Not Found")
     from app.services.risk_analyzer import risk_analyzer_service
-    result = await risk_analyzer_service.analyze_quote(body.text, body.total_price)
+    result = await risk_analyzer_service.analyze_quote(body.text, body.total_price, use_cache=body.use_cache)
     return result
 
 
@@ -48,7 +50,7 @@ async def analyze_contract_text(
     if not settings.DEBUG:
         raise HTTPException(status_code=404, detail="Not Found")
     from app.services.risk_analyzer import risk_analyzer_service
-    result = await risk_analyzer_service.analyze_contract(body.text)
+    result = await risk_analyzer_service.analyze_contract(body.text, use_cache=body.use_cache)
     return result
 
 
@@ -14,6 +14,7 @@
 from app.core.database import get_db
 from app.core.security import get_user_id
 from app.models import Quote, Contract, MaterialCheck, MaterialCheckItem, Construction, ConstructionPhoto
+from app.services.construction_reminders import materialize_reminders
 from app.schemas import ApiResponse
 
 router = APIRouter(prefix="/material-checks", tags=["材料进场人工核对 P37"])
@@ -398,6 +399,7 @@ async def submit_material_check(
                     flag_modified(construction, "stages")
                 except Exception:
                     pass
+                await materialize_reminders(db, user_id)
                 await db.commit()
             else:
                 # 用户未设置开工日期：创建进度计划并以今日为开工日，S00 直接写入核对结果
@@ -414,6 +416,8 @@ async def submit_material_check(
                     progress_percentage=0,
                 )
                 db.add(construction)
+                await db.flush()
+                await materialize_reminders(db, user_id)
                 await db.commit()
         except Exception as sync_err:
             logger.warning(f"材料核对已保存，但同步施工进度 S00 失败（不影响核对记录）: {sync_err}", exc_info=True)
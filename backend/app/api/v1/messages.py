@@ -1,22 +1,32 @@
 """
 装修决策Agent - 消息中心API (P14)
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, update, delete
 import logging
+import secrets
+import uuid
 from typing import Optional
 from pydantic import BaseModel, Field
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_user_id
 from app.models import Message
 from app.schemas import ApiResponse
-from app.services.message_service import create_message
+from app.services.message_service import create_message, broadcast_message
+from app.services.unread_counter import unread_counter
+from app.services.job_queue import register_job, enqueue_job
+from app.services.redis_cache import cache
 
 router = APIRouter(prefix="/messages", tags=["消息中心"])
 logger = logging.getLogger(__name__)
 
+MESSAGE_BROADCAST_JOB = "message_broadcast"
+BROADCAST_CURSOR_TTL = 86400  # 群发断点保留时间（秒）
+MESSAGE_CATEGORIES = ("progress", "report", "system", "acceptance", "customer_service")
+
 
 class MessageCreateRequest(BaseModel):
     """创建消息（系统/业务侧写入施工提醒、报告通知等）"""
@@ -27,6 +37,11 @@ class MessageCreateRequest(BaseModel):
     link_url: Optional[str] = Field(None, max_length=512)
 
 
+class MessageBroadcastRequest(MessageCreateRequest):
+    """群发消息（系统公告等），city_code 为空时发送给全部用户"""
+    city_code: Optional[str] = Field(None, max_length=20)
+
+
 @router.get("")
 async def list_messages(
     user_id: int = Depends(get_user_id),
@@ -82,14 +97,14 @@ async def get_unread_count(
     user_id: int = Depends(get_user_id),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取未读消息数量"""
+    """获取未读消息数量（Redis计数，按分类返回）"""
     try:
-        stmt = select(func.count(Message.id)).where(
-            Message.user_id == user_id,
-            Message.is_read == False
+        by_category = await unread_counter.get_counts(db, user_id)
+        return ApiResponse(
+            code=0,
+            msg="success",
+            data={"count": sum(by_category.values()), "by_category": by_category}
         )
-        count = (await db.execute(stmt)).scalar() or 0
-        return ApiResponse(code=0, msg="success", data={"count": count})
     except Exception as e:
         logger.error(f"获取未读数失败: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="获取失败")
@@ -109,7 +124,14 @@ async def mark_read(
         msg = result.scalar_one_or_none()
         if not msg:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="消息不存在")
-        msg.is_read = True
+        # 条件更新：并发重复标记时只有一次计入未读数变化
+        marked = await db.execute(
+            update(Message)
+            .where(Message.id == msg_id, Message.user_id == user_id, Message.is_read == False)
+            .values(is_read=True)
+        )
+        if marked.rowcount:
+            unread_counter.track(db, user_id, msg.category, -1)
         await db.commit()
         return ApiResponse(code=0, msg="success", data=None)
     except HTTPException:
@@ -127,7 +149,7 @@ async def create_message_api(
 ):
     """创建一条消息（用于施工提醒、报告通知、系统通知等）"""
     try:
-        if request.category not in ("progress", "report", "system", "acceptance", "customer_service"):
+        if request.category not in MESSAGE_CATEGORIES:
             raise HTTPException(status_code=400, detail="category 无效")
         msg = await create_message(
             db, user_id,
@@ -163,6 +185,7 @@ async def mark_all_read(
             Message.is_read == False
         ).values(is_read=True)
         await db.execute(stmt)
+        unread_counter.track_reset(db, user_id)
         await db.commit()
         return ApiResponse(code=0, msg="success", data=None)
     except Exception as e:
@@ -192,7 +215,12 @@ async def delete_message(
                 detail="施工提醒/报告通知不可删除"
             )
         
-        await db.execute(delete(Message).where(Message.id == msg_id, Message.user_id == user_id))
+        deleted = await db.execute(
+            delete(Message).where(Message.id == msg_id, Message.user_id == user_id).returning(Message.is_read)
+        )
+        row = deleted.first()
+        if row is not None and row.is_read is False:
+            unread_counter.track(db, user_id, msg.category, -1)
         await db.commit()
         return ApiResponse(code=0, msg="success", data=None)
     except HTTPException:
@@ -200,3 +228,59 @@ async def delete_message(
     except Exception as e:
         logger.error(f"删除消息失败: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="操作失败")
+
+
+def _broadcast_cursor_key(broadcast_id: str) -> str:
+    return f"msg_broadcast:{broadcast_id}"
+
+
+@register_job(MESSAGE_BROADCAST_JOB, concurrency=1)
+async def run_message_broadcast_job(payload: dict):
+    """
+    任务队列入口：分批群发消息；每批提交后在 Redis 记录断点，重试时从断点继续，已发送的用户不会重复收到
+
+    Args:
+        payload: broadcast_id 与消息字段（category/title/content/summary/link_url/city_code）
+    """
+    cursor_key = _broadcast_cursor_key(payload["broadcast_id"])
+    after_user_id = 0
+    if cache.client:
+        after_user_id = int(await cache.client.get(cursor_key) or 0)
+        if after_user_id:
+            logger.info(f"群发从断点继续: {payload['broadcast_id']}, 用户ID > {after_user_id}")
+
+    async def save_cursor(last_user_id: int) -> None:
+        if cache.client:
+            await cache.client.set(cursor_key, last_user_id, ex=BROADCAST_CURSOR_TTL)
+
+    await broadcast_message(
+        category=payload["category"],
+        title=payload["title"],
+        content=payload.get("content"),
+        summary=payload.get("summary"),
+        link_url=payload.get("link_url"),
+        city_code=payload.get("city_code"),
+        after_user_id=after_user_id,
+        on_batch=save_cursor,
+    )
+
+
+@router.post("/broadcast")
+async def broadcast_message_api(
+    request: MessageBroadcastRequest,
+    background_tasks: BackgroundTasks,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """群发消息（系统公告、批量提醒），需管理令牌；入队后立即返回，由 worker 分批写入"""
+    if not settings.MESSAGE_BROADCAST_TOKEN or not x_admin_token or not secrets.compare_digest(
+        x_admin_token, settings.MESSAGE_BROADCAST_TOKEN
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="无权限")
+    if request.category not in MESSAGE_CATEGORIES:
+        raise HTTPException(status_code=400, detail="category 无效")
+
+    broadcast_id = uuid.uuid4().hex
+    payload = {"broadcast_id": broadcast_id, **request.model_dump()}
+    job_id = await enqueue_job(MESSAGE_BROADCAST_JOB, payload, background_tasks)
+    logger.info(f"群发消息已提交: {broadcast_id}, 城市: {request.city_code or '全部'}, 标题: {request.title}")
+    return ApiResponse(code=0, msg="success", data={"broadcast_id": broadcast_id, "job_id": job_id})
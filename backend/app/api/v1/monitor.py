@@ -1,7 +1,7 @@
 """
 监控API - 提供系统监控、告警和备份状态接口
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Dict, Any
 
 from app.services.monitor_service import (
@@ -15,6 +15,13 @@
     get_backup_status
 )
 from app.services.alert_service import send_alert, AlertLevel
+from app.services.job_queue import get_queue_stats
+from app.services.wechat_dispatcher import wechat_dispatcher
+from app.services.http_client import get_http_pool_stats
+from app.core.metrics import latency_metrics
+from app.services.upload_dedup import dedup_stats
+from app.services.ai_governor import ai_governor
+from app.services.analysis_cache import analysis_cache
 
 router = APIRouter()
 
@@ -73,6 +80,127 @@ async def get_system_overview_api():
         raise HTTPException(status_code=500, detail=f"获取系统概览失败: {str(e)}")
 
 
+@router.get("/jobs", response_model=Dict[str, Any])
+async def get_job_queue_status():
+    """
+    获取分析任务队列状态
+    
+    返回各任务类型的待执行、执行中、延迟重试和死信数量
+    """
+    try:
+        stats = await get_queue_stats()
+        return {
+            "code": 0,
+            "msg": "success",
+            "data": stats
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取任务队列状态失败: {str(e)}")
+
+
+@router.get("/wechat-subscribe", response_model=Dict[str, Any])
+async def get_wechat_subscribe_status():
+    """
+    获取小程序订阅消息发送队列状态
+    
+    返回待发送、等待重试和死信消息数
+    """
+    try:
+        stats = await wechat_dispatcher.get_stats()
+        return {
+            "code": 0,
+            "msg": "success",
+            "data": stats
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取订阅消息队列状态失败: {str(e)}")
+
+
+@router.get("/http-pools", response_model=Dict[str, Any])
+async def get_http_pool_status():
+    """
+    获取出站HTTP连接池状态
+    
+    返回各上游（扣子、微信、聚合数据等）连接池的已打开、使用中和等待中的连接数
+    """
+    try:
+        return {
+            "code": 0,
+            "msg": "success",
+            "data": get_http_pool_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取连接池状态失败: {str(e)}")
+
+
+@router.get("/latency", response_model=Dict[str, Any])
+async def get_latency_histograms(
+    prefix: str = Query("", description="按操作名前缀过滤，如 oss.")
+):
+    """
+    获取进程内各操作的耗时直方图（如 OSS 上传/签名/删除）
+    """
+    try:
+        return {
+            "code": 0,
+            "msg": "success",
+            "data": latency_metrics.snapshot(prefix)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取耗时统计失败: {str(e)}")
+
+
+@router.get("/upload-dedup", response_model=Dict[str, Any])
+async def get_upload_dedup_stats():
+    """
+    获取报价单/合同上传去重的命中统计（进程内）
+
+    返回各类型的查询次数、完全相同/跨用户命中次数、命中率及近似图片（未复用）次数
+    """
+    try:
+        return {
+            "code": 0,
+            "msg": "success",
+            "data": dedup_stats.snapshot()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取去重统计失败: {str(e)}")
+
+
+@router.get("/ai-governor", response_model=Dict[str, Any])
+async def get_ai_governor_stats():
+    """
+    获取AI上游各渠道的并发调控状态
+
+    返回各渠道并发/每秒上限、全局在途数、本进程排队数及排队耗时分布
+    """
+    try:
+        return {
+            "code": 0,
+            "msg": "success",
+            "data": await ai_governor.get_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取AI调控状态失败: {str(e)}")
+
+
+@router.get("/analysis-cache", response_model=Dict[str, Any])
+async def get_analysis_cache_stats():
+    """
+    获取报价单/合同文本分析结果缓存的命中统计
+
+    返回各类型命中/未命中次数、命中率及当前缓存条目数
+    """
+    try:
+        return {
+            "code": 0,
+            "msg": "success",
+            "data": await analysis_cache.get_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取分析缓存统计失败: {str(e)}")
+
+
 @router.get("/backup/status", response_model=Dict[str, Any])
 async def get_backup_status_api():
     """
@@ -14,7 +14,7 @@
 from app.core.database import get_db
 from app.core.security import get_user_id
 from app.core.config import settings
-from app.services.oss_service import oss_service
+from app.services.oss_service import oss_service, async_oss_service
 
 router = APIRouter()
 
@@ -171,7 +171,7 @@ async def test_oss_connection(
         bucket_info = None
         if oss_service.photo_bucket:
             try:
-                bucket_info = oss_service.photo_bucket.get_bucket_info()
+                bucket_info = await async_oss_service.run("get_bucket_info", oss_service.photo_bucket.get_bucket_info)
             except Exception as e:
                 # 记录错误但不抛出，可能权限不足
                 pass
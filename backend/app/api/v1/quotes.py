@@ -2,6 +2,7 @@
 装修决策Agent - 报价单分析API
 """
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import Optional
@@ -10,12 +11,19 @@
 import base64
 import io
 
-from app.core.database import get_db
+from app.core.database import get_db, AsyncSessionLocal, release_connection, with_session
 from app.core.security import get_user_id
 from app.core.config import settings
 from app.models import Quote, User
 from app.services import coze_service, send_progress_reminder
 from app.services.message_service import create_message
+from app.services.job_queue import register_job, enqueue_job
+from app.services.ai_governor import ai_caller
+from app.services.upload_dedup import MATCH_EXACT, apply_reused_result, find_reusable_result, fingerprint_upload
+from app.services.analysis_progress import (
+    SSE_HEADERS, AnalysisProgressReporter, get_latest_progress, progress_events,
+    publish_progress, report_progress,
+)
 from app.schemas import (
     QuoteUploadRequest, QuoteUploadResponse, QuoteAnalysisResponse, ApiResponse
 )
@@ -26,7 +34,10 @@
 
 
 
-async def analyze_quote_background(quote_id: int, image_url: str, db: AsyncSession):
+QUOTE_ANALYSIS_JOB = "quote_analysis"
+
+
+async def analyze_quote_background(quote_id: int, image_url: str, db: AsyncSession, reraise: bool = False):
     """
     后台任务：分析报价单（使用扣子智能体）
 
@@ -34,6 +45,7 @@ async def analyze_quote_background(quote_id: int, image_url: str, db: AsyncSessi
         quote_id: 报价单ID
         image_url: 图片URL（OSS签名URL）
         db: 数据库会话
+        reraise: 异常时是否向上抛出（任务队列据此重试，由死信回调标记失败）
     """
     try:
         logger.info(f"开始分析报价单: {quote_id}, 图片URL: {image_url[:100]}...")
@@ -46,9 +58,8 @@ async def analyze_quote_background(quote_id: int, image_url: str, db: AsyncSessi
             logger.error(f"报价单不存在: {quote_id}")
             return
 
-        # V2.6.2优化：更新分析进度
-        quote.analysis_progress = {"step": "analyzing", "progress": 50, "message": "正在分析报价单..."}
-        await db.commit()
+        # V2.6.2优化：更新分析进度（中间进度走Redis推送，不写库）
+        await report_progress(Quote, quote_id, {"step": "analyzing", "progress": 50, "message": "正在分析报价单..."})
 
         # 重要修复：直接使用签名URL，不要尝试转换为公共URL
         # 扣子智能体应该能够处理签名URL
@@ -67,13 +78,20 @@ async def analyze_quote_background(quote_id: int, image_url: str, db: AsyncSessi
             logger.error(f"解析签名URL失败: {e}")
         
         # 直接使用签名URL调用扣子智能体
-        analysis_result = await coze_service.analyze_quote(image_url, quote.user_id)
+        # 流式返回过程中实时写入已解析的风险评分/风险项数量
+        reporter = AnalysisProgressReporter(Quote, quote_id, start=50)
+        # AI分析最长约90秒，期间不占用数据库连接
+        await release_connection(db)
+        # AI渠道繁忙时最多排队 AI_BACKGROUND_MAX_WAIT 秒，仍无名额则抛出异常由任务队列重试
+        with ai_caller(quote.user_id, background=True):
+            analysis_result = await coze_service.analyze_quote(image_url, quote.user_id, on_progress=reporter)
         
         if not analysis_result:
             logger.error(f"扣子智能体分析失败: {quote_id}")
             quote.status = "failed"
             quote.analysis_progress = {"step": "failed", "progress": 0, "message": "AI分析失败"}
             await db.commit()
+            await publish_progress(Quote, quote_id, quote.analysis_progress)
             return
 
         # 根据用户要求：前端必须原样展示AI智能体返回的数据
@@ -97,12 +115,12 @@ async def analyze_quote_background(quote_id: int, image_url: str, db: AsyncSessi
             quote.status = "failed"
             quote.analysis_progress = {"step": "failed", "progress": 0, "message": "AI分析服务暂时不可用"}
             await db.commit()
+            await publish_progress(Quote, quote_id, quote.analysis_progress)
             logger.warning(f"报价单 {quote_id} AI 返回兜底结果，标记为失败")
             return
 
         # V2.6.2优化：更新分析进度
-        quote.analysis_progress = {"step": "generating", "progress": 90, "message": "生成报告中..."}
-        await db.commit()
+        await report_progress(Quote, quote_id, {"step": "generating", "progress": 90, "message": "生成报告中..."})
 
         # 更新报价单记录
         quote.status = "completed"
@@ -184,6 +202,7 @@ async def analyze_quote_background(quote_id: int, image_url: str, db: AsyncSessi
             link_url=f"/pages/report-detail/index?type=quote&scanId={quote_id}&name={url_quote(_name)}",
         )
         await db.commit()
+        await publish_progress(Quote, quote_id, quote.analysis_progress)
         logger.info(f"报价单分析完成: {quote_id}, 风险评分: {quote.risk_score}")
         # 发送小程序订阅消息「报告生成通知」
         try:
@@ -203,6 +222,8 @@ async def analyze_quote_background(quote_id: int, image_url: str, db: AsyncSessi
 
     except Exception as e:
         logger.error(f"报价单分析失败: {e}", exc_info=True)
+        if reraise:
+            raise
 
         try:
             result = await db.execute(select(Quote).where(Quote.id == quote_id))
@@ -211,16 +232,61 @@ async def analyze_quote_background(quote_id: int, image_url: str, db: AsyncSessi
                 quote.status = "failed"
                 quote.analysis_progress = {"step": "failed", "progress": 0, "message": "分析过程异常"}
                 await db.commit()
+                await publish_progress(Quote, quote_id, quote.analysis_progress)
         except:
             pass
 
 
-def upload_file_to_oss(file: UploadFile, file_type: str = "quote", user_id: Optional[int] = None, 
-                       is_photo: bool = True) -> str:
+def sign_quote_image_url(object_key: str) -> str:
+    """
+    为报价单文件生成OSS签名URL（有效期1小时），供扣子智能体访问
+
+    在任务执行时才签名，避免排队或重试期间签名过期
+    """
+    from app.services.oss_service import oss_service
+    try:
+        image_url = oss_service.sign_url_for_key(object_key, expires=3600)
+        logger.info(f"生成OSS签名URL: {image_url[:100]}...")
+        return image_url
+    except Exception as e:
+        logger.error(f"生成OSS签名URL失败: {e}", exc_info=True)
+    # 如果生成签名URL失败，尝试使用generate_signed_url作为备选
+    try:
+        image_url = oss_service.generate_signed_url(object_key, expires=3600)
+        logger.info(f"使用generate_signed_url生成签名URL: {image_url[:100]}...")
+        return image_url
+    except Exception as e2:
+        logger.error(f"备选签名URL生成也失败: {e2}")
+    # 如果都失败，使用原始object_key
+    return f"https://{settings.ALIYUN_OSS_BUCKET}.{settings.ALIYUN_OSS_ENDPOINT}/{object_key}"
+
+
+async def mark_quote_failed(payload: dict, error: str):
+    """任务重试耗尽：标记报价单分析失败"""
+    async with with_session() as db:
+        result = await db.execute(select(Quote).where(Quote.id == payload["quote_id"]))
+        quote = result.scalar_one_or_none()
+        if quote and quote.status != "completed":
+            quote.status = "failed"
+            quote.analysis_progress = {"step": "failed", "progress": 0, "message": "分析过程异常"}
+            await db.commit()
+            await publish_progress(Quote, quote.id, quote.analysis_progress)
+
+
+@register_job(QUOTE_ANALYSIS_JOB, concurrency=settings.JOB_QUOTE_CONCURRENCY, on_dead=mark_quote_failed)
+async def run_quote_analysis_job(payload: dict):
+    """任务队列入口：使用独立数据库会话分析报价单"""
+    image_url = sign_quote_image_url(payload["object_key"])
+    async with with_session() as db:
+        await analyze_quote_background(payload["quote_id"], image_url, db, reraise=True)
+
+
+async def upload_file_to_oss(file: UploadFile, file_type: str = "quote", user_id: Optional[int] = None, 
+                             is_photo: bool = True) -> str:
     """
     上传文件到阿里云OSS（统一入口）
     
-    使用统一的OSS服务，确保所有照片都上传到OSS
+    使用统一的OSS服务，确保所有照片都上传到OSS（在OSS线程池中流式上传，不阻塞事件循环）
     - 照片上传到 zhuangxiu-images-dev-photo (生命周期1年)
     - 其他文件上传到 zhuangxiu-images-dev
 
@@ -233,10 +299,10 @@ def upload_file_to_oss(file: UploadFile, file_type: str = "quote", user_id: Opti
     Returns:
         对象键（object_key），用于存储及通过 GET /api/v1/oss/sign-url 获取临时 URL
     """
-    from app.services.oss_service import oss_service
+    from app.services.oss_service import async_oss_service
     
     try:
-        return oss_service.upload_upload_file(file, file_type, user_id, is_photo=is_photo)
+        return await async_oss_service.upload_upload_file(file, file_type, user_id, is_photo=is_photo)
     except Exception as e:
         logger.error(f"OSS文件上传失败: {e}", exc_info=True)
         # 开发环境：如果OSS上传失败，返回模拟URL
@@ -287,24 +353,14 @@ async def upload_quote(
                 detail=f"仅支持{', '.join(settings.ALLOWED_FILE_TYPES)}格式"
             )
 
-        # 上传到OSS（统一使用OSS服务，报价单也使用照片bucket，避免ACL权限问题）
-        object_key = upload_file_to_oss(file, "quote", user_id, is_photo=True)
-        
-        # 生成OSS签名URL（有效期1小时）- 使用sign_url_for_key方法，它会根据路径自动选择正确的bucket
-        from app.services.oss_service import oss_service
-        try:
-            image_url = oss_service.sign_url_for_key(object_key, expires=3600)
-            logger.info(f"生成OSS签名URL: {image_url[:100]}...")
-        except Exception as e:
-            logger.error(f"生成OSS签名URL失败: {e}", exc_info=True)
-            # 如果生成签名URL失败，尝试使用generate_signed_url作为备选
-            try:
-                image_url = oss_service.generate_signed_url(object_key, expires=3600)
-                logger.info(f"使用generate_signed_url生成签名URL: {image_url[:100]}...")
-            except Exception as e2:
-                logger.error(f"备选签名URL生成也失败: {e2}")
-                # 如果都失败，使用原始object_key
-                image_url = f"https://{settings.ALIYUN_OSS_BUCKET}.{settings.ALIYUN_OSS_ENDPOINT}/{object_key}"
+        # 内容完全相同的已完成分析直接复用；同一用户上传时连OSS上传也省去
+        fingerprint = await fingerprint_upload(file, file_ext)
+        reused, reuse_match = await find_reusable_result(db, Quote, user_id, fingerprint)
+        if reused is not None and reuse_match == MATCH_EXACT:
+            object_key = reused.file_url
+        else:
+            # 上传到OSS（统一使用OSS服务，报价单也使用照片bucket，避免ACL权限问题）
+            object_key = await upload_file_to_oss(file, "quote", user_id, is_photo=True)
 
         # 创建报价单记录
         quote = Quote(
@@ -314,26 +370,27 @@ async def upload_quote(
             file_size=file.size,
             file_type=file_ext,
             status="analyzing",
-            analysis_progress={"step": "uploading", "progress": 0, "message": "正在上传文件..."}
+            content_hash=fingerprint.sha256,
+            perceptual_hash=fingerprint.phash,
+            # 文件已上传完成，直接以“处理图片”作为初始进度，省去一次更新
+            analysis_progress={"step": "processing", "progress": 30, "message": "正在处理图片..."}
         )
+        if reused is not None:
+            apply_reused_result(quote, reused, reuse_match)
 
         db.add(quote)
         await db.commit()
         await db.refresh(quote)
 
-        # V2.6.2优化：更新分析进度
-        quote.analysis_progress = {"step": "processing", "progress": 30, "message": "正在处理图片..."}
-        await db.commit()
-
-        # 启动后台分析任务（使用扣子智能体）
-        background_tasks.add_task(
-            analyze_quote_background,
-            quote.id,
-            image_url,
-            db
-        )
+        # 分析任务入队，由独立worker执行（签名URL在执行时生成）
+        if reused is None:
+            await enqueue_job(
+                QUOTE_ANALYSIS_JOB,
+                {"quote_id": quote.id, "object_key": object_key},
+                background_tasks,
+            )
 
-        logger.info(f"报价单上传成功: {file.filename}, ID: {quote.id}, 图片URL: {image_url[:100]}...")
+        logger.info(f"报价单上传成功: {file.filename}, ID: {quote.id}, object_key: {object_key}")
 
         return QuoteUploadResponse(
             task_id=quote.id,
@@ -398,6 +455,7 @@ async def get_quote_analysis(
 
         # 构建预览数据（用于解锁页面展示）
         preview_data = None
+        analysis_progress = quote.analysis_progress
         if quote.status == "completed" and quote.result_json:
             # 从分析结果中提取预览数据
             result_json = quote.result_json
@@ -417,11 +475,12 @@ async def get_quote_analysis(
                 }
             }
         elif quote.status == "analyzing":
-            # 分析中的预览数据
+            # 分析中的预览数据（中间进度只在Redis中，优先读取最新进度）
+            analysis_progress = await get_latest_progress(Quote, quote_id) or analysis_progress
             preview_data = {
                 "analysis_status": "analyzing",
-                "progress_message": quote.analysis_progress.get("message", "正在分析中...") if quote.analysis_progress else "正在分析中...",
-                "progress_percentage": quote.analysis_progress.get("progress", 0) if quote.analysis_progress else 0
+                "progress_message": analysis_progress.get("message", "正在分析中...") if analysis_progress else "正在分析中...",
+                "progress_percentage": analysis_progress.get("progress", 0) if analysis_progress else 0
             }
         
         return QuoteAnalysisResponse(
@@ -438,7 +497,7 @@ async def get_quote_analysis(
             is_unlocked=quote.is_unlocked,
             created_at=quote.created_at,
             # V2.6.2优化：返回分析进度
-            analysis_progress=quote.analysis_progress or {"step": "pending", "progress": 0, "message": "等待分析"},
+            analysis_progress=analysis_progress or {"step": "pending", "progress": 0, "message": "等待分析"},
             # 返回AI分析完整结果（失败或兜底时不返回假数据）
             result_json=result_json,
             # 返回预览数据
@@ -455,6 +514,40 @@ async def get_quote_analysis(
         )
 
 
+@router.get("/quote/{quote_id}/progress")
+async def stream_quote_progress(
+    quote_id: int,
+    user_id: int = Depends(get_user_id)
+):
+    """
+    报价单分析进度推送（SSE），替代轮询 /quote/{quote_id}
+
+    连接建立后先推送当前进度，之后每次进度更新推送一条 progress 事件，分析完成或失败后关闭连接
+
+    Args:
+        quote_id: 报价单ID
+        user_id: 用户ID
+
+    Returns:
+        text/event-stream 响应
+    """
+    # 不使用 get_db 依赖：依赖的会话要到响应结束才释放，推送期间会一直占用连接
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Quote.status, Quote.analysis_progress)
+            .where(Quote.id == quote_id, Quote.user_id == user_id)
+        )
+        row = result.first()
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="报价单不存在")
+
+    return StreamingResponse(
+        progress_events(Quote, quote_id, row.status, row.analysis_progress),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
 @router.get("/list")
 async def list_quotes(
     user_id: int = Depends(get_user_id),
@@ -4,8 +4,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func, literal, union_all, or_, and_, String
 from io import BytesIO
+from datetime import datetime
+from typing import Optional, Tuple
+import base64
+import json
 import os
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet
@@ -20,6 +24,7 @@
 from app.core.security import get_user_id
 from app.models import CompanyScan, Quote, Contract, AcceptanceAnalysis, User
 from app.schemas import ApiResponse
+from app.services.pdf_renderer import render_pdf_cached, snapshot_row, PdfRenderBusy
 
 router = APIRouter(prefix="/reports", tags=["报告导出"])
 logger = logging.getLogger(__name__)
@@ -204,6 +209,11 @@ def _content_disposition_pdf(display_filename: str) -> str:
     return f'attachment; filename="{ascii_only}"'
 
 
+class _FallbackPdfBuffer(BytesIO):
+    """中文排版失败时生成的 ASCII 兜底PDF（渲染结果不写入缓存，下次请求重新渲染）"""
+    pass
+
+
 def _build_company_pdf(scan: CompanyScan) -> BytesIO:
     """公司检测PDF：与前端报告页一致，展示企业信息和法律案件详情，不做风险评价"""
     try:
@@ -355,7 +365,7 @@ def _build_company_pdf(scan: CompanyScan) -> BytesIO:
         return buf
     except Exception as e:
         logger.warning("Company PDF with CJK failed, falling back to ASCII: %s", e)
-        buf = BytesIO()
+        buf = _FallbackPdfBuffer()
         doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
         styles = getSampleStyleSheet()
         story = [
@@ -682,7 +692,7 @@ def add_header_footer(canvas, doc):
         return buf
     except Exception as e:
         logger.warning("Quote PDF build failed, fallback ASCII: %s", e)
-        buf = BytesIO()
+        buf = _FallbackPdfBuffer()
         doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
         styles = getSampleStyleSheet()
         safe_name = "".join(c if ord(c) < 128 else "?" for c in (str(quote.file_name or "")[:80])) or "N/A"
@@ -1010,7 +1020,7 @@ def add_header_footer(canvas, doc):
         return buf
     except Exception as e:
         logger.warning("Contract PDF build failed, fallback ASCII: %s", e)
-        buf = BytesIO()
+        buf = _FallbackPdfBuffer()
         doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
         styles = getSampleStyleSheet()
         safe_name = "".join(c if ord(c) < 128 else "?" for c in (str(getattr(contract, "file_name", None) or "")[:80])) or "N/A"
@@ -1072,7 +1082,7 @@ def _build_acceptance_pdf(analysis: AcceptanceAnalysis, user_nickname: str = "")
         return buf
     except Exception as e:
         logger.warning("Acceptance PDF with CJK failed, fallback ASCII: %s", e)
-        buf = BytesIO()
+        buf = _FallbackPdfBuffer()
         doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
         styles = getSampleStyleSheet()
         story = [
@@ -1087,91 +1097,205 @@ def _build_acceptance_pdf(analysis: AcceptanceAnalysis, user_nickname: str = "")
         return buf
 
 
+def _build_company_fallback_pdf(scan: CompanyScan) -> BytesIO:
+    """公司检测PDF兜底：仅含 ASCII 的报告编号和公司名"""
+    buf = BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+    styles = getSampleStyleSheet()
+    safe_name = "".join(c if ord(c) < 128 else "?" for c in (str(scan.company_name or "")[:50])) or "N/A"
+    story = [
+        Paragraph("Company Risk Report", styles["Title"]),
+        Spacer(1, 0.5*cm),
+        Paragraph(f"ID: {scan.id}", styles["Normal"]),
+        Paragraph(f"Company: {safe_name}", styles["Normal"]),
+    ]
+    doc.build(story)
+    buf.seek(0)
+    return buf
+
+
+def _build_quote_failed_pdf(quote: Quote) -> BytesIO:
+    """分析失败的报价单PDF：展示失败原因和建议"""
+    buf = BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+    styles = getSampleStyleSheet()
+    font = _ensure_cjk_font()
+    for name in ("Title", "Normal", "Heading2"):
+        styles[name].fontName = font
+    story = []
+    
+    story.append(_safe_paragraph("报价单分析报告", styles, "Title"))
+    story.append(Spacer(1, 0.5*cm))
+    story.append(_safe_paragraph(f"文件名：{quote.file_name or '未命名'}", styles))
+    story.append(_safe_paragraph(f"生成时间：{_safe_strftime(quote.created_at)}", styles))
+    story.append(_safe_paragraph(f"报告编号：R-Q-{quote.id}", styles))
+    story.append(Spacer(1, 0.5*cm))
+    
+    story.append(_safe_paragraph("分析状态", styles, "Heading2"))
+    story.append(_safe_paragraph("抱歉，报价单分析失败。", styles))
+    
+    # 显示具体的错误信息
+    error_message = "AI分析服务暂时不可用"
+    if quote.analysis_progress and isinstance(quote.analysis_progress, dict):
+        error_message = quote.analysis_progress.get("message", error_message)
+    
+    story.append(_safe_paragraph(f"错误原因：{error_message}", styles))
+    story.append(Spacer(1, 0.3*cm))
+    
+    story.append(_safe_paragraph("建议", styles, "Heading2"))
+    story.append(_safe_paragraph("1. 请稍后重新上传报价单进行分析", styles))
+    story.append(_safe_paragraph("2. 检查网络连接是否正常", styles))
+    story.append(_safe_paragraph("3. 联系客服获取帮助", styles))
+    
+    doc.build(story)
+    buf.seek(0)
+    return buf
+
+
+def _render_report_pdf(report_type: str, row, *extra) -> Tuple[bytes, bool]:
+    """
+    渲染报告PDF字节（在渲染进程池中执行，row 为 snapshot_row 生成的记录快照）
+
+    Args:
+        report_type: company | quote | quote_failed | contract | acceptance
+        row: 记录快照
+        *extra: 验收报告为用户昵称
+
+    Returns:
+        (PDF字节, 是否为 ASCII 兜底PDF)
+    """
+    if report_type == "company":
+        buf = _build_company_pdf(row)
+    elif report_type == "quote":
+        buf = _build_quote_pdf(row)
+    elif report_type == "quote_failed":
+        buf = _build_quote_failed_pdf(row)
+    elif report_type == "contract":
+        buf = _build_contract_pdf(row)
+    elif report_type == "acceptance":
+        buf = _build_acceptance_pdf(row, *extra)
+    else:
+        raise ValueError(f"未知的报告类型: {report_type}")
+    return buf.getvalue(), isinstance(buf, _FallbackPdfBuffer)
+
+
+# 报告时间线分支：(类型, 模型, 名称列, 是否解锁列, 额外过滤条件)
+# 排序键为 (created_at, type, id) 倒序，分支顺序与 type 排序无关
+_TIMELINE_SOURCES = (
+    ("company", CompanyScan, CompanyScan.company_name, None, ()),
+    ("quote", Quote, Quote.file_name, Quote.is_unlocked, ()),
+    ("contract", Contract, Contract.file_name, Contract.is_unlocked, ()),
+    ("acceptance", AcceptanceAnalysis, AcceptanceAnalysis.stage, AcceptanceAnalysis.is_unlocked,
+     (AcceptanceAnalysis.deleted_at.is_(None),)),
+)
+
+
+def _encode_cursor(item: dict) -> str:
+    """将列表最后一项编码为游标"""
+    raw = json.dumps([item["created_at"], item["type"], item["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str, int]:
+    """解析游标，格式错误抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, report_type, report_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(report_type), int(report_id)
+    except Exception as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+
+
+def _timeline_branch(report_type, model, name_col, unlocked_col, filters, user_id, cursor, limit):
+    """单个来源的时间线子查询：只取投影列，游标条件下推到分支内以使用 (user_id, created_at, id) 索引"""
+    unlocked = literal(True) if unlocked_col is None else func.coalesce(unlocked_col, False)
+    stmt = select(
+        literal(report_type, String).label("type"),
+        model.id.label("id"),
+        name_col.label("name"),
+        model.created_at.label("created_at"),
+        unlocked.label("is_unlocked"),
+    ).where(model.user_id == user_id, *filters)
+    if cursor:
+        c_at, c_type, c_id = cursor
+        # 展开 (created_at, type, id) < (c_at, c_type, c_id)：分支内 type 为常量
+        if report_type < c_type:
+            stmt = stmt.where(model.created_at <= c_at)
+        elif report_type == c_type:
+            stmt = stmt.where(or_(model.created_at < c_at, and_(model.created_at == c_at, model.id < c_id)))
+        else:
+            stmt = stmt.where(model.created_at < c_at)
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+
+
+def _timeline_title(report_type: str, report_id: int, name: Optional[str]) -> str:
+    if report_type == "company":
+        return f"公司检测 - {name or '未命名'}"
+    if report_type == "quote":
+        return f"报价单 - {name or str(report_id)}"
+    if report_type == "contract":
+        return f"合同审核 - {name or str(report_id)}"
+    stage_name = STAGE_NAMES.get(name or "", name or "验收")
+    return f"{stage_name}验收报告"
+
+
 @router.get("")
 async def list_reports(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，传入后忽略 page"),
     user_id: int = Depends(get_user_id),
     db: AsyncSession = Depends(get_db),
 ):
-    """报告列表（公司检测、报价单、合同、验收的汇总，用于数据管理/报告中心）"""
+    """报告列表（公司检测、报价单、合同、验收的汇总，用于数据管理/报告中心）
+    按 (created_at, type, id) 倒序的 UNION ALL 时间线；推荐使用 cursor 翻页，深分页与首页开销一致"""
     try:
-        offset = (page - 1) * page_size
-        items = []
-
-        # 公司检测
-        r = await db.execute(
-            select(CompanyScan)
-            .where(CompanyScan.user_id == user_id)
-            .order_by(CompanyScan.created_at.desc())
-            .limit(page_size * 2)
-        )
-        for row in r.scalars().all():
-            items.append({
-                "type": "company",
-                "id": row.id,
-                "title": f"公司检测 - {row.company_name or '未命名'}",
-                "created_at": row.created_at.isoformat() if row.created_at else None,
-                "is_unlocked": True,
-            })
+        key = None
+        offset = 0
+        if cursor:
+            try:
+                key = _decode_cursor(cursor)
+            except ValueError:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的游标")
+        else:
+            offset = (page - 1) * page_size
 
-        # 报价单
+        # 每个分支最多取 offset + page_size 条，外层合并排序后再截取
+        branch_limit = offset + page_size
+        timeline = union_all(*[
+            _timeline_branch(t, m, n, u, f, user_id, key, branch_limit).subquery().select()
+            for t, m, n, u, f in _TIMELINE_SOURCES
+        ]).subquery("timeline")
         r = await db.execute(
-            select(Quote)
-            .where(Quote.user_id == user_id)
-            .order_by(Quote.created_at.desc())
-            .limit(page_size * 2)
+            select(timeline)
+            .order_by(timeline.c.created_at.desc(), timeline.c.type.desc(), timeline.c.id.desc())
+            .offset(offset)
+            .limit(page_size)
         )
-        for row in r.scalars().all():
-            items.append({
-                "type": "quote",
+        items = [
+            {
+                "type": row.type,
                 "id": row.id,
-                "title": f"报价单 - {row.file_name or str(row.id)}",
+                "title": _timeline_title(row.type, row.id, row.name),
                 "created_at": row.created_at.isoformat() if row.created_at else None,
-                "is_unlocked": getattr(row, "is_unlocked", False),
-            })
+                "is_unlocked": bool(row.is_unlocked),
+            }
+            for row in r.all()
+        ]
 
-        # 合同
-        r = await db.execute(
-            select(Contract)
-            .where(Contract.user_id == user_id)
-            .order_by(Contract.created_at.desc())
-            .limit(page_size * 2)
-        )
-        for row in r.scalars().all():
-            items.append({
-                "type": "contract",
-                "id": row.id,
-                "title": f"合同审核 - {row.file_name or str(row.id)}",
-                "created_at": row.created_at.isoformat() if row.created_at else None,
-                "is_unlocked": getattr(row, "is_unlocked", False),
-            })
+        # 精确总数：各来源按 user_id 计数后求和（单次查询）
+        counts = [
+            select(func.count()).select_from(m).where(m.user_id == user_id, *f).scalar_subquery()
+            for _, m, _, _, f in _TIMELINE_SOURCES
+        ]
+        total = (await db.execute(select(sum(counts[1:], counts[0])))).scalar() or 0
 
-        # 验收分析（未删除）
-        r = await db.execute(
-            select(AcceptanceAnalysis)
-            .where(
-                AcceptanceAnalysis.user_id == user_id,
-                AcceptanceAnalysis.deleted_at.is_(None),
-            )
-            .order_by(AcceptanceAnalysis.created_at.desc())
-            .limit(page_size * 2)
-        )
-        for row in r.scalars().all():
-            stage_name = STAGE_NAMES.get(row.stage or "", row.stage or "验收")
-            items.append({
-                "type": "acceptance",
-                "id": row.id,
-                "title": f"{stage_name}验收报告",
-                "created_at": row.created_at.isoformat() if row.created_at else None,
-                "is_unlocked": getattr(row, "is_unlocked", False),
-            })
-
-        # 按创建时间倒序，再分页
-        items.sort(key=lambda x: x["created_at"] or "", reverse=True)
-        total = len(items)
-        items = items[offset : offset + page_size]
-        return ApiResponse(code=0, msg="success", data={"list": items, "total": total})
+        next_cursor = None
+        if len(items) == page_size and items[-1]["created_at"]:
+            next_cursor = _encode_cursor(items[-1])
+        return ApiResponse(code=0, msg="success", data={"list": items, "total": total, "next_cursor": next_cursor})
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取报告列表失败: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="获取失败")
@@ -1197,21 +1321,12 @@ async def export_report_pdf(
             if not getattr(obj, "is_unlocked", True):
                 raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="请先解锁报告")
             try:
-                buf = _build_company_pdf(obj)
+                pdf_bytes = await render_pdf_cached(_render_report_pdf, "company", resource_id, snapshot_row(obj))
+            except PdfRenderBusy:
+                raise
             except Exception as e:
                 logger.warning("Company PDF build failed, using minimal PDF: %s", e)
-                buf = BytesIO()
-                doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
-                styles = getSampleStyleSheet()
-                safe_name = "".join(c if ord(c) < 128 else "?" for c in (str(obj.company_name or "")[:50])) or "N/A"
-                story = [
-                    Paragraph("Company Risk Report", styles["Title"]),
-                    Spacer(1, 0.5*cm),
-                    Paragraph(f"ID: {resource_id}", styles["Normal"]),
-                    Paragraph(f"Company: {safe_name}", styles["Normal"]),
-                ]
-                doc.build(story)
-                buf.seek(0)
+                pdf_bytes = _build_company_fallback_pdf(obj).getvalue()
             filename = f"company_risk_report_{resource_id}.pdf"
         elif report_type == "quote":
             r = await db.execute(select(Quote).where(
@@ -1227,44 +1342,13 @@ async def export_report_pdf(
                 # 如果是失败状态，生成一个包含错误信息的PDF
                 if obj.status == "failed":
                     try:
-                        # 生成包含错误信息的PDF
-                        buf = BytesIO()
-                        doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
-                        styles = getSampleStyleSheet()
-                        font = _ensure_cjk_font()
-                        for name in ("Title", "Normal", "Heading2"):
-                            styles[name].fontName = font
-                        story = []
-                        
-                        story.append(_safe_paragraph("报价单分析报告", styles, "Title"))
-                        story.append(Spacer(1, 0.5*cm))
-                        story.append(_safe_paragraph(f"文件名：{obj.file_name or '未命名'}", styles))
-                        story.append(_safe_paragraph(f"生成时间：{_safe_strftime(obj.created_at)}", styles))
-                        story.append(_safe_paragraph(f"报告编号：R-Q-{obj.id}", styles))
-                        story.append(Spacer(1, 0.5*cm))
-                        
-                        story.append(_safe_paragraph("分析状态", styles, "Heading2"))
-                        story.append(_safe_paragraph("抱歉，报价单分析失败。", styles))
-                        
-                        # 显示具体的错误信息
-                        error_message = "AI分析服务暂时不可用"
-                        if obj.analysis_progress and isinstance(obj.analysis_progress, dict):
-                            error_message = obj.analysis_progress.get("message", error_message)
-                        
-                        story.append(_safe_paragraph(f"错误原因：{error_message}", styles))
-                        story.append(Spacer(1, 0.3*cm))
-                        
-                        story.append(_safe_paragraph("建议", styles, "Heading2"))
-                        story.append(_safe_paragraph("1. 请稍后重新上传报价单进行分析", styles))
-                        story.append(_safe_paragraph("2. 检查网络连接是否正常", styles))
-                        story.append(_safe_paragraph("3. 联系客服获取帮助", styles))
-                        
-                        doc.build(story)
-                        buf.seek(0)
+                        pdf_bytes = await render_pdf_cached(_render_report_pdf, "quote_failed", resource_id, snapshot_row(obj))
                         filename = f"报价单分析报告_{obj.file_name or resource_id}_分析失败.pdf"
+                    except PdfRenderBusy:
+                        raise
                     except Exception as e:
                         logger.warning("Failed quote PDF build failed, fallback ASCII: %s", e)
-                        buf = _minimal_pdf("Quote Analysis Failed", resource_id)
+                        pdf_bytes = _minimal_pdf("Quote Analysis Failed", resource_id).getvalue()
                         filename = f"quote_report_failed_{resource_id}.pdf"
                 else:
                     # 如果是analyzing状态，返回错误
@@ -1277,11 +1361,13 @@ async def export_report_pdf(
                 if not getattr(obj, "is_unlocked", False):
                     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="请先解锁报告")
                 try:
-                    buf = _build_quote_pdf(obj)
+                    pdf_bytes = await render_pdf_cached(_render_report_pdf, "quote", resource_id, snapshot_row(obj))
                     filename = f"报价单分析报告_{obj.file_name or resource_id}.pdf"
+                except PdfRenderBusy:
+                    raise
                 except Exception as e:
                     logger.warning("Quote PDF endpoint fallback: %s", e)
-                    buf = _minimal_pdf("Quote Report", resource_id)
+                    pdf_bytes = _minimal_pdf("Quote Report", resource_id).getvalue()
                     filename = f"quote_report_{resource_id}.pdf"
         elif report_type == "contract":
             r = await db.execute(select(Contract).where(
@@ -1294,14 +1380,16 @@ async def export_report_pdf(
             if not getattr(obj, "is_unlocked", False):
                 raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="请先解锁报告")
             try:
-                buf = _build_contract_pdf(obj)
+                pdf_bytes = await render_pdf_cached(_render_report_pdf, "contract", resource_id, snapshot_row(obj))
                 filename = f"合同审核报告_{getattr(obj, 'file_name', None) or resource_id}.pdf"
+            except PdfRenderBusy:
+                raise
             except Exception as e:
                 logger.warning("Contract PDF endpoint fallback: %s", e)
                 try:
-                    buf = _minimal_pdf("ContractReport", resource_id)
+                    pdf_bytes = _minimal_pdf("ContractReport", resource_id).getvalue()
                 except Exception:
-                    buf = _minimal_pdf("Report", resource_id)
+                    pdf_bytes = _minimal_pdf("Report", resource_id).getvalue()
                 filename = f"contract_report_{resource_id}.pdf"
         elif report_type == "acceptance":
             r = await db.execute(
@@ -1326,7 +1414,7 @@ async def export_report_pdf(
             if not is_unlocked and not is_member and not is_passed and not recheck_exhausted:
                 raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="请先解锁报告")
             nickname = user.nickname or "用户" if user else "用户"
-            buf = _build_acceptance_pdf(obj, nickname)
+            pdf_bytes = await render_pdf_cached(_render_report_pdf, "acceptance", resource_id, snapshot_row(obj), nickname)
             date_str = _safe_strftime(obj.created_at, "%Y-%m-%d") if obj.created_at else ""
             stage_name = STAGE_NAMES.get(obj.stage or "", obj.stage or "验收")
             filename = f"{stage_name}验收报告-{nickname}-{date_str}.pdf"
@@ -1335,7 +1423,6 @@ async def export_report_pdf(
 
         # 使用 Response 返回完整 PDF 字节，避免 StreamingResponse(BytesIO) 在小程序端收不到正确内容
         # Content-Disposition 使用 RFC 5987 编码中文文件名，避免 latin-1 报错
-        pdf_bytes = buf.getvalue()
         headers = {
             "Content-Disposition": _content_disposition_pdf(filename),
             "Content-Length": str(len(pdf_bytes)),
@@ -1347,6 +1434,8 @@ async def export_report_pdf(
         )
     except HTTPException:
         raise
+    except PdfRenderBusy:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="导出请求较多，请稍后再试")
     except Exception as e:
         logger.error("导出PDF失败 report_type=%s resource_id=%s: %s", report_type, resource_id, e, exc_info=True)
         try:
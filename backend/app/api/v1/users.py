@@ -7,13 +7,14 @@
 from sqlalchemy import select
 from datetime import datetime, timedelta
 from typing import Optional
-import httpx
 import logging
 
 from app.core.database import get_db
 from app.core.config import settings
 from app.core.security import create_access_token, get_current_user, get_user_id
+from app.services.http_client import get_http_client
 from app.models import User, UserSetting
+from app.services.construction_reminders import materialize_reminders
 from app.schemas import (
     WxLoginRequest, WxLoginResponse, UserProfileResponse,
     ApiResponse
@@ -95,65 +96,65 @@ async def wx_login(
                 )
 
         # 调用微信API获取openid
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            wx_url = "https://api.weixin.qq.com/sns/jscode2session"
-            params = {
-                "appid": settings.WECHAT_APP_ID,
-                "secret": settings.WECHAT_APP_SECRET,
-                "js_code": request.code,
-                "grant_type": "authorization_code"
-            }
-
-            response = await client.get(wx_url, params=params)
-            wx_data = response.json()
-
-            if "errcode" in wx_data:
-                logger.error(f"微信登录失败: {wx_data}")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail=f"微信登录失败: {wx_data.get('errmsg')}"
-                )
+        client = get_http_client("wechat")
+        wx_url = "https://api.weixin.qq.com/sns/jscode2session"
+        params = {
+            "appid": settings.WECHAT_APP_ID,
+            "secret": settings.WECHAT_APP_SECRET,
+            "js_code": request.code,
+            "grant_type": "authorization_code"
+        }
 
-            openid = wx_data.get("openid")
-            unionid = wx_data.get("unionid")
+        response = await client.get(wx_url, params=params, timeout=30.0)
+        wx_data = response.json()
 
-            # 查找或创建用户
-            result = await db.execute(select(User).where(User.wx_openid == openid))
-            user = result.scalar_one_or_none()
+        if "errcode" in wx_data:
+            logger.error(f"微信登录失败: {wx_data}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"微信登录失败: {wx_data.get('errmsg')}"
+            )
 
-            if not user:
-                # 创建新用户
-                user = User(
-                    wx_openid=openid,
-                    wx_unionid=unionid,
-                    nickname=f"用户{openid[-6:]}",
-                    created_at=datetime.now()
-                )
-                db.add(user)
-                await db.commit()
-                await db.refresh(user)
-                logger.info(f"新用户注册: {openid}")
-            else:
-                # 更新unionid
-                if unionid and not user.wx_unionid:
-                    user.wx_unionid = unionid
-                    await db.commit()
-                logger.info(f"用户登录: {openid}")
+        openid = wx_data.get("openid")
+        unionid = wx_data.get("unionid")
 
-            # 生成JWT Token（7天有效期）
-            access_token = create_access_token(
-                data={"user_id": user.id, "openid": user.wx_openid},
-                expires_delta=timedelta(days=7)
-            )
+        # 查找或创建用户
+        result = await db.execute(select(User).where(User.wx_openid == openid))
+        user = result.scalar_one_or_none()
 
-            return WxLoginResponse(
-                access_token=access_token,
-                user_id=user.id,
-                openid=user.wx_openid,
-                nickname=user.nickname,
-                avatar_url=user.avatar_url,
-                is_member=user.is_member
+        if not user:
+            # 创建新用户
+            user = User(
+                wx_openid=openid,
+                wx_unionid=unionid,
+                nickname=f"用户{openid[-6:]}",
+                created_at=datetime.now()
             )
+            db.add(user)
+            await db.commit()
+            await db.refresh(user)
+            logger.info(f"新用户注册: {openid}")
+        else:
+            # 更新unionid
+            if unionid and not user.wx_unionid:
+                user.wx_unionid = unionid
+                await db.commit()
+            logger.info(f"用户登录: {openid}")
+
+        # 生成JWT Token（7天有效期）
+        access_token = create_access_token(
+            data={"user_id": user.id, "openid": user.wx_openid},
+            expires_delta=timedelta(days=7)
+        )
+
+        return WxLoginResponse(
+            access_token=access_token,
+            user_id=user.id,
+            openid=user.wx_openid,
+            nickname=user.nickname,
+            avatar_url=user.avatar_url,
+            is_member=user.is_member
+        )
 
     except HTTPException:
         raise
@@ -329,6 +330,7 @@ async def update_user_settings(
             setting.notify_acceptance = notify_acceptance
         if notify_system is not None:
             setting.notify_system = notify_system
+        await materialize_reminders(db, user_id)
         await db.commit()
         return ApiResponse(code=0, msg="设置已更新", data=None)
     except Exception as e:
@@ -360,8 +362,8 @@ async def get_storage_usage(
         storage_duration_months = getattr(setting, 'storage_duration_months', 12) if setting else 12
         
         # 获取用户在OSS上的真实存储使用情况
-        from app.services.oss_service import oss_service
-        storage_data = oss_service.get_user_storage_usage(user_id)
+        from app.services.oss_service import async_oss_service
+        storage_data = await async_oss_service.get_user_storage_usage(user_id)
         
         # 获取用户会员状态
         from app.models import User
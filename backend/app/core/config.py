@@ -48,6 +48,7 @@ def coerce_debug(cls, v):
     WECHAT_TEMPLATE_PROGRESS_REMINDER: str = ""
     # 小程序订阅消息模板ID - 报告生成通知
     WECHAT_SUBSCRIBE_REPORT_NOTIFICATION: str = ""
+    WECHAT_SUBSCRIBE_CONSTRUCTION_REMINDER: str = ""  # 施工阶段开工/验收提醒模板ID
 
     # 微信支付配置 - 必须从环境变量读取
     WECHAT_MCH_ID: str = ""
@@ -83,6 +84,12 @@ def coerce_debug(cls, v):
     COZE_API_TOKEN: str = ""   # 扣子开放平台个人访问令牌 PAT 或 OAuth Access Token
     COZE_BOT_ID: str = ""     # 扣子平台部署的智能体 Bot ID
     COZE_API_BASE: str = "https://api.coze.cn"  # 可选，默认国内
+    # 开放平台对话：默认流式（stream=true）逐段接收回复，流式失败时回退为轮询 retrieve（指数退避）
+    COZE_API_STREAM: bool = True
+    COZE_API_STREAM_IDLE_TIMEOUT: float = 30.0  # 流式响应两次事件之间的最长间隔（秒）
+    COZE_API_POLL_INITIAL: float = 0.5  # 轮询首次间隔（秒）
+    COZE_API_POLL_MAX: float = 4.0  # 轮询最长间隔（秒）
+    COZE_API_POLL_BACKOFF: float = 1.6  # 轮询间隔增长倍数
     # 方式二：扣子发布站点 xxx.coze.site/stream_run（需 COZE_SITE_URL + COZE_SITE_TOKEN）
     COZE_SITE_URL: str = ""   # 如 https://9n37hmztzw.coze.site
     COZE_SITE_TOKEN: str = "" # Bearer Token
@@ -91,6 +98,16 @@ def coerce_debug(cls, v):
     # 扣子站点（coze.site）内部工作流若使用 langgraph，可能触发递归深度限制。
     # 若站点支持透传该配置，可用此项提高上限；不支持时不会生效，但也不影响调用。
     COZE_SITE_RECURSION_LIMIT: int = 50
+    # 扣子站点流式响应：连接上超过 IDLE 秒没有收到任何数据（含心跳）判定为中断；
+    # 开始后超过 FIRST_TOKEN 秒仍无正文判定为空流（按空流重试）
+    COZE_SITE_IDLE_TIMEOUT: float = 45.0
+    COZE_SITE_FIRST_TOKEN_TIMEOUT: float = 120.0
+    COZE_SITE_EMPTY_RETRIES: int = 1  # 空流重试次数（工具调用流不重试）
+    COZE_SITE_RETRY_DELAY: float = 1.0  # 空流重试间隔（秒）
+    ANALYSIS_PROGRESS_MIN_INTERVAL: float = 2.0  # 流式分析进度上报的最小间隔（秒）
+    ANALYSIS_PROGRESS_TTL: int = 3600  # Redis 中最新进度的保留时长（秒）
+    ANALYSIS_PROGRESS_STREAM_TIMEOUT: int = 300  # 进度推送连接最长保持时长（秒）
+    ANALYSIS_PROGRESS_HEARTBEAT: float = 15.0  # 进度推送心跳间隔（秒）
     
     # AI设计师智能体配置（扣子平台部署）
     DESIGN_SITE_URL: str = ""   # AI设计师站点URL，如 https://66g9ffxgrz.coze.site/stream_run
@@ -148,6 +165,129 @@ def parse_allowed_origins(cls, v):
     DEFAULT_RATE_LIMIT: str = "200/minute"
     SCAN_RATE_LIMIT: str = "10/minute"  # 公司扫描限流
     UPLOAD_RATE_LIMIT: str = "5/minute"  # 文件上传限流
+    PAYMENT_RATE_LIMIT: str = "3/minute"  # 创建订单限流
+    RATE_LIMIT_TRUST_PROXY: bool = True  # 按 X-Real-IP / X-Forwarded-For 识别未登录用户IP（部署在Nginx之后）
+
+    # 分析任务队列配置（Redis持久化队列，由 worker.py 独立进程消费）
+    JOB_QUEUE_ENABLED: bool = True
+    JOB_MAX_RETRIES: int = 2  # 失败后最多重试次数，超过进入死信列表
+    JOB_RETRY_BASE_SECONDS: int = 10  # 重试退避基数（指数退避）
+    JOB_RETRY_MAX_SECONDS: int = 300  # 单次重试最长等待
+    JOB_DEAD_LETTER_MAX: int = 1000  # 死信列表最多保留条数
+    JOB_QUOTE_CONCURRENCY: int = 4  # 报价单分析并发数（每个worker进程）
+    JOB_CONTRACT_CONCURRENCY: int = 4  # 合同分析并发数
+    JOB_COMPANY_CONCURRENCY: int = 8  # 公司检测并发数
+
+    # 出站HTTP连接池配置（每个上游一个长连接池）
+    HTTP_POOL_MAX_CONNECTIONS: int = 50  # 单个上游最大连接数
+    HTTP_POOL_MAX_KEEPALIVE: int = 20  # 单个上游最大保活连接数
+    HTTP_POOL_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保活时间（秒）
+    HTTP_CONNECT_TIMEOUT: float = 10.0  # 建连超时（秒）
+    HTTP_CLIENT_HTTP2: bool = False  # 开启HTTP/2（需安装 h2）
+    # 各上游默认总超时（秒），单次请求仍可覆盖
+    HTTP_UPSTREAM_TIMEOUTS: dict = {
+        "default": 30,
+        "coze_site": 120,
+        "coze_designer": 120,
+        "coze_api": 30,
+        "wechat": 10,
+        "juhecha": 10,
+        "juhecha_enterprise": 10,
+        "tianyancha": 10,
+        "fengniao": 10,
+        "ocr_download": 30,  # OCR下载待识别图片
+    }
+
+    # OSS调用配置（oss2 为同步SDK，在独立线程池中执行）
+    OSS_EXECUTOR_WORKERS: int = 16  # OSS线程池大小
+    OSS_MULTIPART_THRESHOLD: int = 5 * 1024 * 1024  # 超过该大小使用分片上传
+    OSS_MULTIPART_PART_SIZE: int = 2 * 1024 * 1024  # 分片大小
+    SIGNED_URL_CACHE_SIZE: int = 10000  # 进程内签名URL缓存条数
+    SIGNED_URL_REFRESH_MARGIN: int = 300  # 签名URL过期前多少秒停止复用
+
+    # 公司情报缓存配置（聚合数据/风鸟按次计费，跨用户共享结果）
+    COMPANY_INTEL_ENTERPRISE_TTL: int = 7 * 24 * 3600  # 企业工商信息新鲜期（秒）
+    COMPANY_INTEL_LEGAL_TTL: int = 24 * 3600  # 法律案件新鲜期（秒）
+    COMPANY_INTEL_STALE_TTL: int = 30 * 24 * 3600  # 过期后仍可返回旧数据并后台刷新的时长
+    COMPANY_INTEL_NEGATIVE_TTL: int = 600  # 空结果（查无或上游失败）缓存时长
+    COMPANY_INTEL_LOCK_TTL: int = 30  # 单飞锁过期时间（秒），需大于上游调用超时
+
+    # 公司名称联想索引配置
+    COMPANY_INDEX_MAX_NAMES: int = 200000  # 索引最多收录的公司名数量
+    COMPANY_INDEX_SYNC_INTERVAL: int = 10  # 从Redis增量同步新公司名的间隔（秒）
+
+    # 报价单/合同上传去重配置（内容相同或图片近似时复用已完成的分析结果）
+    UPLOAD_DEDUP_ENABLED: bool = True
+    UPLOAD_DEDUP_CROSS_USER: bool = False  # 是否跨用户复用（仅内容完全相同时）
+    UPLOAD_DEDUP_MAX_AGE_DAYS: int = 30  # 只复用该天数内完成的分析
+    UPLOAD_DEDUP_PHASH_DISTANCE: int = 4  # 感知哈希最大汉明距离（64位），近似上传只计入统计，不复用结果
+    UPLOAD_DEDUP_PHASH_CANDIDATES: int = 200  # 近似匹配时最多比较的历史记录数
+
+    # 报价单/合同文本分析结果缓存（相同提示词+文本+总价直接复用结果）
+    ANALYSIS_CACHE_ENABLED: bool = True
+    ANALYSIS_CACHE_VERSION: str = "1"  # 缓存版本，需要整体失效时递增
+    ANALYSIS_CACHE_TTL: int = 604800  # 条目有效期（秒），默认7天
+    ANALYSIS_CACHE_MAX_ENTRIES: int = 10000  # 最多条目数，超出按最近访问时间淘汰
+
+    # 消息中心未读数计数器（Redis按用户、分类计数，worker 周期对账）
+    MESSAGE_UNREAD_COUNTER_ENABLED: bool = True
+    MESSAGE_UNREAD_COUNTER_TTL: int = 604800  # 计数有效期（秒），过期后从数据库重建，默认7天
+    MESSAGE_UNREAD_RECONCILE_INTERVAL: int = 600  # 对账间隔（秒），0 表示不对账
+    MESSAGE_BROADCAST_BATCH_SIZE: int = 5000  # 群发每批用户数（每批一条 INSERT ... SELECT）
+    MESSAGE_BROADCAST_TOKEN: str = ""  # 群发接口管理令牌（请求头 X-Admin-Token），为空时关闭群发接口
+
+    # 施工提醒配置（进度计划变化时生成 reminder_events，worker 定时发送到期提醒）
+    REMINDER_SEND_HOUR: int = 9  # 提醒当天的发送时间（时）
+    REMINDER_DISPATCH_INTERVAL: int = 60  # 检查到期提醒的间隔（秒），0 表示不发送
+    REMINDER_DISPATCH_BATCH_SIZE: int = 500  # 每批发送的提醒数
+
+    # 小程序订阅消息发送队列（调用方入队，worker 批量发送，按模板限速）
+    WECHAT_DISPATCH_ENABLED: bool = True  # 关闭或 Redis 不可用时直接发送
+    WECHAT_DISPATCH_INTERVAL: int = 2  # worker 检查队列的间隔（秒），0 表示不发送
+    WECHAT_DISPATCH_BATCH_SIZE: int = 200  # 每批取出的消息数
+    WECHAT_DISPATCH_CONCURRENCY: int = 10  # 同时调用微信接口数
+    WECHAT_SUBSCRIBE_QPS: int = 20  # 每个模板每秒发送数，0 表示不限
+    WECHAT_SUBSCRIBE_TEMPLATE_QPS: dict = {}  # 按模板ID单独设置每秒发送数
+    WECHAT_DISPATCH_MAX_RETRIES: int = 3  # 限流/系统繁忙时最多重试次数，耗尽后进入死信列表
+    WECHAT_DISPATCH_RETRY_SECONDS: int = 30  # 首次重试等待（秒），之后指数增长
+    WECHAT_DISPATCH_DEAD_MAX: int = 1000  # 死信列表保留条数
+
+    # 验收照片多图分析配置（每张照片单独调用AI并发执行，结果合并）
+    ACCEPTANCE_IMAGE_CONCURRENCY: int = 16  # 全进程同时分析的照片数
+    ACCEPTANCE_USER_IMAGE_CONCURRENCY: int = 9  # 单个用户同时分析的照片数
+    ACCEPTANCE_ANALYSIS_DEADLINE: float = 150.0  # 多图分析总时限（秒），超时未完成的照片不计入结果
+
+    # AI上游并发调控（按渠道限制全局并发和每秒调用数，多 worker 通过 Redis 共享）
+    AI_GOVERNOR_ENABLED: bool = True
+    AI_COZE_SITE_CONCURRENCY: int = 20  # 扣子站点同时在途调用数
+    AI_COZE_SITE_QPS: int = 5  # 扣子站点每秒新发起调用数，0 表示不限
+    AI_COZE_API_CONCURRENCY: int = 10
+    AI_COZE_API_QPS: int = 5
+    AI_DEEPSEEK_CONCURRENCY: int = 20
+    AI_DEEPSEEK_QPS: int = 10
+    AI_DESIGNER_CONCURRENCY: int = 10  # AI设计师智能体
+    AI_DESIGNER_QPS: int = 5
+    AI_SLOT_LEASE_SECONDS: int = 300  # 名额租约时长（秒），进程异常退出未释放的名额到期自动回收
+    AI_QUEUE_MAX_WAIT: float = 5.0  # 交互接口最长排队时间（秒），超时返回“排队中”
+    AI_BACKGROUND_MAX_WAIT: float = 300.0  # 后台分析任务最长排队时间（秒），超时交由任务队列重试
+    AI_QUEUE_MAX_DEPTH: int = 100  # 单进程单渠道最大排队数，超出直接返回“排队中”
+    AI_GOVERNOR_POLL_INTERVAL: float = 0.2  # 名额已满时重新检查的间隔（秒）
+
+    # 报告PDF渲染配置（进程池渲染 + 本地磁盘缓存）
+    PDF_RENDER_WORKERS: int = 2  # 渲染进程数，0 表示使用线程池渲染
+    PDF_RENDER_MAX_PENDING: int = 16  # 同时排队/渲染的最大请求数
+    PDF_RENDER_QUEUE_TIMEOUT: float = 10.0  # 排队等待超时（秒），超时返回 503
+    PDF_TEMPLATE_VERSION: str = "1"  # 报告模板版本，修改PDF版式后递增以失效缓存
+    PDF_CACHE_ENABLED: bool = True
+    PDF_CACHE_DIR: str = "/tmp/zhuangxiu-pdf-cache"
+    PDF_CACHE_MAX_MB: int = 256  # 缓存目录上限，超出按最近访问时间淘汰
+
+    # OCR图片预处理配置（进程池解码/缩放/分割/编码）
+    OCR_PREPROCESS_WORKERS: int = 2  # 预处理进程数，0 表示使用线程池处理
+    OCR_PREPROCESS_MAX_PENDING: int = 8  # 同时排队/处理的最大图片数
+    OCR_PREPROCESS_QUEUE_TIMEOUT: float = 30.0  # 排队等待超时（秒）
+    OCR_SEGMENT_OVERLAP: int = 200  # 超高图片相邻分段重叠高度（像素），避免文字行被分段边界切开
+    OCR_SEGMENT_CONCURRENCY: int = 4  # 分段并发识别数（进程内所有请求共享）
 
     # 报告定价配置（V2.6.2优化）
     REPORT_SINGLE_PRICE: float = 9.9
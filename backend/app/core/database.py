@@ -1,6 +1,9 @@
 """
 装修决策Agent - 数据库配置（简化版）
 """
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 import os
@@ -47,6 +50,49 @@ async def get_db():
         finally:
             await session.close()
 
+@asynccontextmanager
+async def with_session(commit: bool = True) -> AsyncIterator[AsyncSession]:
+    """
+    工作单元：为后台任务/任务队列中的一段短数据库操作打开独立会话
+
+    正常退出时提交（commit=False 时不提交），异常时回滚，退出即关闭会话并归还连接。
+    块内不要等待AI/上游调用：长耗时调用前结束当前块（或调用 release_connection），之后再开新块
+
+    用法:
+        async with with_session() as db:
+            quote = await db.get(Quote, quote_id)
+            quote.status = "completed"
+
+    Args:
+        commit: 正常退出时是否提交
+
+    Yields:
+        数据库会话
+    """
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+            if commit:
+                await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+
+
+async def release_connection(session: AsyncSession) -> None:
+    """
+    结束会话当前事务并把连接归还连接池，会话本身仍可继续使用（下次查询时重新获取连接）
+
+    在会话中执行长耗时调用（AI分析、上游API）之前调用，避免调用期间一直占用连接；
+    expire_on_commit=False，已加载对象的属性在提交后仍可读取
+
+    Args:
+        session: 数据库会话
+    """
+    if session.in_transaction():
+        await session.commit()
+
+
 async def init_db():
     """初始化数据库（创建表）"""
     async with engine.begin() as conn:
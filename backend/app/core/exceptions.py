@@ -150,7 +150,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             message=exc.detail,
             code=exc.status_code,
             error_id=error_id
-        )
+        ),
+        headers=getattr(exc, "headers", None)
     )
 
 
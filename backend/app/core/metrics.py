@@ -0,0 +1,100 @@
+"""
+装修决策Agent - 进程内延迟指标
+按操作名称记录耗时直方图（累计桶），供监控接口查看
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple
+
+# 直方图桶上限（毫秒），最后一个桶为 +Inf
+DEFAULT_BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class LatencyHistogram:
+    """单个操作的耗时直方图（线程安全）"""
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = DEFAULT_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.count = 0
+        self.errors = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms: float, error: bool = False) -> None:
+        """记录一次耗时"""
+        index = len(self.buckets_ms)
+        for i, upper in enumerate(self.buckets_ms):
+            if elapsed_ms <= upper:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            if error:
+                self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出直方图数据：buckets 为 {"<=上限ms": 累计次数}"""
+        with self._lock:
+            counts = list(self.counts)
+            count, errors, sum_ms, max_ms = self.count, self.errors, self.sum_ms, self.max_ms
+        buckets = {}
+        cumulative = 0
+        for upper, n in zip(list(self.buckets_ms) + ["+Inf"], counts):
+            cumulative += n
+            buckets[f"<={upper}"] = cumulative
+        return {
+            "count": count,
+            "errors": errors,
+            "avg_ms": round(sum_ms / count, 2) if count else 0.0,
+            "max_ms": round(max_ms, 2),
+            "buckets": buckets,
+        }
+
+
+class LatencyRegistry:
+    """操作名称 -> 耗时直方图"""
+
+    def __init__(self):
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> LatencyHistogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def observe(self, name: str, elapsed_ms: float, error: bool = False) -> None:
+        self.get(name).observe(elapsed_ms, error)
+
+    @contextmanager
+    def timer(self, name: str):
+        """计时上下文：with latency_metrics.timer("oss.upload"): ..."""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, error)
+
+    def snapshot(self, prefix: str = "") -> Dict[str, Any]:
+        """导出所有（或指定前缀的）直方图"""
+        return {
+            name: histogram.snapshot()
+            for name, histogram in sorted(self._histograms.items())
+            if name.startswith(prefix)
+        }
+
+
+# 创建全局延迟指标实例
+latency_metrics = LatencyRegistry()
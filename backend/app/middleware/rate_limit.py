@@ -1,22 +1,271 @@
 """
 API限流中间件
-基于slowapi实现全局限流和接口级限流
+基于 Redis 的分布式限流（GCRA 算法），多 worker / 多实例共享同一份配额：
+- 携带有效 JWT 的请求按 token 中的用户ID计数，其余请求按客户端IP计数（支持反向代理转发头）；
+  不信任 X-User-Id 等未经校验的用户ID，否则伪造即可换新配额或耗尽他人配额
+- 敏感接口（公司扫描、上传、创建订单）各自独立计数，其余接口共用默认配额
+- 每个请求只执行一次 Lua 脚本（一次 Redis 往返），检查与扣减原子完成
+- 响应头返回剩余配额（X-RateLimit-Limit / Remaining / Reset），超限返回 429 及 Retry-After
+- Redis 不可用时退化为进程内计数，保证限流不失效
+- slowapi 限流器保留用于单接口装饰器（如 /health）
+
+Redis 键约定：
+- rate_limit:{scope}:user:{user_id} / rate_limit:{scope}:ip:{ip}  理论到达时间（毫秒，带TTL）
 """
+import math
+import re
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
 from slowapi import Limiter
-from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from fastapi import Request, status
 from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+
+from app.core.config import settings
+from app.services.redis_cache import cache
 import logging
 
 logger = logging.getLogger(__name__)
 
-# 创建限流器
+KEY_PREFIX = "rate_limit"
+DEFAULT_SCOPE = "default"
+EXEMPT_PATHS = ("/", "/health", "/api/docs", "/api/redoc", "/openapi.json")
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_RULE_RE = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d*)\s*(second|minute|hour|day)s?\s*$", re.IGNORECASE)
+
+# GCRA：KEYS[1] 为计数键，ARGV[1] 为放行间隔（毫秒），ARGV[2] 为周期（毫秒，即允许的突发量）
+# 返回 {是否放行, 剩余次数, 重试等待毫秒, 配额恢复满额毫秒}
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if allow_at > now then
+    return {0, 0, allow_at - now, tat - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return {1, math.floor((period - (new_tat - now)) / interval), 0, new_tat - now}
+"""
+
+
+class RateLimitResult(NamedTuple):
+    """限流检查结果"""
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # 秒，放行时为 0
+    reset_after: float  # 秒，配额恢复满额所需时间
+
+
+def parse_rate(rule: str) -> Tuple[int, int]:
+    """
+    解析限流规则字符串
+
+    Args:
+        rule: 如 "10/minute"、"100/hour"、"5 per second"
+
+    Returns:
+        (次数, 周期秒数)
+
+    Raises:
+        ValueError: 规则格式不正确
+    """
+    match = _RULE_RE.match(rule or "")
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"无效的限流规则: {rule}")
+    multiple = int(match.group(2) or 1)
+    return int(match.group(1)), multiple * _PERIODS[match.group(3).lower()]
+
+
+def get_client_ip(request: Request) -> str:
+    """
+    获取客户端IP：信任反向代理时优先取 X-Real-IP / X-Forwarded-For 首个地址
+
+    Args:
+        request: 请求对象
+
+    Returns:
+        客户端IP
+    """
+    if settings.RATE_LIMIT_TRUST_PROXY:
+        real_ip = request.headers.get("X-Real-IP")
+        if real_ip:
+            return real_ip.strip()
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _verified_user_id(request: Request) -> Optional[int]:
+    """从 Authorization Bearer 或 access_token 查询参数中的有效 JWT 取用户ID，校验失败返回 None"""
+    auth = request.headers.get("Authorization")
+    token = auth[7:] if auth and auth.startswith("Bearer ") else request.query_params.get("access_token")
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        return int(payload["user_id"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+
+
+def rate_limit_key(request: Request) -> str:
+    """限流身份：JWT 校验通过为 user:{id}，否则为 ip:{ip}"""
+    user_id = _verified_user_id(request)
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{get_client_ip(request)}"
+
+
+class RedisRateLimiter:
+    """基于 Redis 的分布式 GCRA 限流器，Redis 不可用时退化为进程内计数"""
+
+    def __init__(self):
+        self._script = None
+        self._script_client = None
+        self._rules: Dict[str, Tuple[int, int]] = {}
+        self._local_tat: Dict[str, float] = {}
+        self._local_lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _rule(self, rule: str) -> Tuple[int, int]:
+        parsed = self._rules.get(rule)
+        if parsed is None:
+            try:
+                parsed = parse_rate(rule)
+            except ValueError as e:
+                logger.warning(f"{e}，使用默认规则 {settings.DEFAULT_RATE_LIMIT}")
+                parsed = parse_rate(settings.DEFAULT_RATE_LIMIT)
+            self._rules[rule] = parsed
+        return parsed
+
+    async def hit(self, scope: str, identity: str, rule: str) -> RateLimitResult:
+        """
+        计数一次请求并判断是否放行
+
+        Args:
+            scope: 限流范围（接口路径或 default）
+            identity: 限流身份（user:{id} / ip:{ip}）
+            rule: 限流规则字符串
+
+        Returns:
+            RateLimitResult
+        """
+        limit, period = self._rule(rule)
+        interval_ms = period * 1000 / limit
+        key = f"{KEY_PREFIX}:{scope}:{identity}"
+        if cache.client:
+            try:
+                if self._script is None or self._script_client is not cache.client:
+                    # register_script 先 EVALSHA，脚本未缓存时自动加载
+                    self._script = cache.client.register_script(GCRA_SCRIPT)
+                    self._script_client = cache.client
+                allowed, remaining, retry_ms, reset_ms = await self._script(
+                    keys=[key], args=[math.ceil(interval_ms), period * 1000]
+                )
+                return RateLimitResult(bool(allowed), limit, int(remaining),
+                                       int(retry_ms) / 1000, int(reset_ms) / 1000)
+            except Exception as e:
+                logger.warning(f"Redis限流失败，使用进程内计数: {e}")
+        return self._hit_local(key, limit, interval_ms, period * 1000)
+
+    def _hit_local(self, key: str, limit: int, interval_ms: float, period_ms: int) -> RateLimitResult:
+        now = time.monotonic() * 1000
+        with self._local_lock:
+            if now - self._last_sweep > period_ms:
+                # 清理已恢复满额的身份，避免字典无限增长
+                self._local_tat = {k: v for k, v in self._local_tat.items() if v > now}
+                self._last_sweep = now
+            tat = max(self._local_tat.get(key, now), now)
+            new_tat = tat + interval_ms
+            allow_at = new_tat - period_ms
+            if allow_at > now:
+                return RateLimitResult(False, limit, 0, (allow_at - now) / 1000, (tat - now) / 1000)
+            self._local_tat[key] = new_tat
+        remaining = int((period_ms - (new_tat - now)) // interval_ms)
+        return RateLimitResult(True, limit, remaining, 0.0, (new_tat - now) / 1000)
+
+
+def _rate_limit_headers(result: RateLimitResult) -> Dict[str, str]:
+    headers = {
+        "X-RateLimit-Limit": str(result.limit),
+        "X-RateLimit-Remaining": str(max(result.remaining, 0)),
+        "X-RateLimit-Reset": str(math.ceil(result.reset_after)),
+    }
+    if not result.allowed:
+        headers["Retry-After"] = str(max(math.ceil(result.retry_after), 1))
+    return headers
+
+
+def _too_many_requests(headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={
+            "code": 429,
+            "msg": "请求过于频繁，请稍后再试",
+            "error_id": None,
+            "data": None
+        },
+        headers=headers,
+    )
+
+
+async def rate_limit_middleware(request: Request, call_next):
+    """
+    分布式限流中间件：敏感接口按 RateLimitConfig 规则，其余接口按默认规则
+
+    Args:
+        request: 请求对象
+        call_next: 下一个处理器
+
+    Returns:
+        响应（附带限流响应头），超限时返回 429
+    """
+    path = request.url.path
+    if not settings.RATE_LIMIT_ENABLED or request.method == "OPTIONS" or path in EXEMPT_PATHS:
+        return await call_next(request)
+
+    rule = RateLimitConfig.get_limit(path)
+    scope = path if rule else DEFAULT_SCOPE
+    identity = rate_limit_key(request)
+    result = await redis_rate_limiter.hit(scope, identity, rule or settings.DEFAULT_RATE_LIMIT)
+    headers = _rate_limit_headers(result)
+    if not result.allowed:
+        logger.warning(
+            f"API限流触发: {identity}, 路径: {path}",
+            extra={
+                "identity": identity,
+                "path": path,
+                "method": request.method
+            }
+        )
+        return _too_many_requests(headers)
+
+    response = await call_next(request)
+    response.headers.update(headers)
+    return response
+
+
+# 创建限流器（单接口装饰器使用）
 limiter = Limiter(
-    key_func=get_remote_address,
-    default_limits=["200/minute"]
+    key_func=rate_limit_key,
+    default_limits=[settings.DEFAULT_RATE_LIMIT]
 )
 
+# 创建全局分布式限流器实例
+redis_rate_limiter = RedisRateLimiter()
+
 
 async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
     """
@@ -30,23 +279,15 @@ async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
         JSON响应
     """
     logger.warning(
-        f"API限流触发: {request.client.host}, 路径: {request.url.path}",
+        f"API限流触发: {get_client_ip(request)}, 路径: {request.url.path}",
         extra={
-            "ip": request.client.host,
+            "ip": get_client_ip(request),
             "path": request.url.path,
             "method": request.method
         }
     )
 
-    return JSONResponse(
-        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-        content={
-            "code": 429,
-            "msg": "请求过于频繁，请稍后再试",
-            "error_id": None,
-            "data": None
-        }
-    )
+    return _too_many_requests()
 
 
 class RateLimitConfig:
@@ -54,10 +295,10 @@ class RateLimitConfig:
 
     # 敏感接口限流规则
     SENSITIVE_ENDPOINTS = {
-        "/api/v1/companies/scan": "10/minute",  # 公司扫描
-        "/api/v1/quotes/upload": "5/minute",     # 文件上传
-        "/api/v1/contracts/upload": "5/minute",  # 合同上传（实际API路径）
-        "/api/v1/payments/create": "3/minute",   # 创建订单
+        "/api/v1/companies/scan": settings.SCAN_RATE_LIMIT,        # 公司扫描
+        "/api/v1/quotes/upload": settings.UPLOAD_RATE_LIMIT,       # 文件上传
+        "/api/v1/contracts/upload": settings.UPLOAD_RATE_LIMIT,    # 合同上传（实际API路径）
+        "/api/v1/payments/create": settings.PAYMENT_RATE_LIMIT,    # 创建订单
     }
 
     @classmethod
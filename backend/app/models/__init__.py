@@ -1,9 +1,9 @@
 """
 装修决策Agent - 数据模型
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Float, ForeignKey, Boolean, Enum as SQLEnum, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, JSON, Float, ForeignKey, Boolean, Enum as SQLEnum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from datetime import datetime
 import enum
 
@@ -103,6 +103,10 @@ class Quote(Base):
     # V2.6.2优化：分析进度提示
     analysis_progress = Column(JSON)  # {"step": "ocr|analyzing|generating", "progress": 0-100, "message": "提示信息"}
 
+    # 上传去重：文件SHA-256与图片感知哈希（dHash，16位十六进制）
+    content_hash = Column(String(64))
+    perceptual_hash = Column(String(16))
+
     # 元数据
     total_price = Column(Float)  # 总价
     market_ref_price = Column(Float)  # 市场参考价
@@ -143,6 +147,10 @@ class Contract(Base):
     # V2.6.2优化：分析进度提示
     analysis_progress = Column(JSON)  # {"step": "ocr|analyzing|generating", "progress": 0-100, "message": "提示信息"}
 
+    # 上传去重：文件SHA-256与图片感知哈希（dHash，16位十六进制）
+    content_hash = Column(String(64))
+    perceptual_hash = Column(String(16))
+
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -225,6 +233,26 @@ class Construction(Base):
     user = relationship("User", back_populates="constructions")
 
 
+class ReminderEvent(Base):
+    """施工提醒事件表（按进度计划预先生成，定时任务到点发送）"""
+    __tablename__ = "reminder_events"
+    __table_args__ = (
+        UniqueConstraint("user_id", "stage", "event_type", "planned_date", name="uq_reminder_event"),
+        Index("idx_reminder_events_due", "remind_at", postgresql_where=text("status = 'pending'")),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    stage = Column(String(10), nullable=False)  # S00-S05
+    event_type = Column(String(20), nullable=False)  # stage_start, stage_acceptance
+    planned_date = Column(Date, nullable=False)  # 阶段计划开始/验收日期
+    reminder_days_before = Column(Integer, default=0)
+    remind_at = Column(DateTime, nullable=False)  # 计划发送时间
+    status = Column(String(20), nullable=False, default="pending")  # pending, sent
+    sent_at = Column(DateTime)
+    created_at = Column(DateTime, server_default=func.now())
+
+
 class Message(Base):
     """消息表 P14"""
     __tablename__ = "messages"
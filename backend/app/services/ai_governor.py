@@ -0,0 +1,309 @@
+"""
+AI上游并发调控
+扣子站点、扣子开放平台、DeepSeek、AI设计师智能体单次调用长达90-120秒，原先在请求路径中直接调用、没有任何上限：
+- 按渠道限制全局在途调用数（Redis 租约集合，多 worker 共享）和每秒调用数
+- 进程内按用户轮转排队，单个用户的大量请求不会挤占其他用户
+- 交互接口排队超过 AI_QUEUE_MAX_WAIT 秒（或排队数超过上限）立即抛出 AIUpstreamBusy，接口返回“排队中”，不再占着连接等到上游超时
+- 后台任务（报价单/合同分析、验收复检）最多等待 AI_BACKGROUND_MAX_WAIT 秒，仍无空位则交由任务队列重试
+- 排队耗时计入 latency_metrics（ai_queue.{渠道}）
+- Redis 不可用时退化为进程内并发计数（不限每秒调用数）
+
+Redis 键约定：
+- ai_governor:slots:{provider}     在途调用租约（ZSET，score 为租约到期毫秒时间戳）
+- ai_governor:qps:{provider}:{秒}   当前秒调用数（带TTL）
+"""
+import asyncio
+import functools
+import itertools
+import os
+import socket
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import latency_metrics
+from app.services.redis_cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "ai_governor"
+LOCAL_TOKEN = "local"
+
+PROVIDER_COZE_SITE = "coze_site"
+PROVIDER_COZE_API = "coze_api"
+PROVIDER_DEEPSEEK = "deepseek"
+PROVIDER_DESIGNER = "coze_designer"
+
+# 租约检查 + 每秒调用数检查 + 占用，原子完成
+# KEYS[1] 租约集合，KEYS[2] 每秒计数键前缀；ARGV: 租约标识, 并发上限, 每秒上限(0不限), 租约毫秒
+# 返回 1 占用成功，0 并发已满，-1 本秒调用数已满
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+if tonumber(ARGV[3]) > 0 then
+    local qps_key = KEYS[2] .. ':' .. t[1]
+    if tonumber(redis.call('GET', qps_key) or '0') >= tonumber(ARGV[3]) then
+        return -1
+    end
+    redis.call('INCR', qps_key)
+    redis.call('EXPIRE', qps_key, 2)
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[4]), ARGV[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+# 当前调用方：(用户ID, 是否后台任务)，由接口/任务入口通过 ai_caller() 设置
+_caller: ContextVar[Tuple[Optional[int], bool]] = ContextVar("ai_caller", default=(None, False))
+
+
+class AIUpstreamBusy(Exception):
+    """AI渠道排队超时或排队已满"""
+
+    def __init__(self, provider: str, retry_after: int = 5):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f"AI渠道繁忙: {provider}")
+
+
+@contextmanager
+def ai_caller(user_id: Optional[int], background: bool = False):
+    """
+    标记当前调用方，其后（含派生的子任务）发起的AI调用按该用户排队
+
+    Args:
+        user_id: 用户ID
+        background: 是否后台任务（排队等待上限不同）
+    """
+    token = _caller.set((user_id, background))
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+def _budget(provider: str) -> Tuple[int, int]:
+    """渠道预算：(全局并发上限, 每秒调用上限)"""
+    budgets = {
+        PROVIDER_COZE_SITE: (settings.AI_COZE_SITE_CONCURRENCY, settings.AI_COZE_SITE_QPS),
+        PROVIDER_COZE_API: (settings.AI_COZE_API_CONCURRENCY, settings.AI_COZE_API_QPS),
+        PROVIDER_DEEPSEEK: (settings.AI_DEEPSEEK_CONCURRENCY, settings.AI_DEEPSEEK_QPS),
+        PROVIDER_DESIGNER: (settings.AI_DESIGNER_CONCURRENCY, settings.AI_DESIGNER_QPS),
+    }
+    return budgets.get(provider, (settings.AI_COZE_SITE_CONCURRENCY, settings.AI_COZE_SITE_QPS))
+
+
+class _ProviderQueue:
+    """单个渠道的进程内排队状态"""
+
+    def __init__(self):
+        self.waiters: "OrderedDict[Any, Deque[asyncio.Future]]" = OrderedDict()  # 用户 -> 等待队列，按轮转顺序
+        self.waiting = 0
+        self.wakeup = asyncio.Event()
+        self.dispatcher: Optional[asyncio.Task] = None
+        self.local_in_flight = 0
+        self.acquired = 0
+        self.queued = 0
+        self.rejected = 0
+
+
+class AIGovernor:
+    """AI上游并发调控：按渠道限流，按用户公平排队"""
+
+    def __init__(self):
+        self._queues: Dict[str, _ProviderQueue] = {}
+        self._script = None
+        self._script_client = None
+        self._instance = f"{socket.gethostname()}:{os.getpid()}"
+        self._seq = itertools.count()
+
+    def _queue(self, provider: str) -> _ProviderQueue:
+        queue = self._queues.get(provider)
+        if queue is None:
+            queue = self._queues[provider] = _ProviderQueue()
+        return queue
+
+    @asynccontextmanager
+    async def slot(self, provider: str, user_id: Optional[int] = None):
+        """
+        占用一个渠道调用名额，退出时释放
+
+        Args:
+            provider: 渠道名（coze_site / coze_api / deepseek / coze_designer）
+            user_id: 排队用户（默认取 ai_caller() 设置的当前用户）
+
+        Raises:
+            AIUpstreamBusy: 排队超时或排队已满
+        """
+        if not settings.AI_GOVERNOR_ENABLED:
+            yield
+            return
+        token = await self._acquire(provider, user_id)
+        try:
+            yield
+        finally:
+            await self._release(provider, token)
+
+    def governed(self, provider: str):
+        """装饰器：在渠道名额内执行被装饰的异步调用"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                async with self.slot(provider):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    async def _acquire(self, provider: str, user_id: Optional[int]) -> str:
+        caller_id, background = _caller.get()
+        user = user_id if user_id is not None else caller_id
+        max_wait = settings.AI_BACKGROUND_MAX_WAIT if background else settings.AI_QUEUE_MAX_WAIT
+        queue = self._queue(provider)
+        start = time.perf_counter()
+
+        # 无人排队时直接尝试，有人排队时新请求必须排在后面
+        if not queue.waiting:
+            token = await self._try_acquire(provider, queue)
+            if token is not None:
+                queue.acquired += 1
+                latency_metrics.observe(f"ai_queue.{provider}", (time.perf_counter() - start) * 1000)
+                return token
+
+        if queue.waiting >= settings.AI_QUEUE_MAX_DEPTH:
+            queue.rejected += 1
+            latency_metrics.observe(f"ai_queue.{provider}", 0.0, error=True)
+            logger.warning(f"AI渠道排队已满: {provider}, 排队数: {queue.waiting}")
+            raise AIUpstreamBusy(provider)
+
+        future = asyncio.get_running_loop().create_future()
+        queue.waiters.setdefault(user, deque()).append(future)
+        queue.waiting += 1
+        queue.queued += 1
+        self._ensure_dispatcher(provider, queue)
+        try:
+            token = await asyncio.wait_for(asyncio.shield(future), max_wait)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                queue.rejected += 1
+                latency_metrics.observe(f"ai_queue.{provider}", (time.perf_counter() - start) * 1000, error=True)
+                logger.warning(f"AI渠道排队超时: {provider}, 用户: {user}, 等待 {max_wait}s")
+                raise AIUpstreamBusy(provider, retry_after=max(int(max_wait), 1))
+            token = future.result()
+        except asyncio.CancelledError:
+            # 调用方被取消：已分配的名额交还，未分配的撤销排队
+            if future.done() and not future.cancelled():
+                asyncio.ensure_future(self._release(provider, future.result()))
+            else:
+                future.cancel()
+            raise
+        finally:
+            queue.waiting -= 1
+
+        queue.acquired += 1
+        latency_metrics.observe(f"ai_queue.{provider}", (time.perf_counter() - start) * 1000)
+        return token
+
+    def _ensure_dispatcher(self, provider: str, queue: _ProviderQueue) -> None:
+        if queue.dispatcher is None or queue.dispatcher.done():
+            queue.dispatcher = asyncio.create_task(self._dispatch(provider, queue))
+        queue.wakeup.set()
+
+    async def _dispatch(self, provider: str, queue: _ProviderQueue) -> None:
+        """按用户轮转把空出的名额分配给排队者"""
+        while queue.waiters:
+            user, futures = next(iter(queue.waiters.items()))
+            while futures and futures[0].done():
+                futures.popleft()  # 已超时或取消
+            if not futures:
+                queue.waiters.pop(user, None)
+                continue
+
+            token = await self._try_acquire(provider, queue)
+            if token is None:
+                queue.wakeup.clear()
+                try:
+                    await asyncio.wait_for(queue.wakeup.wait(), settings.AI_GOVERNOR_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            future = futures.popleft()
+            # 该用户移到队尾，下一个名额分给其他用户
+            if futures:
+                queue.waiters.move_to_end(user)
+            else:
+                queue.waiters.pop(user, None)
+            if future.done():
+                await self._release(provider, token)
+            else:
+                future.set_result(token)
+
+    async def _try_acquire(self, provider: str, queue: _ProviderQueue) -> Optional[str]:
+        concurrency, qps = _budget(provider)
+        if cache.client:
+            try:
+                if self._script is None or self._script_client is not cache.client:
+                    self._script = cache.client.register_script(ACQUIRE_SCRIPT)
+                    self._script_client = cache.client
+                token = f"{self._instance}:{next(self._seq)}"
+                acquired = await self._script(
+                    keys=[f"{KEY_PREFIX}:slots:{provider}", f"{KEY_PREFIX}:qps:{provider}"],
+                    args=[token, concurrency, qps, settings.AI_SLOT_LEASE_SECONDS * 1000],
+                )
+                return token if int(acquired) == 1 else None
+            except Exception as e:
+                logger.warning(f"Redis AI名额占用失败，使用进程内计数: {e}")
+        if queue.local_in_flight < concurrency:
+            queue.local_in_flight += 1
+            return LOCAL_TOKEN
+        return None
+
+    async def _release(self, provider: str, token: str) -> None:
+        queue = self._queue(provider)
+        if token == LOCAL_TOKEN:
+            queue.local_in_flight -= 1
+        elif cache.client:
+            try:
+                await cache.client.zrem(f"{KEY_PREFIX}:slots:{provider}", token)
+            except Exception as e:
+                logger.warning(f"Redis AI名额释放失败（租约到期后自动回收）: {e}")
+        queue.wakeup.set()
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """各渠道预算、全局在途数和本进程排队情况"""
+        stats = {}
+        for provider in (PROVIDER_COZE_SITE, PROVIDER_COZE_API, PROVIDER_DEEPSEEK, PROVIDER_DESIGNER):
+            concurrency, qps = _budget(provider)
+            queue = self._queue(provider)
+            in_flight = queue.local_in_flight
+            if cache.client:
+                try:
+                    now_ms = int(time.time() * 1000)
+                    in_flight = await cache.client.zcount(f"{KEY_PREFIX}:slots:{provider}", now_ms, "+inf")
+                except Exception as e:
+                    logger.warning(f"读取AI渠道在途数失败: {e}")
+            stats[provider] = {
+                "concurrency": concurrency,
+                "qps": qps,
+                "in_flight": in_flight,
+                "waiting": queue.waiting,
+                "waiting_users": len(queue.waiters),
+                "acquired": queue.acquired,
+                "queued": queue.queued,
+                "rejected": queue.rejected,
+                "queue_time": latency_metrics.get(f"ai_queue.{provider}").snapshot(),
+            }
+        return stats
+
+
+# 创建全局AI上游调控实例
+ai_governor = AIGovernor()
@@ -0,0 +1,188 @@
+"""
+文本分析结果缓存
+报价单/合同文本分析（RiskAnalyzerService.analyze_quote / analyze_contract）的提示词固定，
+相同输入（测试数据、重新分析、同一装修公司的模板报价）反复出现，每次都要等待30-90秒的大模型调用：
+- 缓存键为 (缓存版本, 系统提示词摘要, 规范化文本, 总价) 的 SHA-256，修改提示词后旧缓存自动失效
+- 条目带TTL；按最近访问时间维护 LRU 索引，超过条目上限时淘汰最久未访问的条目
+- 读取与命中计数、写入与淘汰各在一次 Lua 脚本中完成
+- 命中/未命中次数记录在 Redis 中，多 worker 汇总，供监控接口查看
+- 只缓存大模型正常返回并解析成功的结果，兜底数据不缓存
+
+Redis 键约定：
+- analysis_cache:{kind}:{digest}  分析结果（JSON，带TTL）
+- analysis_cache:lru              LRU 索引（ZSET，score 为最近访问毫秒时间戳）
+- analysis_cache:stats            命中统计（HASH，{kind}:hits / {kind}:misses）
+"""
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.services.redis_cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "analysis_cache"
+LRU_KEY = f"{KEY_PREFIX}:lru"
+STATS_KEY = f"{KEY_PREFIX}:stats"
+
+# KEYS: 条目键, LRU索引, 统计; ARGV: 类型
+_GET_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+local t = redis.call('TIME')
+if value then
+    redis.call('ZADD', KEYS[2], 'XX', tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000), KEYS[1])
+    redis.call('HINCRBY', KEYS[3], ARGV[1] .. ':hits', 1)
+else
+    redis.call('HINCRBY', KEYS[3], ARGV[1] .. ':misses', 1)
+end
+return value
+"""
+
+# KEYS: 条目键, LRU索引; ARGV: 值, TTL秒, 最大条目数
+_SET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local ttl = tonumber(ARGV[2])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+redis.call('ZADD', KEYS[2], now, KEYS[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - ttl * 1000)
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[3])
+local evicted = 0
+if excess > 0 then
+    local popped = redis.call('ZPOPMIN', KEYS[2], excess)
+    for i = 1, #popped, 2 do
+        redis.call('DEL', popped[i])
+        evicted = evicted + 1
+    end
+end
+return evicted
+"""
+
+
+def normalize_text(text: str) -> str:
+    """规范化OCR文本：全角转半角，合并空白，去除首尾空白"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AnalysisResultCache:
+    """文本分析结果缓存（Redis）"""
+
+    def __init__(self):
+        self._scripts: Dict[str, Any] = {}
+        self._script_client = None
+
+    @property
+    def available(self) -> bool:
+        return settings.ANALYSIS_CACHE_ENABLED and cache.client is not None
+
+    def _script(self, name: str, source: str):
+        if self._script_client is not cache.client:
+            self._scripts = {}
+            self._script_client = cache.client
+        script = self._scripts.get(name)
+        if script is None:
+            script = self._scripts[name] = cache.client.register_script(source)
+        return script
+
+    @staticmethod
+    def make_key(kind: str, system_prompt: str, text: str, total_price: Optional[float] = None) -> str:
+        """
+        生成缓存键
+
+        Args:
+            kind: 分析类型（quote / contract）
+            system_prompt: 系统提示词（取摘要，提示词修改后自动失效）
+            text: OCR文本
+            total_price: 报价单总价（合同为 None）
+
+        Returns:
+            缓存键
+        """
+        prompt_digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+        price = "" if total_price is None else f"{float(total_price):.2f}"
+        material = "\x1f".join((settings.ANALYSIS_CACHE_VERSION, prompt_digest, normalize_text(text), price))
+        return f"{KEY_PREFIX}:{kind}:{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
+
+    async def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存结果并计入命中统计
+
+        Args:
+            kind: 分析类型
+            key: make_key 生成的缓存键
+
+        Returns:
+            分析结果，未命中或缓存不可用返回 None
+        """
+        if not self.available:
+            return None
+        try:
+            raw = await self._script("get", _GET_SCRIPT)(keys=[key, LRU_KEY, STATS_KEY], args=[kind])
+        except Exception as e:
+            logger.warning(f"读取分析结果缓存失败: {e}")
+            return None
+        if not raw:
+            return None
+        try:
+            result = json.loads(raw)
+        except ValueError:
+            return None
+        logger.info(f"分析结果缓存命中: {kind}")
+        return result
+
+    async def set(self, key: str, result: Dict[str, Any]) -> None:
+        """
+        写入分析结果，超过条目上限时淘汰最久未访问的条目
+
+        Args:
+            key: make_key 生成的缓存键
+            result: 分析结果
+        """
+        if not self.available or not isinstance(result, dict):
+            return
+        try:
+            evicted = await self._script("set", _SET_SCRIPT)(
+                keys=[key, LRU_KEY],
+                args=[json.dumps(result, ensure_ascii=False), settings.ANALYSIS_CACHE_TTL,
+                      settings.ANALYSIS_CACHE_MAX_ENTRIES],
+            )
+            if evicted:
+                logger.info(f"分析结果缓存淘汰 {evicted} 条")
+        except Exception as e:
+            logger.warning(f"写入分析结果缓存失败: {e}")
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """各类型命中/未命中次数、命中率及当前条目数"""
+        if cache.client is None:
+            return {"enabled": settings.ANALYSIS_CACHE_ENABLED, "available": False}
+        try:
+            pipe = cache.client.pipeline(transaction=False)
+            pipe.hgetall(STATS_KEY)
+            pipe.zcard(LRU_KEY)
+            raw, entries = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"读取分析结果缓存统计失败: {e}")
+            return {"enabled": settings.ANALYSIS_CACHE_ENABLED, "available": False}
+        kinds: Dict[str, Dict[str, Any]] = {}
+        for field, value in (raw or {}).items():
+            kind, _, name = field.rpartition(":")
+            kinds.setdefault(kind, {"hits": 0, "misses": 0})[name] = int(value)
+        for counts in kinds.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = round(counts["hits"] / lookups, 4) if lookups else 0.0
+        return {
+            "enabled": settings.ANALYSIS_CACHE_ENABLED,
+            "available": True,
+            "entries": entries,
+            "max_entries": settings.ANALYSIS_CACHE_MAX_ENTRIES,
+            "kinds": kinds,
+        }
+
+
+# 创建全局分析结果缓存实例
+analysis_cache = AnalysisResultCache()
@@ -0,0 +1,266 @@
+"""
+分析进度上报与推送
+报价单/合同分析过程中的进度（步骤、百分比、流式解析出的部分结果）不再逐步写库：
+- 中间进度写入 Redis 最新进度键并 PUBLISH 到进度频道，Redis 不可用时才回退为写 analysis_progress 列
+- 终态（completed / failed）仍随业务结果一起写库，提交后再发布，通知订阅方结束
+- 每个进程只用一个 PSUBSCRIBE 连接接收全部进度事件，再分发给本进程内的 SSE 连接
+- 详情接口在分析中时优先读取 Redis 最新进度，兼容仍在轮询的旧版小程序
+
+Redis 键约定（{kind} 为表名 quotes / contracts）：
+- analysis_progress:{kind}:{id}          进度频道（PUBLISH）
+- analysis_progress:latest:{kind}:{id}   最新进度（JSON，带TTL）
+"""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.redis_cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "analysis_progress"
+TERMINAL_STEPS = ("completed", "failed")
+# SSE 响应头：Content-Encoding: identity 让 GZipMiddleware 原样透传，
+# 否则事件被压缩缓冲，直到流结束才发给客户端
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Content-Encoding": "identity",
+}
+
+
+def _channel(kind: str, record_id: int) -> str:
+    return f"{KEY_PREFIX}:{kind}:{record_id}"
+
+
+def _latest_key(kind: str, record_id: int) -> str:
+    return f"{KEY_PREFIX}:latest:{kind}:{record_id}"
+
+
+def is_terminal(progress: Optional[Dict[str, Any]]) -> bool:
+    """进度是否为终态"""
+    return bool(progress) and progress.get("step") in TERMINAL_STEPS
+
+
+async def publish_progress(model, record_id: int, progress: Dict[str, Any]) -> bool:
+    """
+    发布进度：写入最新进度键并推送到进度频道
+
+    Args:
+        model: ORM模型（Quote / Contract）
+        record_id: 记录ID
+        progress: 进度数据 {"step", "progress", "message", ...}
+
+    Returns:
+        是否发布成功（Redis 不可用返回 False）
+    """
+    if not cache.client or not progress:
+        return False
+    kind = model.__tablename__
+    payload = json.dumps(progress, ensure_ascii=False)
+    try:
+        pipe = cache.client.pipeline(transaction=False)
+        pipe.set(_latest_key(kind, record_id), payload, ex=settings.ANALYSIS_PROGRESS_TTL)
+        pipe.publish(_channel(kind, record_id), payload)
+        await pipe.execute()
+        return True
+    except Exception as e:
+        logger.warning(f"发布分析进度失败: {kind}:{record_id}, 错误: {e}")
+        return False
+
+
+async def report_progress(model, record_id: int, progress: Dict[str, Any]) -> None:
+    """
+    上报中间进度：优先发布到 Redis，Redis 不可用时写 analysis_progress 列
+
+    Args:
+        model: ORM模型（Quote / Contract）
+        record_id: 记录ID
+        progress: 进度数据
+    """
+    if await publish_progress(model, record_id, progress):
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(model)
+                .where(model.id == record_id)
+                .values(analysis_progress=progress)
+            )
+            await db.commit()
+    except Exception as e:
+        logger.warning(f"写入分析进度失败: {model.__tablename__}:{record_id}, 错误: {e}")
+
+
+async def get_latest_progress(model, record_id: int) -> Optional[Dict[str, Any]]:
+    """
+    读取 Redis 中的最新进度
+
+    Args:
+        model: ORM模型（Quote / Contract）
+        record_id: 记录ID
+
+    Returns:
+        进度数据，不存在或 Redis 不可用返回 None
+    """
+    if not cache.client:
+        return None
+    try:
+        raw = await cache.client.get(_latest_key(model.__tablename__, record_id))
+        return json.loads(raw) if raw else None
+    except Exception as e:
+        logger.warning(f"读取分析进度失败: {model.__tablename__}:{record_id}, 错误: {e}")
+        return None
+
+
+class ProgressHub:
+    """进程内进度事件分发：一个 PSUBSCRIBE 连接，按频道分发到各 SSE 连接的队列"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    def _ensure_listener(self) -> None:
+        if cache.client and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        pubsub = cache.client.pubsub()
+        try:
+            await pubsub.psubscribe(f"{KEY_PREFIX}:*")
+            async for message in pubsub.listen():
+                if message.get("type") != "pmessage":
+                    continue
+                queues = self._subscribers.get(message.get("channel"))
+                if not queues:
+                    continue
+                try:
+                    progress = json.loads(message["data"])
+                except (TypeError, ValueError):
+                    continue
+                for queue in list(queues):
+                    queue.put_nowait(progress)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"分析进度订阅中断: {e}")
+        finally:
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, model, record_id: int):
+        """订阅单条记录的进度事件，返回接收队列"""
+        channel = _channel(model.__tablename__, record_id)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(channel, set()).add(queue)
+        self._ensure_listener()
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(channel)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    self._subscribers.pop(channel, None)
+
+    async def close(self) -> None:
+        """停止订阅连接（应用关闭时调用）"""
+        if self._listener and not self._listener.done():
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        self._listener = None
+
+
+def _sse(progress: Dict[str, Any]) -> str:
+    return f"event: progress\ndata: {json.dumps(progress, ensure_ascii=False)}\n\n"
+
+
+async def progress_events(model, record_id: int, status: str,
+                          progress: Optional[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    SSE 进度事件流：先推送当前进度，之后推送每次更新，到达终态或超时后结束
+
+    Args:
+        model: ORM模型（Quote / Contract）
+        record_id: 记录ID
+        status: 记录当前状态
+        progress: 数据库中的 analysis_progress
+
+    Yields:
+        SSE 格式文本
+    """
+    current = progress or {"step": "pending", "progress": 0, "message": "等待分析"}
+    if status != "analyzing" or not cache.client:
+        yield _sse(current)
+        return
+
+    async with progress_hub.subscribe(model, record_id) as queue:
+        # 先订阅再读取最新进度，避免两者之间发布的事件丢失
+        current = await get_latest_progress(model, record_id) or current
+        yield _sse(current)
+        deadline = time.monotonic() + settings.ANALYSIS_PROGRESS_STREAM_TIMEOUT
+        while not is_terminal(current) and time.monotonic() < deadline:
+            try:
+                current = await asyncio.wait_for(queue.get(), timeout=settings.ANALYSIS_PROGRESS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # 心跳间隔内无事件：补读一次最新进度（订阅连接重建期间可能漏掉事件）
+                progress_hub._ensure_listener()
+                latest = await get_latest_progress(model, record_id)
+                if not latest or latest == current:
+                    yield ": ping\n\n"
+                    continue
+                current = latest
+            yield _sse(current)
+
+
+class AnalysisProgressReporter:
+    """把流式解析的部分结果作为中间进度上报（节流）"""
+
+    def __init__(self, model, record_id: int, start: int = 50, end: int = 85, step: str = "analyzing"):
+        """
+        Args:
+            model: ORM模型（Quote / Contract）
+            record_id: 记录ID
+            start: 起始进度百分比
+            end: 流式阶段最高进度百分比（之后由生成报告等步骤接续）
+            step: 进度步骤名
+        """
+        self.model = model
+        self.record_id = record_id
+        self.start = start
+        self.end = end
+        self.step = step
+        self._last_write = 0.0
+
+    def build(self, partial: Dict[str, Any]) -> Dict[str, Any]:
+        """根据部分结果生成进度数据"""
+        fields = partial.get("fields") or {}
+        counts = partial.get("counts") or {}
+        found = sum(counts.values())
+        progress = min(self.end, self.start + 5 * (len(fields) + len(counts)))
+        message = f"正在分析，已识别{found}项..." if found else "正在分析..."
+        return {"step": self.step, "progress": progress, "message": message, "partial": partial}
+
+    async def __call__(self, partial: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        if now - self._last_write < settings.ANALYSIS_PROGRESS_MIN_INTERVAL:
+            return
+        self._last_write = now
+        await report_progress(self.model, self.record_id, self.build(partial))
+
+
+# 创建全局进度分发实例
+progress_hub = ProgressHub()
@@ -17,7 +17,7 @@
 from app.core.logger import get_logger
 from app.core.database import get_db
 from app.services.alert_service import alert_backup_failed, alert_backup_verification_failed
-from app.services.oss_service import oss_service
+from app.services.oss_service import async_oss_service
 
 logger = get_logger(__name__)
 
@@ -483,7 +483,7 @@ async def upload_backups_to_oss(self) -> Dict[str, Any]:
                                 file_data = f.read()
                             
                             # 使用oss_service上传
-                            object_key = oss_service.upload_file(file_data, oss_path, bucket_name='photo')
+                            object_key = await async_oss_service.upload_file(file_data, oss_path, bucket_name='photo')
                             success = True
                             message = f"上传成功: {object_key}"
                         except Exception as upload_error:
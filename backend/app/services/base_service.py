@@ -7,6 +7,7 @@
 from typing import Optional, Dict, Any
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from circuitbreaker import circuit
+from app.services.http_client import http_clients
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,10 +39,10 @@ async def call_with_circuit_breaker(url: str, method: str = "GET", **kwargs) ->
         Exception: 调用失败时抛出异常
     """
     timeout = kwargs.pop('timeout', 30)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        response = await client.request(method, url, **kwargs)
-        response.raise_for_status()
-        return response.json()
+    client = http_clients.for_url(url)
+    response = await client.request(method, url, timeout=timeout, **kwargs)
+    response.raise_for_status()
+    return response.json()
 
 
 class BaseService:
@@ -95,19 +96,20 @@ async def call_api(
         try:
             logger.info(f"调用API: {method} {url}")
 
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.request(
-                    method,
-                    url,
-                    params=params,
-                    json=json_data,
-                    headers=headers
-                )
-                response.raise_for_status()
-
-                result = response.json()
-                logger.info(f"API调用成功: {url}, 状态码: {response.status_code}")
-                return result
+            client = http_clients.for_url(url)
+            response = await client.request(
+                method,
+                url,
+                params=params,
+                json=json_data,
+                headers=headers,
+                timeout=timeout
+            )
+            response.raise_for_status()
+
+            result = response.json()
+            logger.info(f"API调用成功: {url}, 状态码: {response.status_code}")
+            return result
 
         except httpx.TimeoutException as e:
             logger.error(f"API调用超时: {url}, 错误: {e}")
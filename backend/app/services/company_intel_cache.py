@@ -0,0 +1,222 @@
+"""
+公司情报缓存
+公司检测的企业工商信息、法律案件来自按次计费的第三方接口，多个用户检测同一家公司时共享结果：
+- 按规范化公司名缓存，企业信息/法律案件分别设置新鲜期（企业信息变化慢，案件更新快）
+- 过了新鲜期但仍在陈旧窗口内：先返回旧数据，后台刷新（stale-while-revalidate）
+- 未命中时用 Redis 锁做单飞（single-flight）：全集群同一公司同一数据源只有一个上游请求在执行，其余请求等待结果
+- 法律案件优先按企业信息中的统一社会信用代码缓存：同一公司的不同写法（简称、括号全半角等）共享一份案件数据
+- 只有上游失败（返回 None）才短期缓存；查无案件（legal_case_count 为 0）是正常结果，按法律案件新鲜期缓存
+
+Redis 键约定（{name} 为规范化公司名，法律案件有信用代码时为 credit_no:{credit_no}）：
+- company_intel:{source}:{name}     缓存条目（JSON：data/fetched_at/fresh_until）
+- company_intel:lock:{source}:{name} 单飞锁（带TTL，持有者异常退出后自动释放）
+"""
+import asyncio
+import json
+import re
+import time
+import unicodedata
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.redis_cache import cache
+from app.services.juhecha_service import juhecha_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "company_intel"
+SOURCE_ENTERPRISE = "enterprise"
+SOURCE_LEGAL = "legal"
+LOCK_POLL_INTERVAL = 0.2  # 等待其他请求完成上游调用时的轮询间隔（秒）
+
+# 仅当锁仍由自己持有时才删除
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class CompanyIntelBusy(Exception):
+    """等待其他请求的上游调用超时"""
+    pass
+
+
+def normalize_company_name(name: str) -> str:
+    """
+    规范化公司名：全角转半角、统一括号、去除空白、英文小写
+
+    Args:
+        name: 用户输入的公司名
+
+    Returns:
+        规范化后的公司名（用作缓存键）
+    """
+    text = unicodedata.normalize("NFKC", name or "")
+    text = re.sub(r"\s+", "", text)
+    return text.lower()
+
+
+def _is_empty(source: str, data: Any) -> bool:
+    """上游失败（企业信息还包括查无此公司）只做短期缓存；没有法律案件是正常结果"""
+    if source == SOURCE_ENTERPRISE:
+        return not data
+    return data is None
+
+
+class CompanyIntelCache:
+    """公司情报缓存（企业信息 + 法律案件）"""
+
+    def __init__(self):
+        self._fetchers: Dict[str, Callable[[str], Awaitable[Any]]] = {
+            SOURCE_ENTERPRISE: juhecha_service.get_enterprise_detail,
+            SOURCE_LEGAL: juhecha_service.analyze_company_legal_risk,
+        }
+        self._refreshing: set = set()
+
+    @property
+    def available(self) -> bool:
+        return cache.client is not None
+
+    def _ttl(self, source: str) -> int:
+        if source == SOURCE_ENTERPRISE:
+            return settings.COMPANY_INTEL_ENTERPRISE_TTL
+        return settings.COMPANY_INTEL_LEGAL_TTL
+
+    @staticmethod
+    def _key(source: str, name: str) -> str:
+        return f"{KEY_PREFIX}:{source}:{name}"
+
+    @staticmethod
+    def _lock_key(source: str, name: str) -> str:
+        return f"{KEY_PREFIX}:lock:{source}:{name}"
+
+    async def _read(self, source: str, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await cache.client.get(self._key(source, name))
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"读取公司情报缓存失败: {source}:{name}, 错误: {e}")
+            return None
+
+    async def _write(self, source: str, name: str, data: Any) -> None:
+        now = time.time()
+        if _is_empty(source, data):
+            fresh, stale = settings.COMPANY_INTEL_NEGATIVE_TTL, 0
+        else:
+            fresh, stale = self._ttl(source), settings.COMPANY_INTEL_STALE_TTL
+        entry = {"data": data, "fetched_at": now, "fresh_until": now + fresh}
+        try:
+            await cache.client.set(self._key(source, name), json.dumps(entry, ensure_ascii=False), ex=fresh + stale)
+        except Exception as e:
+            logger.warning(f"写入公司情报缓存失败: {source}:{name}, 错误: {e}")
+
+    async def _acquire(self, source: str, name: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        ok = await cache.client.set(self._lock_key(source, name), token, nx=True,
+                                    ex=settings.COMPANY_INTEL_LOCK_TTL)
+        return token if ok else None
+
+    async def _release(self, source: str, name: str, token: str) -> None:
+        try:
+            await cache.client.eval(_RELEASE_LOCK_SCRIPT, 1, self._lock_key(source, name), token)
+        except Exception as e:
+            logger.warning(f"释放公司情报锁失败: {source}:{name}, 错误: {e}")
+
+    async def _fetch_and_store(self, source: str, name: str, company_name: str, token: str) -> Any:
+        """持有锁时调用上游并写缓存"""
+        try:
+            logger.info(f"调用上游获取公司情报: {source}, {company_name}")
+            data = await self._fetchers[source](company_name)
+            await self._write(source, name, data)
+            return data
+        finally:
+            await self._release(source, name, token)
+
+    def _refresh_in_background(self, source: str, name: str, company_name: str) -> None:
+        """陈旧数据后台刷新（锁被占用说明已有请求在刷新，直接跳过）"""
+        async def refresh():
+            try:
+                token = await self._acquire(source, name)
+                if token:
+                    await self._fetch_and_store(source, name, company_name, token)
+            except Exception as e:
+                logger.warning(f"后台刷新公司情报失败: {source}:{name}, 错误: {e}")
+
+        task = asyncio.create_task(refresh())
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+
+    async def get(self, source: str, company_name: str, cache_name: Optional[str] = None) -> Tuple[Any, bool]:
+        """
+        获取单个数据源的公司情报
+
+        Args:
+            source: enterprise | legal
+            company_name: 公司名称（调用上游时使用）
+            cache_name: 缓存键名，默认为规范化公司名
+
+        Returns:
+            (数据, 是否来自缓存)
+
+        Raises:
+            CompanyIntelBusy: 等待其他请求的上游调用超时
+        """
+        if not self.available:
+            return await self._fetchers[source](company_name), False
+
+        name = cache_name or normalize_company_name(company_name)
+        entry = await self._read(source, name)
+        if entry:
+            if entry.get("fresh_until", 0) <= time.time():
+                self._refresh_in_background(source, name, company_name)
+            return entry.get("data"), True
+
+        # 未命中：单飞，拿到锁的请求调用上游，其余请求轮询缓存直到结果写入或锁过期
+        deadline = time.monotonic() + settings.COMPANY_INTEL_LOCK_TTL + 5
+        while True:
+            token = await self._acquire(source, name)
+            if token:
+                # 拿锁前可能已有请求写入结果
+                entry = await self._read(source, name)
+                if entry:
+                    await self._release(source, name, token)
+                    return entry.get("data"), True
+                return await self._fetch_and_store(source, name, company_name, token), False
+
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            entry = await self._read(source, name)
+            if entry:
+                return entry.get("data"), True
+            if time.monotonic() > deadline:
+                raise CompanyIntelBusy(f"等待公司情报超时: {company_name}")
+
+    async def get_comprehensive(self, company_name: str) -> Tuple[Dict[str, Any], bool]:
+        """
+        获取企业信息和法律案件
+
+        先取企业信息，拿到统一社会信用代码后按信用代码取法律案件，同一公司不同写法共用一份案件缓存
+        （企业信息通常命中缓存；未命中时两次上游调用串行执行）
+
+        Args:
+            company_name: 公司名称
+
+        Returns:
+            ({"enterprise_info": ..., "legal_analysis": ...}, 是否全部来自缓存)
+        """
+        enterprise_info, enterprise_cached = await self.get(SOURCE_ENTERPRISE, company_name)
+        credit_no = (enterprise_info or {}).get("credit_no") if isinstance(enterprise_info, dict) else None
+        legal_analysis, legal_cached = await self.get(
+            SOURCE_LEGAL, company_name, cache_name=f"credit_no:{credit_no}" if credit_no else None
+        )
+        return {
+            "enterprise_info": enterprise_info,
+            "legal_analysis": legal_analysis,
+        }, enterprise_cached and legal_cached
+
+
+# 创建全局公司情报缓存实例
+company_intel_cache = CompanyIntelCache()
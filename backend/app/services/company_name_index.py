@@ -0,0 +1,235 @@
+"""
+公司名称联想索引
+小程序输入公司名时逐字请求 /companies/search，直接调用聚合数据搜索接口既慢又按次计费：
+- 进程内二元组（bigram）倒排索引，本地联想查询在毫秒级完成
+- 索引来源：已完成检测的 company_scans（公司名及 company_info.name），以及上游搜索返回的公司名
+- 新公司名写入 Redis 有序集合（score 为写入时间），各进程按时间增量拉取，多 worker 间共享
+- 本地结果不足时才回退到付费搜索接口
+- 进程内最多收录 COMPANY_INDEX_MAX_NAMES 个公司名，超出时淘汰最早加入的一批
+- 数据库加载失败时不标记为已加载，按 LOAD_RETRY_INTERVAL 起指数退避重试
+
+Redis 键约定：
+- company_names:index  新增公司名（ZSET，score 为写入时间戳）
+"""
+import asyncio
+import bisect
+import heapq
+import time
+from typing import Dict, Iterable, List, Set
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import CompanyScan
+from app.services.redis_cache import cache
+from app.services.company_intel_cache import normalize_company_name
+import logging
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = "company_names:index"
+MAX_SCAN = 2000  # 包含匹配时最多检查的候选数，避免“有限公司”这类高频词扫描全部公司名
+LOAD_RETRY_INTERVAL = 30  # 数据库加载失败后首次重试间隔（秒），之后翻倍
+LOAD_RETRY_MAX_INTERVAL = 600
+EVICT_FRACTION = 0.1  # 超出上限时一次淘汰的比例，避免每加入一个名字都重建前缀有序表
+
+
+def _bigrams(text: str) -> Set[str]:
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class CompanyNameIndex:
+    """公司名称联想索引（进程内）"""
+
+    def __init__(self):
+        # id 单调递增，字典按插入顺序保存，淘汰时从最早加入的开始
+        self._names: Dict[int, str] = {}
+        self._normalized: Dict[int, str] = {}
+        self._next_id = 0
+        self._ids: Dict[str, int] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._sorted: List[tuple] = []  # (规范化公司名, id)，用于前缀匹配
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._load_failures = 0
+        self._next_load_at = 0.0
+        self._synced_score = 0.0
+        self._last_sync = 0.0
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: str, keep_sorted: bool = True) -> bool:
+        """
+        加入一个公司名（已存在则忽略）
+
+        Args:
+            name: 公司名
+            keep_sorted: 是否立即维护前缀有序表（批量加载时传 False，加载完统一排序）
+
+        Returns:
+            是否为新公司名
+        """
+        name = (name or "").strip()
+        normalized = normalize_company_name(name)
+        if len(normalized) < 2 or normalized in self._ids:
+            return False
+        doc_id = self._next_id
+        self._next_id += 1
+        self._names[doc_id] = name
+        self._normalized[doc_id] = normalized
+        self._ids[normalized] = doc_id
+        for gram in _bigrams(normalized):
+            self._postings.setdefault(gram, set()).add(doc_id)
+        if keep_sorted:
+            bisect.insort(self._sorted, (normalized, doc_id))
+        else:
+            self._sorted.append((normalized, doc_id))
+        if len(self._names) > settings.COMPANY_INDEX_MAX_NAMES:
+            self._evict()
+        return True
+
+    def _evict(self) -> None:
+        """淘汰最早加入的公司名，使索引回到上限以内"""
+        limit = max(settings.COMPANY_INDEX_MAX_NAMES, 1)
+        count = len(self._names) - limit + max(int(limit * EVICT_FRACTION), 1)
+        evicted = set()
+        for doc_id in list(self._names)[:count]:
+            normalized = self._normalized.pop(doc_id)
+            del self._names[doc_id]
+            del self._ids[normalized]
+            for gram in _bigrams(normalized):
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    posting.discard(doc_id)
+                    if not posting:
+                        del self._postings[gram]
+            evicted.add(doc_id)
+        self._sorted = [item for item in self._sorted if item[1] not in evicted]
+        logger.info(f"公司名称索引超出上限，淘汰 {len(evicted)} 个")
+
+    def search(self, keyword: str, limit: int = 5) -> List[str]:
+        """
+        联想查询：包含关键词的公司名，前缀匹配优先，其次名称较短者优先
+
+        Args:
+            keyword: 输入关键词
+            limit: 最多返回条数
+
+        Returns:
+            公司名列表
+        """
+        query = normalize_company_name(keyword)
+        if len(query) < 2:
+            return []
+
+        # 1. 前缀匹配：有序表二分查找
+        results: List[int] = []
+        pos = bisect.bisect_left(self._sorted, (query, -1))
+        while pos < len(self._sorted) and len(results) < limit * 4:
+            normalized, doc_id = self._sorted[pos]
+            if not normalized.startswith(query):
+                break
+            results.append(doc_id)
+            pos += 1
+        results = heapq.nsmallest(limit, results, key=lambda doc_id: (len(self._normalized[doc_id]), doc_id))
+        if len(results) >= limit:
+            return [self._names[doc_id] for doc_id in results]
+
+        # 2. 包含匹配：二元组倒排表求交集
+        postings = [self._postings.get(gram) for gram in _bigrams(query)]
+        if not all(postings):
+            return [self._names[doc_id] for doc_id in results]
+        postings.sort(key=len)
+        seen = set(results)
+        matched = []
+        for doc_id in postings[0]:
+            if len(matched) >= MAX_SCAN:
+                break
+            if doc_id in seen or any(doc_id not in posting for posting in postings[1:]):
+                continue
+            if query in self._normalized[doc_id]:
+                matched.append(doc_id)
+        results += heapq.nsmallest(limit - len(results), matched,
+                                   key=lambda doc_id: (len(self._normalized[doc_id]), doc_id))
+        return [self._names[doc_id] for doc_id in results]
+
+    async def ensure_loaded(self) -> None:
+        """首次使用时从数据库加载已检测过的公司名（失败时退避重试），并从Redis增量同步"""
+        if not self._loaded and time.time() >= self._next_load_at:
+            async with self._load_lock:
+                if not self._loaded and time.time() >= self._next_load_at:
+                    if await self._load_from_db():
+                        self._loaded = True
+                    else:
+                        self._load_failures += 1
+                        delay = min(LOAD_RETRY_INTERVAL * 2 ** (self._load_failures - 1), LOAD_RETRY_MAX_INTERVAL)
+                        self._next_load_at = time.time() + delay
+        if time.time() - self._last_sync >= settings.COMPANY_INDEX_SYNC_INTERVAL:
+            await self._sync_from_redis()
+
+    async def _load_from_db(self) -> bool:
+        start = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(CompanyScan.company_name, CompanyScan.company_info)
+                    .where(CompanyScan.status == "completed")
+                    .order_by(CompanyScan.id.desc())
+                    .limit(settings.COMPANY_INDEX_MAX_NAMES)
+                )
+                # 从旧到新加入，超出上限时先淘汰较早的检测
+                for company_name, company_info in reversed(result.all()):
+                    self.add(company_name, keep_sorted=False)
+                    if isinstance(company_info, dict):
+                        self.add(company_info.get("name") or "", keep_sorted=False)
+            self._sorted.sort()
+            logger.info(f"公司名称索引加载完成: {len(self)} 个, 耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+            return True
+        except Exception as e:
+            self._sorted.sort()
+            logger.warning(f"公司名称索引加载失败，稍后重试: {e}")
+            return False
+
+    async def _sync_from_redis(self) -> None:
+        self._last_sync = time.time()
+        if not cache.client:
+            return
+        try:
+            rows = await cache.client.zrangebyscore(REDIS_KEY, f"({self._synced_score}", "+inf", withscores=True)
+        except Exception as e:
+            logger.warning(f"同步公司名称索引失败: {e}")
+            return
+        added = False
+        for name, score in rows:
+            added = self.add(name, keep_sorted=False) or added
+            self._synced_score = max(self._synced_score, score)
+        if added:
+            self._sorted.sort()
+
+    async def publish(self, names: Iterable[str]) -> None:
+        """
+        加入本进程索引并写入Redis，其他进程下次同步时获得
+
+        Args:
+            names: 公司名列表
+        """
+        new_names = [n.strip() for n in names if n and self.add(n)]
+        if not new_names or not cache.client:
+            return
+        try:
+            now = time.time()
+            pipe = cache.client.pipeline(transaction=False)
+            pipe.zadd(REDIS_KEY, {name: now for name in new_names})
+            # 只保留最近写入的 COMPANY_INDEX_MAX_NAMES 个
+            pipe.zremrangebyrank(REDIS_KEY, 0, -settings.COMPANY_INDEX_MAX_NAMES - 1)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"写入公司名称索引失败: {e}")
+
+
+# 创建全局公司名称索引实例
+company_name_index = CompanyNameIndex()
@@ -0,0 +1,236 @@
+"""
+施工提醒引擎
+阶段开始/验收提醒原先由 GET /constructions/reminder-schedule 按用户逐个遍历 stages 计算，
+没有定时任务调用，提醒从未真正发出：
+- 进度计划、阶段时间校准、阶段状态或提醒设置变化时，重新生成该用户未来的提醒事件（reminder_events）
+- worker 周期任务按 remind_at 取出到期事件，每批一个事务：批量写入消息中心并标记已发送（FOR UPDATE SKIP LOCKED）
+- 提交后再将小程序订阅消息提交到发送队列（wechat_dispatcher），推送失败不影响消息中心
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import with_session
+from app.services.job_queue import register_periodic
+from app.services.message_service import create_messages_bulk
+from app.services.wechat_dispatcher import wechat_dispatcher
+import logging
+
+logger = logging.getLogger(__name__)
+
+STAGE_ORDER = getattr(settings, "STAGE_ORDER", None) or ["S00", "S01", "S02", "S03", "S04", "S05"]
+STAGE_NAMES = {
+    "S00": "材料进场核对", "S01": "隐蔽工程", "S02": "泥瓦工",
+    "S03": "木工", "S04": "油漆", "S05": "安装收尾",
+}
+# 已通过（不再需要验收提醒）的阶段状态
+PASSED_STATUSES = ("checked", "passed", "completed", "rectify_exhausted")
+REMINDER_LINK = "/pages/construction/index"
+
+
+def _to_date(value: Any) -> Optional[date]:
+    """stages 中的日期可能是 date/datetime 或 ISO 字符串"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            return date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+    return None
+
+
+def compute_reminder_events(
+    stages: Dict[str, Any],
+    reminder_days_before: int = 3,
+    notify_progress: bool = True,
+    notify_acceptance: bool = True,
+    today: Optional[date] = None,
+) -> List[Dict[str, Any]]:
+    """
+    根据阶段计划计算今天及以后需要发送的提醒
+
+    提前天数与开关规则与原 reminder-schedule 接口一致；验收日期优先使用校准后的 acceptance_date。
+    已开始的阶段不再提醒开始，已通过的阶段不再提醒验收
+
+    Args:
+        stages: Construction.stages
+        reminder_days_before: 提前提醒天数
+        notify_progress: 是否提醒阶段开始
+        notify_acceptance: 是否提醒验收
+        today: 当天日期（默认今天）
+
+    Returns:
+        提醒事件列表（stage / event_type / planned_date / reminder_days_before / remind_at）
+    """
+    today = today or date.today()
+    n_days = reminder_days_before or 3
+    if not notify_progress:
+        n_days = 0
+    send_time = time(settings.REMINDER_SEND_HOUR, 0)
+
+    events = []
+    for stage_key in STAGE_ORDER:
+        s = stages.get(stage_key)
+        if not isinstance(s, dict):
+            continue
+        stage_status = s.get("status") or "pending"
+        planned = []
+        if notify_progress and stage_status == "pending":
+            planned.append(("stage_start", _to_date(s.get("start_date"))))
+        if notify_acceptance and stage_status not in PASSED_STATUSES:
+            planned.append(("stage_acceptance", _to_date(s.get("acceptance_date") or s.get("end_date"))))
+        for event_type, planned_date in planned:
+            if not planned_date:
+                continue
+            remind_date = planned_date - timedelta(days=n_days)
+            if remind_date < today:
+                continue
+            events.append({
+                "stage": stage_key,
+                "event_type": event_type,
+                "planned_date": planned_date,
+                "reminder_days_before": n_days,
+                "remind_at": datetime.combine(remind_date, send_time),
+            })
+    return events
+
+
+async def materialize_reminders(db: AsyncSession, user_id: int) -> int:
+    """
+    重新生成用户的待发送提醒（删除旧的待发送事件后写入），在修改进度计划/设置的同一事务中调用，由调用方提交
+
+    Args:
+        db: 数据库会话
+        user_id: 用户ID
+
+    Returns:
+        生成的提醒数
+    """
+    # 延迟导入，避免循环导入
+    from app.models import Construction, UserSetting, ReminderEvent
+    await db.execute(
+        delete(ReminderEvent).where(ReminderEvent.user_id == user_id, ReminderEvent.status == "pending")
+    )
+    construction = (await db.execute(
+        select(Construction).where(Construction.user_id == user_id)
+    )).scalar_one_or_none()
+    stages = construction.stages if construction else None
+    if not isinstance(stages, dict) or not stages:
+        return 0
+    user_setting = (await db.execute(
+        select(UserSetting).where(UserSetting.user_id == user_id)
+    )).scalar_one_or_none()
+
+    events = compute_reminder_events(
+        stages,
+        reminder_days_before=user_setting.reminder_days_before if user_setting else 3,
+        notify_progress=user_setting.notify_progress if user_setting else True,
+        notify_acceptance=user_setting.notify_acceptance if user_setting else True,
+    )
+    if events:
+        # 相同阶段、相同计划日期已发送过的提醒不再生成
+        await db.execute(
+            pg_insert(ReminderEvent)
+            .values([{"user_id": user_id, "status": "pending", **e} for e in events])
+            .on_conflict_do_nothing(constraint="uq_reminder_event")
+        )
+    return len(events)
+
+
+def _reminder_message(user_id: int, stage: str, event_type: str, planned_date: date) -> Dict[str, Any]:
+    name = STAGE_NAMES.get(stage, stage)
+    if event_type == "stage_start":
+        title = f"施工提醒：{name}阶段将于{planned_date}开始"
+        content = f"您的「{name}」阶段计划于 {planned_date} 开始，请提前确认材料进场和施工人员安排。"
+    else:
+        title = f"验收提醒：{name}阶段将于{planned_date}验收"
+        content = f"您的「{name}」阶段计划于 {planned_date} 验收，请提前拍摄施工照片，可使用AI验收检查施工质量。"
+    return {
+        "user_id": user_id,
+        "category": "progress",
+        "title": title,
+        "content": content,
+        "summary": title,
+        "link_url": REMINDER_LINK,
+    }
+
+
+async def _send_subscribe_messages(rows: List[Any]) -> None:
+    """提交小程序订阅消息到发送队列（模板示例：阶段{{thing1.DATA}} 日期{{date2.DATA}} 提醒{{thing3.DATA}}）"""
+    template_id = settings.WECHAT_SUBSCRIBE_CONSTRUCTION_REMINDER
+    if not template_id:
+        return
+    await wechat_dispatcher.enqueue_many([
+        {
+            "openid": row.wx_openid,
+            "template_id": template_id,
+            "data": {
+                "thing1": {"value": STAGE_NAMES.get(row.stage, row.stage)[:20]},
+                "date2": {"value": str(row.planned_date)},
+                "thing3": {"value": "开工提醒" if row.event_type == "stage_start" else "验收提醒"},
+            },
+            "page": REMINDER_LINK,
+        }
+        for row in rows
+    ])
+
+
+async def dispatch_due_reminders(batch_size: Optional[int] = None) -> int:
+    """
+    发送到期的提醒：每批在一个事务中锁定事件、写入消息中心并标记已发送，提交后推送订阅消息
+
+    Args:
+        batch_size: 每批事件数，默认取 REMINDER_DISPATCH_BATCH_SIZE
+
+    Returns:
+        发送的提醒数
+    """
+    # 延迟导入，避免循环导入
+    from app.models import ReminderEvent, User
+    batch_size = batch_size or settings.REMINDER_DISPATCH_BATCH_SIZE
+    total = 0
+    while True:
+        now = datetime.now()
+        async with with_session() as db:
+            rows = (await db.execute(
+                select(
+                    ReminderEvent.id, ReminderEvent.user_id, ReminderEvent.stage,
+                    ReminderEvent.event_type, ReminderEvent.planned_date, User.wx_openid,
+                )
+                .join(User, User.id == ReminderEvent.user_id)
+                .where(ReminderEvent.status == "pending", ReminderEvent.remind_at <= now)
+                .order_by(ReminderEvent.remind_at)
+                .limit(batch_size)
+                .with_for_update(of=ReminderEvent, skip_locked=True)
+            )).all()
+            if rows:
+                await create_messages_bulk(db, [
+                    _reminder_message(r.user_id, r.stage, r.event_type, r.planned_date) for r in rows
+                ])
+                await db.execute(
+                    update(ReminderEvent)
+                    .where(ReminderEvent.id.in_([r.id for r in rows]))
+                    .values(status="sent", sent_at=now)
+                )
+        if not rows:
+            break
+        total += len(rows)
+        await _send_subscribe_messages(rows)
+        if len(rows) < batch_size:
+            break
+    if total:
+        logger.info(f"施工提醒发送完成: {total} 条")
+    return total
+
+
+@register_periodic("construction_reminder_dispatch", interval=settings.REMINDER_DISPATCH_INTERVAL)
+async def dispatch_reminders_job() -> None:
+    """周期发送到期提醒（worker 进程执行）"""
+    await dispatch_due_reminders()
@@ -6,13 +6,23 @@
 import logging
 import asyncio
 import time
-from typing import Dict, Optional, Any, List
+from typing import Awaitable, Callable, Dict, Optional, Any, List, Tuple
 import httpx
 from openai import AsyncOpenAI
 from app.core.config import settings
+from app.services.http_client import get_http_client
+from app.services.ai_governor import (
+    AIUpstreamBusy, PROVIDER_COZE_API, PROVIDER_COZE_SITE, PROVIDER_DEEPSEEK, ai_governor,
+)
+from app.services.coze_stream import (
+    IncrementalJsonObject, TOOL_CALL_SNIFF_CHARS, is_tool_event, looks_like_tool_call,
+)
 
 logger = logging.getLogger(__name__)
 
+# 流式分析进度回调：参数为部分结果 {"fields": {...}, "counts": {...}}
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
 
 class CozeService:
     """扣子智能体服务"""
@@ -36,6 +46,10 @@ def __init__(self):
             base_url=settings.DEEPSEEK_API_BASE or "https://api.deepseek.com/v1"
         )
         self.use_deepseek = bool(settings.DEEPSEEK_API_KEY)
+
+        # 验收多图分析并发限制（全局 + 单用户，单用户信号量在无进行中任务时回收）
+        self._acceptance_slots = asyncio.Semaphore(settings.ACCEPTANCE_IMAGE_CONCURRENCY)
+        self._acceptance_user_slots: Dict[int, list] = {}
         
         if not self.use_site_api and not self.use_open_api and not self.use_deepseek:
             logger.warning("AI分析服务配置不完整，功能将不可用")
@@ -49,13 +63,15 @@ def __init__(self):
             if self.use_deepseek:
                 logger.info(f"DeepSeek API配置: 已启用")
     
-    async def analyze_quote(self, image_url: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    async def analyze_quote(self, image_url: str, user_id: Optional[int] = None,
+                            on_progress: Optional[ProgressCallback] = None) -> Optional[Dict[str, Any]]:
         """
         分析报价单图片
         
         Args:
             image_url: 图片URL（OSS签名URL）
             user_id: 用户ID（可选）
+            on_progress: 流式分析进度回调（可选，仅扣子站点API支持）
             
         Returns:
             分析结果字典，如果失败返回None
@@ -102,7 +118,7 @@ async def analyze_quote(self, image_url: str, user_id: Optional[int] = None) ->
             # 尝试扣子服务
             result = None
             if self.use_site_api:
-                result = await self._call_site_api(image_url, prompt, user_id)
+                result = await self._call_site_api(image_url, prompt, user_id, on_progress)
                 if not result and self.use_deepseek:
                     logger.info("扣子站点API调用失败，降级使用DeepSeek API")
                     result = await self._call_deepseek_api(image_url, prompt, user_id)
@@ -127,11 +143,15 @@ async def analyze_quote(self, image_url: str, user_id: Optional[int] = None) ->
                 logger.error("AI分析失败，返回兜底数据")
                 return self._get_fallback_quote_analysis(image_url)
                 
+        except AIUpstreamBusy:
+            raise
         except Exception as e:
             logger.error(f"扣子智能体分析异常: {e}", exc_info=True)
             return None
     
-    async def _call_site_api(self, image_url: str, prompt: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    @ai_governor.governed(PROVIDER_COZE_SITE)
+    async def _call_site_api(self, image_url: str, prompt: str, user_id: Optional[int] = None,
+                             on_progress: Optional[ProgressCallback] = None) -> Optional[Dict[str, Any]]:
         """
         调用扣子站点API（处理流式响应）
 
@@ -139,6 +159,7 @@ async def _call_site_api(self, image_url: str, prompt: str, user_id: Optional[in
             image_url: 图片URL
             prompt: 提示词
             user_id: 用户ID
+            on_progress: 进度回调，流式解析出新字段时以部分结果调用
 
         Returns:
             分析结果
@@ -182,18 +203,32 @@ async def _call_site_api(self, image_url: str, prompt: str, user_id: Optional[in
                 "Content-Type": "application/json"
             }
 
-            # 设置超时（120秒，图片分析需要更长时间）
-            timeout = httpx.Timeout(120.0, connect=10.0)
+            # 读超时按最后收到的数据（含心跳）计算：连接静默超过 idle_timeout 判定为中断；
+            # 图片分析首个正文可能较晚，单独给 first_token_timeout 的等待时间
+            idle_timeout = settings.COZE_SITE_IDLE_TIMEOUT
+            first_token_timeout = settings.COZE_SITE_FIRST_TOKEN_TIMEOUT
+            timeout = httpx.Timeout(first_token_timeout, connect=10.0, read=idle_timeout)
 
-            # 处理流式响应 - 采用设计师智能体的成功模式
-            async def _do_stream() -> Optional[str]:
-                async with httpx.AsyncClient(timeout=timeout) as client:
-                    async with client.stream("POST", api_url, json=data, headers=headers) as response:
+            # 处理流式响应：逐块增量解析，返回 (正文, 流类型)
+            # 流类型：content 有正文 / empty 空流 / tool_call 工具调用流（重试也不会得到分析结果）
+            # 已收到正文后连接中断（读超时）向上抛出按失败处理，不解析不完整的 JSON
+            async def _do_stream() -> Tuple[Optional[str], str]:
+                client = get_http_client("coze_site")
+                chunks = []
+                raw_samples = []
+                content_length = 0
+                saw_tool_event = False
+                scanner = IncrementalJsonObject()
+                started = time.monotonic()
+                try:
+                    async with client.stream("POST", api_url, json=data, headers=headers, timeout=timeout) as response:
                         response.raise_for_status()
-                        
-                        chunks = []
-                        raw_samples = []
+
                         async for line in response.aiter_lines():
+                            # 只有心跳、迟迟没有正文：判定为空流，不再等下去
+                            if not chunks and time.monotonic() - started > first_token_timeout:
+                                logger.warning(f"扣子站点{first_token_timeout:.0f}秒内无正文，按空流处理")
+                                break
                             line = (line or "").strip()
                             if not line or line == "data: [DONE]":
                                 continue
@@ -204,41 +239,70 @@ async def _do_stream() -> Optional[str]:
                             json_str = line[5:].strip()
                             try:
                                 data_chunk = json.loads(json_str)
-                                # 提取内容
-                                content = self._extract_content_from_stream(data_chunk)
-                                if content:
-                                    chunks.append(content)
-                                    if len(chunks) <= 2:
-                                        logger.info(f"扣子站点提取chunk len={len(content)}")
                             except json.JSONDecodeError:
                                 logger.debug(f"流式响应JSON解析失败: {json_str[:100]}...")
                                 continue
-                        
-                        # 合并所有chunks
-                        full_content = "".join(chunks).strip()
-                        logger.info(f"扣子站点API流式响应接收完成，共{len(chunks)}个数据块，总长度: {len(full_content)}字符")
-                        
-                        if not full_content and raw_samples:
-                            logger.warning(
-                                f"扣子站点返回无解析文本。样本行: {raw_samples}"
-                            )
-                        return full_content if full_content else None
+                            if not isinstance(data_chunk, dict):
+                                continue
+                            if is_tool_event(data_chunk):
+                                saw_tool_event = True
+
+                            # 提取内容
+                            content = self._extract_content_from_stream(data_chunk)
+                            if not content:
+                                continue
+                            chunks.append(content)
+                            if len(chunks) <= 2:
+                                logger.info(f"扣子站点提取chunk len={len(content)}")
+
+                            # 正文开头即为工具调用说明：不必等流结束，直接交给调用方降级
+                            if content_length < TOOL_CALL_SNIFF_CHARS and not scanner.fields \
+                                    and looks_like_tool_call("".join(chunks)):
+                                logger.warning("扣子站点正文为工具调用说明，提前结束读取")
+                                return None, "tool_call"
+                            content_length += len(content)
+
+                            if scanner.feed(content) and on_progress:
+                                await on_progress(scanner.snapshot())
+                            if scanner.complete:
+                                logger.info("扣子站点JSON结果已完整，提前结束读取")
+                                break
+                except httpx.ReadTimeout:
+                    if chunks:
+                        logger.error(f"扣子站点输出正文后{idle_timeout:.0f}秒无数据，连接中断")
+                        raise
+                    logger.warning(f"扣子站点{idle_timeout:.0f}秒内无数据，按空流处理")
+
+                # 合并所有chunks
+                full_content = "".join(chunks).strip()
+                logger.info(f"扣子站点API流式响应接收完成，共{len(chunks)}个数据块，总长度: {len(full_content)}字符")
+
+                if full_content:
+                    return full_content, "content"
+                if raw_samples:
+                    logger.warning(
+                        f"扣子站点返回无解析文本。样本行: {raw_samples}"
+                    )
+                return None, "tool_call" if saw_tool_event else "empty"
 
             # 调用流式处理函数
-            result_text = await _do_stream()
-            
-            # 扣子流式有时先返回 message_start、正文稍后才到，空结果时重试最多 2 次
-            for retry in range(2):
-                if result_text:
+            result_text, stream_kind = await _do_stream()
+
+            # 扣子流式偶发空结果，按配置重试；工具调用流重试也不会得到正文，不再重试
+            for retry in range(settings.COZE_SITE_EMPTY_RETRIES):
+                if stream_kind != "empty":
                     break
-                await asyncio.sleep(5)  # 等待更长时间再重试
+                await asyncio.sleep(settings.COZE_SITE_RETRY_DELAY)
                 logger.info(f"扣子站点空结果，第{retry + 1}次重试")
-                result_text = await _do_stream()
-            
+                result_text, stream_kind = await _do_stream()
+
+            if stream_kind == "tool_call":
+                logger.error("扣子站点返回工具调用而非分析结果，交由调用方降级")
+                return None
             if not result_text:
                 logger.error("扣子站点API流式响应内容为空！")
                 return None
-            
+
             # 尝试解析为JSON
             try:
                 result_data = json.loads(result_text)
@@ -249,7 +313,7 @@ async def _do_stream() -> Optional[str]:
                 return self._extract_json_from_text(result_text)
 
         except httpx.TimeoutException:
-            logger.error("扣子站点API调用超时（120秒）")
+            logger.error("扣子站点API调用超时")
             return None
         except httpx.HTTPStatusError as e:
             body = ""
@@ -279,6 +343,7 @@ async def _do_stream() -> Optional[str]:
             logger.error(f"扣子站点API调用异常: {e}", exc_info=True)
             return None
     
+    @ai_governor.governed(PROVIDER_COZE_API)
     async def _call_open_api(self, image_url: str, prompt: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """
         调用扣子开放平台API
@@ -317,16 +382,16 @@ async def _call_open_api(self, image_url: str, prompt: str, user_id: Optional[in
             # 设置超时（60秒）
             timeout = httpx.Timeout(60.0, connect=10.0)
             
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(api_url, json=data, headers=headers)
-                response.raise_for_status()
-                
-                # 解析响应
-                result_data = response.json()
-                logger.debug(f"扣子开放平台API响应: {json.dumps(result_data, ensure_ascii=False)[:500]}...")
-                
-                return self._parse_coze_response(result_data)
-                
+            client = get_http_client("coze_api")
+            response = await client.post(api_url, json=data, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            
+            # 解析响应
+            result_data = response.json()
+            logger.debug(f"扣子开放平台API响应: {json.dumps(result_data, ensure_ascii=False)[:500]}...")
+            
+            return self._parse_coze_response(result_data)
+            
         except httpx.TimeoutException:
             logger.error("扣子开放平台API调用超时（60秒）")
             return None
@@ -337,6 +402,7 @@ async def _call_open_api(self, image_url: str, prompt: str, user_id: Optional[in
             logger.error(f"扣子开放平台API调用异常: {e}", exc_info=True)
             return None
     
+    @ai_governor.governed(PROVIDER_DEEPSEEK)
     async def _call_deepseek_api(self, image_url: str, prompt: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """
         调用DeepSeek API作为备用服务
@@ -1053,13 +1119,15 @@ def _convert_contract_to_quote_format(self, contract_result: Dict[str, Any]) ->
                 "market_ref_price": None
             }
     
-    async def analyze_contract(self, image_url: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    async def analyze_contract(self, image_url: str, user_id: Optional[int] = None,
+                               on_progress: Optional[ProgressCallback] = None) -> Optional[Dict[str, Any]]:
         """
         分析合同图片 - 重新设计以确保分析成功
         
         Args:
             image_url: 图片URL（OSS签名URL）
             user_id: 用户ID
+            on_progress: 流式分析进度回调（可选，仅扣子站点API支持）
             
         Returns:
             分析结果
@@ -1117,7 +1185,7 @@ async def analyze_contract(self, image_url: str, user_id: Optional[int] = None)
             result = None
             if self.use_site_api:
                 logger.info("使用扣子站点API分析合同")
-                result = await self._call_site_api(image_url, prompt, user_id)
+                result = await self._call_site_api(image_url, prompt, user_id, on_progress)
                 if result:
                     logger.info(f"✅ 扣子站点API合同分析成功")
                 else:
@@ -1165,6 +1233,8 @@ async def analyze_contract(self, image_url: str, user_id: Optional[int] = None)
             logger.info(f"返回兜底合同分析数据: {list(fallback.keys())}")
             return fallback
             
+        except AIUpstreamBusy:
+            raise
         except Exception as e:
             logger.error(f"❌ 合同分析异常: {e}", exc_info=True)
             # 异常时也返回兜底数据而不是错误
@@ -1219,6 +1289,8 @@ async def analyze_acceptance(self, image_url: str, user_id: Optional[int] = None
                 return result
             return None
 
+        except AIUpstreamBusy:
+            raise
         except Exception as e:
             logger.error(f"验收单分析异常: {e}", exc_info=True)
             return None
@@ -1274,38 +1346,182 @@ async def analyze_acceptance_photos(self, stage: str, image_urls: List[str], use
 
 请确保返回的是纯JSON格式，不要包含其他文本。"""
 
-            # 使用第一张图片进行分析（后续可以优化为多图分析）
-            first_image_url = image_urls[0]
-            
-            # 尝试扣子服务
-            result = None
-            if self.use_site_api:
-                result = await self._call_site_api(first_image_url, prompt, user_id)
-                if not result and self.use_deepseek:
-                    logger.info("扣子站点API调用失败，降级使用DeepSeek API")
-                    result = await self._call_deepseek_api(first_image_url, prompt, user_id)
-            elif self.use_open_api:
-                result = await self._call_open_api(first_image_url, prompt, user_id)
-                if not result and self.use_deepseek:
-                    logger.info("扣子开放平台API调用失败，降级使用DeepSeek API")
-                    result = await self._call_deepseek_api(first_image_url, prompt, user_id)
-            elif self.use_deepseek:
-                result = await self._call_deepseek_api(first_image_url, prompt, user_id)
-            else:
+            if not (self.use_site_api or self.use_open_api or self.use_deepseek):
                 logger.error("AI分析服务配置不完整，无法调用")
                 return None
 
-            if result:
-                # 根据用户要求：前端必须原样展示AI智能体返回的数据
-                # 不再进行格式转换，直接返回AI智能体的原始结果
-                logger.info("直接返回AI验收照片分析原始结果，不进行格式转换")
-                return result
-            return None
+            if len(image_urls) == 1:
+                result = await self._call_with_fallback(image_urls[0], prompt, user_id)
+                if result:
+                    # 根据用户要求：前端必须原样展示AI智能体返回的数据
+                    # 不再进行格式转换，直接返回AI智能体的原始结果
+                    logger.info("直接返回AI验收照片分析原始结果，不进行格式转换")
+                    return result
+                return None
+
+            # 多张照片：每张单独分析并发执行，在总时限内合并已完成的结果
+            tasks = [
+                asyncio.create_task(self._analyze_acceptance_image(url, prompt, user_id))
+                for url in image_urls
+            ]
+            done, pending = await asyncio.wait(tasks, timeout=settings.ACCEPTANCE_ANALYSIS_DEADLINE)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"验收多图分析超过时限，{len(pending)}/{len(tasks)} 张照片未完成")
+
+            results = []
+            busy = None
+            for index, task in enumerate(tasks, start=1):
+                if task not in done or task.cancelled():
+                    continue
+                if isinstance(task.exception(), AIUpstreamBusy):
+                    busy = task.exception()
+                elif task.exception() is None and task.result():
+                    results.append((index, task.result()))
+            if not results:
+                # 全部照片都未排到AI名额时向上报告排队，而不是当作分析失败
+                if busy:
+                    raise busy
+                return None
+            return self._merge_acceptance_results(results, len(image_urls))
 
+        except AIUpstreamBusy:
+            raise
         except Exception as e:
             logger.error(f"验收照片分析异常: {e}", exc_info=True)
             return None
 
+    async def _call_with_fallback(self, image_url: str, prompt: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        按配置调用AI服务（扣子站点API / 开放平台API），失败时降级到DeepSeek
+
+        Args:
+            image_url: 图片URL
+            prompt: 提示词
+            user_id: 用户ID
+
+        Returns:
+            AI返回结果，全部失败返回None
+        """
+        result = None
+        if self.use_site_api:
+            result = await self._call_site_api(image_url, prompt, user_id)
+            if not result and self.use_deepseek:
+                logger.info("扣子站点API调用失败，降级使用DeepSeek API")
+                result = await self._call_deepseek_api(image_url, prompt, user_id)
+        elif self.use_open_api:
+            result = await self._call_open_api(image_url, prompt, user_id)
+            if not result and self.use_deepseek:
+                logger.info("扣子开放平台API调用失败，降级使用DeepSeek API")
+                result = await self._call_deepseek_api(image_url, prompt, user_id)
+        elif self.use_deepseek:
+            result = await self._call_deepseek_api(image_url, prompt, user_id)
+        return result
+
+    async def _analyze_acceptance_image(self, image_url: str, prompt: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """在全局和单用户并发限制下分析一张验收照片"""
+        key = user_id if user_id is not None else 0
+        user_slot = self._acceptance_user_slots.get(key)
+        if user_slot is None:
+            user_slot = self._acceptance_user_slots[key] = [asyncio.Semaphore(settings.ACCEPTANCE_USER_IMAGE_CONCURRENCY), 0]
+        user_slot[1] += 1
+        try:
+            async with user_slot[0], self._acceptance_slots:
+                return await self._call_with_fallback(image_url, prompt, user_id)
+        except AIUpstreamBusy:
+            raise
+        except Exception as e:
+            logger.warning(f"验收照片分析失败: {image_url[:100]}, 错误: {e}")
+            return None
+        finally:
+            user_slot[1] -= 1
+            if user_slot[1] == 0:
+                self._acceptance_user_slots.pop(key, None)
+
+    def _merge_acceptance_results(self, results: List[tuple], total_images: int) -> Dict[str, Any]:
+        """
+        合并多张照片的验收分析结果
+
+        - 问题按 item 去重，保留最高严重程度，记录出现在哪几张照片
+        - 验收状态取最差，质量评分取平均（存在严重问题时不高于最低分照片）
+        - 通过项目、整改建议去重合并，已有问题的项目不再计入通过项
+
+        Args:
+            results: [(照片序号, 单张分析结果), ...]
+            total_images: 照片总数
+
+        Returns:
+            标准验收格式的合并结果
+        """
+        if len(results) == 1 and total_images == 1:
+            return results[0][1]
+
+        severity_rank = {"low": 0, "mid": 1, "medium": 1, "high": 2}
+        status_rank = {"通过": 0, "部分通过": 1, "不通过": 2}
+
+        issues: Dict[str, Dict[str, Any]] = {}
+        passed_items: List[str] = []
+        suggestions: List[str] = []
+        summaries: List[str] = []
+        scores: List[float] = []
+        status = "通过"
+
+        for index, raw in results:
+            result = self._convert_acceptance_format(raw) if isinstance(raw, dict) else {}
+
+            item_status = result.get("acceptance_status")
+            if status_rank.get(item_status, -1) > status_rank[status]:
+                status = item_status
+
+            try:
+                scores.append(float(result.get("quality_score")))
+            except (TypeError, ValueError):
+                pass
+
+            for issue in result.get("issues") or []:
+                if isinstance(issue, str):
+                    issue = {"item": issue, "description": issue, "severity": "mid"}
+                if not isinstance(issue, dict):
+                    continue
+                name = str(issue.get("item") or issue.get("description") or "").strip()
+                if not name:
+                    continue
+                merged = issues.get(name.lower())
+                if merged is None:
+                    issues[name.lower()] = dict(issue, item=name, photo_indexes=[index])
+                    continue
+                merged["photo_indexes"].append(index)
+                if severity_rank.get(issue.get("severity"), 1) > severity_rank.get(merged.get("severity"), 1):
+                    merged["severity"] = issue.get("severity")
+                    merged["description"] = issue.get("description", merged.get("description"))
+
+            for item in result.get("passed_items") or []:
+                if isinstance(item, str) and item not in passed_items:
+                    passed_items.append(item)
+            for suggestion in result.get("suggestions") or []:
+                if isinstance(suggestion, str) and suggestion not in suggestions:
+                    suggestions.append(suggestion)
+            if result.get("summary"):
+                summaries.append(f"照片{index}：{result['summary']}")
+
+        passed_items = [item for item in passed_items if item.strip().lower() not in issues]
+        quality_score = round(sum(scores) / len(scores)) if scores else 60
+        if scores and status == "不通过":
+            quality_score = min(quality_score, round(min(scores)))
+
+        coverage = f"共{total_images}张照片，完成分析{len(results)}张"
+        return {
+            "acceptance_status": status,
+            "quality_score": quality_score,
+            "issues": list(issues.values()),
+            "passed_items": passed_items,
+            "suggestions": suggestions,
+            "summary": "；".join([coverage] + summaries),
+            "analyzed_images": len(results),
+            "total_images": total_images,
+        }
+
     def _convert_acceptance_format(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """
         转换扣子返回的验收分析格式
@@ -0,0 +1,154 @@
+"""
+扣子站点流式响应（SSE）增量解析
+扣子站点 /stream_run 逐块返回智能体输出的JSON文本，原先收齐全部数据块后才解析：
+- 顶层字段（risk_score、total_price 等）的值一完整就解析出来，数组字段（high_risk_items 等）逐项计数，用于实时进度
+- 顶层JSON对象闭合后即可结束读取，不必等待流关闭
+- 正文出现工具调用说明、或整条流只有工具事件时，判定为工具调用流，调用方直接降级
+"""
+import json
+from typing import Any, Dict, Optional
+
+# 与 CozeService._extract_json_from_text 判定兜底的关键词保持一致
+TOOL_CALL_KEYWORDS = ("analyze_contract_quote", "调用工具", "工具调用", "function_call", "tool_call")
+TOOL_CALL_SNIFF_CHARS = 500  # 只在正文开头检测工具调用说明
+
+
+def stream_event_type(data_chunk: Dict[str, Any]) -> str:
+    """数据块的事件类型（小写），无则为空串"""
+    event_type = data_chunk.get("type") or data_chunk.get("event") or ""
+    return event_type.lower() if isinstance(event_type, str) else ""
+
+
+def is_tool_event(data_chunk: Dict[str, Any]) -> bool:
+    """是否为工具/函数调用事件（智能体执行插件的中间过程）"""
+    event_type = stream_event_type(data_chunk)
+    if "tool" in event_type or "function" in event_type:
+        return True
+    return "tool_calls" in data_chunk or "function_call" in data_chunk
+
+
+def looks_like_tool_call(text: str) -> bool:
+    """正文开头是否为工具调用说明（而非分析结果）"""
+    head = text[:TOOL_CALL_SNIFF_CHARS].lower()
+    return any(keyword in head for keyword in TOOL_CALL_KEYWORDS)
+
+
+class IncrementalJsonObject:
+    """
+    增量扫描JSON对象
+
+    逐块喂入文本，跳过对象前的说明文字或 ```json 标记；顶层字段的值完整后立即解析，
+    顶层数组字段每完成一个元素计数一次。只扫描新增字符，整体为线性复杂度。
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.counts: Dict[str, int] = {}
+        self.complete = False
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self._str_start = 0
+        self._expect_key = True
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._container = ""
+
+    def feed(self, chunk: str) -> bool:
+        """
+        追加文本并继续扫描
+
+        Args:
+            chunk: 新到达的文本
+
+        Returns:
+            是否解析出新的字段或数组元素
+        """
+        if self.complete or not chunk:
+            return False
+        self._text += chunk
+        before = (len(self.fields), sum(self.counts.values()))
+        text = self._text
+        for i in range(self._pos, len(text)):
+            self._scan(text, i, text[i])
+            if self.complete:
+                break
+        self._pos = len(text)
+        return (len(self.fields), sum(self.counts.values())) != before
+
+    def snapshot(self) -> Dict[str, Any]:
+        """部分结果：已完成的标量字段和各数组字段的元素数"""
+        scalars = {k: v for k, v in self.fields.items() if not isinstance(v, (dict, list))}
+        return {"fields": scalars, "counts": dict(self.counts)}
+
+    def _record(self, end: int) -> None:
+        if self._key is not None and self._value_start is not None:
+            try:
+                self.fields[self._key] = json.loads(self._text[self._value_start:end])
+            except ValueError:
+                pass
+        self._value_start = None
+
+    def _scan(self, text: str, i: int, c: str) -> None:
+        if self._in_str:
+            if self._escape:
+                self._escape = False
+            elif c == "\\":
+                self._escape = True
+            elif c == '"':
+                self._in_str = False
+                if self._depth == 1 and self._expect_key:
+                    try:
+                        self._key = json.loads(text[self._str_start:i + 1])
+                    except ValueError:
+                        self._key = None
+                elif self._depth == 2 and self._container == "[" and self._key is not None:
+                    self.counts[self._key] = self.counts.get(self._key, 0) + 1
+            return
+
+        if self._depth == 0:
+            if c == "{":
+                self._depth = 1
+                self._expect_key = True
+            return
+
+        if c == '"':
+            self._in_str = True
+            self._str_start = i
+            if self._depth == 1 and not self._expect_key and self._value_start is None:
+                self._value_start = i
+            return
+        if c.isspace():
+            return
+
+        if self._depth == 1:
+            if c == ":":
+                self._expect_key = False
+                self._value_start = None
+            elif c in ",}":
+                self._record(i)
+                self._key = None
+                self._expect_key = True
+                if c == "}":
+                    self._depth = 0
+                    self.complete = True
+            elif c in "{[":
+                self._value_start = i
+                self._container = c
+                self._depth = 2
+                if c == "[" and self._key is not None:
+                    self.counts[self._key] = 0
+            elif self._value_start is None:
+                self._value_start = i
+            return
+
+        if c in "{[":
+            self._depth += 1
+        elif c in "}]":
+            self._depth -= 1
+            if self._depth == 1:
+                self._record(i + 1)
+            elif self._depth == 2 and self._container == "[" and self._key is not None:
+                self.counts[self._key] = self.counts.get(self._key, 0) + 1
@@ -7,6 +7,7 @@
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 from app.core.config import settings
+from app.services.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -41,37 +42,37 @@ async def _request_fengniao(
             return None
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                url = f"{self.api_host}{self.api_path}"
-                
-                # 添加认证参数
-                headers = {
-                    "Authorization": f"APPCODE {self.appcode}",
-                    "Content-Type": "application/json; charset=UTF-8"
-                }
-                
-                # 风鸟API使用POST请求，参数在body中
-                if params is None:
-                    params = {}
-                
-                # 风鸟API需要的参数格式
-                request_body = {
-                    "companyName": params.get("keyword", ""),
-                    "pageNo": params.get("pageNo", 1),
-                    "pageSize": params.get("pageSize", 10)
-                }
+            client = get_http_client("fengniao")
+            url = f"{self.api_host}{self.api_path}"
+            
+            # 添加认证参数
+            headers = {
+                "Authorization": f"APPCODE {self.appcode}",
+                "Content-Type": "application/json; charset=UTF-8"
+            }
+            
+            # 风鸟API使用POST请求，参数在body中
+            if params is None:
+                params = {}
                 
-                response = await client.request(method, url, json=request_body, headers=headers)
-                response.raise_for_status()
+            # 风鸟API需要的参数格式
+            request_body = {
+                "companyName": params.get("keyword", ""),
+                "pageNo": params.get("pageNo", 1),
+                "pageSize": params.get("pageSize", 10)
+            }
+            
+            response = await client.request(method, url, json=request_body, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
 
-                data = response.json()
+            data = response.json()
 
-                # 检查风鸟API响应状态
-                if data.get("code") != 200:
-                    logger.error(f"风鸟API错误: {data.get('code')} - {data.get('message')}")
-                    return None
+            # 检查风鸟API响应状态
+            if data.get("code") != 200:
+                logger.error(f"风鸟API错误: {data.get('code')} - {data.get('message')}")
+                return None
 
-                return data.get("data")
+            return data.get("data") or {}
 
         except httpx.TimeoutException:
             logger.error("风鸟API请求超时")
@@ -83,7 +84,7 @@ async def _request_fengniao(
             logger.error(f"风鸟API请求异常: {e}", exc_info=True)
             return None
 
-    async def search_company_legal_cases(self, company_name: str, limit: int = 10) -> List[Dict[str, Any]]:
+    async def search_company_legal_cases(self, company_name: str, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
         """
         查询公司法律案件信息（风鸟企业涉诉查询）
         
@@ -92,7 +93,7 @@ async def search_company_legal_cases(self, company_name: str, limit: int = 10) -
             limit: 最多返回条数
             
         Returns:
-            法律案件列表
+            法律案件列表（查询失败或未配置时返回 None，与查无案件区分）
             [
                 {
                     "type": "cpws",  # 裁判文书
@@ -108,7 +109,7 @@ async def search_company_legal_cases(self, company_name: str, limit: int = 10) -
             return []
         
         if not self._has_valid_config():
-            return []
+            return None
         
         try:
             params = {
@@ -118,8 +119,8 @@ async def search_company_legal_cases(self, company_name: str, limit: int = 10) -
             }
             
             result = await self._request_fengniao(params)
-            if not result:
-                return []
+            if result is None:
+                return None
             
             # 解析返回的法律案件
             cases = self._parse_legal_cases(result)
@@ -127,7 +128,7 @@ async def search_company_legal_cases(self, company_name: str, limit: int = 10) -
             
         except Exception as e:
             logger.error(f"查询公司法律案件失败: {e}", exc_info=True)
-            return []
+            return None
 
     def _parse_legal_cases(self, api_result: Dict) -> List[Dict[str, Any]]:
         """
@@ -304,7 +305,7 @@ def _generate_case_no(self, case_id: str, date_str: str) -> str:
         
         return "案未知"
 
-    async def analyze_company_legal_risk(self, company_name: str) -> Dict[str, Any]:
+    async def analyze_company_legal_risk(self, company_name: str) -> Optional[Dict[str, Any]]:
         """
         分析公司法律案件信息（只返回原始数据，不做评价）
         
@@ -320,6 +321,7 @@ async def analyze_company_legal_risk(self, company_name: str) -> Dict[str, Any]:
                 "decoration_related_cases": 2,
                 "recent_cases": [...]  # 最近5条案件
             }
+            查询失败时返回 None
         """
         legal_analysis = {
             "legal_case_count": 0,
@@ -332,6 +334,8 @@ async def analyze_company_legal_risk(self, company_name: str) -> Dict[str, Any]:
         try:
             # 获取法律案件
             cases = await self.search_company_legal_cases(company_name, limit=20)
+            if cases is None:
+                return None
             if not cases:
                 return legal_analysis
             
@@ -367,6 +371,7 @@ async def analyze_company_legal_risk(self, company_name: str) -> Dict[str, Any]:
             
         except Exception as e:
             logger.error(f"分析公司法律案件失败: {e}", exc_info=True)
+            return None
         
         return legal_analysis
 
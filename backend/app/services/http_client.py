@@ -0,0 +1,120 @@
+"""
+出站HTTP连接池
+按上游（扣子、微信、聚合数据等）复用 httpx.AsyncClient，避免每次调用重新建立 TCP+TLS 连接：
+- 每个上游一个长连接池，连接数/保活/超时可通过配置调整
+- 首次使用时创建，应用（或 worker）关闭时统一释放
+- 提供连接池状态（已打开/使用中/等待中）供监控接口使用
+"""
+import importlib.util
+from typing import Dict, Any
+from urllib.parse import urlparse
+
+import httpx
+
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPSTREAM = "default"
+
+
+class HttpClientRegistry:
+    """出站HTTP客户端注册表：上游名称 -> 共享 AsyncClient"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._http2 = settings.HTTP_CLIENT_HTTP2 and importlib.util.find_spec("h2") is not None
+        if settings.HTTP_CLIENT_HTTP2 and not self._http2:
+            logger.warning("HTTP_CLIENT_HTTP2 已开启但未安装 h2，出站连接使用 HTTP/1.1")
+
+    def _timeout_for(self, upstream: str) -> httpx.Timeout:
+        timeouts = settings.HTTP_UPSTREAM_TIMEOUTS or {}
+        total = timeouts.get(upstream, timeouts.get(DEFAULT_UPSTREAM, 30.0))
+        return httpx.Timeout(float(total), connect=settings.HTTP_CONNECT_TIMEOUT)
+
+    def get(self, upstream: str) -> httpx.AsyncClient:
+        """
+        获取上游对应的共享客户端（不存在则创建）
+
+        调用方不要使用 async with 关闭该客户端；单次请求可通过 timeout= 覆盖默认超时
+
+        Args:
+            upstream: 上游名称（见 HTTP_UPSTREAM_TIMEOUTS），未配置的名称使用 default 超时
+
+        Returns:
+            httpx.AsyncClient
+        """
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=self._timeout_for(upstream),
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.HTTP_POOL_KEEPALIVE_EXPIRY,
+                ),
+                http2=self._http2,
+            )
+            self._clients[upstream] = client
+            logger.info(f"创建出站连接池: {upstream}, HTTP/2: {self._http2}")
+        return client
+
+    def for_url(self, url: str) -> httpx.AsyncClient:
+        """按URL主机获取共享客户端（用于未单独命名的上游）"""
+        host = urlparse(url).netloc or DEFAULT_UPSTREAM
+        return self.get(host)
+
+    async def close(self) -> None:
+        """关闭所有连接池"""
+        clients, self._clients = self._clients, {}
+        for upstream, client in clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"关闭出站连接池失败: {upstream}, 错误: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取各连接池状态
+
+        Returns:
+            {上游: {"open": 已打开连接, "in_use": 使用中, "idle": 空闲, "waiting": 等待连接的请求}}
+        """
+        result = {}
+        for upstream, client in self._clients.items():
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+            idle = sum(1 for c in connections if c.is_idle())
+            waiting = sum(
+                1 for r in list(getattr(pool, "_requests", []) or [])
+                if getattr(r, "is_queued", lambda: False)()
+            )
+            result[upstream] = {
+                "open": len(connections),
+                "in_use": len(connections) - idle,
+                "idle": idle,
+                "waiting": waiting,
+                "max_connections": settings.HTTP_POOL_MAX_CONNECTIONS,
+                "closed": client.is_closed,
+            }
+        return result
+
+
+# 创建全局出站HTTP客户端注册表
+http_clients = HttpClientRegistry()
+
+
+def get_http_client(upstream: str) -> httpx.AsyncClient:
+    """获取上游对应的共享 AsyncClient"""
+    return http_clients.get(upstream)
+
+
+async def close_http_clients() -> None:
+    """关闭所有出站连接池（应用/worker 关闭时调用）"""
+    await http_clients.close()
+
+
+def get_http_pool_stats() -> Dict[str, Any]:
+    """获取出站连接池状态"""
+    return http_clients.stats()
@@ -0,0 +1,482 @@
+"""
+分析任务队列
+基于Redis的持久化任务队列，替代进程内 BackgroundTasks：
+- API 进程只负责入队（enqueue_job），立即返回
+- 独立 worker 进程（backend/worker.py）消费任务，按任务类型限制并发
+- 每个任务由处理函数自行创建数据库会话，不复用请求级会话
+- 失败按指数退避重试，超过重试次数进入死信列表
+- 重试/死信写入失败时任务留在执行中列表，稍后放回待执行队列，不会丢失
+
+Redis 键约定（{type} 为任务类型）：
+- jobq:{type}:ready                  待执行队列（LPUSH 入队，右端取出）
+- jobq:{type}:processing:{worker_id} 各 worker 执行中的任务，worker 异常退出后回收
+- jobq:{type}:delayed                延迟重试（ZSET，score 为可执行时间戳）
+- jobq:{type}:dead                   死信列表
+- jobq:worker:{worker_id}            worker 心跳（带TTL）
+- jobq:periodic:{name}               周期任务执行锁（带TTL，多个 worker 每个周期只执行一次）
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import BackgroundTasks
+
+from app.core.config import settings
+from app.services.redis_cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "jobq"
+HEARTBEAT_TTL = 30  # 心跳过期时间（秒）
+HEARTBEAT_INTERVAL = 10
+POLL_TIMEOUT = 5  # BLMOVE 阻塞等待时间（秒）
+MAINTENANCE_INTERVAL = 1  # 延迟任务搬运周期（秒）
+RECOVERY_INTERVAL = 30  # 孤儿任务回收周期（秒）
+
+# 注册了任务处理函数的模块，worker 启动时导入
+JOB_MODULES = (
+    "app.api.v1.quotes",
+    "app.api.v1.contracts",
+    "app.api.v1.companies",
+    "app.api.v1.messages",
+    "app.services.unread_counter",
+    "app.services.construction_reminders",
+    "app.services.wechat_dispatcher",
+)
+
+# 原子搬运到期的延迟任务
+_PROMOTE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, item in ipairs(items) do
+    redis.call('ZREM', KEYS[1], item)
+    redis.call('LPUSH', KEYS[2], item)
+end
+return #items
+"""
+
+# 将滞留在执行中列表的任务放回待执行队列（仍在执行中列表时才搬运，避免重复入队）
+# KEYS: 执行中LIST, 待执行LIST; ARGV: 任务原文
+_REQUEUE_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) > 0 then
+    redis.call('LPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+DeadHandler = Callable[[Dict[str, Any], str], Awaitable[None]]
+
+
+@dataclass
+class JobSpec:
+    """任务类型定义"""
+    name: str
+    handler: JobHandler
+    concurrency: int = 4
+    max_retries: int = 2
+    on_dead: Optional[DeadHandler] = None
+
+
+JOB_HANDLERS: Dict[str, JobSpec] = {}
+
+
+PeriodicHandler = Callable[[], Awaitable[None]]
+
+
+@dataclass
+class PeriodicSpec:
+    """周期任务定义"""
+    name: str
+    handler: PeriodicHandler
+    interval: int
+
+
+PERIODIC_TASKS: Dict[str, PeriodicSpec] = {}
+
+
+def register_job(
+    name: str,
+    concurrency: int = 4,
+    max_retries: Optional[int] = None,
+    on_dead: Optional[DeadHandler] = None,
+):
+    """
+    注册任务处理函数（装饰器）
+
+    Args:
+        name: 任务类型
+        concurrency: 每个 worker 进程内该类型的最大并发数
+        max_retries: 最大重试次数，默认取 JOB_MAX_RETRIES
+        on_dead: 任务进入死信列表时的回调（payload, error），用于标记业务记录失败
+    """
+    def decorator(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[name] = JobSpec(
+            name=name,
+            handler=func,
+            concurrency=max(1, concurrency),
+            max_retries=settings.JOB_MAX_RETRIES if max_retries is None else max_retries,
+            on_dead=on_dead,
+        )
+        return func
+    return decorator
+
+
+def register_periodic(name: str, interval: int):
+    """
+    注册周期任务（装饰器），由 worker 每 interval 秒执行一次；
+    多个 worker 进程通过 Redis 锁保证每个周期只有一个执行
+
+    Args:
+        name: 任务名称
+        interval: 执行间隔（秒），<=0 表示不执行
+    """
+    def decorator(func: PeriodicHandler) -> PeriodicHandler:
+        PERIODIC_TASKS[name] = PeriodicSpec(name=name, handler=func, interval=interval)
+        return func
+    return decorator
+
+
+def _key(job_type: str, kind: str) -> str:
+    return f"{KEY_PREFIX}:{job_type}:{kind}"
+
+
+def _processing_key(job_type: str, worker_id: str) -> str:
+    return f"{KEY_PREFIX}:{job_type}:processing:{worker_id}"
+
+
+def _heartbeat_key(worker_id: str) -> str:
+    return f"{KEY_PREFIX}:worker:{worker_id}"
+
+
+def compute_backoff(attempt: int) -> float:
+    """
+    计算第 attempt 次重试前的等待时间（指数退避 + 抖动）
+
+    Args:
+        attempt: 已失败次数（从1开始）
+
+    Returns:
+        等待秒数
+    """
+    base = settings.JOB_RETRY_BASE_SECONDS
+    delay = min(base * (2 ** max(attempt - 1, 0)), settings.JOB_RETRY_MAX_SECONDS)
+    return delay + random.uniform(0, base / 2)
+
+
+def _build_job(job_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": uuid.uuid4().hex,
+        "type": job_type,
+        "payload": payload,
+        "attempts": 0,
+        "enqueued_at": time.time(),
+        "last_error": None,
+    }
+
+
+async def enqueue_job(
+    job_type: str,
+    payload: Dict[str, Any],
+    background_tasks: Optional[BackgroundTasks] = None,
+) -> Optional[str]:
+    """
+    入队一个任务
+
+    Redis 不可用（或队列被关闭）时，若提供了 background_tasks 则降级为进程内执行，
+    保证开发环境无需启动 worker 也能完成分析。
+
+    Args:
+        job_type: 任务类型（需已通过 register_job 注册）
+        payload: 任务参数（需可 JSON 序列化，不要放数据库会话等对象）
+        background_tasks: FastAPI 后台任务，用于降级执行
+
+    Returns:
+        任务ID；降级执行或入队失败时返回 None
+    """
+    job = _build_job(job_type, payload)
+    if settings.JOB_QUEUE_ENABLED and cache.client:
+        try:
+            await cache.client.lpush(_key(job_type, "ready"), json.dumps(job, ensure_ascii=False))
+            logger.info(f"任务已入队: {job_type}, job_id: {job['id']}")
+            return job["id"]
+        except Exception as e:
+            logger.error(f"任务入队失败，降级为进程内执行: {job_type}, 错误: {e}")
+
+    if background_tasks is not None:
+        background_tasks.add_task(run_job_inline, job_type, payload)
+        logger.warning(f"任务队列不可用，使用进程内后台任务执行: {job_type}")
+    else:
+        logger.error(f"任务队列不可用且无降级执行方式，任务丢弃: {job_type}")
+    return None
+
+
+async def run_job_inline(job_type: str, payload: Dict[str, Any]) -> None:
+    """进程内执行任务（无重试），失败时触发 on_dead 回调"""
+    spec = JOB_HANDLERS.get(job_type)
+    if not spec:
+        logger.error(f"未注册的任务类型: {job_type}")
+        return
+    try:
+        await spec.handler(payload)
+    except Exception as e:
+        logger.error(f"进程内任务执行失败: {job_type}, 错误: {e}", exc_info=True)
+        await _call_on_dead(spec, payload, str(e))
+
+
+async def _call_on_dead(spec: JobSpec, payload: Dict[str, Any], error: str) -> None:
+    if not spec.on_dead:
+        return
+    try:
+        await spec.on_dead(payload, error)
+    except Exception as e:
+        logger.error(f"死信回调执行失败: {spec.name}, 错误: {e}", exc_info=True)
+
+
+async def get_queue_stats() -> Dict[str, Any]:
+    """获取各任务类型的队列长度（监控用）"""
+    if not cache.client:
+        return {"available": False, "queues": {}}
+
+    queues = {}
+    for job_type in JOB_HANDLERS:
+        try:
+            processing = 0
+            async for key in cache.client.scan_iter(match=_processing_key(job_type, "*")):
+                processing += await cache.client.llen(key)
+            queues[job_type] = {
+                "ready": await cache.client.llen(_key(job_type, "ready")),
+                "processing": processing,
+                "delayed": await cache.client.zcard(_key(job_type, "delayed")),
+                "dead": await cache.client.llen(_key(job_type, "dead")),
+            }
+        except Exception as e:
+            logger.error(f"获取队列状态失败: {job_type}, 错误: {e}")
+            queues[job_type] = {"error": str(e)}
+    return {"available": True, "queues": queues}
+
+
+class JobWorker:
+    """任务消费者：每种任务类型启动 concurrency 个消费协程"""
+
+    def __init__(self, job_types: Optional[List[str]] = None):
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.job_types = job_types or list(JOB_HANDLERS.keys())
+        self._stopping = asyncio.Event()
+        self._promote = None
+        self._requeue = None
+        # 写重试/死信失败、仍留在本 worker 执行中列表的任务 (任务类型, 原文)
+        self._stranded: List[Tuple[str, str]] = []
+
+    def stop(self) -> None:
+        """请求停止：消费协程处理完当前任务后退出"""
+        self._stopping.set()
+
+    async def run(self) -> None:
+        """运行 worker，直到 stop() 被调用"""
+        if not cache.client:
+            raise RuntimeError("Redis 未连接，任务 worker 无法启动")
+
+        unknown = [t for t in self.job_types if t not in JOB_HANDLERS]
+        if unknown:
+            raise ValueError(f"未注册的任务类型: {unknown}")
+
+        self._promote = cache.client.register_script(_PROMOTE_SCRIPT)
+        self._requeue = cache.client.register_script(_REQUEUE_SCRIPT)
+        await self._heartbeat()
+        await self._recover_orphans()
+
+        background = [
+            asyncio.create_task(self._heartbeat_loop()),
+            asyncio.create_task(self._maintenance_loop()),
+        ]
+        for spec in PERIODIC_TASKS.values():
+            if spec.interval > 0:
+                background.append(asyncio.create_task(self._periodic_loop(spec)))
+                logger.info(f"周期任务已启动: {spec.name}, 间隔: {spec.interval}s")
+
+        consumers = []
+        for job_type in self.job_types:
+            spec = JOB_HANDLERS[job_type]
+            for _ in range(spec.concurrency):
+                consumers.append(asyncio.create_task(self._consume(spec)))
+            logger.info(f"任务消费者已启动: {job_type}, 并发: {spec.concurrency}")
+
+        logger.info(f"任务worker启动完成: {self.worker_id}")
+        await self._stopping.wait()
+
+        # 先等待消费协程处理完当前任务，再停止心跳和周期任务
+        await asyncio.gather(*consumers, return_exceptions=True)
+        for t in background:
+            t.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        try:
+            await self._requeue_stranded()
+        except Exception as e:
+            # 未放回的任务留在执行中列表，心跳过期后由其他 worker 回收
+            logger.error(f"放回滞留任务失败: {e}")
+        await cache.client.delete(_heartbeat_key(self.worker_id))
+        logger.info(f"任务worker已停止: {self.worker_id}")
+
+    async def _consume(self, spec: JobSpec) -> None:
+        ready_key = _key(spec.name, "ready")
+        processing_key = _processing_key(spec.name, self.worker_id)
+        while not self._stopping.is_set():
+            raw = None
+            try:
+                raw = await cache.client.blmove(ready_key, processing_key, POLL_TIMEOUT, "RIGHT", "LEFT")
+                if raw is None:
+                    continue
+                if not await self._execute(spec, raw):
+                    # 重试/死信未写入：任务留在执行中列表，由维护协程放回待执行队列
+                    self._stranded.append((spec.name, raw))
+                    continue
+                await cache.client.lrem(processing_key, 1, raw)
+            except Exception as e:
+                # 单次异常不退出消费协程；已取出的任务仍在执行中列表，不会丢失
+                logger.error(f"任务消费异常: {spec.name}, 错误: {e}", exc_info=raw is not None)
+                await asyncio.sleep(POLL_TIMEOUT)
+
+    async def _execute(self, spec: JobSpec, raw: str) -> bool:
+        """
+        执行任务，失败时写入延迟重试或死信
+
+        Args:
+            spec: 任务定义
+            raw: 任务原文
+
+        Returns:
+            任务是否已了结（完成或已写入重试/死信），False 时任务需保留在执行中列表
+        """
+        try:
+            job = json.loads(raw)
+        except (TypeError, ValueError):
+            logger.error(f"任务格式错误，直接进入死信: {spec.name}, {raw[:200]}")
+            try:
+                await self._push_dead(spec.name, raw)
+            except Exception as e:
+                logger.error(f"写入死信失败: {spec.name}, 错误: {e}")
+                return False
+            return True
+
+        started = time.time()
+        try:
+            await spec.handler(job.get("payload") or {})
+            logger.info(
+                f"任务完成: {spec.name}, job_id: {job.get('id')}, "
+                f"耗时: {time.time() - started:.1f}s, 排队: {started - job.get('enqueued_at', started):.1f}s"
+            )
+        except Exception as e:
+            job["attempts"] = int(job.get("attempts", 0)) + 1
+            job["last_error"] = f"{type(e).__name__}: {e}"[:500]
+            if job["attempts"] <= spec.max_retries:
+                delay = compute_backoff(job["attempts"])
+                logger.warning(
+                    f"任务失败，{delay:.0f}秒后重试: {spec.name}, job_id: {job.get('id')}, "
+                    f"第{job['attempts']}次, 错误: {e}"
+                )
+                try:
+                    await cache.client.zadd(
+                        _key(spec.name, "delayed"),
+                        {json.dumps(job, ensure_ascii=False): time.time() + delay},
+                    )
+                except Exception as err:
+                    logger.error(f"写入延迟重试失败: {spec.name}, job_id: {job.get('id')}, 错误: {err}")
+                    return False
+            else:
+                logger.error(
+                    f"任务重试耗尽，进入死信列表: {spec.name}, job_id: {job.get('id')}, 错误: {e}",
+                    exc_info=True,
+                )
+                job["failed_at"] = time.time()
+                try:
+                    await self._push_dead(spec.name, json.dumps(job, ensure_ascii=False))
+                except Exception as err:
+                    logger.error(f"写入死信失败: {spec.name}, job_id: {job.get('id')}, 错误: {err}")
+                    return False
+                await _call_on_dead(spec, job.get("payload") or {}, job["last_error"])
+        return True
+
+    async def _push_dead(self, job_type: str, raw: str) -> None:
+        dead_key = _key(job_type, "dead")
+        async with cache.client.pipeline(transaction=True) as pipe:
+            pipe.lpush(dead_key, raw)
+            pipe.ltrim(dead_key, 0, settings.JOB_DEAD_LETTER_MAX - 1)
+            await pipe.execute()
+
+    async def _requeue_stranded(self) -> None:
+        """
+        将写重试/死信失败的任务放回待执行队列（按原文重新执行，本次失败不计入重试次数）
+        worker 异常退出时这些任务仍在执行中列表，由其他 worker 的孤儿回收处理
+        """
+        while self._stranded:
+            job_type, raw = self._stranded[0]
+            await self._requeue(
+                keys=[_processing_key(job_type, self.worker_id), _key(job_type, "ready")],
+                args=[raw],
+            )
+            self._stranded.pop(0)
+            logger.warning(f"滞留任务已放回待执行队列: {job_type}")
+
+    async def _heartbeat(self) -> None:
+        await cache.client.set(_heartbeat_key(self.worker_id), str(time.time()), ex=HEARTBEAT_TTL)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            try:
+                await self._heartbeat()
+            except Exception as e:
+                logger.error(f"worker心跳写入失败: {e}")
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def _maintenance_loop(self) -> None:
+        last_recovery = time.time()
+        while True:
+            try:
+                await self._requeue_stranded()
+                for job_type in self.job_types:
+                    await self._promote(
+                        keys=[_key(job_type, "delayed"), _key(job_type, "ready")],
+                        args=[time.time(), 100],
+                    )
+                if time.time() - last_recovery >= RECOVERY_INTERVAL:
+                    await self._recover_orphans()
+                    last_recovery = time.time()
+            except Exception as e:
+                logger.error(f"任务队列维护失败: {e}")
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+    async def _periodic_loop(self, spec: PeriodicSpec) -> None:
+        lock_key = f"{KEY_PREFIX}:periodic:{spec.name}"
+        while True:
+            try:
+                # 锁的TTL即执行间隔：本周期内其他 worker 抢锁失败直接跳过
+                if await cache.client.set(lock_key, self.worker_id, nx=True, ex=spec.interval):
+                    started = time.time()
+                    await spec.handler()
+                    logger.info(f"周期任务完成: {spec.name}, 耗时: {time.time() - started:.1f}s")
+            except Exception as e:
+                logger.error(f"周期任务执行失败: {spec.name}, 错误: {e}", exc_info=True)
+            await asyncio.sleep(spec.interval)
+
+    async def _recover_orphans(self) -> None:
+        """将已失去心跳的 worker 遗留的执行中任务放回待执行队列"""
+        for job_type in self.job_types:
+            prefix = _processing_key(job_type, "")
+            async for key in cache.client.scan_iter(match=f"{prefix}*"):
+                owner = key[len(prefix):]
+                if owner == self.worker_id or await cache.client.exists(_heartbeat_key(owner)):
+                    continue
+                moved = 0
+                while await cache.client.lmove(key, _key(job_type, "ready"), "RIGHT", "LEFT"):
+                    moved += 1
+                if moved:
+                    logger.warning(f"回收异常退出worker的任务: {job_type}, worker: {owner}, 数量: {moved}")
@@ -7,6 +7,7 @@
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 from app.core.config import settings
+from app.services.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -48,25 +49,25 @@ async def _request_sifa(
             return None
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                url = f"{self.sifa_base_url}{self.sifa_endpoint}"
+            client = get_http_client("juhecha")
+            url = f"{self.sifa_base_url}{self.sifa_endpoint}"
 
-                # 添加认证参数
-                if params is None:
-                    params = {}
-                params["key"] = self.sifa_token
+            # 添加认证参数
+            if params is None:
+                params = {}
+            params["key"] = self.sifa_token
 
-                response = await client.request(method, url, params=params)
-                response.raise_for_status()
+            response = await client.request(method, url, params=params, timeout=self.timeout)
+            response.raise_for_status()
 
-                data = response.json()
+            data = response.json()
 
-                # 检查聚合数据响应状态
-                if data.get("error_code") != 0:
-                    logger.error(f"司法企业查询API错误: {data.get('error_code')} - {data.get('reason')}")
-                    return None
+            # 检查聚合数据响应状态
+            if data.get("error_code") != 0:
+                logger.error(f"司法企业查询API错误: {data.get('error_code')} - {data.get('reason')}")
+                return None
 
-                return data.get("result")
+            return data.get("result")
 
         except httpx.TimeoutException:
             logger.error("司法企业查询API请求超时")
@@ -89,25 +90,25 @@ async def _request_enterprise(
             return None
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                url = f"{self.enterprise_base_url}{self.enterprise_endpoint}"
+            client = get_http_client("juhecha_enterprise")
+            url = f"{self.enterprise_base_url}{self.enterprise_endpoint}"
 
-                # 添加认证参数
-                if params is None:
-                    params = {}
-                params["key"] = self.enterprise_token
+            # 添加认证参数
+            if params is None:
+                params = {}
+            params["key"] = self.enterprise_token
 
-                response = await client.request(method, url, params=params)
-                response.raise_for_status()
+            response = await client.request(method, url, params=params, timeout=self.timeout)
+            response.raise_for_status()
 
-                data = response.json()
+            data = response.json()
 
-                # 检查聚合数据响应状态
-                if data.get("error_code") != 0:
-                    logger.error(f"企业工商信息API错误: {data.get('error_code')} - {data.get('reason')}")
-                    return None
+            # 检查聚合数据响应状态
+            if data.get("error_code") != 0:
+                logger.error(f"企业工商信息API错误: {data.get('error_code')} - {data.get('reason')}")
+                return None
 
-                return data.get("result")
+            return data.get("result")
 
         except httpx.TimeoutException:
             logger.error("企业工商信息API请求超时")
@@ -149,7 +150,7 @@ async def search_company_legal_cases(self, company_name: str, limit: int = 10) -
             
             # 调用风鸟API查询法律案件
             cases = await fengniao_service.search_company_legal_cases(company_name, limit)
-            return cases
+            return cases or []
             
         except Exception as e:
             logger.error(f"查询公司法律案件失败: {e}", exc_info=True)
@@ -329,7 +330,7 @@ def _generate_case_no(self, entry_id: str, date_str: str) -> str:
         
         return "案未知"
 
-    async def analyze_company_legal_risk(self, company_name: str) -> Dict[str, Any]:
+    async def analyze_company_legal_risk(self, company_name: str) -> Optional[Dict[str, Any]]:
         """
         分析公司法律案件信息（只返回原始数据，不做评价）
         
@@ -345,6 +346,7 @@ async def analyze_company_legal_risk(self, company_name: str) -> Dict[str, Any]:
                 "decoration_related_cases": 2,
                 "recent_cases": [...]  # 最近5条案件
             }
+            查询失败时返回 None（没有案件时 legal_case_count 为 0）
         """
         legal_analysis = {
             "legal_case_count": 0,
@@ -361,11 +363,13 @@ async def analyze_company_legal_risk(self, company_name: str) -> Dict[str, Any]:
             # 调用风鸟API分析法律风险
             fengniao_result = await fengniao_service.analyze_company_legal_risk(company_name)
             
-            if fengniao_result:
-                legal_analysis.update(fengniao_result)
+            if fengniao_result is None:
+                return None
+            legal_analysis.update(fengniao_result)
             
         except Exception as e:
             logger.error(f"分析公司法律案件失败: {e}", exc_info=True)
+            return None
         
         return legal_analysis
 
@@ -1,8 +1,19 @@
 """
 消息创建服务：供 API 与业务侧（验收完成、支付成功等）写入消息中心
+- create_message：单条写入
+- create_messages_bulk：一批不同用户/内容的消息（施工提醒等）一次多行 INSERT
+- broadcast_message：系统公告按目标用户（全部/按城市）分批 INSERT ... SELECT，不把用户ID取回应用层
 """
+from sqlalchemy import insert, select, literal, false, String
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import with_session
+from app.services.unread_counter import unread_counter
+import logging
+
+logger = logging.getLogger(__name__)
 
 # 延迟导入，避免循环导入
 # from app.models import Message
@@ -18,7 +29,7 @@ async def create_message(
     link_url: Optional[str] = None,
 ):
     """
-    创建一条消息（施工提醒/报告通知/系统消息等）
+    创建一条消息（施工提醒/报告通知/系统消息等），未读数在调用方提交事务后更新
     category: progress | report | system | acceptance | customer_service
     """
     # 延迟导入，避免循环导入
@@ -34,4 +45,109 @@ async def create_message(
     )
     db.add(msg)
     await db.flush()
+    unread_counter.track(db, user_id, category, 1)
     return msg
+
+
+async def create_messages_bulk(db: AsyncSession, messages: List[Dict[str, Any]]) -> int:
+    """
+    批量创建消息（一次多行 INSERT，不逐条 flush），未读数在调用方提交事务后更新
+
+    Args:
+        db: 数据库会话
+        messages: 消息列表，每项包含 user_id、category、title，可选 content、summary、link_url
+
+    Returns:
+        创建的消息数
+    """
+    if not messages:
+        return 0
+    # 延迟导入，避免循环导入
+    from app.models import Message
+    rows = [
+        {
+            "user_id": m["user_id"],
+            "category": m["category"],
+            "title": m["title"],
+            "content": m.get("content") or "",
+            "summary": m.get("summary"),
+            "link_url": m.get("link_url"),
+            "is_read": False,
+        }
+        for m in messages
+    ]
+    await db.execute(insert(Message), rows)
+    for row in rows:
+        unread_counter.track(db, row["user_id"], row["category"], 1)
+    return len(rows)
+
+
+async def broadcast_message(
+    category: str,
+    title: str,
+    content: Optional[str] = None,
+    summary: Optional[str] = None,
+    link_url: Optional[str] = None,
+    city_code: Optional[str] = None,
+    after_user_id: int = 0,
+    batch_size: Optional[int] = None,
+    on_batch: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> int:
+    """
+    向目标用户群发同一条消息
+
+    按用户ID顺序分批，每批一条 INSERT INTO messages ... SELECT FROM users ... LIMIT，
+    各批独立提交（不长时间持有连接和锁），提交后更新该批用户的未读数
+
+    Args:
+        category: 消息分类
+        title: 标题
+        content: 内容
+        summary: 摘要
+        link_url: 跳转链接
+        city_code: 只发送给该城市的用户，None 表示全部用户
+        after_user_id: 从该用户ID之后开始（断点续发）
+        batch_size: 每批用户数，默认取 MESSAGE_BROADCAST_BATCH_SIZE
+        on_batch: 每批提交后的回调，参数为本批最大用户ID（用于记录断点）
+
+    Returns:
+        创建的消息数
+    """
+    # 延迟导入，避免循环导入
+    from app.models import Message, User
+    batch_size = batch_size or settings.MESSAGE_BROADCAST_BATCH_SIZE
+    columns = ["user_id", "category", "title", "content", "summary", "link_url", "is_read"]
+    cursor = after_user_id
+    total = 0
+    while True:
+        targets = select(
+            User.id,
+            literal(category, String),
+            literal(title, String),
+            literal(content or "", String),
+            literal(summary, String),
+            literal(link_url, String),
+            false(),
+        ).where(User.id > cursor)
+        if city_code:
+            targets = targets.where(User.city_code == city_code)
+        targets = targets.order_by(User.id).limit(batch_size)
+
+        async with with_session() as db:
+            result = await db.execute(
+                insert(Message).from_select(columns, targets).returning(Message.user_id)
+            )
+            user_ids = result.scalars().all()
+            for user_id in user_ids:
+                unread_counter.track(db, user_id, category, 1)
+        if not user_ids:
+            break
+
+        total += len(user_ids)
+        cursor = max(user_ids)
+        if on_batch:
+            await on_batch(cursor)
+        if len(user_ids) < batch_size:
+            break
+    logger.info(f"群发消息完成: {title}, 城市: {city_code or '全部'}, 数量: {total}")
+    return total
@@ -0,0 +1,95 @@
+"""
+OCR分段识别文本合并
+超高图片按高度分段识别，相邻分段上下重叠一小段，合并时去除重叠区域的重复行：
+- 优先按原样对齐（两段都不跳过行）的重叠，再考虑分段边界处被切开的行
+- 只有确实残缺（比另一段中对应的行短、且内容基本包含在其中）的边界行才会被丢弃，
+  报价单中“数量 1”“单价 10元”这类重复出现的完整行不会被当作残行吞掉
+"""
+import re
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+MERGE_MAX_OVERLAP_LINES = 12  # 相邻分段重叠区域最多包含的文本行数
+MERGE_LINE_SIMILARITY = 0.9  # 重叠行判定为同一行的相似度阈值（容忍OCR个别字差异）
+MERGE_MIN_OVERLAP_CHARS = 4  # 重叠区域最少字符数，避免“合计”“元”等短行误判为重叠
+MERGE_CLIPPED_COVERAGE = 0.6  # 残行中至少该比例的字符出现在完整行中
+
+
+def _normalize_line(line: str) -> str:
+    return re.sub(r"\s+", "", line)
+
+
+def _lines_match(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    return bool(a and b) and SequenceMatcher(None, a, b).ratio() >= MERGE_LINE_SIMILARITY
+
+
+def _is_clipped(fragment: str, full: Optional[str]) -> bool:
+    """fragment 是否为 full 被分段边界切开后的残缺识别结果"""
+    if not fragment or full is None or len(fragment) >= len(full):
+        return False
+    matched = sum(block.size for block in SequenceMatcher(None, fragment, full).get_matching_blocks())
+    return matched / len(fragment) >= MERGE_CLIPPED_COVERAGE
+
+
+def _find_overlap(prev: List[str], nxt: List[str]) -> Tuple[int, int, int]:
+    """
+    查找上一段末尾与下一段开头的重叠行
+
+    先找两段原样对齐的重叠；找不到时再允许丢弃边界处的残行：
+    上一段末行须是下一段重叠之后那一行的残缺版本，下一段首行须是上一段重叠之前那一行的残缺版本
+
+    Returns:
+        (上一段末尾丢弃行数, 下一段开头丢弃行数, 重叠行数)，无重叠时重叠行数为 0
+    """
+    prev_norm = [_normalize_line(line) for line in prev[-(MERGE_MAX_OVERLAP_LINES + 2):]]
+    next_norm = [_normalize_line(line) for line in nxt[:MERGE_MAX_OVERLAP_LINES + 2]]
+    max_size = min(MERGE_MAX_OVERLAP_LINES, len(prev_norm), len(next_norm))
+    for skips in (((0, 0),), ((1, 0), (0, 1), (1, 1))):
+        for size in range(max_size, 0, -1):
+            for skip_prev, skip_next in skips:
+                end = len(prev_norm) - skip_prev
+                start = end - size
+                if start < 0 or skip_next + size > len(next_norm):
+                    continue
+                block = prev_norm[start:end]
+                if sum(len(line) for line in block) < MERGE_MIN_OVERLAP_CHARS:
+                    continue
+                if not all(_lines_match(a, b) for a, b in zip(block, next_norm[skip_next:skip_next + size])):
+                    continue
+                after = skip_next + size
+                if skip_prev and not _is_clipped(prev_norm[end], next_norm[after] if after < len(next_norm) else None):
+                    continue
+                if skip_next and not _is_clipped(next_norm[0], prev_norm[start - 1] if start > 0 else None):
+                    continue
+                return skip_prev, skip_next, size
+    return 0, 0, 0
+
+
+def merge_segment_texts(texts: List[str], dedupe: bool = True) -> str:
+    """
+    按顺序拼接各分段识别文本，去除相邻分段重叠区域的重复行
+
+    Args:
+        texts: 各分段识别文本（按从上到下顺序）
+        dedupe: 是否去除重叠行（分段无重叠时关闭）
+
+    Returns:
+        合并后的文本
+    """
+    merged: List[str] = []
+    for text in texts:
+        lines = [line for line in (text or "").splitlines() if line.strip()]
+        if dedupe and merged and lines:
+            skip_prev, skip_next, size = _find_overlap(merged, lines)
+            if size:
+                # 上一段被切开的末行丢弃；重叠行取两段中较完整（较长）的识别结果
+                start = len(merged) - skip_prev - size
+                overlap = [max(a, b, key=lambda line: len(_normalize_line(line)))
+                           for a, b in zip(merged[start:start + size], lines[skip_next:skip_next + size])]
+                del merged[start:]
+                merged.extend(overlap)
+                lines = lines[skip_next + size:]
+        merged.extend(lines)
+    return "\n".join(merged)
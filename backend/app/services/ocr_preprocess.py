@@ -0,0 +1,206 @@
+"""
+OCR图片预处理
+手机拍摄的报价单/合同照片常在 1200 万像素以上，完整解码 + LANCZOS 缩放 + JPEG 重编码单张需要数百毫秒，
+直接在事件循环中执行会阻塞整个进程：
+- 预处理放到独立进程池执行，排队数有上限，超时抛出 OcrPreprocessBusy
+- JPEG 使用 Pillow draft() 在解码阶段按 1/2、1/4、1/8 缩小，不再先解码全尺寸再缩放
+- 超高图片（长截图）按阿里云OCR高度上限逐段裁剪、逐段编码，不同时持有全部分段的中间图像；
+  相邻分段上下重叠一小段，被分段边界切开的文字行在下一段中完整出现，识别后按行去重拼接
+- 编码为基线 JPEG，不使用 optimize（额外一遍哈夫曼表优化对OCR无收益）
+"""
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional
+
+from PIL import Image, ImageFile
+
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 允许加载大图片
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+OCR_MAX_HEIGHT = 8192  # 阿里云OCR单张图片高度上限
+OCR_MAX_PIXELS = 4000 * 4000  # 阿里云OCR建议的最大像素数
+OCR_MAX_BYTES = 10 * 1024 * 1024  # 阿里云OCR单张图片大小上限
+OCR_SHRINK_TARGET_BYTES = 8 * 1024 * 1024  # 超过大小上限时按该目标大小缩小
+
+
+class OcrPreprocessBusy(Exception):
+    """预处理队列已满"""
+    pass
+
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    """转换为RGB模式（阿里云OCR要求），透明区域填充白色背景"""
+    if image.mode == "RGB":
+        return image
+    if image.mode == "P" and image.info.get("transparency") is not None:
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    buffered = io.BytesIO()
+    # 使用基线JPEG，避免渐进式JPEG导致OCR识别问题
+    image.save(buffered, format="JPEG", quality=quality, progressive=False)
+    return buffered.getvalue()
+
+
+def open_for_ocr(image_data: bytes, use_draft: bool = True) -> Image.Image:
+    """
+    解码图片并缩放到OCR像素上限以内
+
+    JPEG 先用 draft() 请求不小于“像素上限一半”的尺寸，解码器直接输出缩小后的图像；
+    draft 只能按 2 的幂缩小，结果仍超过上限时再用 LANCZOS 缩放到上限
+
+    Args:
+        image_data: 原始图片数据
+        use_draft: 是否启用 JPEG 解码缩放（基准测试对比用）
+
+    Returns:
+        RGB 图像
+    """
+    image = Image.open(io.BytesIO(image_data))
+    width, height = image.size
+    if use_draft and image.format == "JPEG" and width * height > OCR_MAX_PIXELS:
+        scale = (OCR_MAX_PIXELS / 2 / (width * height)) ** 0.5
+        image.draft("RGB", (int(width * scale), int(height * scale)))
+        if image.size != (width, height):
+            logger.debug(f"JPEG解码缩放: {width}x{height} -> {image.size}")
+            width, height = image.size
+
+    if width * height > OCR_MAX_PIXELS:
+        scale = (OCR_MAX_PIXELS / (width * height)) ** 0.5
+        image = image.resize((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+    return _to_rgb(image)
+
+
+def iter_ocr_segments(image: Image.Image, max_height: int = OCR_MAX_HEIGHT, overlap: int = 0) -> Iterator[bytes]:
+    """
+    按高度上限逐段裁剪并编码为JPEG（生成器，每次只持有一段的中间图像）
+
+    Args:
+        image: RGB 图像
+        max_height: 单段最大高度
+        overlap: 相邻分段重叠高度（像素）
+
+    Yields:
+        分段JPEG数据
+    """
+    width, height = image.size
+    step = max(1, max_height - max(0, overlap))
+    top = 0
+    while True:
+        bottom = min(top + max_height, height)
+        segment = image.crop((0, top, width, bottom))
+        data = _encode_jpeg(segment, quality=90)
+        if len(data) > OCR_MAX_BYTES:
+            # 等比缩小到目标大小附近，避免超过阿里云单张大小限制
+            scale = (OCR_SHRINK_TARGET_BYTES / len(data)) ** 0.5
+            segment = segment.resize(
+                (max(1, int(segment.width * scale)), max(1, int(segment.height * scale))),
+                Image.Resampling.LANCZOS,
+            )
+            data = _encode_jpeg(segment, quality=85)
+        yield data
+        if bottom >= height:
+            break
+        top += step
+
+
+def preprocess_image(image_data: bytes, max_height: int = OCR_MAX_HEIGHT, use_draft: bool = True,
+                     overlap: int = 0) -> List[bytes]:
+    """
+    OCR图片预处理（模块级函数，可在子进程中执行）
+
+    Args:
+        image_data: 原始图片数据
+        max_height: 单段最大高度，超过将分割（阿里云OCR限制不超过8192px）
+        use_draft: 是否启用 JPEG 解码缩放
+        overlap: 相邻分段重叠高度（像素）
+
+    Returns:
+        分段JPEG数据列表（未超高时只有一段）
+    """
+    with open_for_ocr(image_data, use_draft=use_draft) as image:
+        return list(iter_ocr_segments(image, max_height, overlap))
+
+
+class OcrPreprocessPool:
+    """OCR预处理进程池（首次使用时创建）"""
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if settings.OCR_PREPROCESS_WORKERS <= 0:
+            return None
+        if self._executor is None:
+            # spawn 避免在已启动事件循环/线程的进程中 fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.OCR_PREPROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"OCR预处理进程池已创建，进程数: {settings.OCR_PREPROCESS_WORKERS}")
+        return self._executor
+
+    async def preprocess(self, image_data, max_height: int = OCR_MAX_HEIGHT) -> List[bytes]:
+        """
+        在进程池中预处理图片（相邻分段按 OCR_SEGMENT_OVERLAP 重叠）
+
+        Args:
+            image_data: 原始图片数据（bytes / bytearray / memoryview）
+            max_height: 单段最大高度
+
+        Returns:
+            分段JPEG数据列表
+
+        Raises:
+            OcrPreprocessBusy: 排队超时
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(1, settings.OCR_PREPROCESS_MAX_PENDING))
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=settings.OCR_PREPROCESS_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise OcrPreprocessBusy("OCR预处理队列已满")
+
+        overlap = settings.OCR_SEGMENT_OVERLAP
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return await asyncio.to_thread(preprocess_image, image_data, max_height, True, overlap)
+            if not isinstance(image_data, bytes):
+                image_data = bytes(image_data)  # memoryview 无法序列化到子进程
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(executor, preprocess_image, image_data, max_height, True, overlap)
+            except BrokenProcessPool:
+                # 预处理进程异常退出（如超大图片OOM），重建进程池，本次改用线程处理
+                logger.error("OCR预处理进程池已损坏，重建进程池")
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                return await asyncio.to_thread(preprocess_image, image_data, max_height, True, overlap)
+        finally:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 创建全局OCR预处理进程池实例
+ocr_preprocess_pool = OcrPreprocessPool()
@@ -4,27 +4,35 @@
 
 安全架构：使用AccessKey认证
 """
+import asyncio
 import base64
-import logging
+import binascii
+import inspect
 import io
+import logging
 import os
-from typing import Dict, Optional, List, Tuple
-from PIL import Image, ImageFile
+from typing import Dict, Optional, List, Tuple, Union
 from alibabacloud_ocr_api20210707.client import Client as OcrClient
 from alibabacloud_tea_openapi import models as open_api_models
 from alibabacloud_ocr_api20210707 import models as ocr_models
 from app.core.config import settings
+from app.core.metrics import latency_metrics
+from app.services.http_client import get_http_client
+from app.services.ocr_merge import merge_segment_texts
+from app.services.ocr_preprocess import (
+    OCR_MAX_HEIGHT, OcrPreprocessBusy, ocr_preprocess_pool, preprocess_image,
+)
 
 logger = logging.getLogger(__name__)
 
-# 允许加载大图片
-ImageFile.LOAD_TRUNCATED_IMAGES = True
+BytesLike = Union[bytes, bytearray, memoryview]
 
 
 class OcrService:
     """阿里云OCR服务 - 使用AccessKey认证"""
 
     def __init__(self):
+        self._segment_slots: Optional[asyncio.Semaphore] = None
         try:
             self.config = open_api_models.Config()
             self.config.region_id = 'cn-hangzhou'
@@ -74,265 +82,119 @@ def _test_connection(self):
         except Exception as e:
             logger.warning(f"OCR统一识别客户端配置测试异常（可能权限或网络问题）: {e}")
 
-    def _optimize_image_for_ocr(self, image_data: bytes, max_height: int = 8192) -> Tuple[bytes, str, List[bytes]]:
+    def _optimize_image_for_ocr(self, image_data: bytes, max_height: int = OCR_MAX_HEIGHT) -> Tuple[bytes, str, List[bytes]]:
         """
-        优化图片以适应阿里云OCR要求
-        
+        优化图片以适应阿里云OCR要求（同步版本，供脚本使用；服务内走 _preprocess 进程池）
+
         Args:
             image_data: 原始图片数据
             max_height: 最大高度限制，超过此高度将分割图片（阿里云OCR限制不超过8192px）
-            
+
         Returns:
             Tuple[优化后的图片数据, 图片格式, 分割后的图片数据列表]
         """
         try:
-            # 打开图片
-            image = Image.open(io.BytesIO(image_data))
-            original_format = image.format or "JPEG"
-            original_mode = image.mode
-            original_size = image.size
-            
-            logger.info(f"原始图片: 格式={original_format}, 模式={original_mode}, 尺寸={original_size}")
-            
-            # 检查图片尺寸是否过大
-            width, height = image.size
-            max_total_pixels = 4000 * 4000  # 阿里云OCR建议的最大像素数
-            
-            if width * height > max_total_pixels:
-                # 计算缩放比例
-                scale_factor = (max_total_pixels / (width * height)) ** 0.5
-                new_width = int(width * scale_factor)
-                new_height = int(height * scale_factor)
-                logger.info(f"图片尺寸过大 ({width}x{height}={width*height}像素)，缩放至 {new_width}x{new_height}")
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                width, height = new_width, new_height
-            
-            # 转换为RGB模式（阿里云OCR要求）
-            if original_mode != "RGB":
-                logger.info(f"转换图片模式: {original_mode} -> RGB")
-                if original_mode == "RGBA":
-                    # 对于RGBA图片，创建白色背景
-                    background = Image.new("RGB", image.size, (255, 255, 255))
-                    # 处理透明度通道
-                    if image.mode == 'RGBA':
-                        r, g, b, a = image.split()
-                        background.paste(image, mask=a)
-                    else:
-                        background.paste(image)
-                    image = background
-                elif original_mode == "P":
-                    # 调色板模式，先转换为RGBA再转换为RGB
-                    if image.info.get("transparency") is not None:
-                        image = image.convert("RGBA")
-                        background = Image.new("RGB", image.size, (255, 255, 255))
-                        r, g, b, a = image.split()
-                        background.paste(image, mask=a)
-                        image = background
-                    else:
-                        image = image.convert("RGB")
-                elif original_mode == "L":
-                    # 灰度图转换为RGB
-                    image = image.convert("RGB")
-                else:
-                    image = image.convert("RGB")
-            
-            # 检查图片尺寸
-            logger.info(f"转换后图片尺寸: {width}x{height}")
-            
-            # 如果图片太高，进行分割（阿里云OCR对高度有限制）
-            segments = []
-            if height > max_height:
-                logger.info(f"图片高度 {height} > {max_height}，进行分割")
-                segment_count = (height + max_height - 1) // max_height  # 向上取整
-                
-                for i in range(segment_count):
-                    top = i * max_height
-                    bottom = min((i + 1) * max_height, height)
-                    segment = image.crop((0, top, width, bottom))
-                    
-                    # 转换为JPEG格式（阿里云OCR兼容性最好）
-                    buffered = io.BytesIO()
-                    # 使用基线JPEG，避免渐进式JPEG导致OCR识别问题
-                    segment.save(buffered, format="JPEG", quality=90, optimize=True, progressive=False)
-                    segment_data = buffered.getvalue()
-                    
-                    # 检查图片大小是否超过阿里云限制（10MB）
-                    if len(segment_data) > 10 * 1024 * 1024:
-                        logger.warning(f"分割段 {i+1} 大小 {len(segment_data)} bytes 超过10MB，进行压缩")
-                        # 压缩图片
-                        segment = segment.resize((width, segment.height // 2), Image.Resampling.LANCZOS)
-                        buffered = io.BytesIO()
-                        segment.save(buffered, format="JPEG", quality=80, optimize=True, progressive=False)
-                        segment_data = buffered.getvalue()
-                    
-                    segments.append(segment_data)
-                    logger.info(f"分割段 {i+1}/{segment_count}: 尺寸={segment.size}, 大小={len(segment_data)} bytes")
-                
-                # 主图片使用第一段
-                main_image_data = segments[0] if segments else None
-            else:
-                # 转换为JPEG格式（基线，非渐进式）
-                buffered = io.BytesIO()
-                image.save(buffered, format="JPEG", quality=90, optimize=True, progressive=False)
-                main_image_data = buffered.getvalue()
-                
-                # 检查图片大小是否超过阿里云限制
-                if len(main_image_data) > 10 * 1024 * 1024:
-                    logger.warning(f"图片大小 {len(main_image_data)} bytes 超过10MB，进行压缩")
-                    # 压缩图片
-                    scale_factor = (8 * 1024 * 1024 / len(main_image_data)) ** 0.5
-                    new_width = int(width * scale_factor)
-                    new_height = int(height * scale_factor)
-                    image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    buffered = io.BytesIO()
-                    image.save(buffered, format="JPEG", quality=85, optimize=True, progressive=False)
-                    main_image_data = buffered.getvalue()
-                
-                segments = [main_image_data]
-            
-            logger.info(f"优化完成: 主图片大小={len(main_image_data)} bytes, 总段数={len(segments)}")
-            return main_image_data, "JPEG", segments
-            
+            segments = preprocess_image(image_data, max_height, overlap=settings.OCR_SEGMENT_OVERLAP)
         except Exception as e:
-            logger.error(f"图片优化失败: {e}", exc_info=True)
-            # 如果优化失败，返回原始数据，但尝试转换为JPEG格式
-            try:
-                # 尝试直接转换为JPEG
-                image = Image.open(io.BytesIO(image_data))
-                if image.mode != "RGB":
-                    image = image.convert("RGB")
-                buffered = io.BytesIO()
-                image.save(buffered, format="JPEG", quality=85, optimize=True, progressive=False)
-                jpeg_data = buffered.getvalue()
-                logger.warning(f"图片优化失败，使用原始数据转换为JPEG: {len(jpeg_data)} bytes")
-                return jpeg_data, "JPEG", [jpeg_data]
-            except:
-                logger.error(f"无法转换图片为JPEG，返回原始数据")
-                return image_data, "JPEG", [image_data]
-
-    def _prepare_ocr_input(self, file_url: str) -> Tuple[str, str, List[str]]:
+            logger.error(f"图片优化失败，使用原始数据: {e}", exc_info=True)
+            segments = [image_data]
+        return segments[0], "JPEG", segments
+
+    async def _preprocess(self, image_data: BytesLike) -> List[bytes]:
         """
-        准备OCR输入数据，包括优化图片和分割处理
-        
+        在预处理进程池中优化图片（解码缩放、转RGB、超高分割、JPEG编码），不阻塞事件循环
+
         Args:
-            file_url: 文件URL或Base64编码
-            
+            image_data: 原始图片数据
+
         Returns:
-            Tuple[主输入数据, 输入类型, 所有分割段的输入数据列表]
+            分段JPEG数据列表，预处理失败时返回原始数据
+
+        Raises:
+            OcrPreprocessBusy: 预处理队列已满
         """
         try:
-            input_type = "Unknown"
-            base64_data = None
-            
-            # 提取Base64数据
-            if file_url.startswith("data:"):
-                # data URL格式
-                if "," in file_url:
-                    base64_data = file_url.split(",")[1]
-                    mime_type = file_url.split(",")[0].split(":")[1].split(";")[0]
-                    logger.info(f"从data URL提取Base64数据，MIME类型: {mime_type}")
-                else:
-                    # 如果没有逗号，可能是纯Base64数据
-                    base64_data = file_url[5:] if file_url.startswith("data:") else file_url
-                input_type = "Base64 (data URL)"
-            elif file_url.startswith("http"):
-                # URL格式，需要下载图片进行处理
-                logger.info(f"使用URL输入，下载图片进行处理: {file_url[:50]}...")
-                try:
-                    import requests
-                    response = requests.get(file_url, timeout=30)
-                    response.raise_for_status()
-                    image_data = response.content
-                    logger.info(f"URL图片下载成功: {len(image_data)} bytes")
-                    
-                    # 优化图片
-                    optimized_data, image_format, segments = self._optimize_image_for_ocr(image_data)
-                    
-                    # 转换为Base64格式 - 返回纯Base64数据，不包含data URL前缀
-                    segments_base64 = []
-                    for i, segment_data in enumerate(segments):
-                        segment_base64 = base64.b64encode(segment_data).decode("utf-8")
-                        # 阿里云OCR API要求纯Base64数据，不包含data URL前缀
-                        segments_base64.append(segment_base64)
-                    
-                    main_input = segments_base64[0]
-                    logger.info(f"URL图片处理完成: 输入类型=URL, 图片格式={image_format}, 段数={len(segments)}")
-                    return main_input, "URL", segments_base64
-                except Exception as e:
-                    logger.error(f"URL图片下载或处理失败: {e}")
-                    # 如果失败，返回原始URL
-                    return file_url, "URL", [file_url]
-            else:
-                # 纯Base64
-                base64_data = file_url
-                input_type = "Base64 (raw)"
-            
-            if base64_data:
-                # 清理Base64数据（移除换行符和空格）
-                cleaned_base64 = base64_data.replace("\n", "").replace("\r", "").replace(" ", "")
-                
-                # 检查Base64长度是否为4的倍数（Base64要求）
-                padding_needed = len(cleaned_base64) % 4
-                if padding_needed:
-                    cleaned_base64 += "=" * (4 - padding_needed)
-                    logger.info(f"Base64数据补全: 原长度{len(base64_data)}，补全后{len(cleaned_base64)}")
-                
-                # 解码Base64
-                try:
-                    image_data = base64.b64decode(cleaned_base64, validate=True)
-                    logger.info(f"Base64解码成功: {len(image_data)} bytes")
-                    
-                    # 检查图片数据是否有效
-                    if len(image_data) == 0:
-                        logger.error("Base64解码后图片数据为空")
-                        return file_url, input_type, [file_url]
-                    
-                    # 优化图片
-                    optimized_data, image_format, segments = self._optimize_image_for_ocr(image_data)
-                    
-                    # 转换为Base64格式 - 返回纯Base64数据，不包含data URL前缀
-                    segments_base64 = []
-                    for i, segment_data in enumerate(segments):
-                        segment_base64 = base64.b64encode(segment_data).decode("utf-8")
-                        # 阿里云OCR API要求纯Base64数据，不包含data URL前缀
-                        segments_base64.append(segment_base64)
-                    
-                    main_input = segments_base64[0]
-                    logger.info(f"准备完成: 输入类型={input_type}, 图片格式={image_format}, 段数={len(segments)}")
-                    return main_input, input_type, segments_base64
-                    
-                except base64.binascii.Error as e:
-                    logger.error(f"Base64格式错误: {e}")
-                    # 尝试使用原始数据（不清理）
-                    try:
-                        image_data = base64.b64decode(base64_data)
-                        logger.info(f"使用原始Base64数据解码成功: {len(image_data)} bytes")
-                        
-                        # 优化图片
-                        optimized_data, image_format, segments = self._optimize_image_for_ocr(image_data)
-                        
-                        # 转换为Base64格式 - 返回纯Base64数据
-                        segments_base64 = []
-                        for i, segment_data in enumerate(segments):
-                            segment_base64 = base64.b64encode(segment_data).decode("utf-8")
-                            segments_base64.append(segment_base64)
-                        
-                        main_input = segments_base64[0]
-                        logger.info(f"使用原始数据准备完成: 输入类型={input_type}, 图片格式={image_format}, 段数={len(segments)}")
-                        return main_input, input_type, segments_base64
-                    except Exception as e2:
-                        logger.error(f"原始Base64数据也解码失败: {e2}")
-                        return file_url, input_type, [file_url]
-                except Exception as e:
-                    logger.error(f"Base64解码或优化失败: {e}")
-                    # 如果失败，返回原始输入
-                    return file_url, input_type, [file_url]
-            
-            return file_url, input_type, [file_url]
-            
+            segments = await ocr_preprocess_pool.preprocess(image_data)
+        except OcrPreprocessBusy:
+            raise
         except Exception as e:
-            logger.error(f"准备OCR输入失败: {e}", exc_info=True)
-            return file_url, "Unknown", [file_url]
+            logger.error(f"图片优化失败，使用原始数据: {e}", exc_info=True)
+            return [image_data]
+        logger.info(f"图片优化完成: 原始大小={len(image_data)} bytes, 段数={len(segments)}, "
+                    f"各段大小={[len(segment) for segment in segments]}")
+        return segments
+
+    async def _download_image(self, url: str) -> bytes:
+        """异步下载图片（共享连接池，超时见 HTTP_UPSTREAM_TIMEOUTS.ocr_download）"""
+        response = await get_http_client("ocr_download").get(url)
+        response.raise_for_status()
+        logger.info(f"URL图片下载成功: {len(response.content)} bytes")
+        return response.content
+
+    @staticmethod
+    def _decode_base64_input(file_input: str) -> bytes:
+        """
+        解码Base64或data URL输入
+
+        a2b_base64 直接跳过换行/空格，不再生成清理后的字符串副本；缺少填充时补全后重试
+
+        Args:
+            file_input: Base64编码或 data URL
+
+        Returns:
+            图片数据
+        """
+        start = 0
+        if file_input.startswith("data:"):
+            start = file_input.find(",") + 1 or len("data:")
+        data = memoryview(file_input.encode("ascii"))[start:]
+        try:
+            return binascii.a2b_base64(data)
+        except binascii.Error:
+            return binascii.a2b_base64(bytes(data) + b"==")
+
+    async def _load_image_data(self, file_input) -> Optional[BytesLike]:
+        """
+        读取OCR输入的原始图片数据
+
+        Args:
+            file_input: 文件URL、Base64编码、图片字节（bytes/memoryview）或文件流对象
+
+        Returns:
+            图片数据，不支持的输入类型返回 None
+        """
+        if isinstance(file_input, (bytes, bytearray, memoryview)):
+            return file_input
+        if hasattr(file_input, 'read'):
+            logger.info("检测到文件流输入")
+            data = file_input.read()
+            return await data if inspect.isawaitable(data) else data
+        if isinstance(file_input, str) and file_input.startswith('http'):
+            logger.info(f"检测到URL输入，下载图片进行处理: {file_input[:50]}...")
+            return await self._download_image(file_input)
+        if isinstance(file_input, str):
+            logger.info("检测到Base64输入")
+            return self._decode_base64_input(file_input)
+        logger.error(f"不支持的输入类型: {type(file_input)}")
+        return None
+
+    async def _prepare_ocr_input(self, file_input) -> Optional[List[bytes]]:
+        """
+        准备OCR输入数据：读取/下载/解码为图片字节后在进程池中优化和分割
+
+        全程使用二进制数据，只在提交给SDK时包装为流，不再做 Base64 往返
+
+        Args:
+            file_input: 文件URL、Base64编码、图片字节或文件流对象
+
+        Returns:
+            分段图片数据列表，输入为空或类型不支持时返回 None
+        """
+        image_data = await self._load_image_data(file_input)
+        if not image_data:
+            logger.error("图片数据为空")
+            return None
+        return await self._preprocess(image_data)
 
     def _get_runtime_options(self):
         """获取运行时选项（超时、重试等）"""
@@ -344,6 +206,58 @@ def _get_runtime_options(self):
             max_attempts=3             # 最大重试3次
         )
 
+    def _recognize_segment(self, segment_data: bytes, ocr_type: str) -> str:
+        """识别单个分段（同步SDK调用，在线程中执行）"""
+        request = ocr_models.RecognizeAllTextRequest()
+        request.body = io.BytesIO(segment_data)  # SDK 以二进制流上传图片
+        request.type = ocr_type
+        request.output_coordinate = True
+        # 使用带超时设置的调用
+        response = self.client.recognize_all_text_with_options(request, self._get_runtime_options())
+        return response.body.data.content or ""
+
+    async def recognize_segments(self, segments: List[bytes], ocr_type: str = "General") -> Dict:
+        """
+        批量识别同一张图片的全部分段：并发提交（进程内并发数受 OCR_SEGMENT_CONCURRENCY 限制），
+        按分段顺序拼接文本，相邻分段重叠区域的重复行只保留一份
+
+        Args:
+            segments: 分段图片数据（按从上到下顺序）
+            ocr_type: OCR识别类型
+
+        Returns:
+            合并后的识别结果
+
+        Raises:
+            Exception: 任一分段识别失败
+        """
+        if self._segment_slots is None:
+            self._segment_slots = asyncio.Semaphore(max(1, settings.OCR_SEGMENT_CONCURRENCY))
+        if len(segments) > 1:
+            logger.info(f"图片高度超限，分割成 {len(segments)} 段并发识别")
+
+        async def recognize(index: int, segment_data: bytes) -> str:
+            async with self._segment_slots:
+                with latency_metrics.timer("ocr.segment"):
+                    text = await asyncio.to_thread(self._recognize_segment, segment_data, ocr_type)
+            logger.info(f"第 {index + 1}/{len(segments)} 段识别完成")
+            return text
+
+        tasks = [asyncio.ensure_future(recognize(i, segment)) for i, segment in enumerate(segments)]
+        try:
+            texts = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        return {
+            "text": merge_segment_texts(texts, dedupe=settings.OCR_SEGMENT_OVERLAP > 0),
+            "prism_words_info": [],
+            "ocr_type": ocr_type,
+            "segments_processed": len(segments)
+        }
+
     async def recognize_general_text(self, file_input, ocr_type: str = "General") -> Optional[Dict]:
         """
         通用文字识别 - 支持文件流和Base64
@@ -362,175 +276,23 @@ async def recognize_general_text(self, file_input, ocr_type: str = "General") ->
             if self.client is None:
                 logger.warning("OCR客户端未初始化")
                 return None
-            
-            # ===== 处理文件流输入 =====
-            if hasattr(file_input, 'read'):
-                logger.info("检测到文件流输入")
-                file_content = await file_input.read()
-                
-                # 调用图片优化方法，自动分割超长图片
-                optimized_data, image_format, segments = self._optimize_image_for_ocr(file_content)
-                
-                # 如果图片被分割成多段，需要分别识别并合并结果
-                if len(segments) > 1:
-                    logger.info(f"图片高度超限，分割成 {len(segments)} 段分别识别")
-                    all_text = []
-                    
-                    for i, segment_data in enumerate(segments):
-                        # 每段单独创建请求
-                        request = ocr_models.RecognizeAllTextRequest()
-                        request.body = base64.b64encode(segment_data).decode('utf-8')
-                        request.type = ocr_type
-                        request.output_coordinate = True
-                        
-                        # 使用带超时设置的调用
-                        runtime = self._get_runtime_options()
-                        logger.info(f"识别第 {i+1}/{len(segments)} 段")
-                        
-                        response = self.client.recognize_all_text_with_options(request, runtime)
-                        all_text.append(response.body.data.content)
-                    
-                    # 合并所有段的识别结果
-                    return {
-                        "text": "\n".join(all_text),
-                        "prism_words_info": [],
-                        "ocr_type": ocr_type,
-                        "segments_processed": len(segments)
-                    }
-                else:
-                    # 没有分割，直接识别
-                    request = ocr_models.RecognizeAllTextRequest()
-                    request.body = base64.b64encode(optimized_data).decode('utf-8')
-                    request.type = ocr_type
-                    request.output_coordinate = True
-                    
-                    response = self.client.recognize_all_text_with_options(request, self._get_runtime_options())
-                    return {
-                        "text": response.body.data.content,
-                        "prism_words_info": [],
-                        "ocr_type": ocr_type,
-                        "segments_processed": 1
-                    }
-            
-            # ===== 处理URL输入 =====
-            elif isinstance(file_input, str) and file_input.startswith('http'):
-                logger.info("检测到URL输入")
-                # 下载图片并优化
-                import requests
-                response = requests.get(file_input, timeout=30)
-                response.raise_for_status()
-                image_data = response.content
-                
-                optimized_data, image_format, segments = self._optimize_image_for_ocr(image_data)
-                
-                # 如果图片被分割成多段，需要分别识别并合并结果
-                if len(segments) > 1:
-                    logger.info(f"图片高度超限，分割成 {len(segments)} 段分别识别")
-                    all_text = []
-                    
-                    for i, segment_data in enumerate(segments):
-                        # 每段单独创建请求
-                        request = ocr_models.RecognizeAllTextRequest()
-                        request.body = base64.b64encode(segment_data).decode('utf-8')
-                        request.type = ocr_type
-                        request.output_coordinate = True
-                        
-                        # 使用带超时设置的调用
-                        runtime = self._get_runtime_options()
-                        logger.info(f"识别第 {i+1}/{len(segments)} 段")
-                        
-                        response = self.client.recognize_all_text_with_options(request, runtime)
-                        all_text.append(response.body.data.content)
-                    
-                    # 合并所有段的识别结果
-                    return {
-                        "text": "\n".join(all_text),
-                        "prism_words_info": [],
-                        "ocr_type": ocr_type,
-                        "segments_processed": len(segments)
-                    }
-                else:
-                    # 没有分割，直接识别
-                    request = ocr_models.RecognizeAllTextRequest()
-                    request.body = base64.b64encode(optimized_data).decode('utf-8')
-                    request.type = ocr_type
-                    request.output_coordinate = True
-                    
-                    response = self.client.recognize_all_text_with_options(request, self._get_runtime_options())
-                    return {
-                        "text": response.body.data.content,
-                        "prism_words_info": [],
-                        "ocr_type": ocr_type,
-                        "segments_processed": 1
-                    }
-            
-            # ===== 处理Base64输入 =====
-            elif isinstance(file_input, str):
-                logger.info("检测到Base64输入")
-                # 解码Base64并优化
-                if file_input.startswith('data:'):
-                    base64_data = file_input.split(',')[1]
-                else:
-                    base64_data = file_input
-                
-                image_data = base64.b64decode(base64_data)
-                optimized_data, image_format, segments = self._optimize_image_for_ocr(image_data)
-                
-                # 如果图片被分割成多段，需要分别识别并合并结果
-                if len(segments) > 1:
-                    logger.info(f"图片高度超限，分割成 {len(segments)} 段分别识别")
-                    all_text = []
-                    
-                    for i, segment_data in enumerate(segments):
-                        # 每段单独创建请求
-                        request = ocr_models.RecognizeAllTextRequest()
-                        request.body = base64.b64encode(segment_data).decode('utf-8')
-                        request.type = ocr_type
-                        request.output_coordinate = True
-                        
-                        # 使用带超时设置的调用
-                        runtime = self._get_runtime_options()
-                        logger.info(f"识别第 {i+1}/{len(segments)} 段")
-                        
-                        response = self.client.recognize_all_text_with_options(request, runtime)
-                        all_text.append(response.body.data.content)
-                    
-                    # 合并所有段的识别结果
-                    return {
-                        "text": "\n".join(all_text),
-                        "prism_words_info": [],
-                        "ocr_type": ocr_type,
-                        "segments_processed": len(segments)
-                    }
-                else:
-                    # 没有分割，直接识别
-                    request = ocr_models.RecognizeAllTextRequest()
-                    request.body = base64.b64encode(optimized_data).decode('utf-8')
-                    request.type = ocr_type
-                    request.output_coordinate = True
-                    
-                    response = self.client.recognize_all_text_with_options(request, self._get_runtime_options())
-                    return {
-                        "text": response.body.data.content,
-                        "prism_words_info": [],
-                        "ocr_type": ocr_type,
-                        "segments_processed": 1
-                    }
-            
-            else:
-                logger.error(f"不支持的输入类型: {type(file_input)}")
+
+            # 预处理在进程池中执行，自动分割超长图片
+            segments = await self._prepare_ocr_input(file_input)
+            if not segments:
                 return None
-                
+            return await self.recognize_segments(segments, ocr_type)
+
         except Exception as e:
             logger.error(f"OCR识别失败: {e}", exc_info=True)
             return None
 
-    async def recognize_table(self, file_url: str) -> Optional[Dict]:
+    async def recognize_table(self, file_url) -> Optional[Dict]:
         """
         表格识别（适用于报价单中的价格表）
 
         Args:
-            file_url: 文件URL或Base64编码
+            file_url: 文件URL、Base64编码或图片字节
 
         Returns:
             表格识别结果
@@ -542,15 +304,12 @@ async def recognize_table(self, file_url: str) -> Optional[Dict]:
             
             request = ocr_models.RecognizeTableRequest()
 
-            if file_url.startswith("http"):
+            if isinstance(file_url, str) and file_url.startswith("http"):
                 request.url = file_url
-            elif file_url.startswith("data:"):
-                if "," in file_url:
-                    request.body = file_url.split(",")[1]
-                else:
-                    request.body = file_url
+            elif isinstance(file_url, str):
+                request.body = io.BytesIO(self._decode_base64_input(file_url))
             else:
-                request.body = file_url
+                request.body = io.BytesIO(file_url)  # SDK 以二进制流上传图片
 
             response = self.client.recognize_table(request)
 
@@ -571,27 +330,19 @@ async def recognize_quote(self, file_input, file_type: str = "image") -> Optiona
         识别装修报价单 - 支持文件流
 
         Args:
-            file_input: 文件URL、Base64编码或文件流对象
+            file_input: 文件URL、Base64编码、图片字节或文件流对象
             file_type: 文件类型（image/pdf）
 
         Returns:
             报价单识别结果
         """
         try:
-            # 如果是文件流，直接调用通用识别
+            # 如果是文件流，读取为字节后直接识别（不转Base64）
             if hasattr(file_input, 'read'):
                 logger.info("识别报价单 - 使用文件流")
-                # 读取文件流内容
                 file_input.seek(0)  # 重置文件指针
-                file_content = file_input.read()
-                # 转换为Base64
-                base64_str = base64.b64encode(file_content).decode('utf-8')
-                # 根据文件类型构建data URL
-                if file_type == "pdf":
-                    file_url = f"data:application/pdf;base64,{base64_str}"
-                else:
-                    file_url = f"data:image/{file_type};base64,{base64_str}"
-                logger.info(f"文件流转换为Base64，大小: {len(file_content)} bytes")
+                file_url = file_input.read()
+                logger.info(f"读取文件流，大小: {len(file_url)} bytes")
             else:
                 # 如果是URL或Base64，按原有逻辑处理
                 file_url = file_input
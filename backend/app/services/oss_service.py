@@ -8,12 +8,20 @@
 安全架构：使用ECS实例RAM角色自动获取临时凭证，无需AccessKey
 """
 import oss2
+from oss2.models import PartInfo
 from app.core.config import settings
+from app.core.metrics import latency_metrics
 from fastapi import UploadFile
+from app.services.redis_cache import cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
 import logging
+import threading
 import time
 import random
-from typing import Optional, Dict
+from typing import Optional, Dict, BinaryIO, Callable, Any, Iterable, List, Tuple
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
@@ -239,6 +247,71 @@ def upload_file(self, file_data: bytes, filename: str,
             
             raise
 
+    @staticmethod
+    def _stream_size(fileobj: BinaryIO) -> Optional[int]:
+        """返回可 seek 文件对象的剩余长度，不可 seek 时返回 None"""
+        try:
+            start = fileobj.tell()
+            fileobj.seek(0, 2)
+            end = fileobj.tell()
+            fileobj.seek(start)
+            return end - start
+        except Exception:
+            return None
+
+    def upload_stream(self, fileobj: BinaryIO, filename: str, size: int,
+                      bucket_name: Optional[str] = None, expires_days: Optional[int] = None) -> str:
+        """
+        从文件对象流式上传到OSS（私有读写）
+        小文件使用 put_object 直接读取文件对象；超过 OSS_MULTIPART_THRESHOLD 时分片上传，
+        每次只在内存中保留一个分片
+
+        Args:
+            fileobj: 可 seek 的文件对象（当前位置为起点）
+            filename: 文件名（会包含路径前缀）
+            size: 待上传字节数
+            bucket_name: 指定bucket名称（None则使用默认bucket）
+            expires_days: 文件过期天数（None则不设置过期时间）
+
+        Returns:
+            文件在OSS中的对象键
+        """
+        bucket = self.photo_bucket if bucket_name == 'photo' else self.bucket
+
+        if not bucket:
+            logger.warning(f"OSS未配置或初始化失败，返回模拟URL: {filename}")
+            return f"https://mock-oss.example.com/{filename}"
+
+        headers = {'x-oss-object-acl': 'private'}
+        if size < settings.OSS_MULTIPART_THRESHOLD:
+            result = bucket.put_object(filename, fileobj, headers=headers)
+            logger.info(f"文件上传成功: {filename}, 大小: {size} bytes, 请求ID: {result.request_id}, 建议生命周期: {expires_days}天")
+            return filename
+
+        part_size = max(settings.OSS_MULTIPART_PART_SIZE, 100 * 1024)  # OSS分片最小100KB
+        upload_id = bucket.init_multipart_upload(filename).upload_id
+        try:
+            parts = []
+            part_number = 1
+            remaining = size
+            while remaining > 0:
+                chunk = fileobj.read(min(part_size, remaining))
+                if not chunk:
+                    break
+                result = bucket.upload_part(filename, upload_id, part_number, chunk)
+                parts.append(PartInfo(part_number, result.etag))
+                remaining -= len(chunk)
+                part_number += 1
+            bucket.complete_multipart_upload(filename, upload_id, parts, headers=headers)
+        except Exception:
+            try:
+                bucket.abort_multipart_upload(filename, upload_id)
+            except Exception as abort_error:
+                logger.warning(f"取消分片上传失败: {filename}, 错误: {abort_error}")
+            raise
+        logger.info(f"文件分片上传成功: {filename}, 大小: {size} bytes, 分片数: {len(parts)}, 建议生命周期: {expires_days}天")
+        return filename
+
     def upload_upload_file(self, file: UploadFile, file_type: str, user_id: Optional[int] = None, 
                           is_photo: bool = True) -> str:
         """
@@ -266,21 +339,27 @@ def upload_upload_file(self, file: UploadFile, file_type: str, user_id: Optional
         else:
             filename = f"{file_type}/{timestamp}_{random_num}.{ext}"
 
-        # 读取文件内容（兼容不可 seek 的流，如部分微信 uploadFile）
-        try:
-            file_content = file.file.read()
-            if hasattr(file.file, "seek"):
-                file.file.seek(0)
-        except Exception as e:
-            logger.error(f"读取上传文件失败: {fname}, 错误: {e}", exc_info=True)
-            raise RuntimeError(f"读取文件失败: {e}") from e
-
         # 选择bucket和设置生命周期
         bucket_name = 'photo' if is_photo else None
         expires_days = 365 if is_photo else None  # 照片生命周期1年
-        
-        object_key = self.upload_file(file_content, filename,
-                                      bucket_name=bucket_name, expires_days=expires_days)
+
+        # 可 seek 的上传文件（SpooledTemporaryFile）直接流式上传，不整体读入内存
+        size = self._stream_size(file.file)
+        if size is not None:
+            try:
+                object_key = self.upload_stream(file.file, filename, size,
+                                                bucket_name=bucket_name, expires_days=expires_days)
+            finally:
+                file.file.seek(0)
+        else:
+            # 读取文件内容（兼容不可 seek 的流，如部分微信 uploadFile）
+            try:
+                file_content = file.file.read()
+            except Exception as e:
+                logger.error(f"读取上传文件失败: {fname}, 错误: {e}", exc_info=True)
+                raise RuntimeError(f"读取文件失败: {e}") from e
+            object_key = self.upload_file(file_content, filename,
+                                          bucket_name=bucket_name, expires_days=expires_days)
         
         if object_key.startswith("https://mock-oss.example.com"):
             return object_key
@@ -507,5 +586,207 @@ def get_user_storage_usage(self, user_id: int, force_refresh: bool = False) -> d
             return result
 
 
+class SignedUrlCache:
+    """
+    签名URL缓存：进程内LRU + Redis二级缓存
+    每个URL缓存到过期前 SIGNED_URL_REFRESH_MARGIN 秒，多个请求/worker 可复用同一URL
+    """
+
+    REDIS_PREFIX = "oss:signed"
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _margin(expires: int) -> int:
+        # 过期前留出余量；有效期很短时最多提前一半
+        return min(settings.SIGNED_URL_REFRESH_MARGIN, expires // 2)
+
+    def _redis_key(self, object_key: str, expires: int) -> str:
+        return f"{self.REDIS_PREFIX}:{expires}:{object_key}"
+
+    def get_local(self, object_key: str, expires: int) -> Optional[str]:
+        """读取进程内缓存（未过期才返回）"""
+        with self._lock:
+            entry = self._entries.get((object_key, expires))
+            if entry is None:
+                return None
+            url, valid_until = entry
+            if valid_until <= time.time():
+                del self._entries[(object_key, expires)]
+                return None
+            self._entries.move_to_end((object_key, expires))
+            return url
+
+    def set_local(self, object_key: str, expires: int, url: str, valid_until: float) -> None:
+        """写入进程内缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[(object_key, expires)] = (url, valid_until)
+            self._entries.move_to_end((object_key, expires))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def get_shared(self, object_keys: List[str], expires: int) -> Dict[str, str]:
+        """批量读取Redis缓存（MGET），命中的同时回填进程内缓存"""
+        if not cache.client or not object_keys:
+            return {}
+        try:
+            values = await cache.client.mget([self._redis_key(k, expires) for k in object_keys])
+        except Exception as e:
+            logger.warning(f"读取签名URL缓存失败: {e}")
+            return {}
+        found = {}
+        now = time.time()
+        for object_key, value in zip(object_keys, values):
+            if not value:
+                continue
+            valid_until, _, url = value.partition("|")
+            try:
+                valid_until = float(valid_until)
+            except ValueError:
+                continue
+            if url and valid_until > now:
+                found[object_key] = url
+                self.set_local(object_key, expires, url, valid_until)
+        return found
+
+    async def set_shared(self, signed: Dict[str, Tuple[str, float]], expires: int) -> None:
+        """批量写入Redis缓存（pipeline），TTL 与进程内缓存一致"""
+        if not cache.client or not signed:
+            return
+        try:
+            pipe = cache.client.pipeline(transaction=False)
+            now = time.time()
+            for object_key, (url, valid_until) in signed.items():
+                ttl = int(valid_until - now)
+                if ttl > 0:
+                    pipe.set(self._redis_key(object_key, expires), f"{valid_until}|{url}", ex=ttl)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"写入签名URL缓存失败: {e}")
+
+
+class AsyncOSSService:
+    """
+    OSS异步门面：在独立的有界线程池中执行同步 oss2 SDK 调用，避免阻塞事件循环，
+    并按操作记录耗时直方图（oss.<操作名>）
+    """
+
+    def __init__(self, service: OSSService, max_workers: int):
+        self.service = service
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="oss")
+        self.signed_urls = SignedUrlCache(settings.SIGNED_URL_CACHE_SIZE)
+
+    async def run(self, operation: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在OSS线程池中执行同步调用
+
+        Args:
+            operation: 操作名称（用于耗时统计）
+            func: 同步函数
+            *args, **kwargs: 函数参数
+
+        Returns:
+            函数返回值
+        """
+        loop = asyncio.get_running_loop()
+        with latency_metrics.timer(f"oss.{operation}"):
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def upload_file(self, file_data: bytes, filename: str,
+                          bucket_name: Optional[str] = None, expires_days: Optional[int] = None) -> str:
+        """异步上传字节数据，参数同 OSSService.upload_file"""
+        return await self.run("upload_file", self.service.upload_file, file_data, filename,
+                              bucket_name=bucket_name, expires_days=expires_days)
+
+    async def upload_upload_file(self, file: UploadFile, file_type: str, user_id: Optional[int] = None,
+                                 is_photo: bool = True) -> str:
+        """异步流式上传 UploadFile，参数同 OSSService.upload_upload_file"""
+        return await self.run("upload_upload_file", self.service.upload_upload_file, file, file_type,
+                              user_id, is_photo=is_photo)
+
+    def sign_url_for_key(self, object_key: str, expires: int = 3600) -> str:
+        """
+        生成签名URL：签名只做本地HMAC计算，不访问网络，直接在当前线程执行（仍记录耗时）
+        """
+        with latency_metrics.timer("oss.sign_url_for_key"):
+            return self.service.sign_url_for_key(object_key, expires=expires)
+
+    async def sign_urls(self, object_keys: Iterable[str], expires: int = 3600) -> Dict[str, str]:
+        """
+        批量生成签名URL：先查进程内缓存，再批量查Redis，剩余的一次性签名并回写两级缓存
+
+        Args:
+            object_keys: OSS对象键列表；已是 http(s) URL 的原样返回
+            expires: 过期时间（秒）
+
+        Returns:
+            {object_key: 签名URL}；签名失败的键返回原值
+        """
+        result: Dict[str, str] = {}
+        pending: List[str] = []
+        for object_key in object_keys:
+            if not object_key or object_key in result:
+                continue
+            if object_key.startswith(("http://", "https://")):
+                result[object_key] = object_key
+                continue
+            url = self.signed_urls.get_local(object_key, expires)
+            if url:
+                result[object_key] = url
+            elif object_key not in pending:
+                pending.append(object_key)
+
+        if pending:
+            shared = await self.signed_urls.get_shared(pending, expires)
+            result.update(shared)
+            pending = [k for k in pending if k not in shared]
+
+        if pending:
+            signed: Dict[str, Tuple[str, float]] = {}
+            valid_until = time.time() + expires - SignedUrlCache._margin(expires)
+            with latency_metrics.timer("oss.sign_urls"):
+                for object_key in pending:
+                    try:
+                        url = self.service.sign_url_for_key(object_key, expires=expires)
+                    except Exception as e:
+                        logger.warning(f"生成签名URL失败: {object_key}, 错误: {e}")
+                        result[object_key] = object_key
+                        continue
+                    result[object_key] = url
+                    # 未配置OSS时 sign_url_for_key 原样返回，不缓存
+                    if url != object_key:
+                        signed[object_key] = (url, valid_until)
+                        self.signed_urls.set_local(object_key, expires, url, valid_until)
+            await self.signed_urls.set_shared(signed, expires)
+        return result
+
+    async def sign_url(self, object_key: str, expires: int = 3600) -> str:
+        """生成单个签名URL（走缓存），签名失败返回原值"""
+        if not object_key:
+            return object_key
+        return (await self.sign_urls([object_key], expires)).get(object_key, object_key)
+
+    async def delete_file(self, filename: str) -> bool:
+        """异步删除文件"""
+        return await self.run("delete_file", self.service.delete_file, filename)
+
+    async def get_user_storage_usage(self, user_id: int, force_refresh: bool = False) -> dict:
+        """异步统计用户存储（缓存命中时不占用线程池）"""
+        if not force_refresh:
+            cached_data = self.service.storage_cache.get(user_id)
+            if cached_data:
+                return cached_data
+        return await self.run("get_user_storage_usage", self.service.get_user_storage_usage,
+                              user_id, force_refresh=force_refresh)
+
+    def shutdown(self) -> None:
+        """关闭线程池（应用关闭时调用）"""
+        self._executor.shutdown(wait=False)
+
+
 # 创建全局OSS服务实例
 oss_service = OSSService()
+async_oss_service = AsyncOSSService(oss_service, max_workers=settings.OSS_EXECUTOR_WORKERS)
@@ -0,0 +1,244 @@
+"""
+报告PDF渲染服务
+ReportLab 中文排版单份报告需要数百毫秒，直接在事件循环中执行会阻塞整个进程：
+- 渲染放到独立进程池执行，排队数有上限，超时抛出 PdfRenderBusy
+- 渲染结果按 (报告类型, 资源ID, 记录内容摘要, 模板版本) 缓存到本地磁盘，按最近访问时间淘汰
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+from typing import Any, Callable, Optional, Tuple
+
+from sqlalchemy import inspect as sa_inspect
+
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PdfRenderBusy(Exception):
+    """渲染队列已满"""
+    pass
+
+
+def snapshot_row(obj: Any) -> SimpleNamespace:
+    """
+    将ORM对象的列属性复制为普通对象，便于传入渲染进程（不携带会话状态）
+
+    Args:
+        obj: ORM对象
+
+    Returns:
+        只包含列属性的 SimpleNamespace
+    """
+    mapper = sa_inspect(obj).mapper
+    return SimpleNamespace(**{attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs})
+
+
+class PdfRenderPool:
+    """PDF渲染进程池（首次使用时创建）"""
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if settings.PDF_RENDER_WORKERS <= 0:
+            return None
+        if self._executor is None:
+            # spawn 避免在已启动事件循环/线程的进程中 fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"PDF渲染进程池已创建，进程数: {settings.PDF_RENDER_WORKERS}")
+        return self._executor
+
+    async def render(self, func: Callable[..., Any], *args) -> Any:
+        """
+        在进程池中执行渲染函数
+
+        Args:
+            func: 模块级渲染函数（需可被子进程导入）
+            *args: 渲染参数（需可序列化）
+
+        Returns:
+            渲染函数的返回值
+
+        Raises:
+            PdfRenderBusy: 排队超时
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(1, settings.PDF_RENDER_MAX_PENDING))
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=settings.PDF_RENDER_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise PdfRenderBusy("PDF渲染队列已满")
+
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return await asyncio.to_thread(func, *args)
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                # 渲染进程异常退出（如OOM），重建进程池，本次改用线程渲染
+                logger.error("PDF渲染进程池已损坏，重建进程池")
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                return await asyncio.to_thread(func, *args)
+        finally:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class PdfCache:
+    """PDF本地磁盘缓存（按文件 mtime 近似 LRU 淘汰）"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(report_type: str, resource_id: int, row: Any, *extra) -> str:
+        """
+        生成缓存键：记录任一列变化（含 updated_at）或模板版本变化都会生成新键
+
+        Args:
+            report_type: 报告类型
+            resource_id: 资源ID
+            row: 记录快照（snapshot_row 的返回值）
+            *extra: 其他影响渲染结果的参数（如用户昵称）
+
+        Returns:
+            缓存键（sha256）
+        """
+        content = json.dumps(
+            [report_type, resource_id, settings.PDF_TEMPLATE_VERSION, vars(row), list(extra)],
+            sort_keys=True, default=str, ensure_ascii=False,
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # 记录访问时间，用于LRU淘汰
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，避免并发读到半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".pdf"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """读取缓存，未命中或读取失败返回 None"""
+        if not settings.PDF_CACHE_ENABLED:
+            return None
+        try:
+            return await asyncio.to_thread(self._read, key)
+        except Exception as e:
+            logger.warning(f"读取PDF缓存失败: {key}, 错误: {e}")
+            return None
+
+    async def set(self, key: str, data: bytes) -> None:
+        """写入缓存，失败只记录日志"""
+        if not settings.PDF_CACHE_ENABLED or not data:
+            return
+        try:
+            await asyncio.to_thread(self._write, key, data)
+        except Exception as e:
+            logger.warning(f"写入PDF缓存失败: {key}, 错误: {e}")
+
+
+# 创建全局渲染进程池和PDF缓存实例
+pdf_render_pool = PdfRenderPool()
+pdf_cache = PdfCache(settings.PDF_CACHE_DIR, settings.PDF_CACHE_MAX_MB * 1024 * 1024)
+
+
+async def render_pdf_cached(func: Callable[..., Tuple[bytes, bool]], report_type: str, resource_id: int,
+                            row: Any, *extra) -> bytes:
+    """
+    渲染报告PDF（优先命中缓存；兜底PDF不写入缓存，避免一次渲染失败后一直返回兜底内容）
+
+    Args:
+        func: 模块级渲染函数，签名为 func(report_type, row, *extra) -> (PDF字节, 是否为兜底PDF)
+        report_type: 报告类型
+        resource_id: 资源ID
+        row: 记录快照
+        *extra: 其他渲染参数
+
+    Returns:
+        PDF字节
+    """
+    key = pdf_cache.make_key(report_type, resource_id, row, *extra)
+    data = await pdf_cache.get(key)
+    if data is not None:
+        logger.debug(f"PDF缓存命中: {report_type}:{resource_id}")
+        return data
+    data, is_fallback = await pdf_render_pool.render(func, report_type, row, *extra)
+    if is_fallback:
+        logger.warning(f"PDF渲染使用兜底内容，不写入缓存: {report_type}:{resource_id}")
+    else:
+        await pdf_cache.set(key, data)
+    return data
+
+
+def shutdown_pdf_renderer() -> None:
+    """关闭PDF渲染进程池（应用关闭时调用）"""
+    pdf_render_pool.shutdown()
@@ -6,10 +6,16 @@
 import logging
 import asyncio
 import time
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from openai import AsyncOpenAI
 import httpx
 from app.core.config import settings
+from app.core.metrics import latency_metrics
+from app.services.http_client import get_http_client
+from app.services.analysis_cache import analysis_cache
+from app.services.ai_governor import (
+    AIUpstreamBusy, PROVIDER_COZE_API, PROVIDER_COZE_SITE, PROVIDER_DEEPSEEK, PROVIDER_DESIGNER, ai_governor,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +67,12 @@ def __init__(self):
             base_url=getattr(settings, "DEEPSEEK_API_BASE", None) or "https://api.deepseek.com/v1"
         )
 
+    @ai_governor.governed(PROVIDER_DEEPSEEK)
+    async def _deepseek_chat(self, **kwargs):
+        """调用 DeepSeek 对话补全（受AI渠道并发调控）"""
+        return await self.client.chat.completions.create(**kwargs)
+
+    @ai_governor.governed(PROVIDER_COZE_SITE)
     async def _call_coze_site(self, system_prompt: str, user_content: str) -> Optional[str]:
         """
         调用扣子发布站点 xxx.coze.site/stream_run，流式响应拼接为完整文本。
@@ -165,40 +177,40 @@ def _extract_content(data: dict) -> Optional[str]:
             return None
 
         async def _do_stream() -> Optional[str]:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                async with client.stream("POST", url, json=payload, headers=headers) as resp:
-                    if resp.status_code != 200:
-                        body = await resp.aread()
-                        logger.error("Coze site stream_run failed: status=%s body=%s", resp.status_code, body[:500])
-                        return None
-                    chunks = []
-                    raw_samples = []
-                    async for line in resp.aiter_lines():
-                        line = (line or "").strip()
-                        if not line or line == "data: [DONE]":
-                            continue
-                        if len(raw_samples) < 5:
-                            raw_samples.append(line[:250])
-                        if not line.startswith("data:"):
-                            continue
-                        json_str = line[5:].strip()
-                        try:
-                            data = json.loads(json_str)
-                            c = _extract_content(data)
-                            if c:
-                                chunks.append(c)
-                                if len(chunks) <= 2:
-                                    logger.info("Coze site extracted chunk len=%d", len(c))
-                        except json.JSONDecodeError:
-                            pass
-                    text = "".join(chunks).strip()
-                    logger.info("Coze site chunks=%d total_len=%d", len(chunks), len(text))
-                    if not text and raw_samples:
-                        logger.warning(
-                            "Coze site returned no parseable text. Sample lines: %s",
-                            raw_samples,
-                        )
-                    return text if text else None
+            client = get_http_client("coze_site")
+            async with client.stream("POST", url, json=payload, headers=headers, timeout=120.0) as resp:
+                if resp.status_code != 200:
+                    body = await resp.aread()
+                    logger.error("Coze site stream_run failed: status=%s body=%s", resp.status_code, body[:500])
+                    return None
+                chunks = []
+                raw_samples = []
+                async for line in resp.aiter_lines():
+                    line = (line or "").strip()
+                    if not line or line == "data: [DONE]":
+                        continue
+                    if len(raw_samples) < 5:
+                        raw_samples.append(line[:250])
+                    if not line.startswith("data:"):
+                        continue
+                    json_str = line[5:].strip()
+                    try:
+                        data = json.loads(json_str)
+                        c = _extract_content(data)
+                        if c:
+                            chunks.append(c)
+                            if len(chunks) <= 2:
+                                logger.info("Coze site extracted chunk len=%d", len(c))
+                    except json.JSONDecodeError:
+                        pass
+                text = "".join(chunks).strip()
+                logger.info("Coze site chunks=%d total_len=%d", len(chunks), len(text))
+                if not text and raw_samples:
+                    logger.warning(
+                        "Coze site returned no parseable text. Sample lines: %s",
+                        raw_samples,
+                    )
+                return text if text else None
 
         try:
             result = await _do_stream()
@@ -214,30 +226,156 @@ async def _do_stream() -> Optional[str]:
             logger.warning("Coze site stream_run error: %s", e, exc_info=True)
             return None
 
+    @ai_governor.governed(PROVIDER_COZE_API)
     async def _call_coze(self, system_prompt: str, user_content: str, max_wait_seconds: int = 90) -> Optional[str]:
         """
-        调用扣子智能体 API（非流式）：发起对话 → 轮询 retrieve 直到完成 → 拉取消息列表取助手回复。
+        调用扣子智能体 API：默认流式（stream=true）一次请求拿到回复；
+        流式不可用时发起非流式对话，按指数退避轮询 retrieve 直到完成，再拉取消息列表取助手回复。
+        流式中途断开但对话已创建时，直接轮询该对话，不重新发起。
         """
         combined = f"【系统要求】\n{system_prompt}\n\n【用户输入】\n{user_content}"
-        payload = {
+        headers = {
+            "Authorization": f"Bearer {self._coze_token}",
+            "Content-Type": "application/json",
+        }
+        client = get_http_client("coze_api")
+        start = time.perf_counter()
+        deadline = time.monotonic() + max_wait_seconds
+
+        mode = "poll"
+        chat_ref = None
+        if settings.COZE_API_STREAM:
+            mode = "stream"
+            text, chat_ref, failed = await self._coze_chat_stream(client, headers, combined, deadline, start)
+            if text or failed:
+                latency_metrics.observe("coze_api.stream.total", (time.perf_counter() - start) * 1000, error=not text)
+                return text
+            if chat_ref:
+                logger.info("Coze chat stream interrupted, polling chat %s", chat_ref[0])
+            else:
+                logger.info("Coze chat stream unavailable, falling back to polling")
+
+        if not chat_ref:
+            chat_ref = await self._coze_create_chat(client, headers, combined)
+        text = await self._coze_poll_chat(client, headers, chat_ref, deadline) if chat_ref else None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if mode == "poll" and text:
+            # 轮询模式拿到完整回复时才有首个正文
+            latency_metrics.observe("coze_api.poll.first_token", elapsed_ms)
+        latency_metrics.observe(f"coze_api.{mode}.total", elapsed_ms, error=not text)
+        return text
+
+    def _coze_chat_payload(self, combined: str, stream: bool) -> Dict[str, Any]:
+        """扣子 /v3/chat 请求体"""
+        return {
             "bot_id": self._coze_bot_id,
             "user_id": "decoration-agent",
-            "stream": False,
-            "auto_save_history": False,
+            "stream": stream,
+            # 非流式对话必须保存记录；流式中断后转轮询同样需要拉取消息列表
+            "auto_save_history": True,
             "additional_messages": [
                 {"role": "user", "content": combined, "content_type": "text"}
             ],
         }
-        headers = {
-            "Authorization": f"Bearer {self._coze_token}",
-            "Content-Type": "application/json",
-        }
-        async with httpx.AsyncClient(timeout=30.0) as client:
+
+    async def _coze_chat_stream(
+        self, client: httpx.AsyncClient, headers: Dict[str, str], combined: str, deadline: float, start: float
+    ) -> Tuple[Optional[str], Optional[Tuple[str, str]], bool]:
+        """
+        流式对话：逐段接收助手回复
+
+        Returns:
+            (回复正文, (chat_id, conversation_id), 对话是否明确失败)；
+            流式不可用或中途断开时正文为 None，已创建的对话可转为轮询
+        """
+        chat_ref = None
+        parts: List[str] = []
+        answer = None
+        completed = False
+        first_token = False
+        timeout = httpx.Timeout(max(deadline - time.monotonic(), 1.0), connect=10.0,
+                                read=settings.COZE_API_STREAM_IDLE_TIMEOUT)
+        try:
+            async with client.stream(
+                "POST",
+                f"{self._coze_base}/v3/chat",
+                headers=headers,
+                json=self._coze_chat_payload(combined, stream=True),
+                timeout=timeout,
+            ) as resp:
+                if resp.status_code != 200:
+                    body = await resp.aread()
+                    logger.warning("Coze chat stream status=%s body=%s", resp.status_code, body[:500])
+                    return None, None, False
+                if "text/event-stream" not in resp.headers.get("content-type", ""):
+                    # 鉴权/参数错误时返回普通 JSON
+                    body = await resp.aread()
+                    logger.warning("Coze chat stream not SSE: %s", body[:500])
+                    return None, None, False
+                event = ""
+                async for line in resp.aiter_lines():
+                    if time.monotonic() > deadline:
+                        logger.warning("Coze chat stream timeout after %ss", round(time.perf_counter() - start))
+                        break
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                        continue
+                    if not line.startswith("data:"):
+                        continue
+                    try:
+                        data = json.loads(line[5:].strip())
+                    except ValueError:
+                        continue
+                    if not isinstance(data, dict):
+                        continue
+                    if event == "conversation.chat.created":
+                        if data.get("id") and data.get("conversation_id"):
+                            chat_ref = (data["id"], data["conversation_id"])
+                    elif event in ("conversation.message.delta", "conversation.message.completed"):
+                        if data.get("role") != "assistant" or data.get("type") != "answer":
+                            continue
+                        content = data.get("content")
+                        if not isinstance(content, str) or not content:
+                            continue
+                        if not first_token:
+                            first_token = True
+                            latency_metrics.observe("coze_api.stream.first_token", (time.perf_counter() - start) * 1000)
+                        if event == "conversation.message.delta":
+                            parts.append(content)
+                        else:
+                            answer = content
+                    elif event == "conversation.chat.completed":
+                        completed = True
+                        break
+                    elif event in ("conversation.chat.failed", "error"):
+                        logger.warning("Coze chat stream failed: %s", data)
+                        return None, chat_ref, True
+        except httpx.HTTPError as e:
+            logger.warning("Coze chat stream error: %s", e)
+
+        if not completed:
+            # 回复不完整，交给轮询取最终结果
+            return None, chat_ref, False
+        text = (answer or "".join(parts)).strip()
+        if not text:
+            logger.warning("Coze chat stream completed without assistant content")
+            return None, chat_ref, True
+        return text, chat_ref, False
+
+    async def _coze_create_chat(
+        self, client: httpx.AsyncClient, headers: Dict[str, str], combined: str
+    ) -> Optional[Tuple[str, str]]:
+        """发起非流式对话，返回 (chat_id, conversation_id)"""
+        try:
             r = await client.post(
                 f"{self._coze_base}/v3/chat",
                 headers=headers,
-                json=payload,
+                json=self._coze_chat_payload(combined, stream=False),
+                timeout=30.0,
             )
+        except httpx.HTTPError as e:
+            logger.error("Coze chat request error: %s", e)
+            return None
         if r.status_code != 200:
             logger.error("Coze chat request failed: status=%s body=%s", r.status_code, r.text[:500])
             return None
@@ -250,20 +388,28 @@ async def _call_coze(self, system_prompt: str, user_content: str, max_wait_secon
         if not chat_id or not conversation_id:
             logger.error("Coze chat missing id/conversation_id: %s", data)
             return None
+        return chat_id, conversation_id
+
+    async def _coze_poll_chat(
+        self, client: httpx.AsyncClient, headers: Dict[str, str], chat_ref: Tuple[str, str], deadline: float
+    ) -> Optional[str]:
+        """轮询对话状态直到完成（间隔指数增长），然后拉取消息列表取助手回复"""
+        chat_id, conversation_id = chat_ref
+        params = {"chat_id": chat_id, "conversation_id": conversation_id}
 
         # 1) 轮询 retrieve 直到 status 为 completed 或 failed
-        poll_interval = 1.5
-        deadline = time.monotonic() + max_wait_seconds
+        poll_interval = settings.COZE_API_POLL_INITIAL
         last_status = None
         while time.monotonic() < deadline:
-            await asyncio.sleep(poll_interval)
+            await asyncio.sleep(min(poll_interval, max(deadline - time.monotonic(), 0)))
+            poll_interval = min(poll_interval * settings.COZE_API_POLL_BACKOFF, settings.COZE_API_POLL_MAX)
             try:
-                async with httpx.AsyncClient(timeout=15.0) as client:
-                    ret = await client.get(
-                        f"{self._coze_base}/v3/chat/retrieve",
-                        params={"chat_id": chat_id, "conversation_id": conversation_id},
-                        headers=headers,
-                    )
+                ret = await client.get(
+                    f"{self._coze_base}/v3/chat/retrieve",
+                    params=params,
+                    headers=headers,
+                    timeout=15.0,
+                )
             except Exception as e:
                 logger.warning("Coze retrieve request error: %s", e)
                 continue
@@ -277,8 +423,8 @@ async def _call_coze(self, system_prompt: str, user_content: str, max_wait_secon
                 last_status = status
             if status == "completed":
                 break
-            if status == "failed":
-                logger.warning("Coze chat status=failed: %s", ret_data.get("data"))
+            if status in ("failed", "canceled"):
+                logger.warning("Coze chat status=%s: %s", status, ret_data.get("data"))
                 return None
         if last_status != "completed":
             logger.warning("Coze chat timeout waiting for completed status (last=%s)", last_status)
@@ -286,12 +432,12 @@ async def _call_coze(self, system_prompt: str, user_content: str, max_wait_secon
 
         # 2) 拉取消息列表，取最后一条助手回复
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                list_res = await client.get(
-                    f"{self._coze_base}/v3/chat/message/list",
-                    params={"chat_id": chat_id, "conversation_id": conversation_id},
-                    headers=headers,
-                )
+            list_res = await client.get(
+                f"{self._coze_base}/v3/chat/message/list",
+                params=params,
+                headers=headers,
+                timeout=15.0,
+            )
         except Exception as e:
             logger.warning("Coze message list request error: %s", e)
             return None
@@ -307,7 +453,7 @@ async def _call_coze(self, system_prompt: str, user_content: str, max_wait_secon
         if not isinstance(messages, list):
             messages = []
         for msg in reversed(messages):
-            if msg.get("role") != "assistant":
+            if msg.get("role") != "assistant" or msg.get("type", "answer") != "answer":
                 continue
             content = msg.get("content")
             if isinstance(content, str) and content.strip():
@@ -318,7 +464,8 @@ async def _call_coze(self, system_prompt: str, user_content: str, max_wait_secon
     async def analyze_quote(
         self,
         ocr_text: str,
-        total_price: float = None
+        total_price: float = None,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         分析报价单风险
@@ -326,6 +473,7 @@ async def analyze_quote(
         Args:
             ocr_text: OCR识别的报价单文本
             total_price: 报价单总价
+            use_cache: 是否使用分析结果缓存（False 时强制重新调用大模型，结果仍写入缓存）
 
         Returns:
             分析结果
@@ -404,12 +552,18 @@ async def analyze_quote(
 """
         user_content = f"请分析以下装修报价单，总价：{total_price}元\n\n报价单内容：\n{ocr_text}"
 
+        cache_key = analysis_cache.make_key("quote", system_prompt, ocr_text, total_price)
+        if use_cache:
+            cached = await analysis_cache.get("quote", cache_key)
+            if cached is not None:
+                return cached
+
         try:
             if _use_coze_site():
                 result_text = await self._call_coze_site(system_prompt, user_content)
                 if not result_text and (getattr(settings, "DEEPSEEK_API_KEY", None) or "").strip():
                     logger.info("Coze site 无正文，降级使用 DeepSeek 报价单分析")
-                    response = await self.client.chat.completions.create(
+                    response = await self._deepseek_chat(
                         model="deepseek-chat",
                         messages=[
                             {"role": "system", "content": system_prompt},
@@ -426,7 +580,7 @@ async def analyze_quote(
                 if not result_text:
                     return self._get_default_quote_analysis()
             else:
-                response = await self.client.chat.completions.create(
+                response = await self._deepseek_chat(
                     model="deepseek-chat",
                     messages=[
                         {"role": "system", "content": system_prompt},
@@ -448,21 +602,25 @@ async def analyze_quote(
                 analysis_result = analysis_result[0]
 
             logger.info(f"报价单分析完成，风险评分: {analysis_result.get('risk_score', 0)}")
+            await analysis_cache.set(cache_key, analysis_result)
             return analysis_result
 
         except json.JSONDecodeError as e:
             logger.error(f"报价单分析结果JSON解析失败: {e}")
             return self._get_default_quote_analysis()
+        except AIUpstreamBusy:
+            raise
         except Exception as e:
             logger.error(f"报价单AI分析失败: {e}", exc_info=True)
             return self._get_default_quote_analysis()
 
-    async def analyze_contract(self, ocr_text: str) -> Dict[str, Any]:
+    async def analyze_contract(self, ocr_text: str, use_cache: bool = True) -> Dict[str, Any]:
         """
         分析合同风险
 
         Args:
             ocr_text: OCR识别的合同文本
+            use_cache: 是否使用分析结果缓存（False 时强制重新调用大模型，结果仍写入缓存）
 
         Returns:
             分析结果
@@ -539,12 +697,18 @@ async def analyze_contract(self, ocr_text: str) -> Dict[str, Any]:
 """
         user_content = f"请分析以下装修合同：\n\n{ocr_text}"
 
+        cache_key = analysis_cache.make_key("contract", system_prompt, ocr_text)
+        if use_cache:
+            cached = await analysis_cache.get("contract", cache_key)
+            if cached is not None:
+                return cached
+
         try:
             if _use_coze_site():
                 result_text = await self._call_coze_site(system_prompt, user_content)
                 if not result_text and (getattr(settings, "DEEPSEEK_API_KEY", None) or "").strip():
                     logger.info("Coze site 无正文，降级使用 DeepSeek 合同分析")
-                    response = await self.client.chat.completions.create(
+                    response = await self._deepseek_chat(
                         model="deepseek-chat",
                         messages=[
                             {"role": "system", "content": system_prompt},
@@ -561,7 +725,7 @@ async def analyze_contract(self, ocr_text: str) -> Dict[str, Any]:
                 if not result_text:
                     return self._get_default_contract_analysis()
             else:
-                response = await self.client.chat.completions.create(
+                response = await self._deepseek_chat(
                     model="deepseek-chat",
                     messages=[
                         {"role": "system", "content": system_prompt},
@@ -600,6 +764,7 @@ async def analyze_contract(self, ocr_text: str) -> Dict[str, Any]:
             analysis_result['risk_level'] = mapped_risk_level
             
             logger.info(f"合同分析完成，风险等级: {analysis_result.get('risk_level', 'compliant')} (原始: {risk_level})")
+            await analysis_cache.set(cache_key, analysis_result)
             return analysis_result
 
         except json.JSONDecodeError as e:
@@ -613,6 +778,8 @@ async def analyze_contract(self, ocr_text: str) -> Dict[str, Any]:
             else:
                 # 其他JSON解析错误，返回兜底结果
                 return self._get_default_contract_analysis()
+        except AIUpstreamBusy:
+            raise
         except Exception as e:
             logger.error(f"合同AI分析失败: {e}", exc_info=True)
             return self._get_default_contract_analysis()
@@ -854,7 +1021,7 @@ async def analyze_acceptance(
                 result_text = await self._call_coze_site(system_prompt, user_content)
                 if not result_text and (getattr(settings, "DEEPSEEK_API_KEY", None) or "").strip():
                     logger.info("Coze site 无正文，降级使用 DeepSeek 验收分析")
-                    response = await self.client.chat.completions.create(
+                    response = await self._deepseek_chat(
                         model="deepseek-chat",
                         messages=[
                             {"role": "system", "content": system_prompt},
@@ -871,7 +1038,7 @@ async def analyze_acceptance(
                 if not result_text:
                     raise ValueError("Coze returned empty")
             else:
-                response = await self.client.chat.completions.create(
+                response = await self._deepseek_chat(
                     model="deepseek-chat",
                     messages=[
                         {"role": "system", "content": system_prompt},
@@ -886,6 +1053,8 @@ async def analyze_acceptance(
             elif "```" in result_text:
                 result_text = result_text.split("```")[1].split("```")[0].strip()
             return json.loads(result_text)
+        except AIUpstreamBusy:
+            raise
         except (json.JSONDecodeError, Exception) as e:
             logger.error(f"验收分析失败: {e}", exc_info=True)
             return {
@@ -979,7 +1148,7 @@ async def consult_acceptance(
                 result_text = await self._call_coze_site(system_prompt, user_content)
                 if not result_text and (getattr(settings, "DEEPSEEK_API_KEY", None) or "").strip():
                     logger.info("Coze site 无正文，降级使用 DeepSeek AI监理咨询")
-                    response = await self.client.chat.completions.create(
+                    response = await self._deepseek_chat(
                         model="deepseek-chat",
                         messages=[
                             {"role": "system", "content": system_prompt},
@@ -998,7 +1167,7 @@ async def consult_acceptance(
             else:
                 if not (getattr(settings, "DEEPSEEK_API_KEY", None) or "").strip():
                     raise ValueError("未配置 AI 服务（Coze 或 DeepSeek）")
-                response = await self.client.chat.completions.create(
+                response = await self._deepseek_chat(
                     model="deepseek-chat",
                     messages=[
                         {"role": "system", "content": system_prompt},
@@ -1139,7 +1308,7 @@ async def consult_designer(
                     logger.warning("AI监理智能体也返回空结果，尝试降级到DeepSeek")
                     # 降级到DeepSeek
                     if (getattr(settings, "DEEPSEEK_API_KEY", None) or "").strip():
-                        response = await self.client.chat.completions.create(
+                        response = await self._deepseek_chat(
                             model="deepseek-chat",
                             messages=[
                                 {"role": "system", "content": system_prompt},
@@ -1160,11 +1329,14 @@ async def consult_designer(
                 return "抱歉，AI设计师服务暂时不可用。当前AI服务资源点不足，请稍后再试或联系客服。\n\n作为临时替代，您可以参考以下装修设计建议：\n\n1. **现代简约风格特点**：\n   - 注重功能性和简洁线条\n   - 常用黑白灰为主色调，搭配木质元素\n   - 适合小户型，能最大化空间感\n\n2. **装修预算规划**：\n   - 硬装占60%，软装占30%，预留10%应急\n   - 根据面积、材料、人工等因素合理分配\n\n3. **材料选择建议**：\n   - 地板推荐实木复合地板，性价比高且环保\n   - 墙面建议使用环保乳胶漆，颜色选择浅色系\n\n4. **色彩搭配技巧**：\n   - 小户型使用浅色系增加空间感\n   - 局部用亮色点缀，如黄色抱枕、绿色植物\n\n5. **空间布局要点**：\n   - 客厅考虑动线流畅，沙发不要正对大门\n   - 卧室床的位置避开窗户，保证私密性\n\n如需更专业的建议，请稍后重试或联系人工设计师。"
             
             return result_text.strip()
+        except AIUpstreamBusy:
+            raise
         except Exception as e:
             logger.error(f"AI设计师咨询失败: {e}", exc_info=True)
             # 失败时返回友好的错误信息，而不是抛出异常
             return "抱歉，AI设计师服务暂时不可用。当前AI服务资源点不足，请稍后再试或联系客服。\n\n作为临时替代，您可以参考以下装修设计建议：\n\n1. **现代简约风格特点**：\n   - 注重功能性和简洁线条\n   - 常用黑白灰为主色调，搭配木质元素\n   - 适合小户型，能最大化空间感\n\n2. **装修预算规划**：\n   - 硬装占60%，软装占30%，预留10%应急\n   - 根据面积、材料、人工等因素合理分配\n\n3. **材料选择建议**：\n   - 地板推荐实木复合地板，性价比高且环保\n   - 墙面建议使用环保乳胶漆，颜色选择浅色系\n\n4. **色彩搭配技巧**：\n   - 小户型使用浅色系增加空间感\n   - 局部用亮色点缀，如黄色抱枕、绿色植物\n\n5. **空间布局要点**：\n   - 客厅考虑动线流畅，沙发不要正对大门\n   - 卧室床的位置避开窗户，保证私密性\n\n如需更专业的建议，请稍后重试或联系人工设计师。"
 
+    @ai_governor.governed(PROVIDER_DESIGNER)
     async def _call_designer_site(self, system_prompt: str, user_content: str) -> Optional[str]:
         """
         调用AI设计师扣子发布站点，流式响应拼接为完整文本。
@@ -1291,53 +1463,53 @@ def _extract_content(data: dict) -> Optional[str]:
             return None
 
         async def _do_stream() -> Optional[str]:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                async with client.stream("POST", url, json=payload, headers=headers) as resp:
-                    if resp.status_code != 200:
-                        body = await resp.aread()
-                        logger.error("AI designer site failed: status=%s body=%s", resp.status_code, body[:500])
-                        return None
-                    chunks = []
-                    raw_samples = []
-                    all_raw_lines = []  # 记录所有原始行用于调试
-                    async for line in resp.aiter_lines():
-                        line = (line or "").strip()
-                        if not line or line == "data: [DONE]":
-                            continue
-                        # 记录所有原始行（最多100行）
-                        if len(all_raw_lines) < 100:
-                            all_raw_lines.append(line)
-                        if len(raw_samples) < 5:
-                            raw_samples.append(line[:250])
-                        if not line.startswith("data:"):
-                            continue
-                        json_str = line[5:].strip()
-                        try:
-                            data = json.loads(json_str)
-                            c = _extract_content(data)
-                            if c:
-                                chunks.append(c)
+            client = get_http_client("coze_designer")
+            async with client.stream("POST", url, json=payload, headers=headers, timeout=120.0) as resp:
+                if resp.status_code != 200:
+                    body = await resp.aread()
+                    logger.error("AI designer site failed: status=%s body=%s", resp.status_code, body[:500])
+                    return None
+                chunks = []
+                raw_samples = []
+                all_raw_lines = []  # 记录所有原始行用于调试
+                async for line in resp.aiter_lines():
+                    line = (line or "").strip()
+                    if not line or line == "data: [DONE]":
+                        continue
+                    # 记录所有原始行（最多100行）
+                    if len(all_raw_lines) < 100:
+                        all_raw_lines.append(line)
+                    if len(raw_samples) < 5:
+                        raw_samples.append(line[:250])
+                    if not line.startswith("data:"):
+                        continue
+                    json_str = line[5:].strip()
+                    try:
+                        data = json.loads(json_str)
+                        c = _extract_content(data)
+                        if c:
+                            chunks.append(c)
+                            if len(chunks) <= 2:
+                                logger.info("AI designer extracted chunk len=%d", len(c))
+                                # 记录前2个chunk的内容用于调试
                                 if len(chunks) <= 2:
-                                    logger.info("AI designer extracted chunk len=%d", len(c))
-                                    # 记录前2个chunk的内容用于调试
-                                    if len(chunks) <= 2:
-                                        logger.debug("AI designer chunk %d content preview: %s", len(chunks), c[:200])
-                        except json.JSONDecodeError as e:
-                            logger.debug("AI designer JSON decode error: %s, line: %s", e, line[:100])
-                    text = "".join(chunks).strip()
-                    logger.info("AI designer chunks=%d total_len=%d", len(chunks), len(text))
-                    # 记录最终文本的前500个字符用于调试
-                    if text:
-                        logger.debug("AI designer final text preview (first 500 chars): %s", text[:500])
-                    if not text and raw_samples:
-                        logger.warning(
-                            "AI designer returned no parseable text. Sample lines: %s",
-                            raw_samples,
-                        )
-                        # 记录更多原始行用于调试
-                        if all_raw_lines:
-                            logger.debug("AI designer all raw lines (first 20): %s", all_raw_lines[:20])
-                    return text if text else None
+                                    logger.debug("AI designer chunk %d content preview: %s", len(chunks), c[:200])
+                    except json.JSONDecodeError as e:
+                        logger.debug("AI designer JSON decode error: %s, line: %s", e, line[:100])
+                text = "".join(chunks).strip()
+                logger.info("AI designer chunks=%d total_len=%d", len(chunks), len(text))
+                # 记录最终文本的前500个字符用于调试
+                if text:
+                    logger.debug("AI designer final text preview (first 500 chars): %s", text[:500])
+                if not text and raw_samples:
+                    logger.warning(
+                        "AI designer returned no parseable text. Sample lines: %s",
+                        raw_samples,
+                    )
+                    # 记录更多原始行用于调试
+                    if all_raw_lines:
+                        logger.debug("AI designer all raw lines (first 20): %s", all_raw_lines[:20])
+                return text if text else None
 
         try:
             result = await _do_stream()
@@ -6,6 +6,7 @@
 import logging
 from typing import Dict, List, Optional, Any
 from app.core.config import settings
+from app.services.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -34,25 +35,25 @@ async def _request(
             logger.debug("天眼查 Token 未配置，跳过 API 调用")
             return None
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                url = f"{self.base_url}{endpoint}"
+            client = get_http_client("tianyancha")
+            url = f"{self.base_url}{endpoint}"
 
-                # 添加认证参数
-                if params is None:
-                    params = {}
-                params["token"] = self.token
+            # 添加认证参数
+            if params is None:
+                params = {}
+            params["token"] = self.token
 
-                response = await client.request(method, url, params=params)
-                response.raise_for_status()
+            response = await client.request(method, url, params=params, timeout=self.timeout)
+            response.raise_for_status()
 
-                data = response.json()
+            data = response.json()
 
-                # 检查天眼查响应状态
-                if data.get("error_code") != 0:
-                    logger.error(f"天眼查API错误: {data.get('error_code')} - {data.get('error_msg')}")
-                    return None
+            # 检查天眼查响应状态
+            if data.get("error_code") != 0:
+                logger.error(f"天眼查API错误: {data.get('error_code')} - {data.get('error_msg')}")
+                return None
 
-                return data.get("result")
+            return data.get("result")
 
         except httpx.TimeoutException:
             logger.error("天眼查API请求超时")
@@ -0,0 +1,287 @@
+"""
+消息中心未读数计数器
+小程序每次切换标签页都会请求 GET /messages/unread-count，原实现每次对 messages 执行 count(*)：
+- 每个用户在 Redis 中保存一个按分类计数的 HASH，未读数查询为一次 HGETALL
+- create_message / 标记已读 / 一键已读 / 删除未读消息时在会话中登记增减，
+  事务提交后才写入 Redis，回滚则丢弃，计数不会领先于数据库
+- 计数不存在时从数据库按分类统计一次并写入（只在键不存在时写入），带TTL，过期后自动重建
+- 增减只作用于已存在的计数，未初始化的用户不会得到一个从 0 开始的错误计数
+- 周期对账任务（worker 进程）比对数据库，不一致的计数直接删除，下次读取时重建
+
+Redis 键约定：
+- msg_unread:{user_id}  各分类未读数（HASH，field 为分类，"_" 为已初始化标记），带TTL
+"""
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import with_session
+from app.services.job_queue import register_periodic
+from app.services.redis_cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "msg_unread"
+INIT_FIELD = "_"
+PENDING_KEY = "unread_counter_ops"  # session.info 中待提交的计数变更
+
+# 写入计数（仅在键不存在时）; KEYS: 计数键; ARGV: TTL秒, 分类1, 数量1, 分类2, 数量2 ...
+_LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], '_', 1)
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# 增减计数（仅在键存在时，结果不小于0）; KEYS: 计数键; ARGV: 分类, 增量
+_INCR_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local value = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if value < 0 then
+    redis.call('HSET', KEYS[1], ARGV[1], 0)
+    value = 0
+end
+return value
+"""
+
+# 清零（一键已读）; KEYS: 计数键; ARGV: TTL秒
+_RESET_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], '_', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# 计数变更：(用户ID, 分类, 增量)，分类为 None 表示清零
+CounterOp = Tuple[int, Optional[str], int]
+
+
+def _counter_key(user_id: int) -> str:
+    return f"{KEY_PREFIX}:{user_id}"
+
+
+def _parse_counts(raw: Dict[str, str]) -> Dict[str, int]:
+    return {k: int(v) for k, v in raw.items() if k != INIT_FIELD and int(v) > 0}
+
+
+def _coalesce(ops: List[CounterOp]) -> Dict[Tuple[int, Optional[str]], int]:
+    """合并同一用户同一分类的增减（批量写入时一个用户只执行一次脚本），清零之前的增减直接丢弃"""
+    merged: Dict[Tuple[int, Optional[str]], int] = {}
+    for user_id, category, delta in ops:
+        if category is None:
+            for key in [k for k in merged if k[0] == user_id]:
+                del merged[key]
+            merged[(user_id, None)] = 0
+        else:
+            merged[(user_id, category)] = merged.get((user_id, category), 0) + delta
+    return merged
+
+
+class UnreadCounter:
+    """消息未读数计数器（Redis）"""
+
+    def __init__(self):
+        self._scripts: Dict[str, object] = {}
+        self._script_client = None
+        self._apply_tasks: set = set()
+
+    @property
+    def available(self) -> bool:
+        return settings.MESSAGE_UNREAD_COUNTER_ENABLED and cache.client is not None
+
+    def _script(self, name: str, source: str):
+        if self._script_client is not cache.client:
+            self._scripts = {}
+            self._script_client = cache.client
+        script = self._scripts.get(name)
+        if script is None:
+            script = self._scripts[name] = cache.client.register_script(source)
+        return script
+
+    # ---------- 写入：登记到会话，提交后生效 ----------
+
+    def track(self, db: AsyncSession, user_id: int, category: str, delta: int) -> None:
+        """
+        登记一次未读数增减，会话提交后写入 Redis（在同一事务中修改消息之后调用）
+
+        Args:
+            db: 执行消息变更的数据库会话
+            user_id: 用户ID
+            category: 消息分类
+            delta: 增量（新建未读消息 +1，已读/删除未读消息 -1）
+        """
+        db.sync_session.info.setdefault(PENDING_KEY, []).append((user_id, category, delta))
+
+    def track_reset(self, db: AsyncSession, user_id: int) -> None:
+        """登记一键已读（提交后该用户所有分类清零）"""
+        db.sync_session.info.setdefault(PENDING_KEY, []).append((user_id, None, 0))
+
+    def _schedule_apply(self, ops: List[CounterOp]) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning(f"无事件循环，跳过未读数更新 {len(ops)} 条，等待对账修正")
+            return
+        task = loop.create_task(self.apply(ops))
+        # 保留引用，避免任务在完成前被回收
+        self._apply_tasks.add(task)
+        task.add_done_callback(self._apply_tasks.discard)
+
+    async def apply(self, ops: List[CounterOp]) -> None:
+        """
+        将已提交的计数变更写入 Redis（一次 pipeline）
+
+        Args:
+            ops: 计数变更列表
+        """
+        if not self.available or not ops:
+            return
+        try:
+            incr = self._script("incr", _INCR_SCRIPT)
+            reset = self._script("reset", _RESET_SCRIPT)
+            pipe = cache.client.pipeline(transaction=False)
+            for (user_id, category), delta in _coalesce(ops).items():
+                key = _counter_key(user_id)
+                if category is None:
+                    await reset(keys=[key], args=[settings.MESSAGE_UNREAD_COUNTER_TTL], client=pipe)
+                elif delta:
+                    await incr(keys=[key], args=[category, delta], client=pipe)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"更新未读数失败，等待对账修正: {e}")
+
+    # ---------- 读取 ----------
+
+    async def _count_from_db(self, db: AsyncSession, user_ids: List[int]) -> Dict[int, Dict[str, int]]:
+        # 延迟导入，避免循环导入
+        from app.models import Message
+        result = await db.execute(
+            select(Message.user_id, Message.category, func.count(Message.id))
+            .where(Message.user_id.in_(user_ids), Message.is_read == False)
+            .group_by(Message.user_id, Message.category)
+        )
+        counts: Dict[int, Dict[str, int]] = {user_id: {} for user_id in user_ids}
+        for user_id, category, count in result.all():
+            counts[user_id][category] = count
+        return counts
+
+    async def get_counts(self, db: AsyncSession, user_id: int) -> Dict[str, int]:
+        """
+        获取用户各分类未读数
+
+        Args:
+            db: 数据库会话（计数不存在或 Redis 不可用时查询数据库）
+            user_id: 用户ID
+
+        Returns:
+            {分类: 未读数}，只包含未读数大于0的分类
+        """
+        key = _counter_key(user_id)
+        if self.available:
+            try:
+                raw = await cache.client.hgetall(key)
+                if raw.get(INIT_FIELD):
+                    return _parse_counts(raw)
+            except Exception as e:
+                logger.warning(f"读取未读数失败，改为查询数据库: {e}")
+
+        counts = (await self._count_from_db(db, [user_id]))[user_id]
+        if self.available:
+            try:
+                args = [settings.MESSAGE_UNREAD_COUNTER_TTL]
+                for category, count in counts.items():
+                    args.extend([category, count])
+                await self._script("load", _LOAD_SCRIPT)(keys=[key], args=args)
+            except Exception as e:
+                logger.warning(f"写入未读数失败: {e}")
+        return counts
+
+    # ---------- 对账 ----------
+
+    async def reconcile(self, batch_size: int = 500) -> int:
+        """
+        比对 Redis 计数与数据库，删除不一致的计数（下次读取时从数据库重建）
+
+        Args:
+            batch_size: 每批比对的用户数
+
+        Returns:
+            删除的计数个数
+        """
+        if not self.available:
+            return 0
+        checked = fixed = 0
+        batch: List[str] = []
+        async for key in cache.client.scan_iter(match=f"{KEY_PREFIX}:*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                fixed += await self._reconcile_batch(batch)
+                checked += len(batch)
+                batch = []
+        if batch:
+            fixed += await self._reconcile_batch(batch)
+            checked += len(batch)
+        if fixed:
+            logger.warning(f"未读数对账: 检查 {checked} 个用户，修正 {fixed} 个")
+        else:
+            logger.info(f"未读数对账: 检查 {checked} 个用户，无差异")
+        return fixed
+
+    async def _reconcile_batch(self, keys: List[str]) -> int:
+        user_ids = []
+        for key in keys:
+            suffix = key[len(KEY_PREFIX) + 1:]
+            if suffix.isdigit():
+                user_ids.append(int(suffix))
+        if not user_ids:
+            return 0
+        # 先查数据库再读 Redis：其间提交的新消息只会造成误判并删除（随后重建），不会漏掉差异
+        async with with_session(commit=False) as db:
+            expected = await self._count_from_db(db, user_ids)
+        pipe = cache.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(_counter_key(user_id))
+        cached = await pipe.execute()
+
+        stale = [
+            _counter_key(user_id)
+            for user_id, raw in zip(user_ids, cached)
+            if raw.get(INIT_FIELD) and _parse_counts(raw) != expected[user_id]
+        ]
+        if stale:
+            await cache.client.delete(*stale)
+        return len(stale)
+
+
+# 创建全局未读数计数器实例
+unread_counter = UnreadCounter()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session: Session) -> None:
+    ops = session.info.pop(PENDING_KEY, None)
+    if ops:
+        unread_counter._schedule_apply(ops)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(PENDING_KEY, None)
+
+
+@register_periodic("message_unread_reconcile", interval=settings.MESSAGE_UNREAD_RECONCILE_INTERVAL)
+async def reconcile_unread_counters() -> None:
+    """周期对账任务（worker 进程执行）"""
+    await unread_counter.reconcile()
@@ -0,0 +1,206 @@
+"""
+报价单/合同上传去重
+用户分析失败后重传、或在另一台设备上重传同一份文件时，复用已完成的分析结果，不再重复上传OSS和调用扣子：
+- 上传时计算文件 SHA-256，图片另算 64 位差值感知哈希（dHash），写入记录的 content_hash / perceptual_hash 列
+- 同一用户内容完全相同：复用原对象键和分析结果，立即完成
+- 同一用户图片近似（感知哈希汉明距离不超过阈值）只计入统计，不复用：
+  版式相同的报价单/合同改了项目或金额，64 位 dHash 也几乎相同，复用会返回旧版本的分析结果
+- 跨用户复用（仅内容完全相同）需开启 UPLOAD_DEDUP_CROSS_USER
+- 命中率按类型统计，供监控接口查看
+"""
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import UploadFile
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+MATCH_EXACT = "exact"
+SIMILAR = "similar"  # 近似图片（仅统计，不复用）
+MATCH_CROSS_USER = "cross_user"
+
+# 复用时从原记录复制的字段（按表名）
+REUSE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "quotes": (
+        "ocr_result", "result_json", "risk_score", "high_risk_items", "warning_items",
+        "missing_items", "overpriced_items", "total_price", "market_ref_price",
+    ),
+    "contracts": (
+        "ocr_result", "result_json", "risk_level", "risk_items", "unfair_terms",
+        "missing_terms", "suggested_modifications",
+    ),
+}
+
+
+class UploadFingerprint(NamedTuple):
+    """上传文件指纹"""
+    sha256: str
+    phash: Optional[str]  # 非图片或无法解码时为 None
+
+
+def _dhash(fileobj) -> Optional[str]:
+    """64位差值哈希：缩放为 9x8 灰度图，逐行比较相邻像素"""
+    try:
+        with Image.open(fileobj) as img:
+            img.draft("L", (64, 64))  # JPEG 直接按缩小尺寸解码
+            pixels = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:016x}"
+
+
+def _fingerprint(fileobj, is_image: bool) -> UploadFingerprint:
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    phash = None
+    if is_image:
+        fileobj.seek(0)
+        phash = _dhash(fileobj)
+    fileobj.seek(0)
+    return UploadFingerprint(digest.hexdigest(), phash)
+
+
+async def fingerprint_upload(file: UploadFile, file_ext: str) -> UploadFingerprint:
+    """
+    计算上传文件指纹（在线程中读取，不阻塞事件循环；完成后文件指针复位）
+
+    Args:
+        file: FastAPI UploadFile
+        file_ext: 文件扩展名（pdf 不计算感知哈希）
+
+    Returns:
+        UploadFingerprint
+    """
+    return await asyncio.to_thread(_fingerprint, file.file, file_ext != "pdf")
+
+
+def _hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class DedupStats:
+    """去重命中统计（进程内）"""
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, match: Optional[str]) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(kind, {"lookups": 0, MATCH_EXACT: 0, MATCH_CROSS_USER: 0, SIMILAR: 0})
+            counts["lookups"] += 1
+            if match:
+                counts[match] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {kind: dict(c) for kind, c in self._counts.items()}
+        for c in counts.values():
+            hits = c[MATCH_EXACT] + c[MATCH_CROSS_USER]
+            c["hits"] = hits
+            c["hit_rate"] = round(hits / c["lookups"], 4) if c["lookups"] else 0.0
+        return counts
+
+
+async def find_reusable_result(db: AsyncSession, model, user_id: int,
+                               fingerprint: UploadFingerprint) -> Tuple[Optional[Any], Optional[str]]:
+    """
+    查找可复用分析结果的已完成记录（仅内容完全相同时复用，近似图片只计入统计）
+
+    Args:
+        db: 数据库会话
+        model: ORM模型（Quote / Contract）
+        user_id: 当前用户ID
+        fingerprint: 上传文件指纹
+
+    Returns:
+        (原记录, 命中类型 exact/cross_user)，未命中返回 (None, None)
+    """
+    if not settings.UPLOAD_DEDUP_ENABLED:
+        return None, None
+
+    since = datetime.now() - timedelta(days=settings.UPLOAD_DEDUP_MAX_AGE_DAYS)
+    completed = (model.status == "completed", model.result_json.isnot(None), model.created_at >= since)
+    record, match, similar = None, None, False
+    try:
+        result = await db.execute(
+            select(model)
+            .where(model.content_hash == fingerprint.sha256, model.user_id == user_id, *completed)
+            .order_by(model.id.desc())
+            .limit(1)
+        )
+        record = result.scalar_one_or_none()
+        if record:
+            match = MATCH_EXACT
+
+        if record is None and settings.UPLOAD_DEDUP_CROSS_USER:
+            result = await db.execute(
+                select(model)
+                .where(model.content_hash == fingerprint.sha256, *completed)
+                .order_by(model.id.desc())
+                .limit(1)
+            )
+            record = result.scalar_one_or_none()
+            if record:
+                match = MATCH_CROSS_USER
+
+        if record is None and fingerprint.phash:
+            # 近似图片可能是修改过的新版本，只统计（用于评估重传比例），照常分析
+            result = await db.execute(
+                select(model.perceptual_hash)
+                .where(model.user_id == user_id, model.perceptual_hash.isnot(None), *completed)
+                .order_by(model.created_at.desc(), model.id.desc())
+                .limit(settings.UPLOAD_DEDUP_PHASH_CANDIDATES)
+            )
+            similar = any(
+                _hamming(fingerprint.phash, phash) <= settings.UPLOAD_DEDUP_PHASH_DISTANCE
+                for phash in result.scalars().all()
+            )
+    except Exception as e:
+        logger.warning(f"查询上传去重索引失败: {model.__tablename__}, 错误: {e}")
+        await db.rollback()
+        record, match, similar = None, None, False
+
+    dedup_stats.record(model.__tablename__, match or (SIMILAR if similar else None))
+    if record:
+        logger.info(f"上传去重命中: {model.__tablename__} {record.id}, 类型: {match}")
+    return record, match
+
+
+def apply_reused_result(target, source, match: str) -> None:
+    """
+    把原记录的分析结果复制到新记录，并标记为已完成
+
+    Args:
+        target: 新建的报价单/合同记录
+        source: 可复用的原记录
+        match: 命中类型
+    """
+    for field in REUSE_FIELDS[target.__tablename__]:
+        setattr(target, field, getattr(source, field))
+    target.status = "completed"
+    target.analysis_progress = {"step": "completed", "progress": 100, "message": "分析完成", "reuse_match": match}
+    if match != MATCH_CROSS_USER:
+        target.analysis_progress["reused_from"] = source.id
+
+
+# 创建全局去重统计实例
+dedup_stats = DedupStats()
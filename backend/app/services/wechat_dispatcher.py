@@ -0,0 +1,283 @@
+"""
+小程序订阅消息发送队列
+报告通知、施工提醒原先在请求/任务中逐条调用 send_subscribe_message，微信接口慢或限流时拖住调用方：
+- 调用方只入队（LPUSH），worker 周期任务批量取出并发发送
+- 按模板限制每秒发送数（Redis 计数，多 worker 共享），超出时等待下一秒
+- 45009（调用额度/频率超限）与 -1（系统繁忙/网络异常）按指数退避重试；
+  40001/42001（access_token 失效）丢弃该 token 后尽快重试；其他错误（用户拒收、openid 无效等）不重试
+- 发送过程中的异常（限速脚本、取 token 等 Redis 异常）按 -1 处理，同样进入重试
+- 重试耗尽进入死信列表；Redis 不可用时退化为后台直接发送
+- 已取出但尚未发送的消息在 worker 异常退出时丢失（通知类消息，站内消息中心仍有记录）
+
+Redis 键约定：
+- wechat_sub:ready                    待发送（LIST，LPUSH 入队，右端批量取出）
+- wechat_sub:delayed                  等待重试（ZSET，score 为可发送时间戳）
+- wechat_sub:dead                     重试耗尽（LIST，保留最近 WECHAT_DISPATCH_DEAD_MAX 条）
+- wechat_sub:rate:{template_id}:{秒}  模板每秒发送计数
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.job_queue import register_periodic
+from app.services.redis_cache import cache
+from app.services.wechat_miniprogram_service import TOKEN_ERRCODES, wechat_miniprogram_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "wechat_sub"
+READY_KEY = f"{KEY_PREFIX}:ready"
+DELAYED_KEY = f"{KEY_PREFIX}:delayed"
+DEAD_KEY = f"{KEY_PREFIX}:dead"
+RETRY_ERRCODES = (45009, -1)
+TOKEN_RETRY_DELAY = 1  # access_token 失效后重试等待（秒）
+
+# 原子搬运到期的重试消息; KEYS: 重试ZSET, 待发送LIST; ARGV: 当前时间, 最大条数
+_PROMOTE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, item in ipairs(items) do
+    redis.call('ZREM', KEYS[1], item)
+    redis.call('LPUSH', KEYS[2], item)
+end
+return #items
+"""
+
+# 固定窗口限速; KEYS: 计数键前缀; ARGV: 每秒上限
+# 返回 0 表示可以发送，否则为距下一秒的微秒数
+_RATE_SCRIPT = """
+local t = redis.call('TIME')
+local key = KEYS[1] .. ':' .. t[1]
+local count = redis.call('INCR', key)
+if count == 1 then
+    redis.call('EXPIRE', key, 2)
+end
+if count <= tonumber(ARGV[1]) then
+    return 0
+end
+return 1000000 - tonumber(t[2])
+"""
+
+
+def compute_retry_delay(errcode: int, attempt: int) -> float:
+    """
+    计算第 attempt 次重试前的等待时间
+
+    Args:
+        errcode: 微信错误码
+        attempt: 已失败次数（从1开始）
+
+    Returns:
+        等待秒数
+    """
+    if errcode in TOKEN_ERRCODES:
+        return TOKEN_RETRY_DELAY
+    base = settings.WECHAT_DISPATCH_RETRY_SECONDS
+    return base * (2 ** max(attempt - 1, 0)) + random.uniform(0, base / 2)
+
+
+class WeChatSubscribeDispatcher:
+    """小程序订阅消息发送队列"""
+
+    def __init__(self):
+        self._scripts: Dict[str, Any] = {}
+        self._script_client = None
+        self._inline_tasks: set = set()
+
+    @property
+    def available(self) -> bool:
+        return settings.WECHAT_DISPATCH_ENABLED and cache.client is not None
+
+    def _script(self, name: str, source: str):
+        if self._script_client is not cache.client:
+            self._scripts = {}
+            self._script_client = cache.client
+        script = self._scripts.get(name)
+        if script is None:
+            script = self._scripts[name] = cache.client.register_script(source)
+        return script
+
+    # ---------- 入队 ----------
+
+    async def enqueue(
+        self,
+        openid: str,
+        template_id: str,
+        data: Dict[str, Dict[str, str]],
+        page: Optional[str] = None,
+        miniprogram_state: str = "formal",
+    ) -> bool:
+        """
+        提交一条订阅消息
+
+        Args:
+            openid: 用户openid
+            template_id: 订阅消息模板ID
+            data: 模板内容
+            page: 点击消息跳转的小程序页面路径
+            miniprogram_state: 跳转小程序类型
+
+        Returns:
+            是否已提交
+        """
+        return await self.enqueue_many([{
+            "openid": openid, "template_id": template_id, "data": data,
+            "page": page, "miniprogram_state": miniprogram_state,
+        }]) > 0
+
+    async def enqueue_many(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        批量提交订阅消息（一次 LPUSH）
+
+        Args:
+            messages: 消息列表，每项包含 openid、template_id、data，可选 page、miniprogram_state
+
+        Returns:
+            提交的消息数（openid/模板为空的消息被跳过）
+        """
+        messages = [m for m in messages if (m.get("openid") or "").strip() and m.get("template_id")]
+        if not messages:
+            return 0
+        if self.available:
+            try:
+                await cache.client.lpush(READY_KEY, *[
+                    json.dumps({**m, "attempts": 0}, ensure_ascii=False) for m in messages
+                ])
+                return len(messages)
+            except Exception as e:
+                logger.error(f"订阅消息入队失败，改为直接发送: {e}")
+
+        # 队列不可用：后台直接发送，不阻塞调用方
+        task = asyncio.create_task(self._send_inline(messages))
+        self._inline_tasks.add(task)
+        task.add_done_callback(self._inline_tasks.discard)
+        return len(messages)
+
+    async def _send_inline(self, messages: List[Dict[str, Any]]) -> None:
+        for m in messages:
+            await wechat_miniprogram_service.send_subscribe_message(
+                m["openid"], m["template_id"], m["data"], m.get("page"), m.get("miniprogram_state") or "formal"
+            )
+
+    # ---------- 发送 ----------
+
+    async def _wait_rate(self, template_id: str) -> None:
+        """按模板限速：本秒已达上限时等待到下一秒"""
+        limit = settings.WECHAT_SUBSCRIBE_TEMPLATE_QPS.get(template_id) or settings.WECHAT_SUBSCRIBE_QPS
+        if limit <= 0:
+            return
+        rate = self._script("rate", _RATE_SCRIPT)
+        while True:
+            wait_us = await rate(keys=[f"{KEY_PREFIX}:rate:{template_id}"], args=[limit])
+            if not wait_us:
+                return
+            await asyncio.sleep(wait_us / 1_000_000)
+
+    async def _send(self, raw: str, slots: asyncio.Semaphore) -> str:
+        """发送一条消息，返回 sent / retry / dead / dropped"""
+        try:
+            message = json.loads(raw)
+            template_id = message["template_id"]
+            openid, data = message["openid"], message["data"]
+        except (TypeError, ValueError, KeyError):
+            logger.error(f"订阅消息格式错误，丢弃: {raw[:200]}")
+            return "dropped"
+
+        try:
+            async with slots:
+                await self._wait_rate(template_id)
+                result = await wechat_miniprogram_service.post_subscribe_message(
+                    openid, template_id, data,
+                    message.get("page"), message.get("miniprogram_state") or "formal",
+                )
+        except Exception as e:
+            # 消息已从待发送队列取出，异常时按系统繁忙重试，避免丢失
+            logger.error(f"订阅消息发送异常: template_id={template_id}, 错误: {e}")
+            result = {"errcode": -1, "errmsg": f"{type(e).__name__}: {e}"}
+        errcode = result.get("errcode")
+        if errcode == 0:
+            return "sent"
+
+        if errcode not in RETRY_ERRCODES and errcode not in TOKEN_ERRCODES:
+            # 用户拒收（43101）、openid/模板无效等，重试无意义
+            logger.warning(
+                f"订阅消息发送失败不重试: template_id={message['template_id']}, "
+                f"errcode={errcode}, errmsg={result.get('errmsg')}"
+            )
+            return "dropped"
+
+        message["attempts"] = int(message.get("attempts", 0)) + 1
+        message["last_error"] = f"{errcode}: {result.get('errmsg')}"[:200]
+        if message["attempts"] > settings.WECHAT_DISPATCH_MAX_RETRIES:
+            logger.error(f"订阅消息重试耗尽，进入死信列表: template_id={message['template_id']}, {message['last_error']}")
+            async with cache.client.pipeline(transaction=True) as pipe:
+                pipe.lpush(DEAD_KEY, json.dumps(message, ensure_ascii=False))
+                pipe.ltrim(DEAD_KEY, 0, settings.WECHAT_DISPATCH_DEAD_MAX - 1)
+                await pipe.execute()
+            return "dead"
+
+        delay = compute_retry_delay(errcode, message["attempts"])
+        await cache.client.zadd(DELAYED_KEY, {json.dumps(message, ensure_ascii=False): time.time() + delay})
+        return "retry"
+
+    async def drain(self, max_messages: Optional[int] = None) -> Dict[str, int]:
+        """
+        批量发送队列中的消息，直到队列为空或达到 max_messages
+
+        Args:
+            max_messages: 本次最多发送的消息数，默认不限
+
+        Returns:
+            各结果计数（sent / retry / dead / dropped）
+        """
+        stats = {"sent": 0, "retry": 0, "dead": 0, "dropped": 0}
+        if not self.available:
+            return stats
+        await self._script("promote", _PROMOTE_SCRIPT)(
+            keys=[DELAYED_KEY, READY_KEY], args=[time.time(), settings.WECHAT_DISPATCH_BATCH_SIZE * 10]
+        )
+        slots = asyncio.Semaphore(max(1, settings.WECHAT_DISPATCH_CONCURRENCY))
+        handled = 0
+        while max_messages is None or handled < max_messages:
+            count = settings.WECHAT_DISPATCH_BATCH_SIZE
+            if max_messages is not None:
+                count = min(count, max_messages - handled)
+            batch = await cache.client.rpop(READY_KEY, count)
+            if not batch:
+                break
+            results = await asyncio.gather(*(self._send(raw, slots) for raw in batch), return_exceptions=True)
+            for r in results:
+                if isinstance(r, Exception):
+                    # 仅在写入重试/死信失败（Redis 不可用）时出现
+                    logger.error(f"订阅消息重试写入失败，消息丢失: {r}")
+                    stats["dropped"] += 1
+                else:
+                    stats[r] += 1
+            handled += len(batch)
+        if handled:
+            logger.info(f"订阅消息批量发送: {stats}")
+        return stats
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """队列长度（监控用）"""
+        if cache.client is None:
+            return {"available": False}
+        pipe = cache.client.pipeline(transaction=False)
+        pipe.llen(READY_KEY)
+        pipe.zcard(DELAYED_KEY)
+        pipe.llen(DEAD_KEY)
+        ready, delayed, dead = await pipe.execute()
+        return {"available": True, "ready": ready, "delayed": delayed, "dead": dead}
+
+
+# 创建全局订阅消息发送队列实例
+wechat_dispatcher = WeChatSubscribeDispatcher()
+
+
+@register_periodic("wechat_subscribe_drain", interval=settings.WECHAT_DISPATCH_INTERVAL)
+async def drain_subscribe_messages() -> None:
+    """周期批量发送订阅消息（worker 进程执行）"""
+    await wechat_dispatcher.drain()
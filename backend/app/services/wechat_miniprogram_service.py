@@ -1,15 +1,40 @@
 """
 微信小程序订阅消息服务
 用于向小程序用户发送订阅消息（如报告生成通知）
+
+access_token 由所有 API/worker 进程通过 Redis 共享：重新获取 token 会使之前的 token 失效，
+各进程各自刷新会互相踢掉对方的 token。缓存未命中时用 Redis 锁保证只有一个进程请求微信，
+其余进程等待新 token 写入；收到 40001/42001 时只删除自己用过的那个 token 再重新获取。
+
+Redis 键约定：
+- wechat:access_token:{app_id}       共享 access_token（TTL 为微信有效期减 5 分钟）
+- wechat:access_token_lock:{app_id}  刷新锁（带TTL）
 """
+import asyncio
 import logging
-import httpx
+import time
+import uuid
 from typing import Optional, Dict, Any
 
 from app.core.config import settings
+from app.services.http_client import get_http_client
+from app.services.redis_cache import cache
 
 logger = logging.getLogger(__name__)
 
+TOKEN_LOCAL_TTL = 300  # 进程内最多复用 Redis 中 token 的时间（秒）
+TOKEN_LOCK_TTL = 10  # 刷新锁过期时间（秒），需大于获取 token 的请求超时
+TOKEN_POLL_INTERVAL = 0.2  # 等待其他进程刷新 token 的轮询间隔（秒）
+TOKEN_ERRCODES = (40001, 42001)  # access_token 无效 / 已过期
+
+# 仅当值与参数相同时删除（释放自己持有的锁 / 删除自己用过的失效 token）
+_DELETE_IF_EQUAL_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 
 class WeChatMiniProgramService:
     """微信小程序服务"""
@@ -19,20 +44,17 @@ def __init__(self):
         self.app_secret = settings.WECHAT_APP_SECRET
         self.access_token = None
         self.token_expire_time = 0
-        
-    async def get_access_token(self) -> Optional[str]:
-        """
-        获取小程序access_token
-        
-        Returns:
-            access_token字符串，失败返回None
-        """
-        import time
-        
-        # 检查token是否有效
-        if self.access_token and time.time() < self.token_expire_time:
-            return self.access_token
-            
+
+    @property
+    def _token_key(self) -> str:
+        return f"wechat:access_token:{self.app_id}"
+
+    @property
+    def _lock_key(self) -> str:
+        return f"wechat:access_token_lock:{self.app_id}"
+
+    async def _fetch_access_token(self) -> Optional[Dict[str, Any]]:
+        """请求微信获取新的 access_token，返回 {"access_token", "expires_in"}，失败返回 None"""
         if not self.app_id or not self.app_secret:
             logger.error("微信小程序配置缺失: WECHAT_APP_ID=%s, WECHAT_APP_SECRET=%s", 
                         self.app_id[:8] + "***" if self.app_id else "None",
@@ -47,15 +69,13 @@ async def get_access_token(self) -> Optional[str]:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params=params)
-                result = response.json()
-                
+            client = get_http_client("wechat")
+            response = await client.get(url, params=params)
+            result = response.json()
+            
             if "access_token" in result:
-                self.access_token = result["access_token"]
-                self.token_expire_time = time.time() + result.get("expires_in", 7200) - 300  # 提前5分钟过期
                 logger.info("获取小程序access_token成功")
-                return self.access_token
+                return result
             else:
                 logger.error("获取小程序access_token失败: %s", result)
                 return None
@@ -63,6 +83,123 @@ async def get_access_token(self) -> Optional[str]:
         except Exception as e:
             logger.error("获取小程序access_token异常: %s", e, exc_info=True)
             return None
+
+    def _remember(self, token: str, ttl: float) -> str:
+        self.access_token = token
+        self.token_expire_time = time.time() + ttl
+        return token
+
+    async def get_access_token(self) -> Optional[str]:
+        """
+        获取小程序access_token（进程内缓存 -> Redis 共享缓存 -> 单飞刷新）
+        
+        Returns:
+            access_token字符串，失败返回None
+        """
+        # 检查token是否有效
+        if self.access_token and time.time() < self.token_expire_time:
+            return self.access_token
+
+        if cache.client is None:
+            # Redis 不可用：退化为进程内缓存
+            result = await self._fetch_access_token()
+            if not result:
+                return None
+            return self._remember(result["access_token"], result.get("expires_in", 7200) - 300)  # 提前5分钟过期
+
+        deadline = time.monotonic() + TOKEN_LOCK_TTL + 5
+        while True:
+            try:
+                pipe = cache.client.pipeline(transaction=False)
+                pipe.get(self._token_key)
+                pipe.ttl(self._token_key)
+                token, ttl = await pipe.execute()
+                if token and ttl > 0:
+                    return self._remember(token, min(ttl, TOKEN_LOCAL_TTL))
+
+                lock = uuid.uuid4().hex
+                if await cache.client.set(self._lock_key, lock, nx=True, ex=TOKEN_LOCK_TTL):
+                    try:
+                        # 拿锁前可能已有进程写入新 token
+                        token = await cache.client.get(self._token_key)
+                        if token:
+                            return self._remember(token, TOKEN_LOCAL_TTL)
+                        result = await self._fetch_access_token()
+                        if not result:
+                            return None
+                        expires = max(60, result.get("expires_in", 7200) - 300)  # 提前5分钟过期
+                        await cache.client.set(self._token_key, result["access_token"], ex=expires)
+                        return self._remember(result["access_token"], min(expires, TOKEN_LOCAL_TTL))
+                    finally:
+                        await cache.client.eval(_DELETE_IF_EQUAL_SCRIPT, 1, self._lock_key, lock)
+            except Exception as e:
+                logger.error("读取共享access_token失败: %s", e)
+                return None
+
+            if time.monotonic() > deadline:
+                logger.error("等待其他进程刷新access_token超时")
+                return None
+            await asyncio.sleep(TOKEN_POLL_INTERVAL)
+
+    async def invalidate_access_token(self, token: str) -> None:
+        """
+        微信返回 40001/42001 时调用：丢弃该 token（Redis 中已换成新 token 时不删除）
+
+        Args:
+            token: 被微信拒绝的 access_token
+        """
+        if self.access_token == token:
+            self.access_token = None
+            self.token_expire_time = 0
+        if cache.client is not None:
+            try:
+                await cache.client.eval(_DELETE_IF_EQUAL_SCRIPT, 1, self._token_key, token)
+            except Exception as e:
+                logger.warning("删除失效access_token失败: %s", e)
+
+    async def post_subscribe_message(
+        self,
+        openid: str,
+        template_id: str,
+        data: Dict[str, Dict[str, str]],
+        page: Optional[str] = None,
+        miniprogram_state: str = "formal"
+    ) -> Dict[str, Any]:
+        """
+        调用一次订阅消息发送接口，返回微信原始结果（供发送队列按错误码决定是否重试）
+
+        token 无效（40001/42001）时丢弃该 token 后返回原错误码；网络异常返回 errcode -1
+
+        Returns:
+            微信返回结果，至少包含 errcode / errmsg
+        """
+        access_token = await self.get_access_token()
+        if not access_token:
+            return {"errcode": -1, "errmsg": "无法获取access_token"}
+
+        url = f"https://api.weixin.qq.com/cgi-bin/message/subscribe/send?access_token={access_token}"
+        
+        payload = {
+            "touser": openid,
+            "template_id": template_id,
+            "data": data,
+            "miniprogram_state": miniprogram_state
+        }
+        
+        if page:
+            payload["page"] = page
+            
+        try:
+            client = get_http_client("wechat")
+            response = await client.post(url, json=payload)
+            result = response.json()
+        except Exception as e:
+            logger.error("小程序订阅消息发送异常: %s", e, exc_info=True)
+            return {"errcode": -1, "errmsg": str(e)}
+
+        if result.get("errcode") in TOKEN_ERRCODES:
+            await self.invalidate_access_token(access_token)
+        return result
     
     async def send_subscribe_message(
         self, 
@@ -73,7 +210,7 @@ async def send_subscribe_message(
         miniprogram_state: str = "formal"
     ) -> bool:
         """
-        发送小程序订阅消息
+        发送小程序订阅消息（立即发送；批量/后台通知请使用 wechat_dispatcher 入队）
         
         Args:
             openid: 用户openid
@@ -88,53 +225,32 @@ async def send_subscribe_message(
         if not openid or not openid.strip():
             logger.debug("openid为空，跳过发送订阅消息")
             return False
-            
-        access_token = await self.get_access_token()
-        if not access_token:
-            logger.error("无法获取access_token，跳过发送订阅消息")
-            return False
-            
-        url = f"https://api.weixin.qq.com/cgi-bin/message/subscribe/send?access_token={access_token}"
-        
-        payload = {
-            "touser": openid,
-            "template_id": template_id,
-            "data": data,
-            "miniprogram_state": miniprogram_state
-        }
+
+        result = await self.post_subscribe_message(openid, template_id, data, page, miniprogram_state)
+        if result.get("errcode") in TOKEN_ERRCODES:
+            # token 已被其他进程刷新或过期，换新 token 重试一次
+            result = await self.post_subscribe_message(openid, template_id, data, page, miniprogram_state)
+
+        if result.get("errcode") == 0:
+            logger.info("小程序订阅消息发送成功: openid=%s, template_id=%s", 
+                       openid[:8] + "***", template_id)
+            return True
+
+        error_code = result.get("errcode", "unknown")
+        error_msg = result.get("errmsg", str(result))
+        logger.error("小程序订阅消息发送失败: code=%s, message=%s", error_code, error_msg)
         
-        if page:
-            payload["page"] = page
+        # 常见错误处理
+        if error_code == 40037:
+            logger.error("错误代码40037: 模板ID不正确")
+        elif error_code == 40003:
+            logger.error("错误代码40003: 无效的openid")
+        elif error_code == 43101:
+            logger.error("错误代码43101: 用户拒绝接收消息")
+        elif error_code == 47003:
+            logger.error("错误代码47003: 模板参数不准确")
             
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(url, json=payload)
-                result = response.json()
-                
-            if result.get("errcode") == 0:
-                logger.info("小程序订阅消息发送成功: openid=%s, template_id=%s", 
-                           openid[:8] + "***", template_id)
-                return True
-            else:
-                error_code = result.get("errcode", "unknown")
-                error_msg = result.get("errmsg", str(result))
-                logger.error("小程序订阅消息发送失败: code=%s, message=%s", error_code, error_msg)
-                
-                # 常见错误处理
-                if error_code == 40037:
-                    logger.error("错误代码40037: 模板ID不正确")
-                elif error_code == 40003:
-                    logger.error("错误代码40003: 无效的openid")
-                elif error_code == 43101:
-                    logger.error("错误代码43101: 用户拒绝接收消息")
-                elif error_code == 47003:
-                    logger.error("错误代码47003: 模板参数不准确")
-                    
-                return False
-                
-        except Exception as e:
-            logger.error("小程序订阅消息发送异常: %s", e, exc_info=True)
-            return False
+        return False
     
     async def send_report_notification(
         self, 
@@ -144,7 +260,7 @@ async def send_report_notification(
         report_id: int
     ) -> bool:
         """
-        发送报告生成通知
+        发送报告生成通知（进入订阅消息发送队列，由 worker 批量发送）
         
         Args:
             openid: 用户openid
@@ -153,7 +269,7 @@ async def send_report_notification(
             report_id: 报告ID
         
         Returns:
-            是否发送成功
+            是否已提交发送
         """
         # 这里需要配置小程序订阅消息模板ID
         # 模板示例：报告名称{{thing1.DATA}}已生成，请点击查看详情
@@ -178,7 +294,9 @@ async def send_report_notification(
             "thing2": {"value": "已生成"}  # 状态
         }
         
-        return await self.send_subscribe_message(openid, template_id, data, page)
+        # 延迟导入，避免循环导入
+        from app.services.wechat_dispatcher import wechat_dispatcher
+        return await wechat_dispatcher.enqueue(openid, template_id, data, page)
 
 
 # 创建全局实例
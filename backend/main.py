@@ -16,9 +16,14 @@
 from app.core.database import init_db, get_pool_status
 from app.core.logger import get_logger, request_context
 from app.core.exceptions import register_exception_handlers
-from app.middleware.rate_limit import limiter, rate_limit_exceeded_handler, RateLimitConfig
+from app.middleware.rate_limit import limiter, rate_limit_exceeded_handler, rate_limit_middleware, RateLimitConfig
 from slowapi.errors import RateLimitExceeded
 from app.services.redis_cache import init_cache, close_cache
+from app.services.http_client import close_http_clients
+from app.services.pdf_renderer import shutdown_pdf_renderer
+from app.services.ocr_preprocess import ocr_preprocess_pool
+from app.services.oss_service import async_oss_service
+from app.services.analysis_progress import progress_hub
 from app.services.risk_analyzer import get_ai_provider_name
 
 # 配置日志
@@ -47,7 +52,12 @@ async def lifespan(app: FastAPI):
 
     # 关闭时的清理工作
     logger.info("正在关闭服务...")
+    await progress_hub.close()
     await close_cache()
+    await close_http_clients()
+    shutdown_pdf_renderer()
+    ocr_preprocess_pool.shutdown()
+    async_oss_service.shutdown()
     logger.info("应用关闭")
 
 
@@ -65,6 +75,8 @@ def create_app() -> FastAPI:
     # 注册限流器
     app.state.limiter = limiter
     app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+    # 分布式限流（按用户/IP，敏感接口独立配额）；先于CORS注册，429响应同样带CORS头
+    app.middleware("http")(rate_limit_middleware)
 
     # CORS中间件配置
     app.add_middleware(
@@ -0,0 +1,206 @@
+"""
+AI上游并发调控测试
+测试用户间轮转排队、排队数上限、超时与分配名额的竞争、分配后取消的名额交还，
+以及 Redis 异常时的进程内计数；排队相关用例在无 Redis 和 fakeredis 下各执行一次
+"""
+import os
+import sys
+import asyncio
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from app.core.config import settings
+from app.services.ai_governor import (
+    KEY_PREFIX, LOCAL_TOKEN, PROVIDER_DEEPSEEK, AIGovernor, AIUpstreamBusy,
+)
+from app.services.redis_cache import cache
+
+PROVIDER = PROVIDER_DEEPSEEK
+
+
+@pytest.fixture(params=["local", "redis"])
+def governor(request, monkeypatch):
+    """并发上限为1的 DeepSeek 渠道，分别使用进程内计数和 fakeredis"""
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis.aioredis")
+        pytest.importorskip("lupa")  # Lua 脚本需要 lupa
+        monkeypatch.setattr(cache, "client", fakeredis.FakeRedis(decode_responses=True))
+    else:
+        monkeypatch.setattr(cache, "client", None)
+    monkeypatch.setattr(settings, "AI_GOVERNOR_ENABLED", True)
+    monkeypatch.setattr(settings, "AI_DEEPSEEK_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "AI_DEEPSEEK_QPS", 0)
+    monkeypatch.setattr(settings, "AI_QUEUE_MAX_WAIT", 2.0)
+    monkeypatch.setattr(settings, "AI_QUEUE_MAX_DEPTH", 100)
+    monkeypatch.setattr(settings, "AI_GOVERNOR_POLL_INTERVAL", 0.01)
+    return AIGovernor()
+
+
+async def _in_flight(gov: AIGovernor) -> int:
+    if cache.client:
+        return await cache.client.zcard(f"{KEY_PREFIX}:slots:{PROVIDER}")
+    return gov._queue(PROVIDER).local_in_flight
+
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+class TestAIGovernorQueue:
+    """AI渠道排队测试类"""
+
+    def test_round_robin_between_users(self, governor):
+        """同一用户的多个请求不会连续占用名额，空出的名额在用户间轮转"""
+        order = []
+
+        async def call(user):
+            token = await governor._acquire(PROVIDER, user)
+            order.append(user)
+            await governor._release(PROVIDER, token)
+
+        async def run():
+            holder = await governor._acquire(PROVIDER, 0)
+            tasks = [asyncio.create_task(call(u)) for u in (1, 1, 1, 2, 2)]
+            await _settle()
+            assert governor._queue(PROVIDER).waiting == 5
+            await governor._release(PROVIDER, holder)
+            await asyncio.wait_for(asyncio.gather(*tasks), 5)
+            assert await _in_flight(governor) == 0
+
+        asyncio.run(run())
+        assert order == [1, 2, 1, 2, 1]
+
+    def test_queue_depth_rejects(self, governor, monkeypatch):
+        """排队数达到上限时新请求立即被拒绝"""
+        monkeypatch.setattr(settings, "AI_QUEUE_MAX_DEPTH", 2)
+
+        async def run():
+            holder = await governor._acquire(PROVIDER, 0)
+            waiters = [asyncio.create_task(governor._acquire(PROVIDER, u)) for u in (1, 2)]
+            await _settle()
+            with pytest.raises(AIUpstreamBusy):
+                await governor._acquire(PROVIDER, 3)
+            assert governor._queue(PROVIDER).rejected == 1
+
+            await governor._release(PROVIDER, holder)
+            for task in waiters:
+                await governor._release(PROVIDER, await asyncio.wait_for(task, 5))
+            assert await _in_flight(governor) == 0
+
+        asyncio.run(run())
+
+    def test_timeout_rejects_without_leaking(self, governor, monkeypatch):
+        """排队超时抛出 AIUpstreamBusy，之后空出的名额不会分给已超时的请求"""
+        monkeypatch.setattr(settings, "AI_QUEUE_MAX_WAIT", 0.05)
+
+        async def run():
+            holder = await governor._acquire(PROVIDER, 0)
+            with pytest.raises(AIUpstreamBusy):
+                await governor._acquire(PROVIDER, 1)
+            queue = governor._queue(PROVIDER)
+            assert (queue.waiting, queue.rejected) == (0, 1)
+
+            await governor._release(PROVIDER, holder)
+            await asyncio.sleep(0.05)
+            assert await _in_flight(governor) == 0
+
+        asyncio.run(run())
+
+    def test_grant_racing_timeout_is_kept(self, governor, monkeypatch):
+        """排队超时与名额分配同时发生时使用已分配的名额，不抛出也不泄漏"""
+        real_wait_for = asyncio.wait_for
+
+        async def run():
+            holder = await governor._acquire(PROVIDER, 0)
+            queue = governor._queue(PROVIDER)
+
+            async def racing_wait_for(aw, timeout):
+                if not asyncio.isfuture(aw):
+                    return await real_wait_for(aw, timeout)
+                # 超时触发前的同一轮事件循环里，分配器把名额交给了该请求
+                future = queue.waiters.pop(1).popleft()
+                await governor._release(PROVIDER, holder)
+                future.set_result(await governor._try_acquire(PROVIDER, queue))
+                raise asyncio.TimeoutError()
+
+            monkeypatch.setattr(asyncio, "wait_for", racing_wait_for)
+            token = await governor._acquire(PROVIDER, 1)
+            monkeypatch.setattr(asyncio, "wait_for", real_wait_for)
+
+            assert token is not None
+            assert (queue.waiting, queue.rejected) == (0, 0)
+            assert await _in_flight(governor) == 1
+            await governor._release(PROVIDER, token)
+            assert await _in_flight(governor) == 0
+
+        asyncio.run(run())
+
+    def test_cancel_after_grant_releases(self, governor, monkeypatch):
+        """名额已分配但调用方随即被取消时，名额交还"""
+        async def run():
+            holder = await governor._acquire(PROVIDER, 0)
+            waiter = asyncio.create_task(governor._acquire(PROVIDER, 1))
+            await _settle()
+
+            # 分配器拿到名额、尚未交给等待者时调用方被取消
+            try_acquire = governor._try_acquire
+
+            async def acquire_then_cancel(provider, queue):
+                token = await try_acquire(provider, queue)
+                if token is not None:
+                    waiter.cancel()
+                return token
+
+            monkeypatch.setattr(governor, "_try_acquire", acquire_then_cancel)
+            await governor._release(PROVIDER, holder)
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            await _settle()
+            assert governor._queue(PROVIDER).waiting == 0
+            assert await _in_flight(governor) == 0
+
+        asyncio.run(run())
+
+
+class TestAIGovernorLocalFallback:
+    """Redis 异常时进程内计数测试类"""
+
+    class _BrokenRedis:
+        def register_script(self, source):
+            async def script(keys, args):
+                raise ConnectionError("redis down")
+            return script
+
+        async def zrem(self, *args):
+            raise ConnectionError("redis down")
+
+    def test_redis_error_uses_local_count(self, monkeypatch):
+        """名额脚本执行失败时按进程内并发上限计数"""
+        monkeypatch.setattr(cache, "client", self._BrokenRedis())
+        monkeypatch.setattr(settings, "AI_GOVERNOR_ENABLED", True)
+        monkeypatch.setattr(settings, "AI_DEEPSEEK_CONCURRENCY", 1)
+        monkeypatch.setattr(settings, "AI_QUEUE_MAX_WAIT", 0.05)
+        monkeypatch.setattr(settings, "AI_GOVERNOR_POLL_INTERVAL", 0.01)
+        governor = AIGovernor()
+
+        async def run():
+            async with governor.slot(PROVIDER, 1):
+                queue = governor._queue(PROVIDER)
+                assert queue.local_in_flight == 1
+                with pytest.raises(AIUpstreamBusy):
+                    await governor._acquire(PROVIDER, 2)
+            assert queue.local_in_flight == 0
+            token = await governor._acquire(PROVIDER, 2)
+            assert token == LOCAL_TOKEN
+            await governor._release(PROVIDER, token)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,84 @@
+"""
+公司情报缓存测试
+测试查无案件按正常新鲜期缓存、上游失败只短期缓存，以及法律案件按信用代码共享
+"""
+import os
+import sys
+import asyncio
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+fakeredis = pytest.importorskip("fakeredis.aioredis")
+
+from app.core.config import settings
+from app.services.company_intel_cache import (
+    SOURCE_ENTERPRISE, SOURCE_LEGAL, CompanyIntelCache, normalize_company_name,
+)
+from app.services.redis_cache import cache
+
+CLEAN = {"legal_case_count": 0, "recent_case_date": "", "case_types": [],
+         "decoration_related_cases": 0, "recent_cases": []}
+
+
+class TestCompanyIntelCache:
+    """公司情报缓存测试类"""
+
+    def setup_method(self):
+        """每个测试方法前的设置"""
+        self.client = fakeredis.FakeRedis(decode_responses=True)
+        cache.client = self.client
+        self.calls = []
+        self.intel = CompanyIntelCache()
+
+    def teardown_method(self):
+        cache.client = None
+
+    def _fetcher(self, source, result):
+        async def fetch(company_name):
+            self.calls.append((source, company_name))
+            return result(company_name) if callable(result) else result
+        self.intel._fetchers[source] = fetch
+
+    async def _ttl(self, key):
+        return await self.client.ttl(f"company_intel:{key}")
+
+    async def _run_and_ttl(self, source, company_name):
+        await self.intel.get(source, company_name)
+        return await self._ttl(f"{source}:{normalize_company_name(company_name)}")
+
+    def test_clean_company_uses_legal_ttl(self):
+        """没有法律案件是正常结果，按法律案件新鲜期缓存"""
+        self._fetcher(SOURCE_LEGAL, CLEAN)
+
+        async def run():
+            await self.intel.get(SOURCE_LEGAL, "某某装饰")
+            assert await self.intel.get(SOURCE_LEGAL, "某某装饰") == (CLEAN, True)
+            return await self._ttl(f"legal:{normalize_company_name('某某装饰')}")
+
+        ttl = asyncio.run(run())
+        assert ttl > settings.COMPANY_INTEL_NEGATIVE_TTL
+        assert len(self.calls) == 1
+
+    def test_failed_fetch_is_short_lived(self):
+        """上游失败（None）只缓存 COMPANY_INTEL_NEGATIVE_TTL"""
+        self._fetcher(SOURCE_LEGAL, None)
+        ttl = asyncio.run(self._run_and_ttl(SOURCE_LEGAL, "某某装饰"))
+        assert 0 < ttl <= settings.COMPANY_INTEL_NEGATIVE_TTL
+
+    def test_legal_shared_by_credit_no(self):
+        """同一信用代码的不同公司写法共用一份法律案件缓存"""
+        self._fetcher(SOURCE_ENTERPRISE, lambda name: {"name": "某某装饰工程有限公司", "credit_no": "91430000X"})
+        self._fetcher(SOURCE_LEGAL, {**CLEAN, "legal_case_count": 2})
+
+        async def run():
+            first, _ = await self.intel.get_comprehensive("某某装饰工程有限公司")
+            second, _ = await self.intel.get_comprehensive("某某装饰工程(有限公司)")
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first["legal_analysis"] == second["legal_analysis"]
+        assert [c for c in self.calls if c[0] == SOURCE_LEGAL] == [(SOURCE_LEGAL, "某某装饰工程有限公司")]
@@ -0,0 +1,61 @@
+"""
+公司名称联想索引测试
+测试前缀/包含匹配、进程内索引上限淘汰和数据库加载失败后的重试
+"""
+import os
+import sys
+import asyncio
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from app.core.config import settings
+from app.services import company_name_index as index_module
+from app.services.company_name_index import CompanyNameIndex
+from app.services.redis_cache import cache
+
+
+class TestCompanyNameIndex:
+    """公司名称索引测试类"""
+
+    def setup_method(self):
+        """每个测试方法前的设置"""
+        cache.client = None
+        self.index = CompanyNameIndex()
+
+    def test_search(self):
+        """前缀匹配优先，其次包含匹配，短名称优先"""
+        for name in ("长沙某某装饰工程有限公司", "某某装饰", "湖南某某装饰设计有限公司"):
+            self.index.add(name)
+        assert self.index.search("某某装饰", limit=3) == [
+            "某某装饰", "长沙某某装饰工程有限公司", "湖南某某装饰设计有限公司",
+        ]
+
+    def test_evicts_oldest_over_limit(self, monkeypatch):
+        """超出上限时淘汰最早加入的公司名，倒排表和前缀表同步删除"""
+        monkeypatch.setattr(settings, "COMPANY_INDEX_MAX_NAMES", 10)
+        for i in range(25):
+            self.index.add(f"第{i:02d}号装饰公司")
+        assert len(self.index) <= 10
+        assert self.index.search("第00号") == []
+        assert self.index.search("第24号") == ["第24号装饰公司"]
+        assert len(self.index._sorted) == len(self.index)
+        assert all(doc_id in self.index._names for posting in self.index._postings.values() for doc_id in posting)
+
+    def test_load_failure_retried(self, monkeypatch):
+        """数据库加载失败不标记为已加载，退避到期后重试"""
+        attempts = []
+
+        async def load():
+            attempts.append(1)
+            return len(attempts) > 1
+
+        monkeypatch.setattr(self.index, "_load_from_db", load)
+        monkeypatch.setattr(index_module, "LOAD_RETRY_INTERVAL", 0)
+        asyncio.run(self.index.ensure_loaded())
+        assert not self.index._loaded
+        asyncio.run(self.index.ensure_loaded())
+        assert self.index._loaded and len(attempts) == 2
+        asyncio.run(self.index.ensure_loaded())
+        assert len(attempts) == 2
@@ -0,0 +1,60 @@
+"""
+施工提醒生成测试
+测试提前天数、提醒开关、已开始/已通过阶段和校准验收日期的处理
+"""
+import os
+import sys
+from datetime import date, datetime
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from app.core.config import settings
+from app.services.construction_reminders import compute_reminder_events
+
+TODAY = date(2026, 3, 1)
+
+
+def _stages():
+    return {
+        "S00": {"status": "checked", "start_date": "2026-03-01T00:00:00", "end_date": "2026-03-03T00:00:00"},
+        "S01": {"status": "pending", "start_date": "2026-03-04T00:00:00", "end_date": "2026-03-10T00:00:00"},
+        "S02": {"status": "pending", "start_date": "2026-03-11T00:00:00", "end_date": "2026-03-20T00:00:00",
+                "acceptance_date": "2026-03-22"},
+    }
+
+
+def _keys(events):
+    return {(e["stage"], e["event_type"], str(e["planned_date"])) for e in events}
+
+
+class TestComputeReminderEvents:
+    """提醒生成测试类"""
+
+    def test_default_days_before(self):
+        """默认提前3天，已通过阶段不提醒，过去的提醒不生成"""
+        events = compute_reminder_events(_stages(), today=TODAY)
+        assert _keys(events) == {
+            ("S01", "stage_start", "2026-03-04"),
+            ("S01", "stage_acceptance", "2026-03-10"),
+            ("S02", "stage_start", "2026-03-11"),
+            ("S02", "stage_acceptance", "2026-03-22"),  # 使用校准后的验收日期
+        }
+        s01_start = next(e for e in events if e["stage"] == "S01" and e["event_type"] == "stage_start")
+        assert s01_start["remind_at"] == datetime(2026, 3, 1, settings.REMINDER_SEND_HOUR)
+
+    def test_started_stage_only_acceptance(self):
+        """已开始的阶段只提醒验收"""
+        stages = _stages()
+        stages["S01"]["status"] = "in_progress"
+        events = compute_reminder_events(stages, reminder_days_before=1, today=TODAY)
+        assert ("S01", "stage_start", "2026-03-04") not in _keys(events)
+        assert ("S01", "stage_acceptance", "2026-03-10") in _keys(events)
+
+    def test_notify_switches(self):
+        """关闭开工提醒时验收提醒当天发送（与原 reminder-schedule 规则一致）"""
+        events = compute_reminder_events(_stages(), notify_progress=False, today=TODAY)
+        assert {e["event_type"] for e in events} == {"stage_acceptance"}
+        assert all(e["reminder_days_before"] == 0 for e in events)
+        assert compute_reminder_events(_stages(), notify_progress=False, notify_acceptance=False, today=TODAY) == []
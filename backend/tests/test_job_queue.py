@@ -0,0 +1,185 @@
+"""
+分析任务队列测试
+测试退避计算、Redis不可用时的降级执行和死信回调，
+以及重试写入失败时任务保留在执行中列表、消费协程不因单次异常退出
+"""
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from fastapi import BackgroundTasks
+
+from app.core.config import settings
+from app.services import job_queue
+from app.services.redis_cache import cache
+
+
+class TestJobQueue:
+    """任务队列测试类"""
+
+    def setup_method(self):
+        """每个测试方法前的设置"""
+        self.calls = []
+        self.dead = []
+        cache.client = None
+
+        async def on_dead(payload, error):
+            self.dead.append((payload, error))
+
+        @job_queue.register_job("test_ok", concurrency=2)
+        async def ok_handler(payload):
+            self.calls.append(payload)
+
+        @job_queue.register_job("test_fail", concurrency=0, max_retries=1, on_dead=on_dead)
+        async def fail_handler(payload):
+            raise RuntimeError("upstream timeout")
+
+    def teardown_method(self):
+        """每个测试方法后的清理"""
+        job_queue.JOB_HANDLERS.pop("test_ok", None)
+        job_queue.JOB_HANDLERS.pop("test_fail", None)
+
+    def test_register_job(self):
+        """测试任务注册"""
+        assert job_queue.JOB_HANDLERS["test_ok"].concurrency == 2
+        # 并发数至少为1
+        assert job_queue.JOB_HANDLERS["test_fail"].concurrency == 1
+        assert job_queue.JOB_HANDLERS["test_fail"].max_retries == 1
+
+    def test_register_periodic(self):
+        """测试周期任务注册"""
+        @job_queue.register_periodic("test_periodic", interval=60)
+        async def periodic():
+            pass
+
+        try:
+            spec = job_queue.PERIODIC_TASKS["test_periodic"]
+            assert spec.handler is periodic
+            assert spec.interval == 60
+        finally:
+            job_queue.PERIODIC_TASKS.pop("test_periodic", None)
+
+    def test_compute_backoff(self):
+        """测试指数退避与上限"""
+        base = settings.JOB_RETRY_BASE_SECONDS
+        assert base <= job_queue.compute_backoff(1) <= base * 1.5
+        assert 2 * base <= job_queue.compute_backoff(2) <= 2 * base + base / 2
+        assert job_queue.compute_backoff(50) <= settings.JOB_RETRY_MAX_SECONDS + base / 2
+
+    def test_enqueue_falls_back_to_background_tasks(self):
+        """测试Redis不可用时降级为进程内后台任务"""
+        background_tasks = BackgroundTasks()
+        job_id = asyncio.run(job_queue.enqueue_job("test_ok", {"id": 1}, background_tasks))
+
+        assert job_id is None
+        assert len(background_tasks.tasks) == 1
+        asyncio.run(background_tasks())
+        assert self.calls == [{"id": 1}]
+
+    def test_inline_failure_calls_on_dead(self):
+        """测试进程内执行失败时触发死信回调"""
+        asyncio.run(job_queue.run_job_inline("test_fail", {"id": 2}))
+        assert self.dead == [({"id": 2}, "upstream timeout")]
+
+    def test_worker_requires_redis(self):
+        """测试Redis未连接时worker拒绝启动"""
+        with pytest.raises(RuntimeError):
+            asyncio.run(job_queue.JobWorker(["test_ok"]).run())
+
+
+class TestJobWorkerRedisErrors:
+    """worker Redis 写入异常测试类"""
+
+    def setup_method(self):
+        """每个测试方法前的设置"""
+        fakeredis = pytest.importorskip("fakeredis.aioredis")
+        pytest.importorskip("lupa")  # Lua 脚本需要 lupa
+        self.client = fakeredis.FakeRedis(decode_responses=True)
+        cache.client = self.client
+
+        @job_queue.register_job("test_flaky", max_retries=3)
+        async def flaky_handler(payload):
+            raise RuntimeError("upstream timeout")
+
+        self.worker = job_queue.JobWorker(["test_flaky"])
+        self.worker._requeue = self.client.register_script(job_queue._REQUEUE_SCRIPT)
+        self.ready = job_queue._key("test_flaky", "ready")
+        self.processing = job_queue._processing_key("test_flaky", self.worker.worker_id)
+
+    def teardown_method(self):
+        """每个测试方法后的清理"""
+        job_queue.JOB_HANDLERS.pop("test_flaky", None)
+        cache.client = None
+
+    async def _consume_until(self, condition):
+        spec = job_queue.JOB_HANDLERS["test_flaky"]
+        task = asyncio.create_task(self.worker._consume(spec))
+        for _ in range(100):
+            if await condition():
+                break
+            await asyncio.sleep(0.02)
+        self.worker.stop()
+        await asyncio.wait_for(task, 5)
+
+    def test_retry_write_failure_keeps_job(self, monkeypatch):
+        """延迟重试写入失败：任务留在执行中列表，恢复后放回待执行队列"""
+        monkeypatch.setattr(job_queue, "POLL_TIMEOUT", 0.05)
+        raw = json.dumps({"id": "j1", "payload": {"id": 1}, "attempts": 0})
+
+        async def broken_zadd(*args, **kwargs):
+            raise ConnectionError("redis down")
+
+        async def run():
+            await self.client.lpush(self.ready, raw)
+            monkeypatch.setattr(self.client, "zadd", broken_zadd)
+
+            async def stranded():
+                return bool(self.worker._stranded)
+
+            await self._consume_until(stranded)
+            assert await self.client.lrange(self.processing, 0, -1) == [raw]
+
+            await self.worker._requeue_stranded()
+            assert self.worker._stranded == []
+            assert await self.client.llen(self.processing) == 0
+            assert await self.client.lrange(self.ready, 0, -1) == [raw]
+
+        asyncio.run(run())
+
+    def test_consumer_survives_redis_error(self, monkeypatch):
+        """拉取任务异常后消费协程继续运行"""
+        monkeypatch.setattr(job_queue, "POLL_TIMEOUT", 0.05)
+        blmove = self.client.blmove
+        failures = []
+
+        async def flaky_blmove(*args, **kwargs):
+            if not failures:
+                failures.append(1)
+                raise ConnectionError("redis down")
+            return await blmove(*args, **kwargs)
+
+        async def run():
+            monkeypatch.setattr(self.client, "blmove", flaky_blmove)
+            await self.client.lpush(self.ready, json.dumps({"id": "j2", "payload": {}}))
+            delayed = job_queue._key("test_flaky", "delayed")
+
+            async def retried():
+                return await self.client.zcard(delayed) == 1
+
+            await self._consume_until(retried)
+            assert failures == [1]
+            assert await self.client.zcard(delayed) == 1
+            assert await self.client.llen(self.processing) == 0
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,49 @@
+"""
+OCR分段文本合并测试
+测试重叠行去重、边界残行处理，以及重复出现的完整行不被误删
+"""
+import os
+import sys
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from app.services.ocr_merge import merge_segment_texts
+
+FULL = ["项目 A 100元", "项目 B 200元", "项目 C 300元", "项目 D 400元"]
+
+
+class TestMergeSegmentTexts:
+    """分段文本合并测试类"""
+
+    def test_exact_overlap(self):
+        """重叠行原样对齐时只保留一份"""
+        texts = ["\n".join(FULL[:3]), "\n".join(FULL[1:])]
+        assert merge_segment_texts(texts) == "\n".join(FULL)
+
+    def test_clipped_last_line_of_previous_segment(self):
+        """上一段末行被切开：丢弃残行，使用下一段中的完整行"""
+        texts = ["项目 A 100元\n项目 B 200元\n项目 C 3", "项目 B 200元\n项目 C 300元\n项目 D 400元"]
+        assert merge_segment_texts(texts) == "\n".join(FULL)
+
+    def test_clipped_first_line_of_next_segment(self):
+        """下一段首行被切开：丢弃残行"""
+        texts = ["\n".join(FULL[:3]), "目 B 20\n项目 C 300元\n项目 D 400元"]
+        assert merge_segment_texts(texts) == "\n".join(FULL)
+
+    def test_repeated_rows_not_dropped(self):
+        """报价单中重复出现的完整行不能当作残行丢弃"""
+        merged = merge_segment_texts(["数量 1\n单价 10元\n数量 1", "数量 1\n单价 10元\n其他"])
+        assert merged.split("\n")[:3] == ["数量 1", "单价 10元", "数量 1"]
+        assert merged.count("单价 10元") == 2
+        assert merged.endswith("其他")
+
+    def test_ocr_variance_keeps_longer_line(self):
+        """重叠行识别结果个别字不同时取较完整的一行"""
+        texts = ["项目 A 100元\n瓷砖铺贴人工费 45元/平方米", "瓷砖铺贴人工费 45元/平方\n项目 D 400元"]
+        assert merge_segment_texts(texts) == "项目 A 100元\n瓷砖铺贴人工费 45元/平方米\n项目 D 400元"
+
+    def test_no_dedupe(self):
+        """关闭去重时原样拼接"""
+        assert merge_segment_texts(["a\nb", "b\nc"], dedupe=False) == "a\nb\nb\nc"
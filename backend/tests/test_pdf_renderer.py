@@ -0,0 +1,65 @@
+"""
+报告PDF渲染缓存测试
+测试正常渲染结果写入缓存、ASCII 兜底PDF不写入缓存
+"""
+import os
+import sys
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from app.core.config import settings
+from app.services import pdf_renderer
+from app.services.pdf_renderer import PdfCache, render_pdf_cached
+from app.api.v1 import reports
+
+ROW = SimpleNamespace(id=1, company_name="某某装饰", created_at=datetime(2026, 3, 1))
+
+
+class TestRenderPdfCached:
+    """PDF渲染缓存测试类"""
+
+    def setup_method(self):
+        """每个测试方法前的设置"""
+        self.calls = []
+
+    def _patch(self, monkeypatch, tmp_path):
+        cache = PdfCache(str(tmp_path), 10 * 1024 * 1024)
+        monkeypatch.setattr(pdf_renderer, "pdf_cache", cache)
+        monkeypatch.setattr(settings, "PDF_CACHE_ENABLED", True)
+        monkeypatch.setattr(settings, "PDF_RENDER_WORKERS", 0)  # 线程内渲染，便于打桩
+
+    def _render_twice(self, func):
+        async def run():
+            first = await render_pdf_cached(func, "company", ROW.id, ROW)
+            second = await render_pdf_cached(func, "company", ROW.id, ROW)
+            return first, second
+        return asyncio.run(run())
+
+    def test_normal_render_cached(self, monkeypatch, tmp_path):
+        """正常渲染结果第二次直接命中缓存"""
+        self._patch(monkeypatch, tmp_path)
+
+        def render(report_type, row):
+            self.calls.append(report_type)
+            return b"%PDF-ok", False
+
+        assert self._render_twice(render) == (b"%PDF-ok", b"%PDF-ok")
+        assert len(self.calls) == 1
+
+    def test_fallback_render_not_cached(self, monkeypatch, tmp_path):
+        """中文排版失败的兜底PDF不写入缓存，下次重新渲染"""
+        self._patch(monkeypatch, tmp_path)
+
+        def broken_font():
+            raise RuntimeError("CJK font missing")
+
+        monkeypatch.setattr(reports, "_ensure_cjk_font", broken_font)
+        assert reports._render_report_pdf("company", ROW)[1] is True
+        first, second = self._render_twice(reports._render_report_pdf)
+        assert first.startswith(b"%PDF") and second.startswith(b"%PDF")
+        assert not any(files for _, _, files in os.walk(tmp_path))
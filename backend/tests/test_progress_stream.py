@@ -0,0 +1,88 @@
+"""
+分析进度 SSE 推送测试
+经过完整中间件栈（含 GZipMiddleware）读取第一条事件，确认事件实时发出而不是被压缩缓冲到流结束
+"""
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from main import app
+from app.api.v1 import quotes
+from app.core.security import get_user_id
+
+PROGRESS = {"step": "analyzing", "progress": 60, "message": "正在分析报价项目" * 100}
+
+
+class _FakeSession:
+    """只返回一行报价单状态的会话"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        row = SimpleNamespace(status="analyzing", analysis_progress=PROGRESS)
+        return SimpleNamespace(first=lambda: row)
+
+
+async def _endless_events(model, record_id, status, progress):
+    """推送一条进度后一直保持连接（分析尚未结束）"""
+    yield f"event: progress\ndata: {json.dumps(progress, ensure_ascii=False)}\n\n"
+    await asyncio.Event().wait()
+
+
+async def _first_body(path: str):
+    """以 ASGI 方式请求，返回响应头和第一段非空响应体"""
+    start, first_body = {}, asyncio.get_running_loop().create_future()
+    requested, disconnected = asyncio.Event(), asyncio.Event()
+
+    async def receive():
+        if not requested.is_set():
+            requested.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body" and message.get("body") and not first_body.done():
+            first_body.set_result(message["body"])
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"test"), (b"accept-encoding", b"gzip")],
+        "client": ("127.0.0.1", 5000), "server": ("test", 80),
+    }
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        body = await asyncio.wait_for(first_body, timeout=5)
+    finally:
+        disconnected.set()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return {k.decode().lower(): v.decode() for k, v in start["headers"]}, body
+
+
+def test_progress_stream_not_buffered_by_gzip(monkeypatch):
+    """gzip 客户端也能在流结束前收到第一条进度事件"""
+    monkeypatch.setattr(quotes, "AsyncSessionLocal", _FakeSession)
+    monkeypatch.setattr(quotes, "progress_events", _endless_events)
+    monkeypatch.setattr(quotes.settings, "RATE_LIMIT_ENABLED", False)
+    app.dependency_overrides[get_user_id] = lambda: 1
+    try:
+        headers, body = asyncio.run(_first_body("/api/v1/quotes/quote/1/progress"))
+    finally:
+        app.dependency_overrides.pop(get_user_id, None)
+    assert headers["content-type"].startswith("text/event-stream")
+    assert headers.get("content-encoding") != "gzip"
+    assert body.startswith(b"event: progress\n")
@@ -0,0 +1,45 @@
+"""
+限流身份测试
+测试只信任校验通过的 JWT 用户ID，伪造的 X-User-Id 不影响限流计数
+"""
+import os
+import sys
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from starlette.requests import Request
+
+from app.core.security import create_access_token
+from app.middleware.rate_limit import rate_limit_key
+
+
+def _request(headers=None, query: str = "") -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/v1/quotes/list",
+        "query_string": query.encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("10.0.0.8", 12345),
+    })
+
+
+class TestRateLimitKey:
+    """限流身份测试类"""
+
+    def test_unverified_user_id_is_ignored(self):
+        """X-User-Id / user_id 查询参数未经校验，按IP计数"""
+        assert rate_limit_key(_request({"X-User-Id": "42"})) == "ip:10.0.0.8"
+        assert rate_limit_key(_request(query="user_id=42")) == "ip:10.0.0.8"
+
+    def test_verified_jwt(self):
+        """有效 JWT 按 token 中的用户ID计数，且优先于 X-User-Id"""
+        token = create_access_token({"user_id": 7, "openid": "o"})
+        assert rate_limit_key(_request({"Authorization": f"Bearer {token}", "X-User-Id": "42"})) == "user:7"
+        assert rate_limit_key(_request(query=f"access_token={token}")) == "user:7"
+
+    def test_invalid_jwt_falls_back_to_ip(self):
+        """签名无效的 token 按IP计数"""
+        assert rate_limit_key(_request({"Authorization": "Bearer not-a-jwt"})) == "ip:10.0.0.8"
@@ -0,0 +1,118 @@
+"""
+消息未读数计数器测试
+测试变更合并、提交后生效/回滚丢弃、计数不小于0、一键已读和周期对账
+"""
+import os
+import sys
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+fakeredis = pytest.importorskip("fakeredis.aioredis")
+pytest.importorskip("lupa")  # Lua 脚本需要 lupa
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.services import unread_counter as counter_module
+from app.services.redis_cache import cache
+from app.services.unread_counter import _coalesce, unread_counter
+
+USER_ID = 7
+
+
+@asynccontextmanager
+async def _no_db(commit=True):
+    yield None
+
+
+class TestCoalesce:
+    """计数变更合并测试类"""
+
+    def test_merge_and_reset(self):
+        """同一分类增减合并；清零丢弃此前的增减，之后的增减保留"""
+        ops = [(1, "system", 1), (1, "system", 1), (1, "progress", 1), (2, "system", -1),
+               (1, None, 0), (1, "system", 1)]
+        assert _coalesce(ops) == {(1, None): 0, (1, "system"): 1, (2, "system"): -1}
+
+
+class TestUnreadCounter:
+    """未读数计数器测试类"""
+
+    def setup_method(self):
+        """每个测试方法前的设置"""
+        self.client = fakeredis.FakeRedis(decode_responses=True)
+        cache.client = self.client
+        self.db_counts = {}
+
+        async def count_from_db(db, user_ids):
+            return {user_id: dict(self.db_counts.get(user_id, {})) for user_id in user_ids}
+
+        unread_counter._count_from_db = count_from_db
+
+    def teardown_method(self):
+        cache.client = None
+        del unread_counter._count_from_db
+
+    async def _drain(self):
+        await asyncio.gather(*list(unread_counter._apply_tasks))
+
+    def _session(self) -> Session:
+        session = Session(bind=create_engine("sqlite://"))
+        session.execute(text("SELECT 1"))
+        return session
+
+    def test_apply_after_commit_discard_after_rollback(self):
+        """提交后写入 Redis，回滚则丢弃"""
+        self.db_counts = {USER_ID: {"system": 1}}
+
+        async def run():
+            assert await unread_counter.get_counts(None, USER_ID) == {"system": 1}
+
+            session = self._session()
+            unread_counter.track(SimpleNamespace(sync_session=session), USER_ID, "system", 1)
+            session.rollback()
+            await self._drain()
+            assert await unread_counter.get_counts(None, USER_ID) == {"system": 1}
+
+            session.execute(text("SELECT 1"))
+            unread_counter.track(SimpleNamespace(sync_session=session), USER_ID, "system", 1)
+            unread_counter.track(SimpleNamespace(sync_session=session), USER_ID, "progress", 1)
+            session.commit()
+            await self._drain()
+            return await unread_counter.get_counts(None, USER_ID)
+
+        assert asyncio.run(run()) == {"system": 2, "progress": 1}
+
+    def test_clamp_reset_and_uninitialized(self):
+        """计数不小于0；一键已读清零；未初始化的用户不生成计数"""
+        async def run():
+            await unread_counter.get_counts(None, USER_ID)
+            await unread_counter.apply([(USER_ID, "system", -3)])
+            assert await self.client.hget(f"msg_unread:{USER_ID}", "system") == "0"
+            await unread_counter.apply([(USER_ID, "system", 2), (USER_ID, None, 0)])
+            assert await unread_counter.get_counts(None, USER_ID) == {}
+            await unread_counter.apply([(99, "system", 1)])
+            assert not await self.client.exists("msg_unread:99")
+
+        asyncio.run(run())
+
+    def test_reconcile_deletes_drifted_counters(self, monkeypatch):
+        """与数据库不一致的计数被删除，一致的保留"""
+        monkeypatch.setattr(counter_module, "with_session", _no_db)
+        self.db_counts = {1: {"system": 2}, 2: {"system": 1}}
+
+        async def run():
+            await unread_counter.get_counts(None, 1)
+            await unread_counter.get_counts(None, 2)
+            await unread_counter.apply([(2, "system", 5)])
+            fixed = await unread_counter.reconcile(batch_size=1)
+            return fixed, await self.client.exists("msg_unread:1"), await self.client.exists("msg_unread:2")
+
+        assert asyncio.run(run()) == (1, 1, 0)
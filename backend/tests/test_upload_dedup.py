@@ -0,0 +1,27 @@
+"""
+上传去重统计测试
+测试近似图片只计入统计、不算作命中
+"""
+import os
+import sys
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from app.services.upload_dedup import MATCH_CROSS_USER, MATCH_EXACT, SIMILAR, DedupStats
+
+
+class TestDedupStats:
+    """去重统计测试类"""
+
+    def test_similar_is_not_a_hit(self):
+        """近似图片照常分析，不计入命中率"""
+        stats = DedupStats()
+        for match in (MATCH_EXACT, MATCH_CROSS_USER, SIMILAR, None):
+            stats.record("quotes", match)
+        quotes = stats.snapshot()["quotes"]
+        assert quotes["lookups"] == 4
+        assert quotes["hits"] == 2
+        assert quotes[SIMILAR] == 1
+        assert quotes["hit_rate"] == 0.5
@@ -0,0 +1,82 @@
+"""
+订阅消息发送队列测试
+测试限流/系统繁忙的指数退避、access_token 失效后的快速重试，
+以及发送异常时消息进入重试/死信而不丢失
+"""
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEBUG", "True")
+
+from app.core.config import settings
+from app.services.redis_cache import cache
+from app.services.wechat_dispatcher import (
+    DEAD_KEY, DELAYED_KEY, READY_KEY, TOKEN_RETRY_DELAY, compute_retry_delay, wechat_dispatcher,
+)
+from app.services.wechat_miniprogram_service import wechat_miniprogram_service
+
+
+class TestComputeRetryDelay:
+    """重试等待时间测试类"""
+
+    def test_exponential_backoff(self):
+        """45009/-1 按指数退避，带不超过半个基数的抖动"""
+        base = settings.WECHAT_DISPATCH_RETRY_SECONDS
+        for attempt in (1, 2, 3):
+            for errcode in (45009, -1):
+                delay = compute_retry_delay(errcode, attempt)
+                assert base * 2 ** (attempt - 1) <= delay <= base * 2 ** (attempt - 1) + base / 2
+
+    def test_token_error_retries_quickly(self):
+        """access_token 失效已丢弃旧 token，短暂等待后重试"""
+        assert compute_retry_delay(40001, 3) == TOKEN_RETRY_DELAY
+        assert compute_retry_delay(42001, 1) == TOKEN_RETRY_DELAY
+
+
+class TestDrainErrors:
+    """批量发送异常测试类"""
+
+    def setup_method(self):
+        """每个测试方法前的设置"""
+        fakeredis = pytest.importorskip("fakeredis.aioredis")
+        pytest.importorskip("lupa")  # Lua 脚本需要 lupa
+        self.client = fakeredis.FakeRedis(decode_responses=True)
+        cache.client = self.client
+
+    def teardown_method(self):
+        """每个测试方法后的清理"""
+        cache.client = None
+
+    def _drain(self, monkeypatch, messages):
+        monkeypatch.setattr(settings, "WECHAT_DISPATCH_ENABLED", True)
+
+        async def broken_post(*args, **kwargs):
+            raise ConnectionError("redis down")
+
+        monkeypatch.setattr(wechat_miniprogram_service, "post_subscribe_message", broken_post)
+
+        async def run():
+            await self.client.lpush(READY_KEY, *messages)
+            stats = await wechat_dispatcher.drain()
+            return stats, await self.client.zcard(DELAYED_KEY), await self.client.llen(DEAD_KEY)
+
+        return asyncio.run(run())
+
+    def test_send_exception_retries(self, monkeypatch):
+        """发送异常的消息进入重试队列；仅格式错误的消息被丢弃"""
+        message = {"openid": "o1", "template_id": "t1", "data": {}, "attempts": 0}
+        stats, delayed, dead = self._drain(monkeypatch, [json.dumps(message), "not-json"])
+        assert (stats["retry"], stats["dropped"], delayed, dead) == (1, 1, 1, 0)
+
+    def test_send_exception_exhausted_goes_dead(self, monkeypatch):
+        """重试耗尽后发送异常的消息进入死信列表"""
+        attempts = settings.WECHAT_DISPATCH_MAX_RETRIES
+        message = {"openid": "o1", "template_id": "t1", "data": {}, "attempts": attempts}
+        stats, delayed, dead = self._drain(monkeypatch, [json.dumps(message)])
+        assert (stats["dead"], delayed, dead) == (1, 0, 1)
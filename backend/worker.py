@@ -0,0 +1,57 @@
+"""
+装修决策Agent - 分析任务worker入口
+消费Redis任务队列中的报价单/合同/公司检测分析任务，并执行周期任务（如消息未读数对账），与API进程分开部署
+
+用法：
+    python worker.py                                   # 消费所有任务类型
+    python worker.py --types quote_analysis,contract_analysis
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import signal
+
+from app.core.logger import get_logger
+from app.services.redis_cache import init_cache, close_cache
+from app.services.job_queue import JobWorker, JOB_MODULES
+from app.services.http_client import close_http_clients
+from app.services.risk_analyzer import get_ai_provider_name
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = get_logger(__name__)
+
+
+async def main(job_types=None):
+    """启动worker，收到 SIGINT/SIGTERM 后处理完当前任务再退出"""
+    # 导入注册了任务处理函数的模块
+    for module in JOB_MODULES:
+        importlib.import_module(module)
+
+    logger.info("正在初始化Redis缓存...")
+    await init_cache()
+
+    worker = JobWorker(job_types)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    logger.info("AI分析渠道: " + get_ai_provider_name())
+    try:
+        await worker.run()
+    finally:
+        await close_cache()
+        await close_http_clients()
+        logger.info("任务worker关闭")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="装修决策Agent 分析任务worker")
+    parser.add_argument("--types", default="", help="逗号分隔的任务类型，默认消费全部")
+    args = parser.parse_args()
+    types = [t.strip() for t in args.types.split(",") if t.strip()] or None
+    asyncio.run(main(types))
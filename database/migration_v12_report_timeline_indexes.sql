@@ -0,0 +1,19 @@
+-- 迁移V12：报告时间线索引
+-- 报告列表按 (created_at, id) 倒序对四类报告做 UNION ALL 游标分页，
+-- 每个分支需要 (user_id, created_at, id) 索引才能只扫描当前页附近的行
+
+CREATE INDEX IF NOT EXISTS idx_company_scans_user_created
+    ON company_scans (user_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_quotes_user_created
+    ON quotes (user_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_contracts_user_created
+    ON contracts (user_id, created_at DESC, id DESC);
+
+-- 验收分析仅统计未删除记录
+CREATE INDEX IF NOT EXISTS idx_acceptance_analyses_user_created
+    ON acceptance_analyses (user_id, created_at DESC, id DESC)
+    WHERE deleted_at IS NULL;
+
+SELECT 'Migration V12 completed: Added report timeline indexes' as status;
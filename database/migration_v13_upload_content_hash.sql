@@ -0,0 +1,39 @@
+-- 迁移V13：报价单/合同上传去重
+-- 上传时记录文件SHA-256与图片感知哈希，相同/近似文件复用已完成的分析结果
+
+-- 为quotes表添加content_hash、perceptual_hash列
+DO $$ 
+BEGIN 
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                   WHERE table_name = 'quotes' AND column_name = 'content_hash') THEN
+        ALTER TABLE quotes ADD COLUMN content_hash VARCHAR(64);
+        ALTER TABLE quotes ADD COLUMN perceptual_hash VARCHAR(16);
+        RAISE NOTICE 'Added content_hash/perceptual_hash columns to quotes table';
+    ELSE
+        RAISE NOTICE 'content_hash column already exists in quotes table';
+    END IF;
+END $$;
+
+-- 为contracts表添加content_hash、perceptual_hash列
+DO $$ 
+BEGIN 
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                   WHERE table_name = 'contracts' AND column_name = 'content_hash') THEN
+        ALTER TABLE contracts ADD COLUMN content_hash VARCHAR(64);
+        ALTER TABLE contracts ADD COLUMN perceptual_hash VARCHAR(16);
+        RAISE NOTICE 'Added content_hash/perceptual_hash columns to contracts table';
+    ELSE
+        RAISE NOTICE 'content_hash column already exists in contracts table';
+    END IF;
+END $$;
+
+-- 按内容哈希查找已完成的分析（同用户与跨用户查询共用）
+CREATE INDEX IF NOT EXISTS idx_quotes_content_hash
+    ON quotes (content_hash, user_id)
+    WHERE content_hash IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_contracts_content_hash
+    ON contracts (content_hash, user_id)
+    WHERE content_hash IS NOT NULL;
+
+SELECT 'Migration V13 completed: Added upload content hash columns' as status;
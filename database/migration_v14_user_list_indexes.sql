@@ -0,0 +1,34 @@
+-- 迁移V14：按用户分页列表的复合索引
+-- 消息、施工照片、验收分析列表均按 user_id 过滤、created_at 倒序分页，
+-- 此前只有主键索引，每次列表/计数都要顺序扫描整表。
+-- 报价单/合同/公司检测列表与报告时间线已由 V12 的 (user_id, created_at DESC, id DESC) 覆盖
+
+-- 消息中心列表 GET /messages（全部分类）
+CREATE INDEX IF NOT EXISTS idx_messages_user_created
+    ON messages (user_id, created_at DESC, id DESC);
+
+-- 消息中心按分类筛选（列表与计数）
+CREATE INDEX IF NOT EXISTS idx_messages_user_category_created
+    ON messages (user_id, category, created_at DESC);
+
+-- 未读数角标 GET /messages/unread-count：只索引未读消息，体积随已读增多而缩小
+CREATE INDEX IF NOT EXISTS idx_messages_user_unread
+    ON messages (user_id)
+    WHERE is_read = false;
+
+-- 施工照片列表（仅未删除）
+CREATE INDEX IF NOT EXISTS idx_construction_photos_user_created
+    ON construction_photos (user_id, created_at DESC)
+    WHERE deleted_at IS NULL;
+
+-- 施工照片按阶段筛选
+CREATE INDEX IF NOT EXISTS idx_construction_photos_user_stage_created
+    ON construction_photos (user_id, stage, created_at DESC)
+    WHERE deleted_at IS NULL;
+
+-- 验收分析按阶段筛选（不筛选阶段时使用 V12 的 idx_acceptance_analyses_user_created）
+CREATE INDEX IF NOT EXISTS idx_acceptance_analyses_user_stage_created
+    ON acceptance_analyses (user_id, stage, created_at DESC)
+    WHERE deleted_at IS NULL;
+
+SELECT 'Migration V14 completed: Added per-user list indexes' as status;
@@ -0,0 +1,32 @@
+-- 迁移V15：施工提醒事件表
+-- 设置开工日期、校准阶段时间、更新阶段状态或提醒设置时，按进度计划生成未来的
+-- 阶段开始/验收提醒；worker 定时取出到期事件批量写入消息中心并推送小程序订阅消息，
+-- 不再按用户逐个扫描 constructions.stages
+
+CREATE TABLE IF NOT EXISTS reminder_events (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    stage VARCHAR(10) NOT NULL,
+    event_type VARCHAR(20) NOT NULL,
+    planned_date DATE NOT NULL,
+    reminder_days_before INTEGER DEFAULT 0,
+    remind_at TIMESTAMP NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    sent_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- 同一阶段同一计划日期只提醒一次；重新生成时已发送的事件不会重复
+    CONSTRAINT uq_reminder_event UNIQUE (user_id, stage, event_type, planned_date)
+);
+
+-- 定时任务按发送时间取到期事件：只索引待发送事件
+CREATE INDEX IF NOT EXISTS idx_reminder_events_due
+    ON reminder_events (remind_at)
+    WHERE status = 'pending';
+
+COMMENT ON TABLE reminder_events IS '施工提醒事件表（V15新增）';
+COMMENT ON COLUMN reminder_events.event_type IS 'stage_start 阶段开始提醒，stage_acceptance 阶段验收提醒';
+COMMENT ON COLUMN reminder_events.status IS 'pending 待发送，sent 已发送';
+
+-- 已有施工计划的用户需执行一次: python scripts/backfill_reminder_events.py
+
+SELECT 'Migration V15 completed: Added reminder_events' as status;
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+为已有施工计划的用户生成提醒事件（执行 migration_v15_reminder_events.sql 后运行一次）。
+之后提醒在设置开工日期、校准阶段时间、更新阶段状态或提醒设置时自动重新生成。
+用法（在项目根目录，需设置 DATABASE_URL）:
+  python scripts/backfill_reminder_events.py
+  python scripts/backfill_reminder_events.py --batch-size 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="生成施工提醒事件")
+    parser.add_argument("--batch-size", type=int, default=500, help="每个事务处理的用户数")
+    args = parser.parse_args()
+
+    from sqlalchemy import select
+    from app.core.database import engine, with_session
+    from app.models import Construction
+    from app.services.construction_reminders import materialize_reminders
+
+    last_id = users = events = 0
+    try:
+        while True:
+            async with with_session() as db:
+                rows = (await db.execute(
+                    select(Construction.id, Construction.user_id)
+                    .where(Construction.id > last_id, Construction.start_date.isnot(None))
+                    .order_by(Construction.id)
+                    .limit(args.batch_size)
+                )).all()
+                for row in rows:
+                    events += await materialize_reminders(db, row.user_id)
+            if not rows:
+                break
+            last_id = rows[-1].id
+            users += len(rows)
+            print(f"已处理 {users} 个用户，生成提醒 {events} 条")
+    finally:
+        await engine.dispose()
+    print(f"完成：{users} 个用户，{events} 条提醒")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+OCR图片预处理基准测试：对比完整解码与 JPEG draft 解码缩放的吞吐量和峰值内存。
+用法（在项目根目录）:
+  python scripts/bench_ocr_preprocess.py
+  python scripts/bench_ocr_preprocess.py --count 20 --size 8000x6000
+  python scripts/bench_ocr_preprocess.py --images 照片1.jpg 照片2.jpg
+
+未指定 --images 时生成合成的手机照片（默认 4032x3024 与 8000x6000）和长截图（1080x20000）。
+每种模式在独立子进程中运行，峰值内存（ru_maxrss）互不影响。
+"""
+import argparse
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+
+def _synthetic_photo(width: int, height: int, seed: int) -> bytes:
+    """生成带噪声和文字行的合成照片（噪声让JPEG大小接近真实照片）"""
+    from PIL import Image, ImageDraw
+
+    image = Image.effect_noise((width, height), 40 + seed % 20).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for y in range(40, height, 60):
+        draw.text((40, y), f"水电改造 {seed}-{y} 单价 88.00 元/米 数量 {y % 97}", fill=(0, 0, 0))
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=92)
+    return buffered.getvalue()
+
+
+def _load_images(paths: list) -> list:
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def _write_synthetic(args, tmp_dir: str) -> list:
+    """生成合成图片写入临时目录（在父进程中生成，子进程的峰值内存不含生成开销）"""
+    paths = []
+    for size in args.size:
+        width, height = (int(v) for v in size.lower().split("x"))
+        for i in range(args.count):
+            path = os.path.join(tmp_dir, f"{size}-{i}.jpg")
+            with open(path, "wb") as f:
+                f.write(_synthetic_photo(width, height, i))
+            paths.append(path)
+    return paths
+
+
+def _run_mode(args) -> None:
+    """子进程：按指定模式预处理全部图片，输出 images/s 与峰值RSS"""
+    from app.services.ocr_preprocess import preprocess_image
+
+    images = _load_images(args.images)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    use_draft = args.mode == "draft"
+    started = time.perf_counter()
+    segments = 0
+    for data in images:
+        segments += len(preprocess_image(data, use_draft=use_draft))
+    elapsed = time.perf_counter() - started
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{args.mode:6s} 图片={len(images):3d} 段数={segments:3d} 耗时={elapsed:7.2f}s "
+          f"吞吐={len(images) / elapsed:6.2f} images/s "
+          f"峰值RSS={peak_rss / 1024:7.1f}MB（加载图片后 {baseline_rss / 1024:.1f}MB）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR图片预处理基准测试")
+    parser.add_argument("--count", type=int, default=5, help="每种尺寸生成的合成图片数")
+    parser.add_argument("--size", nargs="+", default=["4032x3024", "8000x6000", "1080x20000"],
+                        help="合成图片尺寸（宽x高）")
+    parser.add_argument("--images", nargs="*", help="使用本地图片代替合成图片")
+    parser.add_argument("--mode", choices=["full", "draft"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _run_mode(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = args.images or _write_synthetic(args, tmp_dir)
+        total_mb = sum(os.path.getsize(p) for p in paths) / 1024 / 1024
+        print(f"测试图片 {len(paths)} 张，共 {total_mb:.1f}MB")
+        for mode in ("full", "draft"):
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode, "--images", *paths],
+                           check=True)
+
+
+if __name__ == "__main__":
+    main()